@@ -0,0 +1,290 @@
+"""
+COSMOS Asyncio MQTT Controller
+An MQTTController with the same public surface (connect, publish_brake, publish_land,
+disconnect) whose paho client is driven by one shared asyncio event loop instead of a
+loop_start() network thread per controller.
+
+Every paho callback runs on the event loop thread, so command, ack and connection
+events reach listeners in a single deterministic order.
+"""
+
+import asyncio
+import logging
+import threading
+
+import paho.mqtt.client as mqtt
+
+from command_cache import CommandPacketCache
+from cosmos_core import EventBus, create_client
+from cosmos_core.router import NETWORK, MessageRouter
+from telemetry import TelemetryHub
+
+logger = logging.getLogger("cosmos.mqtt")
+
+_shared_loop = None
+_shared_loop_lock = threading.Lock()
+
+
+def get_shared_loop():
+    """Return the process-wide MQTT event loop, starting its thread on first use"""
+    global _shared_loop
+    with _shared_loop_lock:
+        if _shared_loop is None or _shared_loop.is_closed():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="cosmos-mqtt-loop", daemon=True)
+            thread.start()
+            _shared_loop = loop
+        return _shared_loop
+
+
+class AsyncMQTTController:
+    """MQTT controller driven by a shared asyncio event loop"""
+
+    def __init__(self, loop=None):
+        self.loop = loop or get_shared_loop()
+        self.client = None
+        self.connected = False
+        self.broker_host = ""
+        self.broker_port = 1883
+        self.username = ""
+        self.password = ""
+        self.brake_topic = "brakeCosmos"
+        self.land_topic = "landCosmos"
+        self.brake_payload = "1"
+        self.land_payload = "1"
+        self.qos = 0
+        self.keepalive = 60
+        # Extra named commands to pre-encode, name -> (topic, payload)
+        self.extra_commands = {}
+        self.use_command_cache = True
+        self.command_cache = CommandPacketCache()
+        self.telemetry = TelemetryHub()
+        # 'network' routes run on the event loop thread, so they must not block
+        self.router = MessageRouter()
+        self.events = EventBus()
+        self._misc_task = None
+        self._loop_thread_id = None
+
+    def add_listener(self, callback):
+        """Register callback(event, data) for connection, command and message events"""
+        self.events.add_listener(callback)
+
+    def remove_listener(self, callback):
+        """Unregister a listener"""
+        self.events.remove_listener(callback)
+
+    def _emit(self, event, data=None):
+        """Deliver an event to every listener on the event loop thread"""
+        self.events.emit(event, data)
+
+    def _on_loop_thread(self):
+        return threading.get_ident() == self._loop_thread_id
+
+    def call_in_loop(self, func, *args):
+        """Run func on the event loop thread, immediately if already there"""
+        if self._on_loop_thread():
+            func(*args)
+        else:
+            self.loop.call_soon_threadsafe(func, *args)
+
+    # Connection management
+
+    def connect(self, host, port, username, password, timeout=10):
+        """Connect to MQTT broker from any thread other than the event loop"""
+        if self._on_loop_thread():
+            raise RuntimeError("connect() would block the event loop; await connect_async() instead")
+        future = asyncio.run_coroutine_threadsafe(
+            self.connect_async(host, port, username, password), self.loop)
+        return future.result(timeout)
+
+    async def connect_async(self, host, port, username, password):
+        """Connect to MQTT broker from the event loop"""
+        self._loop_thread_id = threading.get_ident()
+        try:
+            self.broker_host = host
+            self.broker_port = int(port)
+            self.username = username
+            self.password = password
+
+            self.client = create_client()
+            if username and password:
+                self.client.username_pw_set(username, password)
+            self.client.on_connect = self.on_connect
+            self.client.on_disconnect = self.on_disconnect
+            self.client.on_message = self.on_message
+            self.client.on_publish = self.on_publish
+            self.client.on_socket_open = self.on_socket_open
+            self.client.on_socket_close = self.on_socket_close
+            self.client.on_socket_register_write = self.on_socket_register_write
+            self.client.on_socket_unregister_write = self.on_socket_unregister_write
+
+            # DNS and the TCP handshake block, so keep them off the event loop
+            await self.loop.run_in_executor(
+                None, self.client.connect, host, self.broker_port, self.keepalive)
+
+            logger.info("MQTT: Connecting to %s:%s", host, port)
+            self._emit('connecting', (host, self.broker_port))
+            return True
+
+        except Exception as e:
+            logger.error("MQTT: Connection failed - %s", e)
+            self._emit('connect_failed', str(e))
+            return False
+
+    def disconnect(self, timeout=5):
+        """Disconnect from MQTT broker"""
+        if not self.client:
+            return
+        if self._on_loop_thread():
+            self._disconnect()
+            return
+        future = asyncio.run_coroutine_threadsafe(self._disconnect_async(), self.loop)
+        future.result(timeout)
+
+    async def _disconnect_async(self):
+        self._disconnect()
+
+    def _disconnect(self):
+        self.client.disconnect()
+        self.connected = False
+
+    # Socket integration with the event loop
+
+    def on_socket_open(self, client, userdata, sock):
+        """Watch the new socket for reads and start the keepalive timer"""
+        self.call_in_loop(self._watch_socket, client, sock)
+
+    def _watch_socket(self, client, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        self._misc_task = self.loop.create_task(self._misc_loop(client))
+
+    def on_socket_close(self, client, userdata, sock):
+        """Stop watching a closed socket"""
+        self.call_in_loop(self._unwatch_socket, sock)
+
+    def _unwatch_socket(self, sock):
+        try:
+            self.loop.remove_reader(sock)
+            self.loop.remove_writer(sock)
+        except (OSError, ValueError):
+            # The socket was already closed by paho before we got here
+            pass
+        if self._misc_task:
+            self._misc_task.cancel()
+            self._misc_task = None
+
+    def on_socket_register_write(self, client, userdata, sock):
+        """Flush pending packets when the socket becomes writable"""
+        self.call_in_loop(self.loop.add_writer, sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        """Stop waiting for writability once the out queue is empty"""
+        self.call_in_loop(self.loop.remove_writer, sock)
+
+    async def _misc_loop(self, client):
+        """Drive keepalive pings and retry timers"""
+        while client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+    # Paho callbacks, always on the event loop thread
+
+    def on_connect(self, client, userdata, flags, rc):
+        """Callback for when the client receives a CONNACK response from the server"""
+        if rc == 0:
+            self.build_command_cache()
+            self.telemetry.subscribe(client)
+            routed = self.router.filters()
+            if routed:
+                client.subscribe(list(routed.items()))
+            self.connected = True
+            logger.info("MQTT: Connected successfully")
+            self._emit('connected', flags)
+        else:
+            self.connected = False
+            logger.error("MQTT: Connection failed with code %s", rc)
+            self._emit('connect_failed', rc)
+
+    def on_disconnect(self, client, userdata, rc):
+        """Callback for when the client disconnects from the broker"""
+        self.connected = False
+        logger.info("MQTT: Disconnected from broker")
+        self._emit('disconnected', rc)
+
+    def on_message(self, client, userdata, msg):
+        """Callback for when a PUBLISH message is received from the server"""
+        if self.telemetry.handle(msg.topic, msg.payload):
+            return
+        if self.router.dispatch(msg):
+            return
+        self._emit('message', msg)
+
+    def on_publish(self, client, userdata, mid):
+        """Callback for when a publish has been written (QoS 0) or acknowledged (QoS 1/2)"""
+        self._emit('published', mid)
+
+    # Subscriptions
+
+    def subscribe(self, topic_filter, handler, qos=0, context=NETWORK):
+        """Call handler(msg) for messages matching topic_filter; returns the route"""
+        route = self.router.route(topic_filter, handler, context, qos)
+        if self.connected and self.client:
+            self.call_in_loop(self.client.subscribe, topic_filter, qos)
+        return route
+
+    def unsubscribe(self, route):
+        """Remove a route, and the broker subscription once no route uses its filter"""
+        if not self.router.unroute(route):
+            return False
+        if self.connected and self.client and route.topic_filter not in self.router.filters():
+            self.call_in_loop(self.client.unsubscribe, route.topic_filter)
+        return True
+
+    # Commands
+
+    def build_command_cache(self):
+        """Pre-encode the packet for every known command"""
+        commands = {'brake': (self.brake_topic, self.brake_payload),
+                    'land': (self.land_topic, self.land_payload)}
+        commands.update(self.extra_commands)
+        self.command_cache.build(commands)
+
+    def publish_brake(self):
+        """Publish brake command"""
+        return self._publish('brake', self.brake_topic, self.brake_payload, self.qos, True)
+
+    def publish_land(self):
+        """Publish land command"""
+        return self._publish('land', self.land_topic, self.land_payload, self.qos, True)
+
+    def publish_command(self, name):
+        """Publish one of the configured extra commands by name"""
+        if name not in self.extra_commands:
+            logger.error("MQTT: Unknown command %s", name)
+            return False
+        topic, payload = self.extra_commands[name]
+        return self._publish(name, topic, payload, self.qos, True)
+
+    def publish(self, topic, payload, qos=None, command='publish'):
+        """Publish an arbitrary message from any thread"""
+        return self._publish(command, topic, payload, self.qos if qos is None else qos, False)
+
+    def _publish(self, command, topic, payload, qos, cached):
+        if not (self.connected and self.client):
+            logger.warning("MQTT: Not connected, cannot publish %s", command)
+            return False
+        self.call_in_loop(self._send, command, topic, payload, qos, cached)
+        return True
+
+    def _send(self, command, topic, payload, qos, cached):
+        """Publish and write immediately rather than waiting for the next writable event"""
+        try:
+            if cached and self.use_command_cache and qos == 0 and self.command_cache.send(self.client, command):
+                mid = 0
+            else:
+                mid = self.client.publish(topic, payload, qos=qos).mid
+        except Exception as e:
+            logger.error("MQTT: Failed to publish %s - %s", command, e)
+            self._emit('command_failed', (command, str(e)))
+            return
+        self._emit('command_sent', (command, mid))
+        self.client.loop_write()
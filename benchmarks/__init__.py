@@ -0,0 +1,4 @@
+"""
+COSMOS MQTT Controller benchmarks.
+Run from the repository root, e.g. `python -m benchmarks.latency --quick`.
+"""
@@ -0,0 +1,64 @@
+"""
+Actuation Round-trip Benchmark
+Measures press -> drone actuation -> ack round trips through the loopback broker
+against the simulated drone, with optional actuation delay and radio loss, and
+reports how many presses needed a retry.
+
+Usage:
+    python -m benchmarks.actuation --presses 500 --delay-ms 2 --drop 0.05
+"""
+
+import argparse
+import sys
+import time
+
+from benchmarks.latency import wait_for
+from cosmos_core import MQTTController
+from loopback_broker import LoopbackBroker
+from sim_drone import SimulatedDrone
+
+
+def actuation_round_trips(broker, presses, rate, delay, drop, deadline):
+    """Press BRAKE with acks enabled; returns the controller's ack channel"""
+    drone = SimulatedDrone(broker.host, broker.port, actuation_delay=delay, drop_rate=drop, seed=1)
+    if not drone.subscribed.wait(5):
+        raise RuntimeError("simulated drone did not subscribe")
+    controller = MQTTController()
+    controller.command_qos['brake'] = 1
+    controller.enable_command_acks(deadline=deadline, max_retries=10)
+    controller.connect(broker.host, broker.port, "", "")
+    if not wait_for(lambda: controller.connected and controller.session_subscribed, 5):
+        raise RuntimeError("controller did not connect")
+    interval = 1.0 / rate
+    for _ in range(presses):
+        controller.publish_brake()
+        time.sleep(interval)
+    acks = controller.acks
+    wait_for(lambda: acks.acked + acks.failed == presses, 30)
+    controller.disconnect()
+    drone.close()
+    return acks
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COSMOS actuation round-trip benchmark")
+    parser.add_argument('--presses', type=int, default=500)
+    parser.add_argument('--rate', type=float, default=200.0)
+    parser.add_argument('--delay-ms', type=float, default=0.0, help="simulated actuation time")
+    parser.add_argument('--drop', type=float, default=0.0, help="share of commands lost")
+    parser.add_argument('--deadline-ms', type=float, default=50.0, help="retry deadline")
+    args = parser.parse_args(argv)
+
+    with LoopbackBroker() as broker:
+        acks = actuation_round_trips(broker, args.presses, args.rate, args.delay_ms / 1000.0,
+                                     args.drop, args.deadline_ms / 1000.0)
+    histogram = acks.histogram
+    print(f"{acks.acked}/{args.presses} acked, {acks.retried} retries, {acks.failed} unacked")
+    if histogram.count:
+        print(f"p50 {histogram.percentile(50) * 1000:.2f} ms  p99 {histogram.percentile(99) * 1000:.2f} ms"
+              f"  max {histogram.max * 1000:.2f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
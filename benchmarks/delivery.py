@@ -0,0 +1,76 @@
+"""
+Delivery Confirmation Benchmark
+Measures press-to-PUBACK/PUBCOMP round trips through the loopback broker as seen
+by the in-flight tracker, and the tracker's own cost with many thousands of
+unacknowledged messages outstanding.
+
+Usage:
+    python -m benchmarks.delivery --presses 2000 --outstanding 50000
+"""
+
+import argparse
+import sys
+import time
+
+from benchmarks.latency import wait_for
+from cosmos_core import MQTTController
+from cosmos_core.inflight import InflightTracker
+from loopback_broker import LoopbackBroker
+
+
+def round_trips(broker, qos, presses, rate):
+    """Press BRAKE at QoS 1/2; returns the controller's delivery histogram"""
+    controller = MQTTController()
+    controller.command_qos['brake'] = qos
+    controller.connect(broker.host, broker.port, "", "")
+    if not wait_for(lambda: controller.connected, 5):
+        raise RuntimeError("controller did not connect")
+    interval = 1.0 / rate
+    for _ in range(presses):
+        controller.publish_brake()
+        time.sleep(interval)
+    if not wait_for(lambda: controller.inflight.confirmed == presses, 10):
+        raise RuntimeError(f"only {controller.inflight.confirmed}/{presses} presses confirmed")
+    controller.disconnect()
+    return controller.inflight.histogram
+
+
+def tracker_cost(outstanding):
+    """Nanoseconds per track() and per ack() with `outstanding` messages in flight"""
+    tracker = InflightTracker(capacity=outstanding + 1, timeout=3600.0)
+    now = time.perf_counter()
+    for mid in range(outstanding):
+        tracker.track(mid, 'brake', now)
+    started = time.perf_counter_ns()
+    for mid in range(outstanding, outstanding * 2):
+        tracker.track(mid, 'brake', now)
+    track_ns = (time.perf_counter_ns() - started) / outstanding
+    started = time.perf_counter_ns()
+    for mid in range(outstanding * 2 - 1, -1, -1):
+        tracker.ack(mid, now)
+    ack_ns = (time.perf_counter_ns() - started) / (outstanding * 2)
+    return track_ns, ack_ns
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COSMOS delivery confirmation benchmark")
+    parser.add_argument('--presses', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=500.0)
+    parser.add_argument('--outstanding', type=int, default=50000)
+    args = parser.parse_args(argv)
+
+    with LoopbackBroker() as broker:
+        print(f"{'qos':<6}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for qos in (1, 2):
+            histogram = round_trips(broker, qos, args.presses, args.rate)
+            print(f"{qos:<6}{histogram.percentile(50) * 1000:>10.2f}"
+                  f"{histogram.percentile(99) * 1000:>10.2f}{histogram.max * 1000:>10.2f}")
+
+    track_ns, ack_ns = tracker_cost(args.outstanding)
+    print(f"Tracker with {args.outstanding:,} outstanding: "
+          f"track {track_ns:.0f} ns, ack {ack_ns:.0f} ns")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Multi-broker Benchmark
+Runs several loopback brokers with injected delay and loss and a simulated drone
+listening on all of them, then measures:
+
+    press -> drone ack round trips through the primary broker alone, and raced
+    over every broker (first ack wins, the drone dedupes by sequence number)
+
+    failover time: the primary broker dies and the controller reconnects to the
+    next healthy one
+
+Usage:
+    python -m benchmarks.failover --presses 200 --delays 0,5,20 --losses 0.3,0,0
+"""
+
+import argparse
+import contextlib
+import sys
+import time
+
+from benchmarks.latency import wait_for
+from cosmos_core import MQTTController
+from loopback_broker import LoopbackBroker
+from sim_drone import SimulatedDrone
+
+
+def press(controller, presses, rate):
+    """Press BRAKE `presses` times; returns the ack channel once every press settled"""
+    acks = controller.acks
+    for _ in range(presses):
+        controller.publish_brake()
+        time.sleep(1.0 / rate)
+    wait_for(lambda: acks.acked + acks.failed >= presses, 30)
+    return acks
+
+
+def run(brokers, race, presses, rate):
+    """Connect to the broker list and press; returns (ack channel, controller)"""
+    controller = MQTTController()
+    spec = ", ".join(f"{broker.host}:{broker.port}" for broker in brokers)
+    if not controller.connect(spec, 1883, "", ""):
+        raise RuntimeError("controller did not connect")
+    controller.command_qos['brake'] = 1
+    controller.enable_command_acks(deadline=0.05, max_retries=10)
+    if race:
+        controller.enable_race_publishing()
+    if not wait_for(lambda: controller.connected and controller.session_subscribed
+                    and all(client.is_connected() for client in controller.race_clients.values()), 5):
+        raise RuntimeError("not every broker connected")
+    # Let the race clients' ack subscriptions settle
+    time.sleep(0.2)
+    acks = press(controller, presses, rate)
+    return acks, controller
+
+
+def failover_time(brokers):
+    """Seconds from the primary broker dying to the controller being connected elsewhere"""
+    controller = MQTTController()
+    spec = ", ".join(f"{broker.host}:{broker.port}" for broker in brokers)
+    controller.connect(spec, 1883, "", "")
+    if not wait_for(lambda: controller.connected, 5):
+        raise RuntimeError("controller did not connect")
+    primary = next(broker for broker in brokers if broker.port == controller.broker_port)
+    started = time.perf_counter()
+    primary.stop()
+    wait_for(lambda: not controller.connected, 5)
+    wait_for(lambda: controller.connected, 10)
+    elapsed = time.perf_counter() - started
+    controller.disconnect()
+    return elapsed, controller.broker_port != primary.port
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COSMOS multi-broker benchmark")
+    parser.add_argument('--presses', type=int, default=200)
+    parser.add_argument('--rate', type=float, default=100.0)
+    parser.add_argument('--delays', default="0,5,20", help="per-broker delay in ms")
+    parser.add_argument('--losses', default="0.3,0,0", help="per-broker delivery loss")
+    args = parser.parse_args(argv)
+    delays = [float(value) / 1000.0 for value in args.delays.split(",")]
+    losses = [float(value) for value in args.losses.split(",")]
+
+    print(f"{'mode':<10}{'acked':>8}{'retries':>9}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for race in (False, True):
+        with contextlib.ExitStack() as stack:
+            brokers = [stack.enter_context(LoopbackBroker(delay=delay, loss=loss, seed=index))
+                       for index, (delay, loss) in enumerate(zip(delays, losses))]
+            drone = SimulatedDrone(brokers[0].host, brokers[0].port,
+                                   extra_brokers=[(broker.host, broker.port) for broker in brokers[1:]])
+            drone.subscribed.wait(5)
+            acks, controller = run(brokers, race, args.presses, args.rate)
+            histogram = acks.histogram
+            print(f"{'race' if race else 'primary':<10}{acks.acked:>8}{acks.retried:>9}"
+                  f"{histogram.percentile(50) * 1000:>9.2f}{histogram.percentile(99) * 1000:>9.2f}"
+                  f"{histogram.max * 1000:>9.2f}")
+            controller.disconnect()
+            drone.close()
+
+    with contextlib.ExitStack() as stack:
+        brokers = [stack.enter_context(LoopbackBroker(delay=delay)) for delay in delays]
+        elapsed, moved = failover_time(brokers)
+    print(f"Failover after the primary died: {elapsed * 1000:.0f} ms"
+          + ("" if moved else " (did not move to another broker)"))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
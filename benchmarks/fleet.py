@@ -0,0 +1,114 @@
+"""
+Fleet Fan-out Benchmark
+Measures how long "brake all" takes to reach the first and the last drone when
+hundreds of drones share a small pool of broker connections, comparing the
+batched broadcast with N serial per-drone publishes.
+
+Usage:
+    python -m benchmarks.fleet --drones 500 --pool-size 2
+"""
+
+import argparse
+import sys
+import threading
+import time
+import tracemalloc
+
+from benchmarks.latency import create_client, percentile, wait_for
+from fleet_controller import FleetController
+from loopback_broker import LoopbackBroker
+
+
+class SwarmSubscriber:
+    """Plays every drone with one wildcard subscription and timestamps deliveries"""
+
+    def __init__(self, host, port, topic_filter):
+        self.lock = threading.Lock()
+        self.arrivals = []
+        self.subscribed = threading.Event()
+        self.client = create_client()
+        self.client.on_connect = lambda client, userdata, flags, rc: client.subscribe(topic_filter)
+        self.client.on_subscribe = lambda *args: self.subscribed.set()
+        self.client.on_message = self.on_message
+        self.client.connect(host, port, 60)
+        self.client.loop_start()
+
+    def on_message(self, client, userdata, msg):
+        now = time.perf_counter()
+        with self.lock:
+            self.arrivals.append(now)
+
+    def reset(self):
+        with self.lock:
+            self.arrivals = []
+
+    def count(self):
+        with self.lock:
+            return len(self.arrivals)
+
+    def close(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+
+def fan_out(fleet, swarm, batched, rounds):
+    """Run several brake-all rounds and return first/last drone latencies in ms"""
+    drones = len(fleet.drone_ids)
+    firsts, lasts = [], []
+    for _ in range(rounds):
+        swarm.reset()
+        started = time.perf_counter()
+        if batched:
+            fleet.brake_all()
+        else:
+            for drone_id in fleet.drone_ids:
+                fleet.publish_brake(drone_id)
+        if not wait_for(lambda: swarm.count() >= drones, 10):
+            raise RuntimeError(f"only {swarm.count()}/{drones} drones received the brake")
+        with swarm.lock:
+            arrivals = sorted(swarm.arrivals)
+        firsts.append((arrivals[0] - started) * 1000)
+        lasts.append((arrivals[-1] - started) * 1000)
+        time.sleep(0.02)
+    return sorted(firsts), sorted(lasts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COSMOS fleet fan-out benchmark")
+    parser.add_argument('--drones', type=int, default=500)
+    parser.add_argument('--pool-size', type=int, default=2)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    with LoopbackBroker() as broker:
+        swarm = SwarmSubscriber(broker.host, broker.port, "cosmos/+/brakeCosmos")
+        if not swarm.subscribed.wait(5):
+            raise RuntimeError("swarm subscriber did not subscribe")
+
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        fleet = FleetController([f"drone{i}" for i in range(args.drones)], pool_size=args.pool_size)
+        fleet.connect(broker.host, broker.port, "", "")
+        if not wait_for(lambda: fleet.connected, 5):
+            raise RuntimeError("fleet did not connect")
+        fleet.brake_all()
+        wait_for(lambda: swarm.count() >= args.drones, 10)
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        footprint = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+
+        print(f"{args.drones} drones over {args.pool_size} connections, "
+              f"~{footprint / args.drones:.0f} bytes per drone")
+        print(f"{'strategy':<10}{'first p50':>11}{'last p50':>10}{'last p95':>10}{'last max':>10}  (ms)")
+        for label, batched in (('batched', True), ('serial', False)):
+            firsts, lasts = fan_out(fleet, swarm, batched, args.rounds)
+            print(f"{label:<10}{percentile(firsts, 50):>11.3f}{percentile(lasts, 50):>10.3f}"
+                  f"{percentile(lasts, 95):>10.3f}{lasts[-1]:>10.3f}")
+
+        fleet.disconnect()
+        swarm.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""
+Hardware Key Benchmark
+Press -> socket write for BRAKE through the hardware key fast path and through
+an on-screen button, while a stand-in for Kivy's UI loop draws frames.
+
+The button path is what a touch goes through in the app: the press waits for
+the UI loop's next frame, is dispatched there and publishes on the UI thread.
+The key path hands the press to KeyCommandDispatcher, which publishes on its own
+thread. Both are timed from the press to paho's socket write, as the app does.
+
+Usage:
+    python -m benchmarks.hardware_keys --presses 200 --frame-work-ms 8
+"""
+
+import argparse
+import queue
+import random
+import sys
+import threading
+import time
+
+from benchmarks.latency import wait_for
+from cosmos_core import MQTTController
+from hardware_keys import KEYCODE_VOLUME_UP, KeyCommandDispatcher
+from loopback_broker import LoopbackBroker
+
+
+class FrameLoop:
+    """Runs input handlers at the start of each frame, then busy-works like a frame render"""
+
+    def __init__(self, fps, frame_work):
+        self.interval = 1.0 / fps
+        self.frame_work = frame_work
+        self.events = queue.Queue()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def post(self, handler, *args):
+        self.events.put((handler, args))
+
+    def _run(self):
+        next_frame = time.perf_counter()
+        while self.running:
+            while True:
+                try:
+                    handler, args = self.events.get_nowait()
+                except queue.Empty:
+                    break
+                handler(*args)
+            # Layout and drawing: Python work holding the GIL
+            deadline = time.perf_counter() + self.frame_work
+            while time.perf_counter() < deadline:
+                pass
+            next_frame += self.interval
+            time.sleep(max(0.0, next_frame - time.perf_counter()))
+
+    def stop(self):
+        self.running = False
+        self.thread.join(1.0)
+
+
+def press_button(controller, pressed_at):
+    controller.time_to_write('button_to_write_seconds', pressed_at)
+    controller.publish_brake()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COSMOS hardware key fast path benchmark")
+    parser.add_argument('--presses', type=int, default=200, help="presses per path")
+    parser.add_argument('--fps', type=float, default=60.0)
+    parser.add_argument('--frame-work-ms', type=float, default=8.0, help="busy time per UI frame")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(1)
+    with LoopbackBroker() as broker:
+        controller = MQTTController()
+        controller.connect("localhost", broker.port, "", "")
+        if not wait_for(lambda: controller.connected, 5):
+            raise RuntimeError("controller did not connect")
+        ui = FrameLoop(args.fps, args.frame_work_ms / 1000.0)
+        keys = KeyCommandDispatcher(controller, debounce=0.0)
+        keys.start()
+        histograms = controller.metrics.histograms
+        for _ in range(args.presses):
+            # Presses land anywhere within a frame
+            time.sleep(rng.uniform(0.02, 0.04))
+            ui.post(press_button, controller, time.perf_counter())
+            time.sleep(rng.uniform(0.02, 0.04))
+            keys.key_down(KEYCODE_VOLUME_UP, time.perf_counter())
+        wait_for(lambda: all(histograms[name].count >= args.presses
+                             for name in ('key_to_write_seconds', 'button_to_write_seconds')), 5)
+        keys.stop()
+        ui.stop()
+        controller.disconnect()
+
+    print(f"UI loop at {args.fps:.0f} fps with {args.frame_work_ms:.1f} ms of work per frame")
+    for label, name in (("volume key", 'key_to_write_seconds'), ("on-screen button", 'button_to_write_seconds')):
+        histogram = histograms[name]
+        print(f"{label:17} press -> socket write  p50 {histogram.percentile(50) * 1000:7.3f} ms"
+              f"  p99 {histogram.percentile(99) * 1000:7.3f} ms  max {histogram.max * 1000:7.3f} ms"
+              f"  ({histogram.count} presses)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
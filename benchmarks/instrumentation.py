@@ -0,0 +1,62 @@
+"""
+Instrumentation Overhead Benchmark
+Compares the caller-thread CPU time of a BRAKE press with the metrics registry
+enabled and disabled, and times a single histogram update and a full export.
+
+Usage:
+    python -m benchmarks.instrumentation --presses 5000
+"""
+
+import argparse
+import sys
+import time
+
+from benchmarks.latency import percentile, wait_for
+from benchmarks.publish_cost import measure
+from cosmos_core import MQTTController
+from cosmos_core.metrics import ControllerMetrics
+from loopback_broker import LoopbackBroker
+
+
+def observe_cost(samples):
+    """Nanoseconds per ControllerMetrics.observe()"""
+    metrics = ControllerMetrics()
+    started = time.perf_counter_ns()
+    for _ in range(samples):
+        metrics.observe('publish_seconds', 0.00002)
+    return (time.perf_counter_ns() - started) / samples
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COSMOS instrumentation overhead")
+    parser.add_argument('--presses', type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    with LoopbackBroker() as broker:
+        controller = MQTTController()
+        controller.connect(broker.host, broker.port, "", "")
+        if not wait_for(lambda: controller.connected, 5):
+            raise RuntimeError("controller did not connect")
+
+        print(f"{'metrics':<10}{'cpu p50 µs':>12}{'cpu p99 µs':>12}{'bytes/press':>13}")
+        results = {}
+        for enabled in (False, True, False, True):
+            controller.metrics.enabled = enabled
+            cpu, allocated = measure(controller.publish_brake, args.presses)
+            results[enabled] = percentile(cpu, 50)
+            label = "on" if enabled else "off"
+            print(f"{label:<10}{percentile(cpu, 50):>12.2f}{percentile(cpu, 99):>12.2f}{allocated:>13.0f}")
+
+        started = time.perf_counter()
+        text = controller.metrics.to_prometheus()
+        export_ms = (time.perf_counter() - started) * 1000
+        controller.disconnect()
+
+    print(f"observe(): {observe_cost(100000):.0f} ns; "
+          f"press overhead at p50: {results[True] - results[False]:+.2f} µs")
+    print(f"Prometheus export: {export_ms:.2f} ms for {len(text.splitlines())} lines")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""
+End-to-end Command Latency Benchmark
+Drives MQTTController.publish_brake()/publish_land() through an in-process loopback
+broker to a subscriber playing the drone, and reports press-to-delivery latency.
+
+Usage:
+    python -m benchmarks.latency                 # full matrix
+    python -m benchmarks.latency --quick         # short CI run
+    python -m benchmarks.latency --max-p99-ms 50 # fail if any p99 exceeds 50 ms
+"""
+
+import argparse
+import collections
+import json
+import sys
+import threading
+import time
+
+from async_controller import AsyncMQTTController
+from cosmos_core import create_client
+from loopback_broker import LoopbackBroker
+
+
+class HeadlessApp:
+    """Stand-in for the UI app that swallows status updates"""
+
+    def log_message(self, message):
+        pass
+
+    def update_connection_status(self, connected):
+        pass
+
+    def update_status(self, message):
+        pass
+
+
+def load_controller_class(name):
+    """Import the MQTTController of the requested front end"""
+    if name == 'kivy':
+        from main import MQTTController
+    else:
+        from cosmos_mqtt_controller import MQTTController
+    return MQTTController
+
+
+class DroneSubscriber:
+    """Plays the drone: subscribes to the command topics and timestamps deliveries"""
+
+    def __init__(self, host, port, topics, qos):
+        self.pending = {topic: collections.deque() for topic in topics}
+        self.latencies = []
+        self.lock = threading.Lock()
+        self.subscribed = threading.Event()
+        self.client = create_client()
+        self.client.on_connect = lambda client, userdata, flags, rc: client.subscribe(
+            [(topic, qos) for topic in topics])
+        self.client.on_subscribe = lambda *args: self.subscribed.set()
+        self.client.on_message = self.on_message
+        self.client.connect(host, port, 60)
+        self.client.loop_start()
+
+    def expect(self, topic, pressed_at):
+        """Register a press that should be delivered on a topic"""
+        with self.lock:
+            self.pending[topic].append(pressed_at)
+
+    def on_message(self, client, userdata, msg):
+        """Match a delivery with the oldest outstanding press on its topic"""
+        delivered_at = time.perf_counter()
+        with self.lock:
+            queue = self.pending.get(msg.topic)
+            if queue:
+                self.latencies.append(delivered_at - queue.popleft())
+
+    def outstanding(self):
+        """Number of presses not yet delivered"""
+        with self.lock:
+            return sum(len(queue) for queue in self.pending.values())
+
+    def close(self):
+        """Stop the subscriber"""
+        self.client.disconnect()
+        self.client.loop_stop()
+
+
+def create_controller(mode, controller_name):
+    """Build a controller for the given client mode"""
+    if mode == 'async':
+        return AsyncMQTTController()
+    return load_controller_class(controller_name)(HeadlessApp())
+
+
+def wait_for(predicate, timeout):
+    """Poll until predicate() is true or the timeout expires"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.001)
+    return predicate()
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return float('nan')
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies, presses):
+    """Summarize latencies (seconds) into millisecond percentiles"""
+    values = sorted(latencies)
+    return {
+        'presses': presses,
+        'delivered': len(values),
+        'p50_ms': percentile(values, 50) * 1000,
+        'p95_ms': percentile(values, 95) * 1000,
+        'p99_ms': percentile(values, 99) * 1000,
+        'max_ms': (values[-1] * 1000) if values else float('nan'),
+    }
+
+
+def run_case(broker, mode, qos, payload_size, presses, rate, controller_name='tk'):
+    """Run one benchmark case and return its summary"""
+    controller = create_controller(mode, controller_name)
+    topics = [controller.brake_topic, controller.land_topic]
+    drone = DroneSubscriber(broker.host, broker.port, topics, qos)
+    try:
+        if not drone.subscribed.wait(5):
+            raise RuntimeError("drone subscriber did not subscribe")
+        controller.qos = qos
+        controller.brake_payload = "1".ljust(payload_size, "0")
+        controller.land_payload = "1".ljust(payload_size, "0")
+        controller.connect(broker.host, broker.port, "", "")
+        if not wait_for(lambda: controller.connected, 5):
+            raise RuntimeError("controller did not connect")
+
+        interval = 1.0 / rate if rate else 0.0
+        next_press = time.perf_counter()
+        for index in range(presses):
+            if index % 2 == 0:
+                topic, publish = controller.brake_topic, controller.publish_brake
+            else:
+                topic, publish = controller.land_topic, controller.publish_land
+            pressed_at = time.perf_counter()
+            drone.expect(topic, pressed_at)
+            publish()
+            next_press += interval
+            delay = next_press - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+        wait_for(lambda: drone.outstanding() == 0, 5)
+        result = summarize(drone.latencies, presses)
+    finally:
+        controller.disconnect()
+        drone.close()
+    result.update({'mode': mode, 'qos': qos, 'payload_bytes': payload_size})
+    return result
+
+
+def format_row(result):
+    """Format one result as a table row"""
+    return (f"{result['mode']:<9}{result['qos']:>4}{result['payload_bytes']:>9}"
+            f"{result['delivered']:>6}/{result['presses']:<6}"
+            f"{result['p50_ms']:>9.3f}{result['p95_ms']:>9.3f}"
+            f"{result['p99_ms']:>9.3f}{result['max_ms']:>9.3f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COSMOS command latency benchmark")
+    parser.add_argument('--presses', type=int, default=500, help="presses per case")
+    parser.add_argument('--rate', type=float, default=200.0, help="presses per second (0 = unthrottled)")
+    parser.add_argument('--qos', type=int, nargs='+', default=[0, 1, 2])
+    parser.add_argument('--payload-sizes', type=int, nargs='+', default=[1, 256, 4096])
+    parser.add_argument('--modes', nargs='+', default=['threaded', 'async'], choices=['threaded', 'async'])
+    parser.add_argument('--controller', default='tk', choices=['tk', 'kivy'],
+                        help="front end whose MQTTController is driven in threaded mode")
+    parser.add_argument('--quick', action='store_true', help="short run suitable for CI")
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--max-p99-ms', type=float, help="exit non-zero if any case p99 exceeds this")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.presses = min(args.presses, 100)
+        args.payload_sizes = args.payload_sizes[:2]
+
+    results = []
+    print(f"{'mode':<9}{'qos':>4}{'payload':>9}{'delivered':>13}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    with LoopbackBroker() as broker:
+        for mode in args.modes:
+            for qos in args.qos:
+                for payload_size in args.payload_sizes:
+                    result = run_case(broker, mode, qos, payload_size,
+                                      args.presses, args.rate, args.controller)
+                    results.append(result)
+                    print(format_row(result))
+
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump(results, handle, indent=2)
+
+    failed = [r for r in results if r['delivered'] < r['presses']]
+    if args.max_p99_ms is not None:
+        failed += [r for r in results if not r['p99_ms'] <= args.max_p99_ms]
+    if failed:
+        print(f"❌ {len(failed)} case(s) lost presses or exceeded the latency budget")
+        return 1
+    print("✅ All cases delivered within budget")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
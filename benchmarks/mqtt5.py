@@ -0,0 +1,95 @@
+"""
+MQTT 5 Benchmark
+Compares MQTT 3.1.1 and MQTT 5 per BRAKE press against the loopback broker:
+
+    bytes on the wire for each PUBLISH, as counted by the broker: plain QoS 0
+    (prebuilt packet), QoS 0 with a drone-ack stamp, and QoS 1
+
+    publish latency: time in the publish call at QoS 0 and press -> PUBACK at
+    QoS 1
+
+MQTT 5 presses carry a 5 second message expiry, a topic alias once the first
+press set it, and drone-ack stamps in user properties instead of the payload.
+
+Usage:
+    python -m benchmarks.mqtt5 --presses 500
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+import mqtt_wire as wire
+from benchmarks.latency import wait_for
+from cosmos_core import MQTTController
+from loopback_broker import LoopbackBroker
+
+
+def connected(broker, protocol):
+    controller = MQTTController()
+    if protocol == wire.MQTT5:
+        controller.enable_mqtt5(message_expiry=5)
+    controller.connect("localhost", broker.port, "", "")
+    if not wait_for(lambda: controller.connected and controller.session_subscribed, 5):
+        raise RuntimeError("controller did not connect")
+    return controller
+
+
+def press(broker, controller, presses, confirm):
+    """Press BRAKE `presses` times; returns (bytes per PUBLISH, seconds per press)"""
+    times = []
+    for _ in range(presses):
+        before = broker.publish_bytes
+        confirmed = controller.metrics['commands_confirmed']
+        started = time.perf_counter()
+        controller.publish_brake()
+        if confirm:
+            wait_for(lambda: controller.metrics['commands_confirmed'] > confirmed, 5)
+        times.append(time.perf_counter() - started)
+        wait_for(lambda: broker.publish_bytes > before, 5)
+    # The first press of a connection still carries the topic to set the alias
+    before = broker.publish_bytes
+    controller.publish_brake()
+    wait_for(lambda: broker.publish_bytes > before, 5)
+    before = broker.publish_bytes
+    controller.publish_brake()
+    wait_for(lambda: broker.publish_bytes > before, 5)
+    return broker.publish_bytes - before, times
+
+
+def scenarios(controller):
+    """(label, set up, PUBACK wait) for each way a press can go out"""
+    def plain():
+        controller.command_qos['brake'] = 0
+
+    def stamped():
+        controller.enable_command_acks(deadline=1.0)
+
+    def qos1():
+        controller.disable_command_acks()
+        controller.command_qos['brake'] = 1
+
+    return [("QoS 0", plain, False), ("QoS 0 + ack stamp", stamped, False), ("QoS 1", qos1, True)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COSMOS MQTT 3.1.1 vs MQTT 5 benchmark")
+    parser.add_argument('--presses', type=int, default=500)
+    args = parser.parse_args(argv)
+
+    with LoopbackBroker() as broker:
+        for protocol, name in ((wire.MQTT311, "MQTT 3.1.1"), (wire.MQTT5, "MQTT 5")):
+            controller = connected(broker, protocol)
+            for label, set_up, confirm in scenarios(controller):
+                set_up()
+                size, times = press(broker, controller, args.presses, confirm)
+                print(f"{name:11} {label:18} {size:3d} bytes  "
+                      f"p50 {statistics.median(times) * 1e6:8.1f} us  "
+                      f"p99 {sorted(times)[int(len(times) * 0.99)] * 1e6:8.1f} us")
+            controller.disconnect()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+Outbound Priority Benchmark
+BRAKE press -> drone delivery while background publishes saturate the uplink.
+
+The controller reaches the loopback broker through a throttled TCP relay, a
+stand-in for a slow cellular uplink, while a flood thread publishes status
+messages faster than the relay forwards them. Two setups are compared:
+
+    fifo    the flood goes straight to paho and BRAKE is queued behind it, as
+            before the outbound scheduler
+    lanes   the flood goes through publish_background() and BRAKE through the
+            safety lane
+
+Usage:
+    python -m benchmarks.priority --link-kbps 256 --flood-rate 400 --presses 20
+
+The lanes case lets background publishes through at the flood rate, so it is the
+link and max_backlog, not the token bucket, that hold them back.
+"""
+
+import argparse
+import socket
+import sys
+import threading
+import time
+
+from benchmarks.latency import DroneSubscriber, percentile, wait_for
+from cosmos_core import MQTTController
+from cosmos_core.scheduler import OutboundScheduler
+from loopback_broker import LoopbackBroker
+
+QUICKACK = getattr(socket, 'TCP_QUICKACK', None)
+
+
+class ThrottledLink:
+    """TCP relay to the broker whose uplink forwards at most `rate` bytes per second
+
+    Reads in small slices from a small receive buffer, so a backlog builds up in
+    the sender's socket, where it would on a real slow link.
+    """
+
+    def __init__(self, target_port, rate, chunk=512):
+        self.target_port = target_port
+        self.rate = rate
+        self.chunk = chunk
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.port = self.server.getsockname()[1]
+        self.sockets = []
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 2048)
+            upstream = socket.create_connection(("127.0.0.1", self.target_port))
+            upstream.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.sockets += [client, upstream]
+            threading.Thread(target=self._pump, args=(client, upstream, self.rate), daemon=True).start()
+            threading.Thread(target=self._pump, args=(upstream, client, None), daemon=True).start()
+
+    def _pump(self, source, sink, rate):
+        started = time.perf_counter()
+        forwarded = 0
+        while True:
+            try:
+                data = source.recv(self.chunk if rate else 65536)
+                if not data:
+                    break
+                if rate and QUICKACK is not None:
+                    # Ack what was read right away: with a window this small,
+                    # delayed acks would throttle the link below `rate`
+                    source.setsockopt(socket.IPPROTO_TCP, QUICKACK, 1)
+                if rate:
+                    forwarded += len(data)
+                    delay = started + forwarded / rate - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                sink.sendall(data)
+            except OSError:
+                break
+
+    def close(self):
+        self.server.close()
+        for sock in self.sockets:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+
+def run_case(broker, mode, args):
+    """Press BRAKE while flooding; returns sorted press -> delivery seconds"""
+    link = ThrottledLink(broker.port, args.link_kbps * 1000 / 8)
+    controller = MQTTController()
+    if mode == 'fifo':
+        controller.safety_commands = set()
+    else:
+        controller.outbound = OutboundScheduler(controller._send_background, controller._outbound_depth,
+                                                max_backlog=args.max_backlog, bulk_rate=args.flood_rate,
+                                                bulk_burst=args.flood_rate)
+    drone = DroneSubscriber(broker.host, broker.port, [controller.brake_topic], 0)
+    stop = threading.Event()
+    payload = b"s" * args.payload
+    try:
+        if not drone.subscribed.wait(5):
+            raise RuntimeError("drone subscriber did not subscribe")
+        controller.connect("127.0.0.1", link.port, "", "")
+        if not wait_for(lambda: controller.connected, 5):
+            raise RuntimeError("controller did not connect")
+
+        def flood():
+            interval = 1.0 / args.flood_rate
+            next_send = time.perf_counter()
+            index = 0
+            while not stop.is_set():
+                topic = f"cosmos/status/{index % args.keys}"
+                if mode == 'fifo':
+                    controller.client.publish(topic, payload)
+                else:
+                    controller.publish_background(topic, payload)
+                index += 1
+                next_send += interval
+                time.sleep(max(0.0, next_send - time.perf_counter()))
+
+        threading.Thread(target=flood, daemon=True).start()
+        # Let the backlog build before the first press
+        time.sleep(args.press_interval)
+        for _ in range(args.presses):
+            drone.expect(controller.brake_topic, time.perf_counter())
+            controller.publish_brake()
+            time.sleep(args.press_interval)
+        stop.set()
+        wait_for(lambda: drone.outstanding() == 0, args.drain)
+        waiting = drone.outstanding()
+    finally:
+        stop.set()
+        controller.disconnect()
+        drone.close()
+        link.close()
+    return sorted(drone.latencies), waiting
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COSMOS outbound priority benchmark")
+    parser.add_argument('--link-kbps', type=float, default=256.0, help="uplink bandwidth of the relay")
+    parser.add_argument('--flood-rate', type=float, default=400.0, help="background publishes per second")
+    parser.add_argument('--payload', type=int, default=200, help="bytes per background publish")
+    parser.add_argument('--keys', type=int, default=20, help="distinct background topics")
+    parser.add_argument('--max-backlog', type=int, default=2048,
+                        help="unsent bytes allowed in the socket before background traffic waits")
+    parser.add_argument('--presses', type=int, default=20)
+    parser.add_argument('--press-interval', type=float, default=0.2)
+    parser.add_argument('--drain', type=float, default=30.0, help="seconds to wait for late deliveries")
+    args = parser.parse_args(argv)
+
+    offered = args.flood_rate * (args.payload + 30) * 8 / 1000
+    print(f"Uplink {args.link_kbps:.0f} kbit/s, background offered {offered:.0f} kbit/s, "
+          f"{args.presses} BRAKE presses every {args.press_interval * 1000:.0f} ms")
+    with LoopbackBroker() as broker:
+        for mode in ('fifo', 'lanes'):
+            latencies, waiting = run_case(broker, mode, args)
+            note = f"  ({waiting} not delivered)" if waiting else ""
+            print(f"{mode:6} press -> delivery  p50 {percentile(latencies, 50) * 1000:8.1f} ms"
+                  f"  p99 {percentile(latencies, 99) * 1000:8.1f} ms"
+                  f"  max {(latencies[-1] if latencies else float('nan')) * 1000:8.1f} ms{note}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
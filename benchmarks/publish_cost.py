@@ -0,0 +1,87 @@
+"""
+Per-press Publish Cost Microbenchmark
+Measures caller-thread CPU time and transient allocations of one BRAKE press for:
+
+    legacy    the original path: client.publish() plus f-string logging inline
+    uncached  publish_brake() with the command packet cache disabled
+    cached    publish_brake() writing the pre-encoded PUBLISH packet
+
+Usage:
+    python -m benchmarks.publish_cost --presses 5000
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+from benchmarks.latency import HeadlessApp, load_controller_class, percentile, wait_for
+from loopback_broker import LoopbackBroker
+
+
+def legacy_press(controller):
+    """The publish path as it was before the command cache"""
+    payload = "1"
+    controller.client.publish(controller.brake_topic, payload)
+    controller.app.log_message(f"🛑 BRAKE command sent: {controller.brake_topic} = {payload}")
+    return True
+
+
+def measure(press, presses):
+    """Return sorted per-press CPU times (µs) and mean transient bytes per press"""
+    # Warm up caches and paho's internal state
+    for _ in range(100):
+        press()
+
+    cpu = []
+    for _ in range(presses):
+        started = time.thread_time_ns()
+        press()
+        cpu.append((time.thread_time_ns() - started) / 1000.0)
+        time.sleep(0)
+
+    # Allocation pass, separate because tracing slows every allocation down
+    tracemalloc.start()
+    total = 0
+    for _ in range(presses):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        press()
+        total += tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    return sorted(cpu), total / presses
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COSMOS per-press publish cost")
+    parser.add_argument('--presses', type=int, default=5000)
+    parser.add_argument('--controller', default='tk', choices=['tk', 'kivy'])
+    args = parser.parse_args(argv)
+
+    with LoopbackBroker() as broker:
+        controller = load_controller_class(args.controller)(HeadlessApp())
+        controller.connect(broker.host, broker.port, "", "")
+        if not wait_for(lambda: controller.connected, 5):
+            raise RuntimeError("controller did not connect")
+
+        def uncached():
+            controller.use_command_cache = False
+            return controller.publish_brake()
+
+        def cached():
+            controller.use_command_cache = True
+            return controller.publish_brake()
+
+        print(f"{'path':<10}{'cpu p50 µs':>12}{'cpu p99 µs':>12}{'bytes/press':>13}")
+        for label, press in (('legacy', lambda: legacy_press(controller)),
+                             ('uncached', uncached),
+                             ('cached', cached)):
+            cpu, allocated = measure(press, args.presses)
+            print(f"{label:<10}{percentile(cpu, 50):>12.2f}{percentile(cpu, 99):>12.2f}{allocated:>13.0f}")
+
+        controller.disconnect()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
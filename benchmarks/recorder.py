@@ -0,0 +1,82 @@
+"""
+Flight Recorder Benchmark
+Caller-thread CPU time of a BRAKE press with and without the flight recorder,
+the cost of one record written straight to the log, and how fast a recorded
+session replays against the loopback broker at speed 0.
+
+Usage:
+    python -m benchmarks.recorder --presses 5000 --records 200000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.latency import percentile, wait_for
+from benchmarks.publish_cost import measure
+from cosmos_core import MQTTController, create_client
+from flight_recorder import COMMAND, MESSAGE, FlightLog, FlightRecorder
+from loopback_broker import LoopbackBroker
+from replay import replay
+
+
+def write_cost(path, records):
+    """Nanoseconds per telemetry-sized record written, and bytes per record"""
+    recorder = FlightRecorder(path)
+    payload = b"12.5,3.2,87"
+    started = time.perf_counter_ns()
+    for _ in range(records):
+        recorder.write(MESSAGE, "", "telemetryCosmos", payload)
+    elapsed = time.perf_counter_ns() - started
+    recorder.close()
+    return elapsed / records, recorder.position / records, recorder.dropped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COSMOS flight recorder benchmark")
+    parser.add_argument('--presses', type=int, default=5000)
+    parser.add_argument('--records', type=int, default=200000, help="records written for the write cost")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory, LoopbackBroker() as broker:
+        session = os.path.join(directory, "session.flight")
+        controller = MQTTController()
+        controller.connect(broker.host, broker.port, "", "")
+        if not wait_for(lambda: controller.connected, 5):
+            raise RuntimeError("controller did not connect")
+
+        print(f"{'recorder':<10}{'cpu p50 µs':>12}{'cpu p99 µs':>12}{'bytes/press':>13}")
+        results = {}
+        for enabled in (False, True, False, True):
+            if enabled:
+                controller.enable_recorder(session)
+            cpu, allocated = measure(controller.publish_brake, args.presses)
+            if enabled:
+                controller.disable_recorder()
+            results[enabled] = percentile(cpu, 50)
+            label = "on" if enabled else "off"
+            print(f"{label:<10}{percentile(cpu, 50):>12.2f}{percentile(cpu, 99):>12.2f}{allocated:>13.0f}")
+        controller.disconnect()
+        print(f"Press overhead at p50: {results[True] - results[False]:+.2f} µs")
+
+        ns, size, dropped = write_cost(os.path.join(directory, "writes.flight"), args.records)
+        print(f"write(): {ns:.0f} ns and {size:.0f} bytes per telemetry record, {dropped} dropped")
+
+        records = FlightLog(session).records((COMMAND,))
+        client = create_client()
+        client.connect(broker.host, broker.port, 60)
+        client.loop_start()
+        started = time.perf_counter()
+        replay(records, lambda record: client.publish(record.topic, record.payload), 0)
+        elapsed = time.perf_counter() - started
+        client.disconnect()
+        client.loop_stop()
+        print(f"Replay at speed 0: {len(records)} commands in {elapsed:.3f}s "
+              f"({len(records) / elapsed:.0f}/s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
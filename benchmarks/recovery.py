@@ -0,0 +1,81 @@
+"""
+Link Recovery Benchmark
+Measures how fast MQTTController gets back to a usable link when the loopback
+broker drops every connection on purpose, and how long a full broker outage takes
+to recover from once the broker returns.
+
+Recovery time runs from paho noticing the loss until the CONNACK of the new
+connection, so it covers the backoff wait plus the TCP and MQTT handshakes.
+Persistent sessions skip the resubscribe round trip after the CONNACK.
+
+Usage:
+    python -m benchmarks.recovery --drops 20
+"""
+
+import argparse
+import sys
+import time
+
+from benchmarks.latency import HeadlessApp, load_controller_class, percentile, wait_for
+from loopback_broker import LoopbackBroker
+
+
+def drop_cycles(broker, controller, drops):
+    """Drop the link `drops` times; returns sorted recovery times in ms"""
+    for _ in range(drops):
+        before = len(controller.reconnect.stats.recoveries)
+        broker.drop_all()
+        if not wait_for(lambda: len(controller.reconnect.stats.recoveries) > before, 10):
+            raise RuntimeError("controller did not recover from a dropped link")
+        time.sleep(0.05)
+    return sorted(value * 1000.0 for value in controller.reconnect.stats.recoveries)
+
+
+def outage(broker, controller, seconds):
+    """Stop the broker for `seconds`, restart it on the same port; returns (recovery, attempts)"""
+    port = broker.port
+    broker.stop()
+    time.sleep(seconds)
+    broker = LoopbackBroker(port=port).start()
+    if not wait_for(lambda: controller.connected, 30):
+        raise RuntimeError("controller did not recover from the outage")
+    stats = controller.reconnect.stats
+    return broker, stats.last - seconds, stats.attempts[-1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COSMOS link recovery benchmark")
+    parser.add_argument('--drops', type=int, default=20)
+    parser.add_argument('--outage', type=float, default=2.0,
+                        help="seconds the broker stays down in the outage case")
+    parser.add_argument('--controller', default='tk', choices=['tk', 'kivy'])
+    args = parser.parse_args(argv)
+
+    broker = LoopbackBroker().start()
+    print(f"{'session':<12}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'attempts':>10}")
+    for label, clean in (('clean', True), ('persistent', False)):
+        controller = load_controller_class(args.controller)(HeadlessApp())
+        controller.clean_session = clean
+        controller.connect(broker.host, broker.port, "", "")
+        if not wait_for(lambda: controller.connected, 5):
+            raise RuntimeError("controller did not connect")
+        times = drop_cycles(broker, controller, args.drops)
+        attempts = controller.reconnect.stats.summary()['attempts']
+        print(f"{label:<12}{percentile(times, 50):>10.1f}{percentile(times, 95):>10.1f}"
+              f"{times[-1]:>10.1f}{attempts:>10.1f}")
+        controller.disconnect()
+
+    controller = load_controller_class(args.controller)(HeadlessApp())
+    controller.connect(broker.host, broker.port, "", "")
+    if not wait_for(lambda: controller.connected, 5):
+        raise RuntimeError("controller did not connect")
+    broker, after, attempts = outage(broker, controller, args.outage)
+    print(f"{args.outage:.1f}s outage: back {after * 1000.0:.0f} ms after the broker returned "
+          f"({attempts} attempts)")
+    controller.disconnect()
+    broker.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
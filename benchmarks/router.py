@@ -0,0 +1,113 @@
+"""
+Message Router Benchmark
+Cost of finding the handlers for one incoming message as the number of
+subscriptions grows, with the compiled topic trie and with a scan that checks
+every filter in turn (mqtt_wire.topic_matches), as a handler list would.
+
+The subscriptions model a fleet: per drone, "drones/<n>/status",
+"drones/<n>/telemetry/+" and "drones/<n>/cmd/#", plus a few fleet-wide
+wildcards. Messages go to random drones. "trie" is a cold lookup (cache
+cleared before each message), "trie cached" the steady state where the same
+topics keep arriving, and "dispatch" the full MessageRouter.dispatch() with
+network-context handlers that do nothing. With more distinct topics than the
+match cache holds, "trie cached" falls back to the cold cost.
+
+Usage:
+    python -m benchmarks.router --subscriptions 100,1000,10000 --messages 20000
+"""
+
+import argparse
+import random
+import sys
+import time
+
+import mqtt_wire as wire
+from cosmos_core.router import MessageRouter
+
+FLEET_FILTERS = ["drones/+/status", "drones/+/ack", "fleet/#", "$SYS/#"]
+
+
+class Message:
+    __slots__ = ('topic', 'payload')
+
+    def __init__(self, topic, payload=b""):
+        self.topic = topic
+        self.payload = payload
+
+
+def build_filters(count):
+    """About `count` filters: three per drone plus the fleet-wide ones"""
+    filters = list(FLEET_FILTERS)
+    drone = 0
+    while len(filters) < count:
+        filters += [f"drones/{drone}/status", f"drones/{drone}/telemetry/+", f"drones/{drone}/cmd/#"]
+        drone += 1
+    return filters[:count], max(drone, 1)
+
+
+def build_topics(drones, messages, seed=1):
+    rng = random.Random(seed)
+    shapes = ["drones/{}/status", "drones/{}/telemetry/battery", "drones/{}/cmd/brake/ack",
+              "drones/{}/ack"]
+    return [rng.choice(shapes).format(rng.randrange(drones)) for _ in range(messages)]
+
+
+def per_message(run, items):
+    """Microseconds per item for run(items)"""
+    started = time.perf_counter()
+    run(items)
+    return (time.perf_counter() - started) / len(items) * 1e6
+
+
+def measure(count, args):
+    filters, drones = build_filters(count)
+    topics = build_topics(drones, args.messages)
+    router = MessageRouter()
+    for topic_filter in filters:
+        router.route(topic_filter, lambda msg: None)
+    trie = router.trie
+
+    def scan(topics):
+        for topic in topics:
+            [topic_filter for topic_filter in filters if wire.topic_matches(topic_filter, topic)]
+
+    def cold(topics):
+        for topic in topics:
+            trie.cache = {}
+            trie.match(topic)
+
+    def cached(topics):
+        for topic in topics:
+            trie.match(topic)
+
+    def dispatch(messages):
+        for msg in messages:
+            router.dispatch(msg)
+
+    # The scan is slow with many filters; a slice of the messages is enough
+    scanned = topics[:max(100, args.messages * 100 // max(count, 100))]
+    results = {'linear scan': per_message(scan, scanned), 'trie': per_message(cold, topics)}
+    cached(topics)
+    results['trie cached'] = per_message(cached, topics)
+    results['dispatch'] = per_message(dispatch, [Message(topic) for topic in topics])
+    return len(filters), results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COSMOS message router benchmark")
+    parser.add_argument('--subscriptions', default="100,1000,10000",
+                        help="comma-separated subscription counts")
+    parser.add_argument('--messages', type=int, default=20000, help="messages matched per count")
+    args = parser.parse_args(argv)
+
+    print(f"Per-message matching cost in microseconds, {args.messages} messages")
+    print(f"{'filters':>8}  {'linear scan':>12}  {'trie':>8}  {'trie cached':>12}  {'dispatch':>9}")
+    for count in (int(value) for value in args.subscriptions.split(',')):
+        filters, results = measure(count, args)
+        print(f"{filters:8d}  {results['linear scan']:12.2f}  {results['trie']:8.2f}"
+              f"  {results['trie cached']:12.2f}  {results['dispatch']:9.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
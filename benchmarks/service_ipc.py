@@ -0,0 +1,99 @@
+"""
+Controller Service Benchmark
+Press -> drone delivery for BRAKE sent by the app's own controller and through
+the controller service running in another process, as the Android foreground
+service does. The difference is the cost of the local socket hop: one JSON line
+from the UI process, read and dispatched by the service.
+
+Also reports the UI -> service -> reply round trip (service_call_seconds).
+
+Usage:
+    python -m benchmarks.service_ipc --presses 500 --rate 50
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.latency import DroneSubscriber, summarize, wait_for
+from cosmos_core import MQTTController
+from cosmos_core.service import ControllerService, ServiceClient
+from loopback_broker import LoopbackBroker
+
+
+def serve(address, stop):
+    """Service process: a controller behind the local socket until stop is set"""
+    service = ControllerService(MQTTController(), address).start()
+    stop.wait()
+    service.controller.disconnect()
+    service.stop()
+
+
+def press_loop(sender, drone, topic, presses, rate):
+    interval = 1.0 / rate
+    next_press = time.perf_counter()
+    for _ in range(presses):
+        drone.expect(topic, time.perf_counter())
+        sender.publish_brake()
+        next_press += interval
+        time.sleep(max(0.0, next_press - time.perf_counter()))
+    wait_for(lambda: drone.outstanding() == 0, 5)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COSMOS controller service IPC benchmark")
+    parser.add_argument('--presses', type=int, default=500, help="presses per path")
+    parser.add_argument('--rate', type=float, default=50.0, help="presses per second")
+    args = parser.parse_args(argv)
+
+    context = multiprocessing.get_context('spawn')
+    results = []
+    with LoopbackBroker() as broker, tempfile.TemporaryDirectory() as directory:
+        local = MQTTController()
+        topic = local.brake_topic
+        drone = DroneSubscriber(broker.host, broker.port, [topic], 0)
+        if not drone.subscribed.wait(5):
+            raise RuntimeError("drone subscriber did not subscribe")
+
+        local.connect(broker.host, broker.port, "", "")
+        if not wait_for(lambda: local.connected, 5):
+            raise RuntimeError("controller did not connect")
+        press_loop(local, drone, topic, args.presses, args.rate)
+        results.append(("in-process controller", summarize(drone.latencies, args.presses)))
+        local.disconnect()
+
+        address = os.path.join(directory, "controller.sock")
+        stop = context.Event()
+        process = context.Process(target=serve, args=(address, stop), daemon=True)
+        process.start()
+        client = ServiceClient(address)
+        try:
+            client.open(wait=10)
+            client.connect(broker.host, broker.port, "", "")
+            if not wait_for(lambda: client.connected, 5):
+                raise RuntimeError("service did not connect")
+            drone.latencies = []
+            press_loop(client, drone, topic, args.presses, args.rate)
+            results.append(("through the service", summarize(drone.latencies, args.presses)))
+            wait_for(lambda: client.metrics.histograms['service_call_seconds'].count >= args.presses, 5)
+        finally:
+            client.close()
+            stop.set()
+            process.join(5)
+            drone.close()
+
+    print(f"{args.presses} BRAKE presses at {args.rate:.0f}/s, press -> drone delivery")
+    for label, result in results:
+        print(f"{label:22}  p50 {result['p50_ms']:7.3f} ms  p99 {result['p99_ms']:7.3f} ms"
+              f"  max {result['max_ms']:7.3f} ms  ({result['delivered']} delivered)")
+    round_trip = client.metrics.histograms['service_call_seconds']
+    print(f"{'UI -> service -> reply':22}  p50 {round_trip.percentile(50) * 1000:7.3f} ms"
+          f"  p99 {round_trip.percentile(99) * 1000:7.3f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Telemetry Throughput Benchmark
+Measures sustained telemetry decode rate per core for each payload codec, the
+end-to-end receive rate through the loopback broker into MQTTController, and
+memory growth over a long run.
+
+Usage:
+    python -m benchmarks.telemetry --messages 200000
+"""
+
+import argparse
+import array
+import sys
+import time
+import tracemalloc
+
+from benchmarks.latency import HeadlessApp, create_client, load_controller_class, wait_for
+from loopback_broker import LoopbackBroker
+from telemetry import TelemetryHub
+
+CHANNELS = ["altitude", "vx", "vy", "vz", "battery", "heading"]
+
+PAYLOADS = {
+    'float32': array.array('f', [12.5, 0.1, -0.2, 0.05, 87.0, 271.0]).tobytes(),
+    'float64': array.array('d', [12.5, 0.1, -0.2, 0.05, 87.0, 271.0]).tobytes(),
+    'csv': b"12.50,0.10,-0.20,0.05,87.00,271.00",
+}
+
+
+def decode_rate(codec, messages):
+    """Messages per CPU second for the decode + ring buffer path"""
+    hub = TelemetryHub({"telemetryCosmos": (codec, CHANNELS)})
+    payload = PAYLOADS[codec]
+    started = time.thread_time()
+    for _ in range(messages):
+        hub.handle("telemetryCosmos", payload)
+    return messages / (time.thread_time() - started)
+
+
+def memory_growth(messages):
+    """Traced memory growth in bytes across a long decode run"""
+    hub = TelemetryHub({"telemetryCosmos": ('csv', CHANNELS)})
+    payload = PAYLOADS['csv']
+    for _ in range(10000):
+        hub.handle("telemetryCosmos", payload)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(messages):
+        hub.handle("telemetryCosmos", payload)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before
+
+
+def end_to_end(messages, controller_name):
+    """Received telemetry messages per wall second through the broker and controller"""
+    with LoopbackBroker() as broker:
+        controller = load_controller_class(controller_name)(HeadlessApp())
+        controller.telemetry.add_topic("telemetryCosmos", 'csv', CHANNELS)
+        controller.connect(broker.host, broker.port, "", "")
+        if not wait_for(lambda: controller.connected, 5):
+            raise RuntimeError("controller did not connect")
+        time.sleep(0.1)
+
+        publisher = create_client()
+        publisher.connect(broker.host, broker.port, 60)
+        publisher.loop_start()
+        started = time.perf_counter()
+        for _ in range(messages):
+            publisher.publish("telemetryCosmos", PAYLOADS['csv'])
+        wait_for(lambda: controller.telemetry.messages >= messages, 30)
+        elapsed = time.perf_counter() - started
+        received = controller.telemetry.messages
+
+        publisher.disconnect()
+        publisher.loop_stop()
+        controller.disconnect()
+    return received, received / elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COSMOS telemetry throughput benchmark")
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--e2e-messages', type=int, default=20000)
+    parser.add_argument('--controller', default='tk', choices=['tk', 'kivy'])
+    args = parser.parse_args(argv)
+
+    print("Decode + ring buffer, messages per CPU second (one core):")
+    for codec in PAYLOADS:
+        print(f"  {codec:<8}{decode_rate(codec, args.messages):>12,.0f}")
+
+    growth = memory_growth(args.messages)
+    print(f"Memory growth over {args.messages:,} messages: {growth:,} bytes")
+
+    received, rate = end_to_end(args.e2e_messages, args.controller)
+    print(f"End to end through the loopback broker: {received:,}/{args.e2e_messages:,} "
+          f"messages at {rate:,.0f} msg/s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+Tk Bridge Stress Harness
+Floods the Tk front end's MQTTController with incoming messages and connection
+state changes from several threads, the way paho's network thread would under
+load. It checks that the Tk mainloop stays responsive and that no widget is
+touched off the main thread.
+
+Responsiveness is the lateness of a 10 ms heartbeat timer on the mainloop. With
+a display the real COSMOSMQTTApp is used. Without one (or with --headless), a
+stand-in root runs the same after() timers and a stand-in app wires the same
+LogPipeline/UIDispatcher/PollingBridge.
+
+Usage:
+    python -m benchmarks.tk_bridge --threads 4 --messages 50000
+"""
+
+import argparse
+import heapq
+import itertools
+import sys
+import threading
+import time
+import types
+
+from benchmarks.latency import percentile
+from log_pipeline import LogPipeline
+from ui_dispatch import PollingBridge, UIDispatcher
+
+HEARTBEAT_MS = 10
+
+
+class FakeTkRoot:
+    """Single-threaded timer loop with Tk's after() signature"""
+
+    def __init__(self):
+        self.timers = []
+        self.order = itertools.count()
+        self.thread = threading.get_ident()
+
+    def after(self, ms, fn, *args):
+        heapq.heappush(self.timers, (time.perf_counter() + ms / 1000.0, next(self.order), fn, args))
+
+    def run(self, until):
+        """Run timers until until() is true"""
+        while not until():
+            if not self.timers:
+                time.sleep(0.001)
+                continue
+            due, _, fn, args = self.timers[0]
+            wait = due - time.perf_counter()
+            if wait > 0:
+                time.sleep(min(wait, 0.001))
+                continue
+            heapq.heappop(self.timers)
+            fn(*args)
+
+
+class HeadlessTkApp:
+    """The parts of COSMOSMQTTApp the controller talks to, without widgets"""
+
+    def __init__(self, root, controller_class):
+        self.root = root
+        self.log_pipeline = LogPipeline(max_lines=500)
+        self.mqtt_controller = controller_class(self)
+        self.dispatcher = UIDispatcher(max_calls=64)
+        self.dispatcher.on('connected', self.apply_connection_status)
+        self.bridge = PollingBridge(self.dispatcher, root.after,
+                                    busy=self.mqtt_controller.commands_in_flight)
+        self.status_updates = 0
+        self.rendered_lines = 0
+        self.off_thread = 0
+        self.bridge.start()
+        root.after(0, self.flush_log)
+
+    def log_message(self, message):
+        self.log_pipeline.post(message)
+
+    def update_connection_status(self, connected):
+        self.dispatcher.post('connected', connected)
+
+    def apply_connection_status(self, connected):
+        if threading.get_ident() != self.root.thread:
+            self.off_thread += 1
+        self.status_updates += 1
+
+    def flush_log(self):
+        lines, _ = self.log_pipeline.take_batch()
+        self.rendered_lines += len(lines)
+        self.root.after(int(self.log_pipeline.interval * 1000), self.flush_log)
+
+
+def flood(controller, count):
+    """Deliver `count` messages and link flaps straight into the controller callbacks"""
+    status = types.SimpleNamespace(topic="cosmos/status", payload=b"ok")
+    telemetry = types.SimpleNamespace(topic="telemetryCosmos", payload=b"12.5,3.0,87")
+    for index in range(count):
+        controller.on_message(None, None, telemetry if index % 2 else status)
+        if index % 500 == 0:
+            controller.events.emit('link_lost', (1, 0.1))
+            controller.events.emit('connected', (0.1, True))
+
+
+def stress(app, root, threads, messages):
+    """Flood the controller while the mainloop runs; returns heartbeat lateness in ms"""
+    lateness = []
+
+    def heartbeat(due):
+        lateness.append(max(0.0, time.perf_counter() - due) * 1000)
+        root.after(HEARTBEAT_MS, heartbeat, time.perf_counter() + HEARTBEAT_MS / 1000.0)
+
+    root.after(HEARTBEAT_MS, heartbeat, time.perf_counter() + HEARTBEAT_MS / 1000.0)
+    writers = [threading.Thread(target=flood, args=(app.mqtt_controller, messages // threads))
+               for _ in range(threads)]
+    for writer in writers:
+        writer.start()
+    finished = []
+
+    def done():
+        if not finished and not any(writer.is_alive() for writer in writers):
+            # Give the mainloop one more idle poll to drain what is left
+            finished.append(time.perf_counter() + 0.2)
+        return bool(finished) and time.perf_counter() > finished[0]
+
+    if isinstance(root, FakeTkRoot):
+        root.run(done)
+    else:
+        def check():
+            if done():
+                root.quit()
+            else:
+                root.after(50, check)
+        root.after(50, check)
+        root.mainloop()
+    return sorted(lateness)
+
+
+def make_app(headless):
+    """Return (app, root), preferring the real Tk app when a display is available"""
+    from cosmos_mqtt_controller import MQTTController
+    if not headless:
+        try:
+            from cosmos_mqtt_controller import COSMOSMQTTApp
+            app = COSMOSMQTTApp()
+            return app, app.root
+        except Exception as e:
+            print(f"No Tk display ({e}), using the headless stand-in")
+    root = FakeTkRoot()
+    return HeadlessTkApp(root, MQTTController), root
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COSMOS Tk bridge stress harness")
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--messages', type=int, default=50000)
+    parser.add_argument('--headless', action='store_true')
+    args = parser.parse_args(argv)
+
+    app, root = make_app(args.headless)
+    started = time.perf_counter()
+    lateness = stress(app, root, args.threads, args.messages)
+    elapsed = time.perf_counter() - started
+    metrics = app.mqtt_controller.metrics
+    print(f"{args.messages} messages from {args.threads} threads in {elapsed:.2f}s "
+          f"({metrics['messages_received'] + metrics['telemetry_received']} handled)")
+    print(f"heartbeat lateness p50 {percentile(lateness, 50):.2f} ms  "
+          f"p99 {percentile(lateness, 99):.2f} ms  max {lateness[-1]:.2f} ms")
+    if isinstance(app, HeadlessTkApp):
+        print(f"{app.status_updates} status updates applied, {app.off_thread} off the main thread, "
+              f"{app.rendered_lines} log lines rendered")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
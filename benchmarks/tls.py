@@ -0,0 +1,167 @@
+"""
+TLS Reconnect Benchmark
+Drops the link to a local TLS broker with a self-signed certificate over and over
+and measures link lost -> CONNACK, with TLS session resumption and with every
+reconnect forced into a full handshake, next to plain TCP. A relay in front of
+the broker adds `--rtt-ms` of round trip, since resumption mostly saves round
+trips (TLS 1.2) and certificate checks (TLS 1.3), not loopback bandwidth. Also
+reports the TLS handshakes alone and the cost of building the SSLContext against
+reusing the cached one.
+
+Usage:
+    python -m benchmarks.tls --drops 30 --rtt-ms 20
+"""
+
+import argparse
+import queue
+import socket
+import ssl
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.latency import wait_for
+from cosmos_core import MQTTController
+from cosmos_core.tls import TLSContext, tls_context
+from loopback_broker import LoopbackBroker, self_signed_context
+
+
+class DelayRelay:
+    """TCP relay to a local port that delays every chunk by half the round trip"""
+
+    def __init__(self, target_port, rtt):
+        self.target_port = target_port
+        self.delay = rtt / 2
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.port = self.server.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            upstream = socket.create_connection(("127.0.0.1", self.target_port))
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            for source, sink in ((client, upstream), (upstream, client)):
+                chunks = queue.Queue()
+                threading.Thread(target=self._read, args=(source, chunks), daemon=True).start()
+                threading.Thread(target=self._write, args=(sink, chunks), daemon=True).start()
+
+    def _read(self, source, chunks):
+        """Stamp every chunk with its delivery time, so queued chunks are not delayed twice"""
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                chunks.put((time.perf_counter() + self.delay, data))
+        except OSError:
+            pass
+        chunks.put((0.0, b""))
+
+    def _write(self, sink, chunks):
+        while True:
+            due, data = chunks.get()
+            if not data:
+                break
+            time.sleep(max(0.0, due - time.perf_counter()))
+            try:
+                sink.sendall(data)
+            except OSError:
+                break
+        try:
+            sink.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        self.server.close()
+
+
+def reconnect_times(broker, port, drops, certfile=None, resume=True):
+    """Seconds from each dropped link to the next CONNACK"""
+    controller = MQTTController()
+    controller.reconnect.backoff.initial = 0.001
+    controller.reconnect.backoff.jitter = 0.0
+    if certfile is not None:
+        controller.enable_tls(ca_file=certfile)
+        if not resume:
+            controller.add_listener(lambda event, data: controller.tls.sessions.clear()
+                                    if event == 'link_lost' else None)
+    if not controller.connect("localhost", port, "", ""):
+        raise RuntimeError("controller did not connect")
+    wait_for(lambda: controller.connected, 5)
+    times = []
+    for _ in range(drops):
+        connects = controller.metrics['connects']
+        started = time.perf_counter()
+        broker.drop_all()
+        if not wait_for(lambda: controller.metrics['connects'] > connects, 5):
+            raise RuntimeError("controller did not reconnect")
+        times.append(time.perf_counter() - started)
+    controller.disconnect()
+    return times
+
+
+def context_cost(certfile, repeats=20):
+    """Mean seconds to build a verifying SSLContext, and to fetch the cached one"""
+    started = time.perf_counter()
+    for _ in range(repeats):
+        context = TLSContext()
+        context.load_verify_locations(certfile)
+        context.load_default_certs()
+    built = (time.perf_counter() - started) / repeats
+    tls_context(ca_file=certfile)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        tls_context(ca_file=certfile)
+    return built, (time.perf_counter() - started) / repeats
+
+
+def report(name, times):
+    print(f"{name:30} median {statistics.median(times) * 1000:7.2f} ms"
+          f"  p90 {sorted(times)[int(len(times) * 0.9)] * 1000:7.2f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COSMOS TLS reconnect benchmark")
+    parser.add_argument('--drops', type=int, default=30)
+    parser.add_argument('--rtt-ms', type=float, default=20.0, help="round trip added by the relay")
+    args = parser.parse_args(argv)
+    rtt = args.rtt_ms / 1000.0
+
+    with tempfile.TemporaryDirectory() as directory:
+        server, certfile = self_signed_context(directory)
+        with LoopbackBroker() as plain:
+            relay = DelayRelay(plain.port, rtt)
+            report("plain TCP", reconnect_times(plain, relay.port, args.drops))
+            relay.close()
+        with LoopbackBroker(ssl_context=server) as broker:
+            relay = DelayRelay(broker.port, rtt)
+            for version in (ssl.TLSVersion.TLSv1_2, ssl.TLSVersion.TLSv1_3):
+                server.maximum_version = version
+                label = "TLS 1.2" if version == ssl.TLSVersion.TLSv1_2 else "TLS 1.3"
+                for kind, resume in (("full handshake", False), ("resumed session", True)):
+                    tls = tls_context(ca_file=certfile)
+                    tls.full.reset()
+                    tls.resumed.reset()
+                    tls.sessions.clear()
+                    report(f"{label}, {kind}", reconnect_times(broker, relay.port, args.drops, certfile, resume))
+                    for name, histogram in (("full", tls.full), ("resumed", tls.resumed)):
+                        if histogram.count:
+                            print(f"    {histogram.count} {name} handshakes, "
+                                  f"p50 {histogram.percentile(50) * 1000:.2f} ms")
+            relay.close()
+        built, cached = context_cost(certfile)
+        print(f"SSLContext: built {built * 1000:.2f} ms, cached {cached * 1e6:.2f} us")
+    print(ssl.OPENSSL_VERSION)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
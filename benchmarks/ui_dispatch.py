@@ -0,0 +1,111 @@
+"""
+UI Dispatch Benchmark
+Floods status events from a background thread at a 60 fps simulated frame loop
+and compares frame times for:
+
+    per-event   one frame callback per event, as Clock.schedule_once(update_ui) did
+    coalesced   UIDispatcher, which applies the latest status once per frame
+
+Each applied update does a fixed amount of simulated widget work.
+
+Usage:
+    python -m benchmarks.ui_dispatch --rate 20000 --seconds 2
+"""
+
+import argparse
+import collections
+import sys
+import threading
+import time
+
+from benchmarks.latency import percentile
+from ui_dispatch import UIDispatcher
+
+FRAME = 1.0 / 60
+
+
+def widget_work(message, cost):
+    """Stand-in for re-texturing a label: burn `cost` seconds of CPU"""
+    until = time.perf_counter() + cost
+    while time.perf_counter() < until:
+        pass
+    return message
+
+
+def flood(post, rate, seconds):
+    """Call post(message) `rate` times a second for `seconds`"""
+    interval = 1.0 / rate
+    started = time.perf_counter()
+    sent = 0
+    while time.perf_counter() - started < seconds:
+        post(f"status {sent}")
+        sent += 1
+        # Send in small bursts, like paho delivering a backlog of packets
+        if sent % 50 == 0:
+            time.sleep(max(0.0, started + sent * interval - time.perf_counter()))
+    return sent
+
+
+def run(mode, rate, seconds, cost):
+    """Return (frame times in ms, updates applied) for one mode"""
+    if mode == 'per-event':
+        queue = collections.deque()
+
+        def post(message):
+            queue.append(message)
+
+        def frame():
+            applied = 0
+            for _ in range(len(queue)):
+                widget_work(queue.popleft(), cost)
+                applied += 1
+            return applied
+    else:
+        dispatcher = UIDispatcher()
+        counter = [0]
+
+        def show(message):
+            widget_work(message, cost)
+            counter[0] += 1
+
+        dispatcher.on('status', show)
+
+        def post(message):
+            dispatcher.post('status', message)
+
+        def frame():
+            before = counter[0]
+            dispatcher.run_frame()
+            return counter[0] - before
+
+    writer = threading.Thread(target=flood, args=(post, rate, seconds))
+    writer.start()
+    frame_ms = []
+    applied = 0
+    while writer.is_alive():
+        started = time.perf_counter()
+        applied += frame()
+        elapsed = time.perf_counter() - started
+        frame_ms.append(elapsed * 1000)
+        time.sleep(max(0.0, FRAME - elapsed))
+    applied += frame()
+    return sorted(frame_ms), applied
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COSMOS UI dispatch benchmark")
+    parser.add_argument('--rate', type=float, default=20000.0, help="events per second")
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--cost-us', type=float, default=20.0, help="widget work per update")
+    args = parser.parse_args(argv)
+
+    print(f"{'mode':<12}{'frame p50 ms':>14}{'frame p99 ms':>14}{'max ms':>10}{'updates':>10}")
+    for mode in ('per-event', 'coalesced'):
+        frame_ms, applied = run(mode, args.rate, args.seconds, args.cost_us / 1e6)
+        print(f"{mode:<12}{percentile(frame_ms, 50):>14.2f}{percentile(frame_ms, 99):>14.2f}"
+              f"{frame_ms[-1]:>10.2f}{applied:>10}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
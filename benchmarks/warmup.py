@@ -0,0 +1,120 @@
+"""
+Connection Warm-up Benchmark
+Measures the first BRAKE after launch and after an idle gap against a loopback
+broker whose path goes cold: the first packet after `--idle-ms` of silence waits
+`--wake-ms`, like a radio leaving power save.
+
+    cold start      connect when BRAKE is pressed, then publish
+    pre-connected   connected (and resolved) at app open, so BRAKE only publishes
+    idle gap        BRAKE after sitting idle, with and without keep-warm echoes
+
+Also times a broker lookup through the resolver and from the DNS cache.
+
+Usage:
+    python -m benchmarks.warmup --presses 5 --idle-ms 300 --wake-ms 50
+"""
+
+import argparse
+import statistics
+import sys
+import time
+
+from benchmarks.latency import wait_for
+from cosmos_core import MQTTController
+from cosmos_core.warmup import DNSCache
+from loopback_broker import LoopbackBroker
+
+
+def connected_controller(broker, keep_warm=None):
+    controller = MQTTController()
+    controller.command_qos['brake'] = 1
+    if keep_warm is not None:
+        controller.enable_keep_warm(interval=keep_warm, minimum=keep_warm / 4, maximum=keep_warm)
+    controller.connect("localhost", broker.port, "", "")
+    if not wait_for(lambda: controller.connected and controller.session_subscribed, 5):
+        raise RuntimeError("controller did not connect")
+    return controller
+
+
+def press_to_puback(controller, started=None):
+    """Press BRAKE and wait for the broker's PUBACK; seconds from `started` (default now)"""
+    confirmed = []
+    controller.add_listener(lambda event, data: confirmed.append(time.perf_counter())
+                            if event == 'command_confirmed' else None)
+    started = time.perf_counter() if started is None else started
+    controller.publish_brake()
+    if not wait_for(lambda: confirmed, 5):
+        raise RuntimeError("BRAKE was not confirmed")
+    return confirmed[0] - started
+
+
+def cold_start(broker):
+    """Connect at the press, as the app did before warm-up"""
+    controller = MQTTController()
+    controller.command_qos['brake'] = 1
+    started = time.perf_counter()
+    controller.connect("localhost", broker.port, "", "")
+    wait_for(lambda: controller.connected and controller.session_subscribed, 5)
+    elapsed = press_to_puback(controller, started)
+    controller.disconnect()
+    return elapsed
+
+
+def pre_connected(broker):
+    controller = connected_controller(broker)
+    elapsed = press_to_puback(controller)
+    controller.disconnect()
+    return elapsed
+
+
+def after_idle(broker, idle, keep_warm):
+    controller = connected_controller(broker, keep_warm)
+    time.sleep(idle)
+    elapsed = press_to_puback(controller)
+    controller.disconnect()
+    return elapsed
+
+
+def lookup_cost(host, repeats=200):
+    """Mean seconds per lookup of host: (resolver, cache hit)"""
+    cache = DNSCache()
+    started = time.perf_counter()
+    for _ in range(repeats):
+        DNSCache(resolver=cache.resolver).resolve(host, 1883)
+    uncached = (time.perf_counter() - started) / repeats
+    cache.resolve(host, 1883)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        cache.resolve(host, 1883)
+    return uncached, (time.perf_counter() - started) / repeats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COSMOS connection warm-up benchmark")
+    parser.add_argument('--presses', type=int, default=5, help="runs per scenario")
+    parser.add_argument('--idle-ms', type=float, default=300.0, help="silence before the path goes cold")
+    parser.add_argument('--wake-ms', type=float, default=50.0, help="cost of waking a cold path")
+    parser.add_argument('--gap-ms', type=float, default=1000.0, help="idle time before the press")
+    args = parser.parse_args(argv)
+    idle, gap = args.idle_ms / 1000.0, args.gap_ms / 1000.0
+
+    with LoopbackBroker(idle_timeout=idle, wake_delay=args.wake_ms / 1000.0) as broker:
+        scenarios = [
+            ("cold start (connect at press)", lambda: cold_start(broker)),
+            ("pre-connected", lambda: pre_connected(broker)),
+            ("after idle gap, no keep-warm", lambda: after_idle(broker, gap, None)),
+            ("after idle gap, keep-warm", lambda: after_idle(broker, gap, idle / 2)),
+        ]
+        for name, scenario in scenarios:
+            times = [scenario() for _ in range(args.presses)]
+            print(f"{name:32} median {statistics.median(times) * 1000:7.2f} ms"
+                  f"  max {max(times) * 1000:7.2f} ms")
+        print(f"{broker.wakeups} cold wake-ups at the broker")
+
+    uncached, cached = lookup_cost("localhost")
+    print(f"lookup of localhost: resolver {uncached * 1e6:.1f} us, cache hit {cached * 1e6:.2f} us")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""
+COSMOS Command Packet Cache
+Pre-encodes the complete QoS 0 PUBLISH packet for every known command once at
+connect time, so an emergency press only hands prebuilt bytes to the client
+instead of re-encoding the topic and payload on every press.
+
+For MQTT 5 connections the packets carry properties such as the message expiry.
+A command with a topic alias gets two packets: the first send carries the topic
+and sets the alias, every later one carries only the alias.
+"""
+
+import mqtt_wire as wire
+
+
+class CommandPacketCache:
+    """Prebuilt PUBLISH packets keyed by command name"""
+
+    def __init__(self):
+        self.packets = {}
+        # name -> alias-only packet that replaces the first packet once sent
+        self.aliased = {}
+        self.infos = {}
+
+    def build(self, commands, properties=None, aliases=None):
+        """Encode every command; commands maps name -> (topic, payload)
+
+        With properties (a list of MQTT 5 (identifier, value) pairs, possibly
+        empty) MQTT 5 packets are built; aliases maps name -> topic alias.
+        """
+        # Imported here so importing the cache does not load paho at app start
+        from paho.mqtt.client import MQTTMessageInfo
+        aliases = aliases or {}
+        self.aliased = {}
+        if properties is None:
+            self.packets = {name: wire.encode_publish(topic, payload)
+                            for name, (topic, payload) in commands.items()}
+        else:
+            self.packets = {}
+            for name, (topic, payload) in commands.items():
+                alias = aliases.get(name)
+                if alias is None:
+                    self.packets[name] = wire.encode_publish(topic, payload, properties=properties)
+                    continue
+                with_alias = list(properties) + [(wire.TOPIC_ALIAS, alias)]
+                self.packets[name] = wire.encode_publish(topic, payload, properties=with_alias)
+                self.aliased[name] = wire.encode_publish("", payload, properties=with_alias)
+        # One reusable info object per command keeps the press path allocation free
+        self.infos = {name: MQTTMessageInfo(0) for name in self.packets}
+
+    def clear(self):
+        """Forget every packet, e.g. after a disconnect"""
+        self.packets = {}
+        self.aliased = {}
+        self.infos = {}
+
+    def __contains__(self, name):
+        return name in self.packets
+
+    def send(self, client, name, urgent=False):
+        """Queue the prebuilt packet for a command, returning False if it is not cached"""
+        packet = self.packets.get(name)
+        if packet is None:
+            return False
+        wire.queue_raw_publish(client, packet, self.infos[name], urgent)
+        if self.aliased:
+            aliased = self.aliased.pop(name, None)
+            if aliased is not None:
+                # The broker knows the alias from now on
+                self.packets[name] = aliased
+        return True
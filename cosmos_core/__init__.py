@@ -0,0 +1,12 @@
+"""
+COSMOS Core
+The headless controller shared by the Kivy app (main.py), the Tk/Pydroid app
+(cosmos_mqtt_controller.py), the benchmarks and load tests. Nothing in here
+imports a UI toolkit.
+"""
+
+from cosmos_core.controller import MQTTController, create_client, preload_client
+from cosmos_core.events import EventBus
+from cosmos_core.metrics import ControllerMetrics
+
+__all__ = ['MQTTController', 'create_client', 'preload_client', 'EventBus', 'ControllerMetrics']
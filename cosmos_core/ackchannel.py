@@ -0,0 +1,233 @@
+"""
+COSMOS Drone Acknowledgement Channel
+Request/response on top of MQTT so the controller learns that the drone acted on
+a command, not just that the broker received it.
+
+With acks enabled, a command payload carries the channel's epoch, a sequence
+number and the send time:
+
+    <payload>|<epoch>|<seq>|<sent unix µs>    e.g. b"1|3735928559|42|1712345678123456"
+
+The epoch is a random number drawn for every AckChannel, so sequence numbers,
+which start at 1 again whenever acks are re-enabled or the app restarts, never
+repeat an earlier (epoch, seq). The drone acts on the first copy of each
+(epoch, seq) and replies on the ack topic with
+
+    <epoch>|<seq>|<status>                    e.g. b"3735928559|42|ok"
+
+Unacknowledged safety commands are resent with the same epoch and sequence number
+after a short deadline, up to a retry limit, so a duplicate delivery never
+actuates twice. Acks from another epoch are ignored.
+"""
+
+import collections
+import logging
+import os
+import threading
+import time
+
+from cosmos_core.inflight import LatencyHistogram
+
+logger = logging.getLogger("cosmos.acks")
+
+DEFAULT_ACK_TOPIC = "cosmos/ack"
+
+
+def new_epoch():
+    """A random 32-bit epoch for a new channel"""
+    return int.from_bytes(os.urandom(4), 'big')
+
+
+def encode_command(payload, epoch, seq, sent_us):
+    """Append the epoch, sequence number and send time to a command payload"""
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    return b"%s|%d|%d|%d" % (payload, epoch, seq, sent_us)
+
+
+def decode_command(data):
+    """Split a command into (payload, epoch, seq, sent µs); seq is None for a plain command"""
+    parts = bytes(data).rsplit(b"|", 3)
+    if len(parts) != 4:
+        return bytes(data), None, None, None
+    try:
+        return parts[0], int(parts[1]), int(parts[2]), int(parts[3])
+    except ValueError:
+        return bytes(data), None, None, None
+
+
+def decode_message(msg):
+    """Like decode_command for a received paho message, reading MQTT 5 user properties first"""
+    properties = getattr(msg, 'properties', None)
+    stamp = dict(getattr(properties, 'UserProperty', None) or ())
+    if 'seq' in stamp and 'epoch' in stamp:
+        try:
+            return (bytes(msg.payload), int(stamp['epoch']), int(stamp['seq']),
+                    int(stamp.get('sent_us', 0)))
+        except ValueError:
+            pass
+    return decode_command(msg.payload)
+
+
+def encode_ack(epoch, seq, status=b"ok"):
+    return b"%d|%d|%s" % (epoch, seq, status)
+
+
+def decode_ack(data):
+    """Return (epoch, seq, status) from an ack payload"""
+    epoch, seq, status = (bytes(data).split(b"|", 2) + [b""])[:3]
+    return int(epoch), int(seq), status or b"ok"
+
+
+class PendingCommand:
+    """A stamped command waiting for the drone's reply"""
+
+    __slots__ = ('seq', 'name', 'topic', 'payload', 'qos', 'first_sent', 'deadline', 'attempts')
+
+    def __init__(self, seq, name, topic, payload, qos, now, deadline):
+        self.seq = seq
+        self.name = name
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.first_sent = now
+        self.deadline = now + deadline
+        self.attempts = 1
+
+
+class AckChannel:
+    """Stamps outgoing commands, matches drone replies and schedules retries
+
+    Commands whose name is in `commands` are stamped. Every one of them is resent
+    after `deadline` seconds without a reply, at most `max_retries` times, and is
+    reported as unacknowledged after that.
+    """
+
+    def __init__(self, ack_topic=DEFAULT_ACK_TOPIC, deadline=0.2, max_retries=3,
+                 commands=('brake', 'land'), qos=1):
+        self.ack_topic = ack_topic
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.commands = set(commands)
+        # QoS of the ack subscription
+        self.qos = qos
+        # Tells this channel's sequence numbers apart from an earlier channel's
+        self.epoch = new_epoch()
+        self.next_seq = 0
+        # seq -> PendingCommand, ordered by deadline
+        self.outstanding = collections.OrderedDict()
+        self.histogram = LatencyHistogram()
+        self.acked = 0
+        self.retried = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.thread = None
+        self.running = False
+
+    def stamp(self, name, topic, payload, qos, now=None):
+        """Register a command and return its payload with seq and timestamp attached"""
+        now = time.perf_counter() if now is None else now
+        with self.lock:
+            self.next_seq = self.next_seq % 0xFFFFFFFF + 1
+            seq = self.next_seq
+            stamped = encode_command(payload, self.epoch, seq, int(time.time() * 1e6))
+            self.outstanding[seq] = PendingCommand(seq, name, topic, stamped, qos, now, self.deadline)
+            self.wakeup.notify()
+        return stamped
+
+    def handle(self, payload, now=None):
+        """Match a reply from the ack topic; returns (name, round trip, attempts) or None"""
+        now = time.perf_counter() if now is None else now
+        try:
+            epoch, seq, _ = decode_ack(payload)
+        except ValueError:
+            logger.warning("Malformed ack payload %r", payload)
+            return None
+        if epoch != self.epoch:
+            # For a command sent before acks were last re-enabled
+            return None
+        with self.lock:
+            pending = self.outstanding.pop(seq, None)
+            if pending is None:
+                # A late duplicate for a command that was already acked or given up on
+                return None
+            latency = now - pending.first_sent
+            self.histogram.record(latency)
+            self.acked += 1
+        return pending.name, latency, pending.attempts
+
+    def due(self, now=None):
+        """Return (commands to resend, commands given up on) whose deadline has passed"""
+        now = time.perf_counter() if now is None else now
+        resend = []
+        failed = []
+        with self.lock:
+            # Entries are kept in deadline order, so stop at the first one not yet due
+            while self.outstanding:
+                seq, pending = next(iter(self.outstanding.items()))
+                if pending.deadline > now:
+                    break
+                if pending.attempts > self.max_retries:
+                    del self.outstanding[seq]
+                    self.failed += 1
+                    failed.append(pending)
+                else:
+                    pending.attempts += 1
+                    pending.deadline = now + self.deadline
+                    self.outstanding.move_to_end(seq)
+                    self.retried += 1
+                    resend.append(pending)
+        return resend, failed
+
+    def _next_deadline(self):
+        for pending in self.outstanding.values():
+            return pending.deadline
+        return None
+
+    def start(self, resend, give_up):
+        """Run the retry timer thread; resend(pending) and give_up(pending) run on it"""
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._run, args=(resend, give_up),
+                                       name="cosmos-ack-retry", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.lock:
+            self.running = False
+            self.wakeup.notify()
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+            self.thread = None
+
+    def _run(self, resend, give_up):
+        while True:
+            with self.lock:
+                while self.running:
+                    deadline = self._next_deadline()
+                    wait = None if deadline is None else deadline - time.perf_counter()
+                    if wait is not None and wait <= 0:
+                        break
+                    self.wakeup.wait(wait)
+                if not self.running:
+                    return
+            retries, failures = self.due()
+            for pending in retries:
+                try:
+                    resend(pending)
+                except Exception:
+                    logger.exception("Resending %s failed", pending.name)
+            for pending in failures:
+                give_up(pending)
+
+    def summary(self):
+        """Return a one-line drone acknowledgement status for the UIs"""
+        line = f"drone acked {self.acked}, {len(self.outstanding)} waiting"
+        if self.retried or self.failed:
+            line += f", {self.retried} retried, {self.failed} unacked"
+        if self.histogram.count:
+            line += f" | p50 {self.histogram.percentile(50) * 1000:.1f} ms"
+        return line
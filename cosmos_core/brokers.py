@@ -0,0 +1,194 @@
+"""
+COSMOS Broker Set
+Several brokers for one controller, ranked by health and latency.
+
+Each broker is probed with a real MQTT CONNECT/CONNACK round trip on a background
+thread, and round trips are smoothed into an exponentially weighted average.
+Brokers rank by consecutive failures first and latency second, so one failed probe
+or dropped link puts a broker behind every broker that is answering; after
+max_failures it counts as down. The controller connects to the best-ranked broker
+and fails over to the next one as soon as its link drops. Safety commands can be
+raced over all of them (see MQTTController.enable_race_publishing).
+"""
+
+import logging
+import socket
+import struct
+import threading
+import time
+import uuid
+
+import mqtt_wire as wire
+
+logger = logging.getLogger("cosmos.brokers")
+
+
+def parse_brokers(spec, default_port=1883):
+    """Parse "host[:port], host[:port]" into a list of (host, port)"""
+    brokers = []
+    for item in spec.replace(";", ",").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.rpartition(":") if item.count(":") == 1 else (item, "", "")
+        brokers.append((host, int(port) if port else int(default_port)))
+    return brokers
+
+
+def probe(host, port, timeout=2.0, username="", password="", tls=None):
+    """Time an MQTT CONNECT/CONNACK round trip in seconds; raises OSError on failure
+
+    With tls (an SSLContext) the round trip includes the TLS handshake.
+    """
+    flags = 0x02
+    payload = wire.encode_string(f"cosmos-probe-{uuid.uuid4().hex[:8]}")
+    if username:
+        flags |= 0x80
+        payload += wire.encode_string(username)
+        if password:
+            flags |= 0x40
+            payload += wire.encode_string(password)
+    body = wire.encode_string("MQTT") + bytes((4, flags)) + struct.pack("!H", 10) + payload
+    started = time.perf_counter()
+    sock = socket.create_connection((host, port), timeout=timeout)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if tls is not None:
+        try:
+            sock = tls.wrap_socket(sock, server_hostname=host)
+        except (OSError, ValueError):
+            sock.close()
+            raise
+    with sock:
+        sock.settimeout(timeout)
+        sock.sendall(wire.encode_packet(wire.CONNECT, body))
+        packet = wire.read_packet(sock)
+        elapsed = time.perf_counter() - started
+        if packet is None or packet[0] & 0xF0 != wire.CONNACK:
+            raise ConnectionError("no CONNACK")
+        if packet[1][1] != 0:
+            raise ConnectionRefusedError(f"CONNACK code {packet[1][1]}")
+        sock.sendall(wire.encode_packet(wire.DISCONNECT))
+    return elapsed
+
+
+class BrokerEndpoint:
+    """One broker and what the probes have learned about it"""
+
+    def __init__(self, host, port=1883):
+        self.host = host
+        self.port = int(port)
+        # Smoothed CONNECT/CONNACK round trip in seconds, None until first measured
+        self.rtt = None
+        self.failures = 0
+        self.last_error = None
+
+    def __repr__(self):
+        return f"{self.host}:{self.port}"
+
+    def record(self, rtt, alpha=0.3):
+        """Fold a successful round trip into the average"""
+        self.rtt = rtt if self.rtt is None else self.rtt + alpha * (rtt - self.rtt)
+        self.failures = 0
+        self.last_error = None
+
+    def failed(self, error=None):
+        self.failures += 1
+        self.last_error = error
+
+    def score(self, max_failures):
+        """Sort key, lower is better: fewest recent failures first, then fastest"""
+        return (min(self.failures, max_failures), float('inf') if self.rtt is None else self.rtt)
+
+
+class BrokerSet:
+    """Brokers ranked by health and latency, re-probed in the background"""
+
+    def __init__(self, brokers, probe_interval=5.0, probe_timeout=2.0, max_failures=2,
+                 username="", password="", tls=None):
+        self.endpoints = [broker if isinstance(broker, BrokerEndpoint) else BrokerEndpoint(*broker)
+                          for broker in brokers]
+        if not self.endpoints:
+            raise ValueError("at least one broker is required")
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.max_failures = max_failures
+        self.username = username
+        self.password = password
+        # SSLContext for brokers spoken to over TLS, None for plain TCP
+        self.tls = tls
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.probes = 0
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def __iter__(self):
+        return iter(self.endpoints)
+
+    def find(self, host, port):
+        for endpoint in self.endpoints:
+            if endpoint.host == host and endpoint.port == int(port):
+                return endpoint
+        return None
+
+    def ranked(self):
+        """Endpoints from best to worst"""
+        # sorted() is stable, so equally ranked brokers keep the configured order
+        return sorted(self.endpoints, key=lambda endpoint: endpoint.score(self.max_failures))
+
+    def best(self):
+        return self.ranked()[0]
+
+    def healthy(self):
+        return [endpoint for endpoint in self.ranked()
+                if endpoint.failures < self.max_failures]
+
+    def probe_one(self, endpoint):
+        try:
+            endpoint.record(probe(endpoint.host, endpoint.port, self.probe_timeout,
+                                  self.username, self.password, self.tls))
+        except (OSError, ValueError) as e:
+            endpoint.failed(str(e))
+
+    def probe_all(self):
+        """Probe every broker in parallel, so a dead one costs at most probe_timeout"""
+        threads = [threading.Thread(target=self.probe_one, args=(endpoint,), daemon=True)
+                   for endpoint in self.endpoints]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(self.probe_timeout + 1.0)
+        self.probes += 1
+        return self.ranked()
+
+    def start(self):
+        """Re-probe every probe_interval seconds on a background thread"""
+        if self.thread is not None:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="cosmos-probe", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.probe_timeout + 2.0)
+            self.thread = None
+
+    def _run(self):
+        while not self.stop_event.wait(self.probe_interval):
+            try:
+                self.probe_all()
+            except Exception:
+                logger.exception("Broker probe failed")
+
+    def summary(self):
+        """One line per broker: address, smoothed round trip and failures"""
+        lines = []
+        for endpoint in self.ranked():
+            rtt = "-" if endpoint.rtt is None else f"{endpoint.rtt * 1000:.1f} ms"
+            state = "down" if endpoint.failures >= self.max_failures else "up"
+            lines.append(f"{endpoint!r} {state} {rtt}"
+                         + (f" ({endpoint.failures} failures)" if endpoint.failures else ""))
+        return lines
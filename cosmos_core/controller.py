@@ -0,0 +1,1001 @@
+"""
+COSMOS Controller Core
+The UI-independent MQTTController shared by the Kivy and Tk front ends.
+
+The core owns the paho client, reconnects, the command packet cache, the offline
+queue and telemetry. It reports everything through its EventBus. The front ends
+subclass it and turn events into log lines and status updates; benchmarks and
+load tests use it directly, without importing a UI toolkit.
+"""
+
+import collections
+import logging
+import threading
+import time
+import uuid
+
+import mqtt_wire as wire
+from command_cache import CommandPacketCache
+from flight_recorder import FlightRecorder
+from cosmos_core.ackchannel import AckChannel, decode_command
+from cosmos_core.brokers import BrokerSet, parse_brokers
+from cosmos_core.events import EventBus
+from cosmos_core.inflight import InflightTracker
+from cosmos_core.metrics import ControllerMetrics, socket_backlog
+from cosmos_core.router import NETWORK, MessageRouter
+from cosmos_core.scheduler import BULK, OutboundScheduler
+from cosmos_core.tls import tls_context
+from cosmos_core.warmup import DNSCache, KeepWarm
+from offline_queue import OfflineCommandQueue
+from reconnect import ReconnectEngine
+from telemetry import DEFAULT_TELEMETRY_TOPICS, TelemetryHub
+
+logger = logging.getLogger("cosmos.mqtt")
+
+
+def load_client_module():
+    """Import paho, which is deferred until the first connect to keep app start fast"""
+    import paho.mqtt.client as mqtt
+    return mqtt
+
+
+def preload_client():
+    """Import paho on a background thread so the first connect does not pay for it"""
+    thread = threading.Thread(target=load_client_module, name="cosmos-preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def create_client(client_id="", clean_session=None, transport="tcp", protocol=wire.MQTT311):
+    """Create a paho client across paho-mqtt 1.x and 2.x, speaking MQTT 3.1.1 or 5"""
+    mqtt = load_client_module()
+    if protocol == wire.MQTT5:
+        # MQTT 5 replaces clean_session with clean_start, given on connect
+        clean_session = None
+    try:
+        # Try new method (paho-mqtt 2.0+)
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION1, client_id=client_id,
+                           clean_session=clean_session, protocol=protocol, transport=transport)
+    except (AttributeError, TypeError):
+        # Fallback to old method (paho-mqtt 1.x)
+        return mqtt.Client(client_id=client_id, clean_session=clean_session, protocol=protocol,
+                           transport=transport)
+
+
+def mqtt5_properties(packet, **values):
+    """paho Properties for an MQTT 5 packet, e.g. mqtt5_properties('PUBLISH', MessageExpiryInterval=5)"""
+    from paho.mqtt.packettypes import PacketTypes
+    from paho.mqtt.properties import Properties
+    properties = Properties(getattr(PacketTypes, packet))
+    for name, value in values.items():
+        setattr(properties, name, value)
+    return properties
+
+
+class MQTTController:
+    """Connection management and command publishing for one broker link
+
+    Events (name, data):
+        connecting        (host, port)
+        connect_failed    error message
+        connected         (recovery seconds or None, session present)
+        connect_refused   (rc, retry delay)
+        failover          (host, port) the next reconnect goes to
+        link_lost         (rc, retry delay)
+        disconnected      rc
+        reconnect_failed  retry delay
+        message           paho message no route took (telemetry and acks excluded)
+        command_sent      (name, topic, payload)
+        command_confirmed (name, round-trip seconds), QoS 1/2 only
+        command_acked     (name, actuation round-trip seconds, attempts), drone acks only
+        command_retry     (name, attempt)
+        command_unacked   (name, attempts)
+        command_failed    (name, error message)
+        command_queued    name
+        queue_failed      (name, error message)
+        not_connected     name
+        unknown_command   name
+        replayed          (replayed count, expired count)
+        protocol_fallback protocol level now used, after the broker refused MQTT 5
+    """
+
+    def __init__(self):
+        self.client = None
+        self.connected = False
+        self.broker_host = ""
+        self.broker_port = 1883
+        self.username = ""
+        self.password = ""
+        self.brake_topic = "brakeCosmos"
+        self.land_topic = "landCosmos"
+        self.brake_payload = "1"
+        self.land_payload = "1"
+        self.qos = 0
+        # Per-command QoS overriding self.qos, e.g. {'brake': 1}
+        self.command_qos = {}
+        # Extra named commands to pre-encode, name -> (topic, payload)
+        self.extra_commands = {}
+        self.use_command_cache = True
+        self.command_cache = CommandPacketCache()
+        self.telemetry = TelemetryHub(DEFAULT_TELEMETRY_TOPICS)
+        self.offline_queue = None
+        # Serialises offline enqueues with the replay on reconnect
+        self.offline_lock = threading.Lock()
+        # A stable client id lets the broker keep our session across reconnects
+        self.client_id = f"cosmos-{uuid.uuid4().hex[:12]}"
+        self.clean_session = False
+        # True once the broker acknowledged our subscriptions for this session
+        self.session_subscribed = False
+        self.reconnect = ReconnectEngine(keepalive=15)
+        self.events = EventBus()
+        self.metrics = ControllerMetrics()
+        self.inflight = InflightTracker()
+        # Drone-level acknowledgements, see enable_command_acks()
+        self.acks = None
+        # Several brokers to pick from, see use_brokers(); None for a single broker
+        self.brokers = None
+        # Commands raced over every broker, and the extra client per broker
+        self.race_commands = set()
+        self.race_clients = {}
+        # perf_counter() of the connect() call until its CONNACK arrives
+        self.connect_started = None
+        self.dns = DNSCache()
+        # What broker_host resolved to when last connecting
+        self.broker_address = None
+        # Idle echoes that keep the path warm, see enable_keep_warm()
+        self.keep_warm = None
+        self.warm_topic = f"cosmos/warm/{self.client_id}"
+        self.created = time.perf_counter()
+        # Seconds from creating the controller to the first command sent
+        self.time_to_first_command = None
+        # Shared TLSContext, see enable_tls(); None for plain TCP
+        self.tls = None
+        # URL path for MQTT over WebSockets, None for plain MQTT
+        self.websocket_path = None
+        # Protocol level and MQTT 5 options, see enable_mqtt5()
+        self.protocol = wire.MQTT311
+        self.message_expiry = None
+        self.use_topic_aliases = False
+        self.session_expiry = 0
+        self.stamp_in_properties = False
+        # Per MQTT 5 connection: the broker's alias limit, topic -> alias for our
+        # commands, and the topics whose alias the broker already knows
+        self.topic_alias_maximum = 0
+        self.topic_aliases = {}
+        self.aliased_topics = set()
+        # (histogram name, press time) waiting for the next socket write, see time_to_write()
+        self.write_stamps = collections.deque()
+        # Commands moved ahead of everything else queued for the socket
+        self.safety_commands = {'brake', 'land'}
+        # Lanes for non-command traffic, see publish_background()
+        self.outbound = OutboundScheduler(self._send_background, self._outbound_depth)
+        # Handlers for incoming topics, see subscribe()
+        self.router = MessageRouter()
+        # Binary session log, see enable_recorder()
+        self.recorder = None
+        self.register_metrics()
+
+    def add_listener(self, callback):
+        """Register callback(event, data) on the controller's event bus"""
+        self.events.add_listener(callback)
+
+    def remove_listener(self, callback):
+        """Unregister an event listener"""
+        self.events.remove_listener(callback)
+
+    def register_metrics(self):
+        """Export the tracker histograms and link state alongside the counters"""
+        self.metrics.add_histogram('command_confirm_seconds', self.inflight.histogram)
+        self.metrics.add_gauge('connected', lambda: int(self.connected))
+        self.metrics.add_gauge('inflight_pending', lambda: len(self.inflight))
+        self.metrics.add_gauge('brokers_healthy',
+                               lambda: None if self.brokers is None else len(self.brokers.healthy()))
+        self.metrics.add_gauge('acks_outstanding',
+                               lambda: None if self.acks is None else len(self.acks.outstanding))
+        self.metrics.add_gauge('offline_queue_depth',
+                               lambda: None if self.offline_queue is None else len(self.offline_queue))
+        self.metrics.add_gauge('socket_send_backlog_bytes',
+                               lambda: socket_backlog(self.client.socket()) if self.client else None)
+        self.metrics.add_gauge('time_to_first_command_seconds', lambda: self.time_to_first_command)
+        self.metrics.add_gauge('keep_warm_interval_seconds',
+                               lambda: None if self.keep_warm is None else self.keep_warm.interval)
+        # paho's own queue of packets not yet written to the socket
+        self.metrics.add_gauge('client_out_packets',
+                               lambda: len(getattr(self.client, '_out_packet', ())) if self.client else None)
+        self.metrics.add_gauge('outbound_waiting', lambda: len(self.outbound))
+        self.metrics.add_gauge('outbound_coalesced', lambda: self.outbound.coalesced)
+        self.metrics.add_gauge('routes', lambda: len(self.router))
+        self.metrics.add_gauge('recorder_bytes',
+                               lambda: None if self.recorder is None else self.recorder.position)
+
+    # Connection
+
+    def enable_tls(self, ca_file=None, certfile=None, keyfile=None, pins=(), websocket_path=None):
+        """Connect over TLS, resuming each broker's session on reconnect
+
+        pins are SHA-256 certificate fingerprints; without ca_file they replace
+        CA verification (for self-signed brokers). websocket_path, e.g. "/mqtt",
+        tunnels MQTT through WebSockets over TLS. Takes effect on the next connect().
+        """
+        self.tls = tls_context(ca_file, certfile, keyfile, pins)
+        self.websocket_path = websocket_path
+        if self.brokers is not None:
+            self.brokers.tls = self.tls
+        self.metrics.add_histogram('tls_full_handshake_seconds', self.tls.full)
+        self.metrics.add_histogram('tls_resumed_handshake_seconds', self.tls.resumed)
+        return self.tls
+
+    def enable_mqtt5(self, message_expiry=5, topic_aliases=True, session_expiry=3600,
+                     stamp_in_properties=True):
+        """Speak MQTT 5 from the next connect(), falling back to 3.1.1 if the broker refuses
+
+        message_expiry: seconds after which the broker drops an undelivered command
+            rather than deliver it late (None to never expire)
+        topic_aliases: send QoS 0 commands with a two byte topic alias instead of
+            the topic, as far as the broker's Topic Alias Maximum allows
+        session_expiry: seconds the broker keeps our session after a dropped link
+        stamp_in_properties: carry drone-ack sequence numbers and send times in
+            user properties instead of appending them to the payload
+        """
+        self.protocol = wire.MQTT5
+        self.message_expiry = message_expiry
+        self.use_topic_aliases = topic_aliases
+        self.session_expiry = session_expiry
+        self.stamp_in_properties = stamp_in_properties
+
+    def disable_mqtt5(self):
+        self.protocol = wire.MQTT311
+
+    def _connect_options(self, clean_session):
+        """Extra connect()/connect_async() arguments for the protocol in use"""
+        if self.protocol != wire.MQTT5:
+            return {}
+        if clean_session:
+            return {'clean_start': True}
+        return {'clean_start': False,
+                'properties': mqtt5_properties('CONNECT', SessionExpiryInterval=self.session_expiry)}
+
+    def disable_tls(self):
+        self.tls = None
+        self.websocket_path = None
+        if self.brokers is not None:
+            self.brokers.tls = None
+
+    def _create_client(self, client_id, clean_session):
+        """A paho client set up for this controller's transport"""
+        client = create_client(client_id, clean_session,
+                               "tcp" if self.websocket_path is None else "websockets", self.protocol)
+        if self.websocket_path is not None:
+            client.ws_set_options(path=self.websocket_path)
+        if self.tls is not None:
+            client.tls_set_context(self.tls)
+        if self.username and self.password:
+            client.username_pw_set(self.username, self.password)
+        return client
+
+    def _resolve(self, host, port):
+        """Address to connect to for host; TLS still checks the certificate against host"""
+        address = self._address(host, port)
+        if self.tls is not None:
+            self.tls.server_names[address] = host
+        return address
+
+    def use_brokers(self, brokers, **options):
+        """Spread the link over several brokers, given as [(host, port)] or "host:port, host:port"
+
+        options are passed on to BrokerSet (probe_interval, probe_timeout, max_failures).
+        """
+        if isinstance(brokers, str):
+            brokers = parse_brokers(brokers, self.broker_port)
+        if self.brokers is not None:
+            self.brokers.stop()
+        self.brokers = BrokerSet(brokers, **options)
+        return self.brokers
+
+    def connect(self, host, port, username, password):
+        """Connect to MQTT broker, or to the fastest healthy one of a comma-separated list"""
+        try:
+            self._retire_client()
+            self.broker_host = host
+            self.broker_port = int(port)
+            self.username = username
+            self.password = password
+            if "," in host or ";" in host:
+                self.use_brokers(host)
+            if self.tls is None and self.broker_port == 8883:
+                self.enable_tls()
+            candidates = [(host, self.broker_port)]
+            if self.brokers is not None:
+                self.brokers.username, self.brokers.password = username, password
+                self.brokers.tls = self.tls
+                candidates = [(endpoint.host, endpoint.port) for endpoint in self.brokers.probe_all()]
+
+            self.client = self._create_client(self.client_id, self.clean_session)
+            self.client.on_connect = self.on_connect
+            self.client.on_disconnect = self.on_disconnect
+            self.client.on_message = self.on_message
+            self.client.on_connect_fail = self.on_connect_fail
+            self.client.on_subscribe = self.on_subscribe
+            self.client.on_publish = self.on_publish
+            self.client.on_socket_unregister_write = self.on_writes_flushed
+            self.reconnect.attach(self.client)
+            if self.acks is not None:
+                self.acks.start(self._resend_unacked, self._give_up_unacked)
+
+            for index, (host, port) in enumerate(candidates):
+                self.broker_host, self.broker_port = host, port
+                self.events.emit('connecting', (host, port))
+                self.connect_started = time.perf_counter()
+                try:
+                    # Connect by address so paho does not resolve the name again
+                    self.broker_address = self._resolve(host, port)
+                    self.client.connect(self.broker_address, port, self.reconnect.keepalive,
+                                        **self._connect_options(self.clean_session))
+                    break
+                except OSError as e:
+                    if index == len(candidates) - 1:
+                        raise
+                    self.brokers.find(host, port).failed(str(e))
+            self.client.loop_start()
+            if self.keep_warm is not None:
+                self.keep_warm.start(self._send_warm_echo)
+            if self.brokers is not None:
+                self.brokers.start()
+                if self.race_commands:
+                    self._open_race_clients()
+            return True
+
+        except Exception as e:
+            logger.error("MQTT: Connection failed - %s", e)
+            self.events.emit('connect_failed', str(e))
+            return False
+
+    def _retire_client(self):
+        """Stop the previous client before a new one takes over our client id
+
+        Its network thread may still be reconnecting. Left running, it and the new
+        client would keep taking the session from each other at the broker.
+        """
+        client, self.client = self.client, None
+        if client is None:
+            return
+        self.connected = False
+        for callback in ('on_connect', 'on_disconnect', 'on_message', 'on_connect_fail',
+                         'on_subscribe', 'on_publish', 'on_socket_unregister_write'):
+            setattr(client, callback, None)
+        client.loop_stop()
+        client.disconnect()
+
+    def disconnect(self):
+        """Disconnect from MQTT broker"""
+        if self.acks is not None:
+            self.acks.stop()
+        if self.keep_warm is not None:
+            self.keep_warm.stop()
+        if self.brokers is not None:
+            self.brokers.stop()
+        self._close_race_clients()
+        self.outbound.stop()
+        if self.client:
+            self.client.loop_stop()
+            self.client.disconnect()
+            self.connected = False
+
+    def on_connect(self, client, userdata, flags, rc, properties=None):
+        """Callback for when the client receives a CONNACK response from the server"""
+        # MQTT 5 reports a ReasonCode object rather than an int
+        rc = getattr(rc, 'value', rc)
+        if rc == 0:
+            recovered = self.reconnect.link_up()
+            if self.protocol == wire.MQTT5:
+                self._assign_topic_aliases(getattr(properties, 'TopicAliasMaximum', 0) if properties else 0)
+            if self.tls is not None:
+                self._remember_tls_session(client)
+            if self.connect_started is not None:
+                self.metrics.observe('connect_seconds', time.perf_counter() - self.connect_started)
+                self.connect_started = None
+            if recovered is not None:
+                self.metrics.observe('reconnect_seconds', recovered)
+            if self.brokers is not None:
+                current = self.brokers.find(self.broker_host, self.broker_port)
+                if current is not None:
+                    current.failures = 0
+            self.build_command_cache()
+            # A resumed session still holds our subscriptions, once they were acknowledged
+            session_present = bool(flags.get('session present'))
+            if not (session_present and self.session_subscribed):
+                self.session_subscribed = False
+                self.telemetry.subscribe(client)
+                routed = self.router.filters()
+                if routed:
+                    client.subscribe(list(routed.items()))
+                if self.acks is not None:
+                    client.subscribe(self.acks.ack_topic, self.acks.qos)
+                if self.keep_warm is not None:
+                    client.subscribe(self.warm_topic, 0)
+            with self.offline_lock:
+                # Replay before accepting new presses so commands keep their order
+                self.replay_offline_queue(client)
+                self.connected = True
+            self.metrics.increment('connects')
+            self.outbound.kick()
+            self.events.emit('connected', (recovered, session_present))
+        elif self.protocol == wire.MQTT5 and rc in (1, 0x84):
+            # A 3.1.1 broker answers MQTT 5 with "unacceptable protocol version";
+            # paho cannot switch a client's protocol, so reconnect with a new one
+            self.connected = False
+            threading.Thread(target=self._fall_back_to_mqtt311, args=(client,), daemon=True).start()
+        else:
+            self.connected = False
+            delay = self.reconnect.attempt_failed(client)
+            self.events.emit('connect_refused', (rc, delay))
+            self._fail_over(client)
+
+    def _fall_back_to_mqtt311(self, client):
+        logger.warning("MQTT: %s refused MQTT 5, falling back to 3.1.1", self.broker_host)
+        client.loop_stop()
+        client.disconnect()
+        if client is not self.client:
+            return
+        self.protocol = wire.MQTT311
+        self.events.emit('protocol_fallback', wire.MQTT311)
+        self.connect(self.broker_host, self.broker_port, self.username, self.password)
+
+    def _assign_topic_aliases(self, maximum):
+        """Give the command topics aliases 1..maximum for this connection, BRAKE first"""
+        self.topic_alias_maximum = maximum
+        self.aliased_topics = set()
+        if not self.use_topic_aliases:
+            self.topic_aliases = {}
+            return
+        topics = []
+        for topic, _ in self.commands().values():
+            if topic not in topics:
+                topics.append(topic)
+        self.topic_aliases = {topic: alias for alias, topic in enumerate(topics[:maximum], 1)}
+
+    def on_disconnect(self, client, userdata, rc, properties=None):
+        """Callback for when the client disconnects from the broker"""
+        rc = getattr(rc, 'value', rc)
+        self.connected = False
+        if rc != 0:
+            # paho's network thread retries after the delay set here
+            delay = self.reconnect.link_lost(client)
+            self.metrics.increment('links_lost')
+            self.events.emit('link_lost', (rc, delay))
+            self._fail_over(client)
+            self._refresh_address(client)
+        else:
+            self.events.emit('disconnected', rc)
+
+    def on_connect_fail(self, client, userdata):
+        """Callback for when a reconnect attempt could not reach the broker"""
+        delay = self.reconnect.attempt_failed(client)
+        self.events.emit('reconnect_failed', delay)
+        self._fail_over(client)
+        self._refresh_address(client)
+
+    def _fail_over(self, client):
+        """Point paho's next reconnect at the best broker if the current one just failed"""
+        if self.brokers is None:
+            return
+        current = self.brokers.find(self.broker_host, self.broker_port)
+        if current is not None:
+            current.failed("link lost")
+        best = self.brokers.best()
+        if best is current:
+            return
+        self.broker_host, self.broker_port = best.host, best.port
+        # The new broker holds none of our subscriptions
+        self.session_subscribed = False
+        self.broker_address = self._resolve(best.host, best.port)
+        client.connect_async(self.broker_address, best.port, self.reconnect.keepalive,
+                             **self._connect_options(self.clean_session))
+        self.metrics.increment('failovers')
+        self.events.emit('failover', (best.host, best.port))
+
+    def _remember_tls_session(self, client):
+        """Keep the session of a connected client; TLS 1.3 tickets arrive with the first data"""
+        sock = client.socket()
+        # paho wraps the TLS socket when tunnelling through WebSockets
+        self.tls.remember(getattr(sock, '_socket', sock))
+
+    def _address(self, host, port):
+        """The cached address of host, or host itself if it cannot be resolved right now"""
+        try:
+            return self.dns.resolve(host, port)
+        except OSError:
+            return host
+
+    def _refresh_address(self, client):
+        """Reconnect to the broker's current address once its DNS entry expired"""
+        if self.brokers is not None or not self.dns.expired(self.broker_host, self.broker_port):
+            return
+        address = self._resolve(self.broker_host, self.broker_port)
+        if address != self.broker_address:
+            logger.info("%s moved to %s", self.broker_host, address)
+            self.broker_address = address
+            client.connect_async(address, self.broker_port, self.reconnect.keepalive,
+                                 **self._connect_options(self.clean_session))
+
+    def on_subscribe(self, client, userdata, mid, granted_qos, properties=None):
+        """Callback for when the broker acknowledges a SUBSCRIBE"""
+        self.session_subscribed = True
+
+    def on_publish(self, client, userdata, mid):
+        """Callback for when a publish was written (QoS 0) or acknowledged (QoS 1/2)"""
+        confirmed = self.inflight.ack(mid)
+        if confirmed is not None:
+            self.metrics.increment('commands_confirmed')
+            self.events.emit('command_confirmed', confirmed)
+
+    def time_to_write(self, histogram, pressed_at):
+        """Record seconds from pressed_at (perf_counter) until paho next drains its
+        queue to the socket, in the named histogram
+
+        Call it right before publishing the press, and cancel_write() with the
+        returned stamp if nothing was sent after all.
+        """
+        stamp = (histogram, pressed_at)
+        self.write_stamps.append(stamp)
+        return stamp
+
+    def cancel_write(self, stamp):
+        """Forget a time_to_write() stamp whose command was not sent"""
+        try:
+            self.write_stamps.remove(stamp)
+        except ValueError:
+            pass
+
+    def on_writes_flushed(self, client, userdata, sock):
+        """Callback for when paho has written everything it queued to the socket"""
+        stamps = self.write_stamps
+        if stamps:
+            now = time.perf_counter()
+            # paho's thread and a publishing thread can both drain the stamps
+            while True:
+                try:
+                    histogram, pressed_at = stamps.popleft()
+                except IndexError:
+                    break
+                self.metrics.observe(histogram, now - pressed_at)
+        if len(self.outbound):
+            # Room for background publishes that are waiting
+            self.outbound.kick()
+
+    def on_message(self, client, userdata, msg):
+        """Callback for when a PUBLISH message is received from the server"""
+        started = time.perf_counter()
+        self.handle_message(msg)
+        self.metrics.observe('message_handling_seconds', time.perf_counter() - started)
+
+    def handle_message(self, msg):
+        """Route an incoming PUBLISH to the ack channel, telemetry, routes or listeners"""
+        keep_warm = self.keep_warm
+        if keep_warm is not None:
+            if msg.topic == self.warm_topic:
+                rtt = keep_warm.echoed()
+                if rtt is not None:
+                    self.metrics.observe('warm_echo_seconds', rtt)
+                return
+            keep_warm.touch()
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.message(msg)
+        if self.acks is not None and msg.topic == self.acks.ack_topic:
+            acked = self.acks.handle(msg.payload)
+            if acked is not None:
+                self.metrics.increment('commands_acked')
+                self.events.emit('command_acked', acked)
+            return
+        # Telemetry is sampled into ring buffers and shown at display rate, not reported
+        if self.telemetry.handle(msg.topic, msg.payload):
+            self.metrics.increment('telemetry_received')
+            return
+        self.metrics.increment('messages_received')
+        if self.router.dispatch(msg):
+            return
+        self.events.emit('message', msg)
+
+    # Commands
+
+    def build_command_cache(self):
+        """Pre-encode the packet for every known command"""
+        commands = self.commands()
+        if self.protocol != wire.MQTT5:
+            self.command_cache.build(commands)
+            return
+        properties = []
+        if self.message_expiry:
+            properties.append((wire.MESSAGE_EXPIRY, int(self.message_expiry)))
+        aliases = {name: self.topic_aliases[topic] for name, (topic, _) in commands.items()
+                   if topic in self.topic_aliases}
+        self.command_cache.build(commands, properties, aliases)
+
+    def commands(self):
+        """Return every known command as name -> (topic, payload)"""
+        commands = {'brake': (self.brake_topic, self.brake_payload),
+                    'land': (self.land_topic, self.land_payload)}
+        commands.update(self.extra_commands)
+        return commands
+
+    def qos_for(self, name):
+        """QoS used for a command"""
+        return self.command_qos.get(name, self.qos)
+
+    def _send_command(self, name, topic, payload):
+        """Send a command, using its prebuilt packet when possible
+
+        QoS 1/2 sends are tracked until acknowledged. Returns the round-trip time
+        if the ack won the race with this call, else None.
+        """
+        qos = self.command_qos.get(name, self.qos)
+        stamped = self.acks is not None and name in self.acks.commands
+        urgent = name in self.safety_commands
+        if stamped:
+            # Every stamped copy differs, so the prebuilt packet cannot be used
+            payload = self.acks.stamp(name, topic, payload, qos)
+        elif qos == 0:
+            if not (self.use_command_cache and self.command_cache.send(self.client, name, urgent)):
+                self._publish_to(self.client, topic, payload, 0, urgent=urgent)
+            return None
+        sent_at = time.perf_counter()
+        info = self._publish_to(self.client, topic, payload, qos, stamped, urgent)
+        if stamped and name in self.race_commands:
+            self._race(topic, payload, qos)
+        if qos == 0:
+            return None
+        return self.inflight.track(info.mid, name, sent_at)
+
+    def _publish_to(self, client, topic, payload, qos, stamped=False, urgent=False):
+        """Publish through client; MQTT 5 adds expiry, a topic alias and stamp properties
+
+        Aliases are only used at QoS 0: paho resends unacknowledged QoS 1/2 packets
+        as they were after a reconnect, when the broker has forgotten the alias.
+        QoS 0 packets on the main link are encoded here and queued raw, since
+        building paho's Properties costs more than the rest of the publish.
+        An urgent packet is moved ahead of everything else paho has queued.
+        """
+        if self.protocol != wire.MQTT5:
+            return self._expedite(client, client.publish(topic, payload, qos=qos), urgent)
+        properties = []
+        if self.message_expiry:
+            properties.append((wire.MESSAGE_EXPIRY, int(self.message_expiry)))
+        if stamped and self.stamp_in_properties:
+            payload, epoch, seq, sent_us = decode_command(payload)
+            properties.append((wire.USER_PROPERTY, ("epoch", str(epoch))))
+            properties.append((wire.USER_PROPERTY, ("seq", str(seq))))
+            properties.append((wire.USER_PROPERTY, ("sent_us", str(sent_us))))
+        if qos == 0 and client is self.client:
+            alias = self.topic_aliases.get(topic)
+            if alias is not None:
+                properties.append((wire.TOPIC_ALIAS, alias))
+                if topic in self.aliased_topics:
+                    topic = ""
+                else:
+                    self.aliased_topics.add(topic)
+            return wire.queue_raw_publish(client, wire.encode_publish(topic, payload, properties=properties),
+                                          urgent=urgent)
+        values = {}
+        for identifier, value in properties:
+            if identifier == wire.MESSAGE_EXPIRY:
+                values['MessageExpiryInterval'] = value
+            else:
+                values.setdefault('UserProperty', []).append(value)
+        info = client.publish(topic, payload, qos=qos, properties=mqtt5_properties('PUBLISH', **values))
+        return self._expedite(client, info, urgent)
+
+    @staticmethod
+    def _expedite(client, info, urgent):
+        """Move the packet of a paho publish() to the front of the client's queue if urgent"""
+        if urgent:
+            mid = info.mid
+            wire.expedite(client, lambda entry: entry['mid'] == mid and entry['command'] & 0xF0 == wire.PUBLISH)
+        return info
+
+    def commands_in_flight(self):
+        """Number of sent commands still waiting for a broker or drone acknowledgement"""
+        acks = self.acks
+        return len(self.inflight) + (len(acks.outstanding) if acks is not None else 0)
+
+    def _report_sent(self, name, topic, payload, latency):
+        """Count and announce a sent command (and its ack if that already came back)"""
+        if self.time_to_first_command is None:
+            self.time_to_first_command = time.perf_counter() - self.created
+        if self.keep_warm is not None:
+            self.keep_warm.touch()
+        self.metrics.increment('commands_sent')
+        self.events.emit('command_sent', (name, topic, payload))
+        if latency is not None:
+            self.metrics.increment('commands_confirmed')
+            self.events.emit('command_confirmed', (name, latency))
+
+    def _send_now(self, client, name, topic, payload):
+        """Send a command on the live client and report it, or report why it failed"""
+        started = time.perf_counter()
+        try:
+            latency = self._send_command(name, topic, payload)
+        except Exception as e:
+            self.metrics.increment('commands_failed')
+            self.events.emit('command_failed', (name, str(e)))
+            return False
+        self.metrics.observe('publish_seconds', time.perf_counter() - started)
+        if self.write_stamps and not client.want_write():
+            # paho's thread wrote the packet before it armed on_socket_unregister_write
+            self.on_writes_flushed(client, None, None)
+        self._report_sent(name, topic, payload, latency)
+        return True
+
+    def _publish(self, name, topic, payload):
+        """Send a command now, queue it while offline, or report why it was not sent"""
+        client = self.client
+        if self.connected and client:
+            return self._send_now(client, name, topic, payload)
+        if self.offline_queue is not None:
+            return self._queue_offline(name, topic, payload)
+        self.events.emit('not_connected', name)
+        return False
+
+    def publish_brake(self):
+        """Publish brake command"""
+        return self._publish('brake', self.brake_topic, self.brake_payload)
+
+    def publish_land(self):
+        """Publish land command"""
+        return self._publish('land', self.land_topic, self.land_payload)
+
+    def publish_command(self, name):
+        """Publish one of the configured extra commands by name"""
+        if name not in self.extra_commands:
+            self.events.emit('unknown_command', name)
+            return False
+        topic, payload = self.extra_commands[name]
+        return self._publish(name, topic, payload)
+
+    # Background traffic
+
+    def publish_background(self, topic, payload, qos=0, lane=BULK, key=None):
+        """Send status, heartbeats and other non-command traffic behind brake and land
+
+        Waits in the outbound scheduler until the link is not backed up. 'bulk'
+        publishes are rate-limited, and a newer one with the same key (default:
+        the topic) replaces one still waiting. 'normal' publishes all go out in
+        order, ahead of bulk. Kept while disconnected and sent after reconnecting.
+        """
+        return self.outbound.submit(topic, payload, qos, lane, key)
+
+    def _send_background(self, topic, payload, qos):
+        self.client.publish(topic, payload, qos=qos)
+
+    def _outbound_depth(self):
+        """(paho's queued packets, unsent kernel bytes), or None without a link"""
+        client = self.client
+        if not (self.connected and client):
+            return None
+        return len(client._out_packet), socket_backlog(client.socket())
+
+    # Subscriptions
+
+    def subscribe(self, topic_filter, handler, qos=0, context=NETWORK):
+        """Call handler(msg) for messages matching topic_filter, wildcards allowed
+
+        context is 'network' (paho's thread, short handlers only), 'worker' (a
+        thread pool) or 'ui' (the app's UI thread). The broker subscription is made
+        now if connected and again on every new session. Returns the route, for
+        unsubscribe().
+        """
+        route = self.router.route(topic_filter, handler, context, qos)
+        if self.connected and self.client:
+            self.client.subscribe(topic_filter, qos)
+        return route
+
+    def unsubscribe(self, route):
+        """Remove a route, and the broker subscription once no route uses its filter"""
+        if not self.router.unroute(route):
+            return False
+        if self.connected and self.client and route.topic_filter not in self.router.filters():
+            self.client.unsubscribe(route.topic_filter)
+        return True
+
+    # Drone acknowledgements
+
+    def enable_command_acks(self, ack_topic=None, deadline=0.2, max_retries=3,
+                            commands=('brake', 'land')):
+        """Stamp commands with a sequence number and wait for the drone to reply on ack_topic"""
+        if self.acks is not None:
+            self.disable_command_acks()
+        self.acks = AckChannel(ack_topic or "cosmos/ack", deadline, max_retries, commands)
+        self.metrics.add_histogram('command_ack_seconds', self.acks.histogram)
+        self.acks.start(self._resend_unacked, self._give_up_unacked)
+        if self.connected and self.client:
+            self.client.subscribe(self.acks.ack_topic, self.acks.qos)
+        for client in list(self.race_clients.values()):
+            if client.is_connected():
+                client.subscribe(self.acks.ack_topic, self.acks.qos)
+
+    def disable_command_acks(self):
+        """Send plain commands again and stop retrying"""
+        acks, self.acks = self.acks, None
+        if acks is None:
+            return
+        acks.stop()
+        if self.connected and self.client:
+            self.client.unsubscribe(acks.ack_topic)
+
+    def _resend_unacked(self, pending):
+        """Resend a command the drone has not acknowledged (runs on the retry thread)"""
+        if not (self.connected and self.client):
+            # Still counts as an attempt; the link may be back by the next deadline
+            return
+        self._publish_to(self.client, pending.topic, pending.payload, pending.qos, True,
+                         pending.name in self.safety_commands)
+        if pending.name in self.race_commands:
+            self._race(pending.topic, pending.payload, pending.qos)
+        self.metrics.increment('commands_retried')
+        self.events.emit('command_retry', (pending.name, pending.attempts))
+
+    def _give_up_unacked(self, pending):
+        self.metrics.increment('commands_unacked')
+        self.events.emit('command_unacked', (pending.name, pending.attempts))
+
+    # Warm-up
+
+    def warm_up(self, host, port=1883):
+        """Get ready for the first press: resolve the broker and import paho in the background
+
+        Once connected, an echo is sent right away to wake the path, e.g. on resume.
+        """
+        for broker_host, broker_port in parse_brokers(host, port):
+            self.dns.prefetch(broker_host, broker_port)
+        preload_client()
+        if self.keep_warm is not None and self.connected:
+            self.keep_warm.kick()
+
+    def enable_keep_warm(self, interval=5.0, minimum=1.0, maximum=25.0):
+        """Echo through the broker whenever the link idles for the adaptive interval"""
+        if self.keep_warm is not None:
+            return
+        self.keep_warm = KeepWarm(interval, minimum, maximum)
+        if self.client is not None:
+            if self.connected:
+                self.client.subscribe(self.warm_topic, 0)
+            self.keep_warm.start(self._send_warm_echo)
+
+    def disable_keep_warm(self):
+        keep_warm, self.keep_warm = self.keep_warm, None
+        if keep_warm is None:
+            return
+        keep_warm.stop()
+        if self.connected and self.client:
+            self.client.unsubscribe(self.warm_topic)
+
+    def _send_warm_echo(self):
+        """Publish one echo to our own topic (runs on the keep-warm thread)"""
+        if not (self.connected and self.client and self.session_subscribed):
+            return False
+        self.client.publish(self.warm_topic, b"", qos=0)
+        return True
+
+    # Racing over several brokers
+
+    def enable_race_publishing(self, commands=('brake', 'land')):
+        """Send these commands through every broker at once; the first drone ack wins
+
+        Needs a broker set (use_brokers or a comma-separated host). Drone acks are
+        turned on if they are not already: the drone drops every copy but the first
+        by its sequence number.
+        """
+        if self.brokers is None or len(self.brokers) < 2:
+            raise ValueError("race publishing needs at least two brokers")
+        if self.acks is None:
+            self.enable_command_acks(commands=commands)
+        else:
+            self.acks.commands.update(commands)
+        self.race_commands = set(commands)
+        if self.client is not None:
+            self._open_race_clients()
+
+    def disable_race_publishing(self):
+        """Send commands through the current broker only"""
+        self.race_commands = set()
+        self._close_race_clients()
+
+    def _open_race_clients(self):
+        """Keep a connection to every broker besides the current one"""
+        for endpoint in self.brokers:
+            if endpoint in self.race_clients:
+                continue
+            if (endpoint.host, endpoint.port) == (self.broker_host, self.broker_port):
+                continue
+            client = self._create_client(f"{self.client_id}-{len(self.race_clients) + 1}", True)
+            client.on_connect = self._on_race_connect
+            client.on_message = self.on_message
+            client.on_socket_open = self.reconnect.on_socket_open
+            client.reconnect_delay_set(0.1, 2.0)
+            # Asynchronous, so a broker that is down does not hold up the others
+            client.connect_async(self._resolve(endpoint.host, endpoint.port), endpoint.port,
+                                 self.reconnect.keepalive, **self._connect_options(True))
+            client.loop_start()
+            self.race_clients[endpoint] = client
+
+    def _close_race_clients(self):
+        clients, self.race_clients = self.race_clients, {}
+        for client in clients.values():
+            client.loop_stop()
+            client.disconnect()
+
+    def _on_race_connect(self, client, userdata, flags, rc, properties=None):
+        rc = getattr(rc, 'value', rc)
+        if rc == 0 and self.tls is not None:
+            self._remember_tls_session(client)
+        if rc == 0 and self.acks is not None:
+            client.subscribe(self.acks.ack_topic, self.acks.qos)
+
+    def _race(self, topic, payload, qos):
+        """Send a stamped command through every other connected broker"""
+        for client in list(self.race_clients.values()):
+            if client.is_connected():
+                self._publish_to(client, topic, payload, qos, True)
+                self.metrics.increment('race_copies')
+
+    # Flight recorder
+
+    def enable_recorder(self, path):
+        """Log commands, acks, state changes and incoming messages to a flight log at path"""
+        if self.recorder is not None:
+            self.disable_recorder()
+        self.recorder = FlightRecorder(path)
+        self.add_listener(self.recorder.on_event)
+        return self.recorder
+
+    def disable_recorder(self):
+        """Stop recording and close the log"""
+        recorder, self.recorder = self.recorder, None
+        if recorder is None:
+            return
+        self.remove_listener(recorder.on_event)
+        recorder.close()
+
+    # Offline queue
+
+    def enable_offline_queue(self, path):
+        """Keep commands pressed while disconnected in a durable queue for replay"""
+        if self.offline_queue is None:
+            self.offline_queue = OfflineCommandQueue(path)
+
+    def disable_offline_queue(self):
+        """Stop queueing commands while disconnected"""
+        with self.offline_lock:
+            if self.offline_queue is not None:
+                self.offline_queue.close()
+                self.offline_queue = None
+
+    def _queue_offline(self, name, topic, payload):
+        """Store a command pressed while disconnected, or send it if we just reconnected"""
+        with self.offline_lock:
+            client = self.client
+            if self.connected and client:
+                return self._send_now(client, name, topic, payload)
+            try:
+                self.offline_queue.enqueue(name, topic, payload, self.command_qos.get(name, self.qos))
+            except Exception as e:
+                self.events.emit('queue_failed', (name, str(e)))
+                return False
+        self.metrics.increment('commands_queued')
+        self.events.emit('command_queued', name)
+        return True
+
+    def replay_offline_queue(self, client):
+        """Publish queued commands in order, dropping the ones that went stale"""
+        if self.offline_queue is None:
+            return
+        commands, expired = self.offline_queue.drain()
+        for command in commands:
+            sent_at = time.perf_counter()
+            info = self._publish_to(client, command.topic, command.payload, command.qos)
+            if command.qos:
+                self.inflight.track(info.mid, command.name, sent_at)
+        if commands or expired:
+            self.metrics.increment('commands_replayed', len(commands))
+            self.metrics.increment('commands_expired', expired)
+            self.events.emit('replayed', (len(commands), expired))
@@ -0,0 +1,37 @@
+"""
+COSMOS Event Bus
+Delivers controller events (connection changes, commands, messages) to the front
+ends and to headless listeners such as benchmarks.
+
+Listeners are called synchronously on the thread that emits, which for paho
+callbacks is the network thread. A UI listener should hand the work to its own
+thread (Clock.schedule_once, a queue drained by Tk's after(), ...).
+"""
+
+import logging
+
+logger = logging.getLogger("cosmos.events")
+
+
+class EventBus:
+    """Synchronous fan-out of (event, data) pairs to registered listeners"""
+
+    def __init__(self):
+        # Copy-on-write so emit() never has to copy or lock
+        self.listeners = ()
+
+    def add_listener(self, callback):
+        """Register callback(event, data)"""
+        self.listeners = self.listeners + (callback,)
+
+    def remove_listener(self, callback):
+        """Unregister a listener"""
+        self.listeners = tuple(listener for listener in self.listeners if listener != callback)
+
+    def emit(self, event, data=None):
+        """Deliver an event to every listener; a failing listener does not stop the rest"""
+        for callback in self.listeners:
+            try:
+                callback(event, data)
+            except Exception:
+                logger.exception("Listener failed for %s", event)
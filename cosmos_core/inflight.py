@@ -0,0 +1,180 @@
+"""
+COSMOS In-flight Tracker
+Correlates PUBACK/PUBCOMP acknowledgements with the press that caused them.
+
+QoS 1/2 publishes are tracked by message id in an OrderedDict, so both registering
+a press and matching its ack are O(1). The oldest entries sit at the front, which
+lets timeouts and overflow be handled in amortised constant time. (A plain dict
+degrades here: finding its first key after many deletions from the front means
+scanning the dead slots.) A fixed capacity bounds memory when the broker stops
+acknowledging. Round-trip times go into a log-linear histogram whose size never
+changes, however many presses it records.
+"""
+
+import array
+import collections
+import threading
+import time
+
+# 16 sub-buckets per power of two keeps every bucket within ~6% of its value
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+# Microsecond resolution up to 2**27 µs (~134 s); anything slower lands in the last bucket
+MAX_EXPONENT = 27
+
+
+class LatencyHistogram:
+    """Fixed-memory log-linear histogram of durations in seconds"""
+
+    def __init__(self):
+        self.counts = array.array('Q', bytes(8 * SUB_BUCKETS * (MAX_EXPONENT - SUB_BUCKET_BITS + 2)))
+        self.last = len(self.counts) - 1
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @staticmethod
+    def _index(micros):
+        if micros < SUB_BUCKETS:
+            return micros
+        shift = micros.bit_length() - SUB_BUCKET_BITS - 1
+        return (shift + 1) * SUB_BUCKETS + (micros >> shift) - SUB_BUCKETS
+
+    @staticmethod
+    def _value(index):
+        """Upper bound in microseconds of the values a bucket holds"""
+        if index < SUB_BUCKETS:
+            return index
+        shift = index // SUB_BUCKETS - 1
+        return ((index % SUB_BUCKETS + SUB_BUCKETS + 1) << shift) - 1
+
+    def record(self, seconds):
+        # _index() inlined: this runs on the press path when metrics are enabled
+        micros = int(seconds * 1e6)
+        if micros < SUB_BUCKETS:
+            index = micros if micros > 0 else 0
+        else:
+            shift = micros.bit_length() - SUB_BUCKET_BITS - 1
+            index = shift * SUB_BUCKETS + (micros >> shift)
+            if index > self.last:
+                index = self.last
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percent):
+        """Return the p-th percentile in seconds (bucket upper bound), or None if empty"""
+        if not self.count:
+            return None
+        target = max(1, int(self.count * percent / 100.0 + 0.5))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._value(index) / 1e6, self.max)
+        return self.max
+
+    def merge(self, other):
+        """Add another histogram's durations to this one, e.g. from a worker process"""
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        if other.max > self.max:
+            self.max = other.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def reset(self):
+        for index in range(len(self.counts)):
+            self.counts[index] = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+class InflightTracker:
+    """Outstanding QoS 1/2 presses keyed by paho message id"""
+
+    def __init__(self, capacity=65535, timeout=30.0):
+        self.capacity = capacity
+        self.timeout = timeout
+        # mid -> (command name, sent at); insertion order is send order
+        self.pending = collections.OrderedDict()
+        # Acks that arrived before track() registered their mid, mid -> acked at
+        self.early = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.histogram = LatencyHistogram()
+        self.confirmed = 0
+        self.timed_out = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def track(self, mid, name, sent_at):
+        """Register a sent press; returns its latency if the ack already arrived"""
+        with self.lock:
+            acked_at = self.early.pop(mid, None)
+            if acked_at is None:
+                self._sweep(sent_at)
+                if len(self.pending) >= self.capacity:
+                    self.pending.popitem(last=False)
+                    self.dropped += 1
+                # A reused mid replaces its stale entry and moves to the back
+                self.pending.pop(mid, None)
+                self.pending[mid] = (name, sent_at)
+                return None
+            latency = acked_at - sent_at
+            self.histogram.record(latency)
+            self.confirmed += 1
+            return latency
+
+    def ack(self, mid, now=None):
+        """Match an acknowledgement; returns (name, latency) or None if it was not tracked"""
+        now = time.perf_counter() if now is None else now
+        with self.lock:
+            entry = self.pending.pop(mid, None)
+            if entry is None:
+                # Usually a QoS 0 publish, else the publisher has not called track() yet
+                if len(self.early) >= 256:
+                    self.early.popitem(last=False)
+                self.early[mid] = now
+                return None
+            name, sent_at = entry
+            latency = now - sent_at
+            self.histogram.record(latency)
+            self.confirmed += 1
+            return name, latency
+
+    def _sweep(self, now):
+        """Drop entries older than the timeout, oldest first (call with the lock held)"""
+        pending = self.pending
+        while pending:
+            mid = next(iter(pending))
+            if now - pending[mid][1] < self.timeout:
+                break
+            del pending[mid]
+            self.timed_out += 1
+
+    def expire(self, now=None):
+        """Drop timed-out entries; returns how many are still pending"""
+        with self.lock:
+            self._sweep(time.perf_counter() if now is None else now)
+            return len(self.pending)
+
+    def summary(self):
+        """Return a one-line delivery status for the UIs"""
+        histogram = self.histogram
+        line = f"{self.confirmed} confirmed, {len(self.pending)} pending"
+        if self.timed_out:
+            line += f", {self.timed_out} timed out"
+        if histogram.count:
+            line += (f" | p50 {histogram.percentile(50) * 1000:.1f} ms"
+                     f" p99 {histogram.percentile(99) * 1000:.1f} ms")
+        return line
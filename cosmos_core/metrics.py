@@ -0,0 +1,338 @@
+"""
+COSMOS Controller Metrics
+Counters, fixed-bucket histograms and gauges kept by the controller core, cheap
+enough to update on the press path.
+
+Updates come from several threads at once: the UI and key threads on the press
+path, and one or more paho network threads (race clients). So every thread that
+updates a counter or histogram gets its own cell, created on its first update
+and written by that thread only. An update is a plain dict or array write with
+no lock and no lost increments. Readers sum the cells: snapshot() and the
+exporters add up the counters, and a histogram merges its per-thread
+LatencyHistograms when a percentile is asked for. When a thread ends, its
+cells are folded into a retired total, so memory follows the live threads rather
+than every thread that ever updated a metric. Gauges are read lazily, only
+when a snapshot is exported.
+
+Snapshots are exported as JSON or Prometheus text, to a file (write) or over a
+local HTTP port (serve):
+
+    controller.metrics.write("/sdcard/cosmos/metrics.prom")
+    controller.metrics.serve(9464)        # curl 127.0.0.1:9464/metrics
+"""
+
+import json
+import logging
+import os
+import struct
+import threading
+import time
+
+from cosmos_core.inflight import LatencyHistogram
+
+logger = logging.getLogger("cosmos.metrics")
+
+COUNTERS = (
+    'commands_sent',
+    'commands_confirmed',
+    'commands_acked',
+    'commands_retried',
+    'commands_unacked',
+    'commands_failed',
+    'commands_queued',
+    'commands_replayed',
+    'commands_expired',
+    'messages_received',
+    'telemetry_received',
+    'connects',
+    'links_lost',
+    'failovers',
+    'race_copies',
+)
+
+HISTOGRAMS = (
+    # connect() to CONNACK
+    'connect_seconds',
+    # Link lost to CONNACK of the resumed connection
+    'reconnect_seconds',
+    # Time spent inside the publish call on the press path
+    'publish_seconds',
+    # Time spent in on_message per incoming PUBLISH
+    'message_handling_seconds',
+    # Lag between posting a UI update and the toolkit running it
+    'ui_dispatch_seconds',
+    # Hardware key-down / on-screen button touch to the command's socket write
+    'key_to_write_seconds',
+    'button_to_write_seconds',
+    # UI -> controller service call -> reply, when the controller runs in the service
+    'service_call_seconds',
+)
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def socket_backlog(sock):
+    """Bytes queued in the kernel send buffer not yet acked by the peer, or None
+
+    Uses the TIOCOUTQ ioctl, so it only reports on Linux and Android.
+    """
+    if sock is None:
+        return None
+    try:
+        import fcntl
+        import termios
+        raw = fcntl.ioctl(sock.fileno(), termios.TIOCOUTQ, b"\0\0\0\0")
+    except (ImportError, AttributeError, OSError, ValueError):
+        return None
+    return struct.unpack("i", raw)[0]
+
+
+def add_counts(total, cell):
+    """Add a counter cell into total"""
+    # dict() copies in one step, so a key added meanwhile cannot break the loop
+    for name, value in dict(cell).items():
+        total[name] = total.get(name, 0) + value
+
+
+class ThreadCells:
+    """One cell per writing thread, created on its first use
+
+    Cells of threads that have ended are folded into one retired cell with
+    combine(total, cell), so short-lived threads do not pile up.
+    """
+
+    def __init__(self, factory, combine):
+        self.factory = factory
+        self.combine = combine
+        self.local = threading.local()
+        # Only held to register a new thread's cell and to list them
+        self.lock = threading.Lock()
+        # (thread, cell) of every thread that has written
+        self.cells = []
+        # Replaced, never changed, so a reader holding it sees fixed totals
+        self.retired = factory()
+
+    def cell(self):
+        """The calling thread's cell"""
+        try:
+            return self.local.cell
+        except AttributeError:
+            cell = self.local.cell = self.factory()
+            with self.lock:
+                self._retire()
+                self.cells.append((threading.current_thread(), cell))
+            return cell
+
+    def all(self):
+        """The retired cell and the cells of live threads"""
+        with self.lock:
+            self._retire()
+            return [self.retired] + [cell for _, cell in self.cells]
+
+    def _retire(self):
+        # A thread that has ended never writes its cell again
+        if all(thread.is_alive() for thread, _ in self.cells):
+            return
+        retired = self.factory()
+        self.combine(retired, self.retired)
+        live = []
+        for thread, cell in self.cells:
+            if thread.is_alive():
+                live.append((thread, cell))
+            else:
+                self.combine(retired, cell)
+        self.cells = live
+        self.retired = retired
+
+
+class ShardedHistogram:
+    """A LatencyHistogram per recording thread, merged when read"""
+
+    def __init__(self):
+        self.shards = ThreadCells(LatencyHistogram, LatencyHistogram.merge)
+
+    def record(self, seconds):
+        self.shards.cell().record(seconds)
+
+    def merge(self, other):
+        self.shards.cell().merge(other)
+
+    def merged(self):
+        """One LatencyHistogram holding every thread's durations"""
+        histogram = LatencyHistogram()
+        for shard in self.shards.all():
+            histogram.merge(shard)
+        return histogram
+
+    @property
+    def count(self):
+        return sum(shard.count for shard in self.shards.all())
+
+    @property
+    def total(self):
+        return sum(shard.total for shard in self.shards.all())
+
+    @property
+    def max(self):
+        return max((shard.max for shard in self.shards.all()), default=0.0)
+
+    def percentile(self, percent):
+        return self.merged().percentile(percent)
+
+
+class ControllerMetrics:
+    """Named counters, histograms and gauges with JSON and Prometheus export"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        # Per-thread name -> count dicts, summed by snapshot()
+        self.counters = ThreadCells(lambda: dict.fromkeys(COUNTERS, 0), add_counts)
+        self.histograms = {name: ShardedHistogram() for name in HISTOGRAMS}
+        # name -> callable returning a number, or None when it does not apply
+        self.gauges = {}
+        self.server = None
+
+    def increment(self, name, amount=1):
+        cell = self.counters.cell()
+        cell[name] = cell.get(name, 0) + amount
+
+    def __getitem__(self, name):
+        return sum(cell.get(name, 0) for cell in self.counters.all())
+
+    def observe(self, name, seconds):
+        """Record a duration in the named histogram"""
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms.setdefault(name, ShardedHistogram())
+        histogram.record(seconds)
+
+    def add_histogram(self, name, histogram):
+        """Export a histogram owned by another component, which serialises its writes, under `name`"""
+        self.histograms[name] = histogram
+
+    def add_gauge(self, name, read):
+        """Export read() under `name` each time a snapshot is taken"""
+        self.gauges[name] = read
+
+    def snapshot(self):
+        """Return every counter, summed over the threads that updated it"""
+        totals = dict.fromkeys(COUNTERS, 0)
+        for cell in self.counters.all():
+            add_counts(totals, cell)
+        return totals
+
+    def export(self):
+        """Return counters, gauges and histogram summaries as one JSON-ready dict"""
+        gauges = {}
+        for name, read in list(self.gauges.items()):
+            try:
+                value = read()
+            except Exception:
+                logger.exception("Reading gauge %s failed", name)
+                continue
+            if value is not None:
+                gauges[name] = value
+        histograms = {}
+        for name, histogram in list(self.histograms.items()):
+            if isinstance(histogram, ShardedHistogram):
+                histogram = histogram.merged()
+            summary = {'count': histogram.count, 'sum': histogram.total, 'max': histogram.max}
+            for quantile in QUANTILES:
+                summary[f"p{quantile * 100:g}"] = histogram.percentile(quantile * 100)
+            histograms[name] = summary
+        return {'timestamp': time.time(), 'counters': self.snapshot(),
+                'gauges': gauges, 'histograms': histograms}
+
+    def to_json(self):
+        return json.dumps(self.export(), indent=2, sort_keys=True)
+
+    def to_prometheus(self, prefix="cosmos"):
+        """Render a snapshot in the Prometheus text exposition format
+
+        Histograms are exported as summaries (quantiles, _sum and _count) since
+        their buckets are far finer than a scraper needs.
+        """
+        data = self.export()
+        lines = []
+        for name, value in sorted(data['counters'].items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        for name, value in sorted(data['gauges'].items()):
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+        for name, summary in sorted(data['histograms'].items()):
+            lines.append(f"# TYPE {prefix}_{name} summary")
+            for quantile in QUANTILES:
+                value = summary[f"p{quantile * 100:g}"]
+                lines.append(f'{prefix}_{name}{{quantile="{quantile:g}"}} '
+                             f'{"NaN" if value is None else repr(value)}')
+            lines.append(f"{prefix}_{name}_sum {summary['sum']!r}")
+            lines.append(f"{prefix}_{name}_count {summary['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Atomically write a snapshot to path: JSON for *.json, else Prometheus text"""
+        text = self.to_json() if path.endswith(".json") else self.to_prometheus()
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as handle:
+            handle.write(text)
+        os.replace(temporary, path)
+
+    def serve(self, port=9464, host="127.0.0.1"):
+        """Serve /metrics (Prometheus) and /metrics.json on a background thread
+
+        Returns the bound port, which is useful with port=0.
+        """
+        if self.server is not None:
+            return self.server.server_address[1]
+        # Only pulled in when exporting, to keep app start fast
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path == "/metrics.json":
+                    body, content_type = metrics.to_json(), "application/json"
+                elif path in ("/", "/metrics"):
+                    body, content_type = metrics.to_prometheus(), "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                body = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug("metrics: " + format, *args)
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="cosmos-metrics", daemon=True).start()
+        return self.server.server_address[1]
+
+    def export_from_env(self, environ=None):
+        """Serve on $COSMOS_METRICS_PORT if set; returns $COSMOS_METRICS_FILE or None
+
+        The apps write the returned file when they close.
+        """
+        environ = os.environ if environ is None else environ
+        port = environ.get("COSMOS_METRICS_PORT")
+        if port:
+            try:
+                logger.info("Serving metrics on 127.0.0.1:%d", self.serve(int(port)))
+            except (OSError, ValueError) as e:
+                logger.warning("Could not serve metrics on port %s - %s", port, e)
+        return environ.get("COSMOS_METRICS_FILE") or None
+
+    def stop_serving(self):
+        server, self.server = self.server, None
+        if server is not None:
+            server.shutdown()
+            server.server_close()
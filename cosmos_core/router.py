@@ -0,0 +1,250 @@
+"""
+COSMOS Message Router
+Sends each incoming PUBLISH to the handlers whose topic filter matches it.
+
+Filters are MQTT subscriptions, wildcards included: `+` matches one level and
+`#` the rest of the topic, as in "drones/+/telemetry/#". They are compiled into a
+trie with one node per level, so matching a topic walks at most a few branches
+per level. The cost grows with the depth of the topic, not with the number of
+filters. Matches are also cached per topic; a registered or removed filter
+starts a fresh cache.
+
+Each handler picks where it runs:
+
+    network  on paho's network thread, straight away. For short handlers only:
+             while it runs, no other message, ack or keepalive is processed.
+    worker   on a small thread pool, for handlers that parse, store or block
+    ui       on the UI thread, through `ui(route, fn, *args)`. The apps set this
+             to their UIDispatcher's call_latest(), so a busy route costs the UI
+             one call per frame: a handler sees the newest message, and older
+             ones that arrived within the same frame are skipped. Without it, ui
+             handlers run on the network thread.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("cosmos.router")
+
+NETWORK = 'network'
+WORKER = 'worker'
+UI = 'ui'
+CONTEXTS = (NETWORK, WORKER, UI)
+
+
+def validate_filter(topic_filter):
+    """Raise ValueError unless topic_filter is a valid MQTT topic filter"""
+    if not topic_filter:
+        raise ValueError("empty topic filter")
+    levels = topic_filter.split('/')
+    for index, level in enumerate(levels):
+        if '#' in level and (level != '#' or index != len(levels) - 1):
+            raise ValueError(f"'#' must be a whole last level: {topic_filter!r}")
+        if '+' in level and level != '+':
+            raise ValueError(f"'+' must be a whole level: {topic_filter!r}")
+    return levels
+
+
+class _Node:
+    __slots__ = ('children', 'values')
+
+    def __init__(self):
+        self.children = {}
+        # Copy-on-write, so a match running on another thread never sees a partial update
+        self.values = ()
+
+
+class TopicTrie:
+    """Topic filters -> values, looked up by topic with MQTT wildcard rules
+
+    Topics starting with '$' (broker topics such as $SYS) are not matched by a
+    wildcard in the first level, as the MQTT spec requires.
+    """
+
+    def __init__(self, max_cache=4096):
+        self.root = _Node()
+        self.max_cache = max_cache
+        self.cache = {}
+        self.lock = threading.Lock()
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, topic_filter, value):
+        levels = validate_filter(topic_filter)
+        with self.lock:
+            node = self.root
+            for level in levels:
+                child = node.children.get(level)
+                if child is None:
+                    child = node.children[level] = _Node()
+                node = child
+            node.values = node.values + (value,)
+            self.size += 1
+            # A match in progress keeps filling the old cache, which is dropped
+            self.cache = {}
+
+    def remove(self, topic_filter, value):
+        """Remove one value; returns False if it was not registered under topic_filter"""
+        levels = validate_filter(topic_filter)
+        with self.lock:
+            path = [self.root]
+            for level in levels:
+                node = path[-1].children.get(level)
+                if node is None:
+                    return False
+                path.append(node)
+            node = path[-1]
+            if value not in node.values:
+                return False
+            values = list(node.values)
+            values.remove(value)
+            node.values = tuple(values)
+            self.size -= 1
+            # Prune the branch back to the last node still in use
+            for parent, level in zip(reversed(path[:-1]), reversed(levels)):
+                child = parent.children[level]
+                if child.values or child.children:
+                    break
+                del parent.children[level]
+            self.cache = {}
+        return True
+
+    def match(self, topic):
+        """Values of every filter matching topic, in no particular order"""
+        cache = self.cache
+        found = cache.get(topic)
+        if found is not None:
+            return found
+        found = self._walk(topic)
+        if len(cache) >= self.max_cache:
+            cache.clear()
+        cache[topic] = found
+        return found
+
+    def _walk(self, topic):
+        levels = topic.split('/')
+        found = []
+        nodes = [self.root]
+        wildcards = not topic.startswith('$')
+        for level in levels:
+            following = []
+            for node in nodes:
+                children = node.children
+                if wildcards:
+                    rest = children.get('#')
+                    if rest is not None:
+                        found.extend(rest.values)
+                    child = children.get('+')
+                    if child is not None:
+                        following.append(child)
+                child = children.get(level)
+                if child is not None:
+                    following.append(child)
+            if not following:
+                return tuple(found)
+            nodes = following
+            wildcards = True
+        for node in nodes:
+            found.extend(node.values)
+            # "a/#" also matches "a"
+            rest = node.children.get('#')
+            if rest is not None:
+                found.extend(rest.values)
+        return tuple(found)
+
+
+class Route:
+    """One registered handler, returned by MessageRouter.route()"""
+
+    __slots__ = ('topic_filter', 'handler', 'context', 'qos')
+
+    def __init__(self, topic_filter, handler, context, qos):
+        self.topic_filter = topic_filter
+        self.handler = handler
+        self.context = context
+        self.qos = qos
+
+    def __repr__(self):
+        return f"Route({self.topic_filter!r}, {self.context})"
+
+
+class MessageRouter:
+    """Dispatches messages to handler(msg) by topic filter, each in its chosen context"""
+
+    def __init__(self, ui=None, workers=2):
+        self.trie = TopicTrie()
+        # ui(route, fn, *args) runs fn on the UI thread, e.g. UIDispatcher.call_latest
+        self.ui = ui
+        self.workers = workers
+        self.pool = None
+        self.pool_lock = threading.Lock()
+        self.routes = ()
+        self.dispatched = 0
+        self.errors = 0
+
+    def __len__(self):
+        return len(self.routes)
+
+    def route(self, topic_filter, handler, context=NETWORK, qos=0):
+        """Call handler(msg) for every message matching topic_filter; returns the Route"""
+        if context not in CONTEXTS:
+            raise ValueError(f"unknown context {context!r}")
+        route = Route(topic_filter, handler, context, qos)
+        self.trie.add(topic_filter, route)
+        self.routes = self.routes + (route,)
+        return route
+
+    def unroute(self, route):
+        """Remove a route; returns False if it was not registered"""
+        if not self.trie.remove(route.topic_filter, route):
+            return False
+        self.routes = tuple(other for other in self.routes if other is not route)
+        return True
+
+    def filters(self):
+        """topic filter -> highest QoS any of its routes asked for"""
+        filters = {}
+        for route in self.routes:
+            filters[route.topic_filter] = max(route.qos, filters.get(route.topic_filter, 0))
+        return filters
+
+    def dispatch(self, msg):
+        """Hand msg to every matching route; returns the number of routes it went to"""
+        routes = self.trie.match(msg.topic)
+        for route in routes:
+            if route.context == NETWORK:
+                self._run(route, msg)
+            elif route.context == WORKER:
+                self._worker_pool().submit(self._run, route, msg)
+            elif self.ui is not None:
+                self.ui(route, self._run, route, msg)
+            else:
+                self._run(route, msg)
+        self.dispatched += len(routes)
+        return len(routes)
+
+    def _run(self, route, msg):
+        try:
+            route.handler(msg)
+        except Exception:
+            self.errors += 1
+            logger.exception("Handler for %s failed on %s", route.topic_filter, msg.topic)
+
+    def _worker_pool(self):
+        pool = self.pool
+        if pool is None:
+            with self.pool_lock:
+                if self.pool is None:
+                    self.pool = ThreadPoolExecutor(self.workers, thread_name_prefix="cosmos-router")
+                pool = self.pool
+        return pool
+
+    def close(self):
+        """Stop the worker pool once its queued handlers ran"""
+        with self.pool_lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
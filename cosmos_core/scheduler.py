@@ -0,0 +1,189 @@
+"""
+COSMOS Outbound Scheduler
+Keeps background publishes from getting between a press and the socket.
+
+paho writes everything through one FIFO queue, and the kernel send buffer behind
+it is another. A BRAKE queued behind a burst of status messages has to wait for
+all of them. So outbound traffic goes through lanes:
+
+    safety  brake and land. These are queued on paho straight away and moved
+            ahead of everything paho has queued (mqtt_wire.expedite). Only the
+            packet paho is already writing can be in front of them. The socket
+            has TCP_NODELAY (reconnect.tune_socket), so Nagle does not hold them
+            back either.
+
+    normal  background publishes that must all arrive, in order
+
+    bulk    status, heartbeats and similar. These are rate-limited by a token
+            bucket. While one waits, a newer publish with the same key (the
+            topic by default) replaces it, so only the latest value is sent.
+
+Normal and bulk publishes wait in the scheduler. They are handed to paho only
+while its queue holds at most `max_packets` entries and the kernel holds at most
+`max_backlog` unsent bytes. The wait in front of a safety packet therefore stays
+short even when the link is saturated. Normal always goes before bulk.
+"""
+
+import collections
+import logging
+import threading
+import time
+
+logger = logging.getLogger("cosmos.scheduler")
+
+NORMAL = 'normal'
+BULK = 'bulk'
+
+
+class TokenBucket:
+    """`rate` sends per second on average, up to `burst` at once"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.perf_counter()
+
+    def take(self, now=None):
+        """Take a token; returns 0.0 on success, else the seconds until one is available"""
+        now = time.perf_counter() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+class OutboundScheduler:
+    """Feeds normal and bulk publishes to the link only while it is not backed up
+
+    publish(topic, payload, qos) sends one message. depth() returns (packets
+    queued in paho, unsent bytes in the kernel or None), or None while there is no
+    link, in which case everything waits.
+    """
+
+    def __init__(self, publish, depth, max_packets=2, max_backlog=2048, bulk_rate=20.0,
+                 bulk_burst=10, max_queued=1024, poll=0.002):
+        self.publish = publish
+        self.depth = depth
+        self.max_packets = max_packets
+        self.max_backlog = max_backlog
+        self.bucket = TokenBucket(bulk_rate, bulk_burst)
+        self.max_queued = max_queued
+        # How often a congested link is checked again
+        self.poll = poll
+        self.condition = threading.Condition()
+        self.normal = collections.deque()
+        # key -> (topic, payload, qos), oldest key first
+        self.bulk = collections.OrderedDict()
+        self.sent = {NORMAL: 0, BULK: 0}
+        self.coalesced = 0
+        self.dropped = 0
+        self.running = False
+        self.thread = None
+
+    def __len__(self):
+        return len(self.normal) + len(self.bulk)
+
+    def submit(self, topic, payload, qos=0, lane=BULK, key=None):
+        """Queue a publish on a lane; a full lane drops its oldest entry"""
+        with self.condition:
+            if lane == NORMAL:
+                if len(self.normal) >= self.max_queued:
+                    self.normal.popleft()
+                    self.dropped += 1
+                self.normal.append((topic, payload, qos))
+            elif lane == BULK:
+                key = topic if key is None else key
+                if key in self.bulk:
+                    self.coalesced += 1
+                elif len(self.bulk) >= self.max_queued:
+                    self.bulk.popitem(last=False)
+                    self.dropped += 1
+                # Keeps the key's place in line, with the newest value
+                self.bulk[key] = (topic, payload, qos)
+            else:
+                raise ValueError(f"unknown lane {lane!r}")
+            if not self.running:
+                self._start()
+            self.condition.notify()
+        return True
+
+    def kick(self):
+        """Check the link again now, e.g. when paho's queue drained or the link came up"""
+        with self.condition:
+            if not self.running and (self.normal or self.bulk):
+                self._start()
+            self.condition.notify()
+
+    def congested(self, depth):
+        """True while paho's queue or the kernel send buffer is too full for more"""
+        packets, backlog = depth
+        return packets > self.max_packets or (backlog is not None and backlog > self.max_backlog)
+
+    def _start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="cosmos-outbound", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop feeding; queued publishes are kept for the next kick() or submit()"""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join(1.0)
+            self.thread = None
+
+    def clear(self):
+        with self.condition:
+            self.normal.clear()
+            self.bulk.clear()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running and not (self.normal or self.bulk):
+                    self.condition.wait()
+                if not self.running:
+                    return
+            wait = self._feed()
+            if wait != 0.0:
+                with self.condition:
+                    if self.running:
+                        self.condition.wait(wait)
+
+    def _feed(self):
+        """Hand publishes to the link until it backs up
+
+        Returns 0.0 once the lanes are empty, else the seconds to wait before
+        trying again, or None to wait for kick() while there is no link.
+        """
+        while True:
+            depth = self.depth()
+            if depth is None:
+                return None
+            if self.congested(depth):
+                return self.poll
+            with self.condition:
+                if self.normal:
+                    lane, message = NORMAL, self.normal.popleft()
+                elif self.bulk:
+                    wait = self.bucket.take()
+                    if wait:
+                        return wait
+                    lane, message = BULK, self.bulk.popitem(last=False)[1]
+                else:
+                    return 0.0
+            try:
+                self.publish(*message)
+            except Exception as e:
+                logger.warning("Dropped a %s publish to %s: %s", lane, message[0], e)
+                continue
+            self.sent[lane] += 1
+
+    def summary(self):
+        """One-line lane accounting"""
+        return (f"sent {self.sent[NORMAL]} normal / {self.sent[BULK]} bulk, "
+                f"{len(self)} waiting, {self.coalesced} coalesced, {self.dropped} dropped")
@@ -0,0 +1,429 @@
+"""
+COSMOS Controller Service
+Runs the controller core in a process of its own (the Android foreground
+service, see service.py at the top level) and lets the UI drive it over a local
+socket. The broker connection then outlives the Activity: pausing or killing
+the UI leaves the paho thread, its socket and the session alone.
+
+    ControllerService serves one controller to any number of local clients.
+    Requests are JSON lines {"id": 7, "call": "publish_brake", "args": []}, and
+    only the controller methods in SERVICE_CALLS can be called. Each reply
+    carries the request's id. Controller events are pushed to every client as
+    {"event": "link_lost", "data": [...]}.
+
+    ServiceClient is the UI's end. It has publish_brake/publish_land/
+    publish_command like the controller, so the buttons and the volume key
+    dispatcher can send through either. A press is one short write on the
+    socket and does not wait for the reply.
+
+    WakePolicy decides which locks the service holds. While the screen is on
+    the device is awake anyway and nothing is held. While it is off and a link
+    should be up, it holds a partial wake lock and a Wi-Fi lock, so keepalives
+    and reconnects are not stalled by CPU sleep or Wi-Fi power save.
+
+The socket is a Unix socket in the app's private directory, so no other app
+can connect. A (host, port) address uses TCP where Unix sockets are missing.
+"""
+
+import collections
+import itertools
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from cosmos_core.events import EventBus
+from cosmos_core.metrics import ControllerMetrics
+
+logger = logging.getLogger("cosmos.service")
+
+SERVICE_CALLS = frozenset((
+    'connect', 'disconnect', 'warm_up', 'status',
+    'publish_brake', 'publish_land', 'publish_command', 'publish_background',
+    'enable_command_acks', 'disable_command_acks',
+    'enable_offline_queue', 'disable_offline_queue',
+    'enable_race_publishing', 'disable_race_publishing',
+    'enable_keep_warm', 'disable_keep_warm',
+    'enable_mqtt5', 'disable_mqtt5',
+))
+
+# Run on a thread of their own so presses from the same client are not held up
+SLOW_CALLS = frozenset(('connect', 'warm_up'))
+
+# Not relayed: paho message objects at telemetry rate
+QUIET_EVENTS = frozenset(('message',))
+
+class ServiceError(Exception):
+    """The service refused or failed a call"""
+
+
+def service_address():
+    """The socket path shared by the app and its service
+
+    python-for-android points ANDROID_PRIVATE at the app's private files
+    directory in both processes, also when the system restarts the service alone.
+    """
+    directory = os.environ.get('ANDROID_PRIVATE') or tempfile.gettempdir()
+    return os.path.join(directory, "cosmos-controller.sock")
+
+
+def listen(address):
+    """Listening socket for a Unix socket path or a (host, port) pair"""
+    if isinstance(address, str):
+        try:
+            os.unlink(address)
+        except FileNotFoundError:
+            pass
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(address)
+        os.chmod(address, 0o600)
+    else:
+        server = socket.create_server(address)
+    server.listen(8)
+    return server
+
+
+def dial(address, timeout):
+    """Connected socket to a service address"""
+    if isinstance(address, str):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(address)
+        except OSError:
+            sock.close()
+            raise
+    else:
+        sock = socket.create_connection(address, timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.settimeout(None)
+    return sock
+
+
+class Connection:
+    """One end of a service socket, sending JSON lines from any thread"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        data = (json.dumps(message, separators=(',', ':'), default=str) + "\n").encode('utf-8')
+        with self.lock:
+            self.sock.sendall(data)
+
+    def lines(self):
+        """Yield each received message until the other end closes"""
+        reader = self.sock.makefile('rb')
+        try:
+            for line in reader:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.warning("Ignoring a malformed service message")
+        except OSError:
+            return
+        finally:
+            reader.close()
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class ControllerService:
+    """Serves one controller to local clients"""
+
+    def __init__(self, controller, address):
+        self.controller = controller
+        self.address = address
+        self.server = None
+        self.clients = []
+        self.lock = threading.Lock()
+        self.started = time.time()
+        controller.add_listener(self.relay)
+
+    def start(self):
+        self.server = listen(self.address)
+        threading.Thread(target=self._accept_loop, name="cosmos-service", daemon=True).start()
+        logger.info("Controller service listening on %s", self.address)
+        return self
+
+    def stop(self):
+        self.controller.remove_listener(self.relay)
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        with self.lock:
+            clients, self.clients = self.clients, []
+        for connection in clients:
+            connection.close()
+
+    def _accept_loop(self):
+        while self.server is not None:
+            try:
+                sock, _ = self.server.accept()
+            except OSError:
+                return
+            connection = Connection(sock)
+            with self.lock:
+                self.clients.append(connection)
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection):
+        for request in connection.lines():
+            if request.get('call') in SLOW_CALLS:
+                threading.Thread(target=self._call, args=(connection, request), daemon=True).start()
+            else:
+                self._call(connection, request)
+        with self.lock:
+            if connection in self.clients:
+                self.clients.remove(connection)
+        connection.close()
+
+    def _call(self, connection, request):
+        name = request.get('call')
+        reply = {'id': request.get('id')}
+        try:
+            if name not in SERVICE_CALLS:
+                raise ServiceError(f"{name!r} cannot be called through the service")
+            args = request.get('args', [])
+            reply['result'] = self.status() if name == 'status' else getattr(self.controller, name)(*args)
+        except Exception as e:
+            reply['error'] = f"{type(e).__name__}: {e}"
+        try:
+            connection.send(reply)
+        except OSError:
+            pass
+
+    def relay(self, event, data):
+        """Push a controller event to every client"""
+        if event in QUIET_EVENTS:
+            return
+        with self.lock:
+            clients = list(self.clients)
+        for connection in clients:
+            try:
+                connection.send({'event': event, 'data': data})
+            except OSError:
+                pass
+
+    def status(self):
+        controller = self.controller
+        return {'connected': controller.connected, 'host': controller.broker_host,
+                'port': controller.broker_port, 'pid': os.getpid(),
+                'uptime': time.time() - self.started,
+                'commands_sent': controller.metrics['commands_sent']}
+
+
+class ServiceClient:
+    """The UI's end of a ControllerService, usable where a controller sends commands
+
+    Replies to presses are matched in the background: their round trip goes into
+    the service_call_seconds histogram. A press the controller refused is already
+    reported by its relayed events; one the service failed to call is reported as
+    a command_failed event.
+    """
+
+    def __init__(self, address, metrics=None, timeout=2.0):
+        self.address = address
+        self.timeout = timeout
+        self.connection = None
+        # The service's broker link, kept up to date from its events
+        self.connected = False
+        self.events = EventBus()
+        self.metrics = metrics if metrics is not None else ControllerMetrics()
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        # id -> [Event, reply] of calls waiting for their reply
+        self.waiting = {}
+        # id -> (command name, perf_counter() sent, time_to_write() stamps)
+        self.presses = {}
+        self.write_stamps = collections.deque()
+
+    def open(self, wait=0.0):
+        """Connect to the service, retrying for up to `wait` seconds while it starts"""
+        deadline = time.perf_counter() + wait
+        while True:
+            try:
+                sock = dial(self.address, self.timeout)
+                break
+            except OSError:
+                if time.perf_counter() >= deadline:
+                    raise
+                time.sleep(0.05)
+        self.connection = Connection(sock)
+        threading.Thread(target=self._read_loop, args=(self.connection,), name="cosmos-service-client",
+                         daemon=True).start()
+        status = self.call('status')
+        self.connected = status['connected']
+        return status
+
+    def close(self):
+        connection, self.connection = self.connection, None
+        if connection is not None:
+            connection.close()
+
+    def add_listener(self, callback):
+        self.events.add_listener(callback)
+
+    def remove_listener(self, callback):
+        self.events.remove_listener(callback)
+
+    def call(self, name, *args, timeout=None):
+        """Call a controller method in the service and return its result"""
+        connection = self.connection
+        if connection is None:
+            raise ServiceError("not connected to the service")
+        request_id = next(self.ids)
+        slot = [threading.Event(), None]
+        with self.lock:
+            self.waiting[request_id] = slot
+        try:
+            connection.send({'id': request_id, 'call': name, 'args': list(args)})
+            if not slot[0].wait(self.timeout if timeout is None else timeout):
+                raise ServiceError(f"no reply to {name}")
+        finally:
+            with self.lock:
+                self.waiting.pop(request_id, None)
+        reply = slot[1]
+        if 'error' in reply:
+            raise ServiceError(reply['error'])
+        return reply.get('result')
+
+    def connect(self, host, port, username, password, timeout=30.0):
+        """Connect the service's controller; True once its TCP connect succeeded"""
+        return self.call('connect', host, port, username, password, timeout=timeout)
+
+    def disconnect(self):
+        return self.call('disconnect')
+
+    def press(self, name, call, *args):
+        """Send a command without waiting; False only if the service is unreachable"""
+        connection = self.connection
+        if connection is None:
+            return False
+        request_id = next(self.ids)
+        stamps = []
+        while self.write_stamps:
+            stamps.append(self.write_stamps.popleft())
+        with self.lock:
+            self.presses[request_id] = (name, time.perf_counter(), stamps)
+        try:
+            connection.send({'id': request_id, 'call': call, 'args': list(args)})
+        except OSError:
+            with self.lock:
+                self.presses.pop(request_id, None)
+            return False
+        return True
+
+    def publish_brake(self):
+        return self.press('brake', 'publish_brake')
+
+    def publish_land(self):
+        return self.press('land', 'publish_land')
+
+    def publish_command(self, name):
+        return self.press(name, 'publish_command', name)
+
+    def time_to_write(self, histogram, pressed_at):
+        """Time pressed_at until the service has handed the next press to paho"""
+        stamp = (histogram, pressed_at)
+        self.write_stamps.append(stamp)
+        return stamp
+
+    def cancel_write(self, stamp):
+        try:
+            self.write_stamps.remove(stamp)
+        except ValueError:
+            pass
+
+    def _read_loop(self, connection):
+        for message in connection.lines():
+            if 'event' in message:
+                self._on_event(message['event'], message.get('data'))
+            else:
+                self._on_reply(message)
+        if self.connection is connection:
+            self.connection = None
+        self.connected = False
+        with self.lock:
+            waiting, self.waiting = self.waiting, {}
+            self.presses.clear()
+        for slot in waiting.values():
+            slot[1] = {'error': "service connection closed"}
+            slot[0].set()
+        self.events.emit('service_lost', None)
+
+    def _on_reply(self, reply):
+        now = time.perf_counter()
+        with self.lock:
+            slot = self.waiting.get(reply.get('id'))
+            press = self.presses.pop(reply.get('id'), None) if slot is None else None
+        if slot is not None:
+            slot[1] = reply
+            slot[0].set()
+            return
+        if press is None:
+            return
+        name, sent_at, stamps = press
+        self.metrics.observe('service_call_seconds', now - sent_at)
+        if 'error' in reply:
+            self.events.emit('command_failed', (name, reply['error']))
+        elif reply.get('result'):
+            for histogram, pressed_at in stamps:
+                self.metrics.observe(histogram, now - pressed_at)
+
+    def _on_event(self, event, data):
+        if event == 'connected':
+            self.connected = True
+        elif event in ('link_lost', 'disconnected', 'connect_failed'):
+            self.connected = False
+        self.events.emit(event, data)
+
+
+class WakePolicy:
+    """Holds the CPU and Wi-Fi awake while the screen is off and a link should be up
+
+    acquire() and release() take and drop the platform's locks. Feed it the
+    controller's events (as a listener) and screen changes.
+    """
+
+    def __init__(self, acquire, release):
+        self.acquire = acquire
+        self.release = release
+        self.screen_on = True
+        # Connected, or reconnecting after a dropped link
+        self.linked = False
+        self.held = False
+        self.lock = threading.Lock()
+
+    def on_event(self, event, data):
+        if event in ('connected', 'link_lost', 'connect_refused'):
+            self._update(linked=True)
+        elif event in ('disconnected', 'connect_failed'):
+            self._update(linked=False)
+
+    def screen(self, on):
+        self._update(screen_on=on)
+
+    def close(self):
+        self._update(linked=False)
+
+    def _update(self, linked=None, screen_on=None):
+        with self.lock:
+            if linked is not None:
+                self.linked = linked
+            if screen_on is not None:
+                self.screen_on = screen_on
+            want = self.linked and not self.screen_on
+            if want == self.held:
+                return
+            self.held = want
+            (self.acquire if want else self.release)()
@@ -0,0 +1,140 @@
+"""
+COSMOS TLS Transport
+A client SSLContext that every connection of a controller shares (main link,
+race clients and broker probes), so reconnecting never pays for a full TLS setup:
+
+    the context is built once per configuration and cached, so loading the CA
+    bundle and certificates is not repeated on reconnect
+
+    the TLS session of each broker is kept and offered on the next handshake, so
+    the broker can resume it (ticket or session id) and skip the certificate
+    exchange and its signature checks
+
+    certificates can be pinned by SHA-256 fingerprint; the pin is checked right
+    after the handshake, before credentials are sent
+
+paho resolves nothing itself when the controller connects by address (see
+DNSCache), so the context also maps each address back to the broker's name for SNI
+and hostname checks.
+"""
+
+import hashlib
+import logging
+import ssl
+import threading
+import time
+
+from cosmos_core.inflight import LatencyHistogram
+
+logger = logging.getLogger("cosmos.tls")
+
+_contexts = {}
+_contexts_lock = threading.Lock()
+
+
+def fingerprint(der):
+    """SHA-256 fingerprint of a DER certificate as lowercase hex"""
+    return hashlib.sha256(der).hexdigest()
+
+
+def normalize_pin(pin):
+    """Accept "AB:CD:..." or "abcd..." fingerprints"""
+    return pin.replace(":", "").strip().lower()
+
+
+class ResumingSSLSocket(ssl.SSLSocket):
+    """SSLSocket that reports each handshake to its TLSContext"""
+
+    def do_handshake(self, block=False):
+        if getattr(self, 'handshake_done', False):
+            return
+        started = time.perf_counter()
+        super().do_handshake(block)
+        self.handshake_done = True
+        self.context.handshake_finished(self, time.perf_counter() - started)
+
+
+class TLSContext(ssl.SSLContext):
+    """Client context with per-broker session resumption and certificate pinning"""
+
+    sslsocket_class = ResumingSSLSocket
+
+    def __new__(cls, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        return super().__new__(cls, protocol)
+
+    def __init__(self, protocol=ssl.PROTOCOL_TLS_CLIENT):
+        self.pins = set()
+        # (server name, port) -> ssl.SSLSession of the last handshake
+        self.sessions = {}
+        # address connected to -> broker name, for SNI and hostname checks
+        self.server_names = {}
+        self.full = LatencyHistogram()
+        self.resumed = LatencyHistogram()
+
+    def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True,
+                    suppress_ragged_eofs=True, server_hostname=None, session=None):
+        """Wrap sock for the broker, offering its last session for resumption"""
+        name = self.server_names.get(server_hostname, server_hostname)
+        if session is None and name is not None:
+            session = self.sessions.get((name, _peer_port(sock)))
+        return super().wrap_socket(sock, server_side, do_handshake_on_connect,
+                                   suppress_ragged_eofs, name, session)
+
+    def handshake_finished(self, sock, seconds):
+        """Check the pin, time the handshake and keep the session"""
+        if self.pins:
+            der = sock.getpeercert(binary_form=True)
+            if der is None or fingerprint(der) not in self.pins:
+                sock.close()
+                raise ssl.SSLCertVerificationError(
+                    f"certificate of {sock.server_hostname} matches no pinned fingerprint")
+        (self.resumed if sock.session_reused else self.full).record(seconds)
+        self.remember(sock)
+
+    def remember(self, sock):
+        """Keep sock's session for its broker
+
+        TLS 1.3 sends session tickets after the handshake, so call this again
+        once the first data has been read (the controller does on CONNACK).
+        """
+        session = getattr(sock, 'session', None)
+        if session is not None and sock.server_hostname:
+            self.sessions[(sock.server_hostname, _peer_port(sock))] = session
+
+
+def _peer_port(sock):
+    try:
+        return sock.getpeername()[1]
+    except (OSError, IndexError):
+        return None
+
+
+def tls_context(ca_file=None, certfile=None, keyfile=None, pins=()):
+    """Return the shared TLSContext for this configuration, building it on first use
+
+    With pins and no ca_file the pins are the only trust anchor, which suits a
+    broker with a self-signed certificate. Otherwise the system CAs (or ca_file)
+    are verified as usual and the pins are checked on top.
+    """
+    pins = frozenset(normalize_pin(pin) for pin in pins)
+    key = (ca_file, certfile, keyfile, pins)
+    with _contexts_lock:
+        context = _contexts.get(key)
+        if context is not None:
+            return context
+        started = time.perf_counter()
+        context = TLSContext()
+        context.minimum_version = ssl.TLSVersion.TLSv1_2
+        if pins and ca_file is None:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        elif ca_file is not None:
+            context.load_verify_locations(ca_file)
+        else:
+            context.load_default_certs()
+        if certfile is not None:
+            context.load_cert_chain(certfile, keyfile)
+        context.pins.update(pins)
+        _contexts[key] = context
+        logger.info("TLS context built in %.1f ms", (time.perf_counter() - started) * 1000)
+        return context
@@ -0,0 +1,174 @@
+"""
+COSMOS Connection Warm-up
+Keeps the first press after launch or resume as fast as any later one.
+
+DNSCache answers repeated lookups of the broker host from memory for a TTL. A
+failed refresh falls back to the last good answer, so a flaky resolver never
+stands between a press and a reconnect.
+
+KeepWarm sends a tiny QoS 0 echo to the controller's own topic whenever the link
+has been idle for `interval` seconds. This keeps NAT bindings alive and stops the
+Wi-Fi radio from dropping into power save. The echo round trip also shows how long
+the path may sit idle: if an echo after an idle gap comes back much slower than
+the warm baseline, the path had gone cold and the interval is halved. Otherwise
+the interval grows slowly up to `maximum`, so quiet networks cost little traffic.
+"""
+
+import collections
+import ipaddress
+import logging
+import socket
+import threading
+import time
+
+logger = logging.getLogger("cosmos.warmup")
+
+
+class DNSCache:
+    """getaddrinfo() answers per (host, port), reused for `ttl` seconds"""
+
+    def __init__(self, ttl=300.0, resolver=None):
+        self.ttl = ttl
+        self.resolver = resolver or socket.getaddrinfo
+        # (host, port) -> (expires at, address)
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, host, port, now=None):
+        """Return an IP address for host, from the cache while it is fresh"""
+        try:
+            ipaddress.ip_address(host)
+            return host
+        except ValueError:
+            pass
+        now = time.monotonic() if now is None else now
+        key = (host, int(port))
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is not None and entry[0] > now:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        try:
+            infos = self.resolver(host, port, 0, socket.SOCK_STREAM)
+        except OSError:
+            if entry is not None:
+                logger.warning("Resolving %s failed, using the cached %s", host, entry[1])
+                return entry[1]
+            raise
+        address = infos[0][4][0]
+        with self.lock:
+            self.entries[key] = (now + self.ttl, address)
+        return address
+
+    def expired(self, host, port, now=None):
+        """True if the next resolve() of host will ask the resolver"""
+        entry = self.entries.get((host, int(port)))
+        return entry is None or entry[0] <= (time.monotonic() if now is None else now)
+
+    def prefetch(self, host, port):
+        """Resolve on a background thread so the connect does not wait for DNS"""
+        def run():
+            try:
+                self.resolve(host, port)
+            except OSError as e:
+                logger.info("Prefetching %s failed - %s", host, e)
+
+        thread = threading.Thread(target=run, name="cosmos-dns", daemon=True)
+        thread.start()
+        return thread
+
+
+class KeepWarm:
+    """Idle echoes at an interval that adapts to how fast the path goes cold"""
+
+    def __init__(self, interval=5.0, minimum=1.0, maximum=25.0, slow_factor=2.0, slow_margin=0.02):
+        self.interval = interval
+        self.minimum = minimum
+        self.maximum = maximum
+        # An echo slower than baseline * slow_factor + slow_margin means the path went cold
+        self.slow_factor = slow_factor
+        self.slow_margin = slow_margin
+        self.recent = collections.deque(maxlen=16)
+        self.last_activity = time.perf_counter()
+        self.sent_at = None
+        self.echoes = 0
+        self.cold = 0
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.running = False
+
+    @property
+    def baseline(self):
+        """Round trip of the warm path: the fastest recent echo"""
+        return min(self.recent) if self.recent else None
+
+    def touch(self, now=None):
+        """Note traffic on the link; an echo is only needed after `interval` of silence"""
+        self.last_activity = time.perf_counter() if now is None else now
+
+    def due(self, now=None):
+        """Seconds until the next echo, 0 if it is due now"""
+        now = time.perf_counter() if now is None else now
+        return max(0.0, self.last_activity + self.interval - now)
+
+    def sent(self, now=None):
+        self.sent_at = time.perf_counter() if now is None else now
+        self.touch(self.sent_at)
+
+    def echoed(self, now=None):
+        """Record the echo coming back and adapt the interval; returns its round trip"""
+        if self.sent_at is None:
+            return None
+        now = time.perf_counter() if now is None else now
+        rtt = now - self.sent_at
+        self.sent_at = None
+        baseline = self.baseline
+        if baseline is not None and rtt > baseline * self.slow_factor + self.slow_margin:
+            self.cold += 1
+            self.interval = max(self.minimum, self.interval / 2)
+        else:
+            self.interval = min(self.maximum, self.interval * 1.25)
+        self.recent.append(rtt)
+        self.echoes += 1
+        return rtt
+
+    def start(self, send):
+        """Run the echo timer thread; send() publishes one echo"""
+        if self.running:
+            return
+        self.running = True
+        self.wakeup.clear()
+        self.thread = threading.Thread(target=self._run, args=(send,), name="cosmos-warm", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+            self.thread = None
+
+    def kick(self):
+        """Send an echo now, e.g. when the app resumes"""
+        self.last_activity = 0.0
+        self.wakeup.set()
+
+    def _run(self, send):
+        while self.running:
+            wait = self.due()
+            if wait > 0:
+                self.wakeup.wait(wait)
+                self.wakeup.clear()
+                continue
+            try:
+                if send():
+                    self.sent()
+                else:
+                    # Not connected; look again after a full interval
+                    self.touch()
+            except Exception:
+                logger.exception("Keep-warm echo failed")
+                self.touch()
@@ -5,107 +5,88 @@ Optimized for Pydroid 3 on Android devices.
 """
 
 import json
+import os
 import threading
-import time
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
-import paho.mqtt.client as mqtt
 
+from cosmos_core import MQTTController as ControllerCore
+from flight_recorder import new_session_path
+from log_pipeline import LogPipeline
+from ui_dispatch import PollingBridge, UIDispatcher
 
-class MQTTController:
+
+class MQTTController(ControllerCore):
+    """Tk adapter over the shared controller core: renders events into the activity log"""
+    
     def __init__(self, app_instance):
+        super().__init__()
         self.app = app_instance
-        self.client = None
-        self.connected = False
-        self.broker_host = ""
-        self.broker_port = 1883
-        self.username = ""
-        self.password = ""
-        self.brake_topic = "brakeCosmos"
-        self.land_topic = "landCosmos"
-        
-    def connect(self, host, port, username, password):
-        """Connect to MQTT broker"""
-        try:
-            self.broker_host = host
-            self.broker_port = int(port)
-            self.username = username
-            self.password = password
-            
-            self.client = mqtt.Client()
-            if username and password:
-                self.client.username_pw_set(username, password)
-            self.client.on_connect = self.on_connect
-            self.client.on_disconnect = self.on_disconnect
-            self.client.on_message = self.on_message
-            
-            self.client.connect(host, int(port), 60)
-            self.client.loop_start()
-            
-            self.app.log_message(f"MQTT: Connecting to {host}:{port}")
-            return True
-            
-        except Exception as e:
-            self.app.log_message(f"Connection failed: {str(e)}")
-            return False
+        self.sent_messages = {}
+        self.add_listener(self.on_event)
+        
+    def build_command_cache(self):
+        """Pre-encode the packet and log line for every known command"""
+        super().build_command_cache()
+        self.sent_messages = {name: f"📤 {name} command sent: {topic} = {payload}"
+                              for name, (topic, payload) in self.commands().items()}
+        self.sent_messages['brake'] = f"🛑 BRAKE command sent: {self.brake_topic} = {self.brake_payload}"
+        self.sent_messages['land'] = f"🛬 LAND command sent: {self.land_topic} = {self.land_payload}"
+        for name in self.sent_messages:
+            if self.qos_for(name) > 0:
+                self.sent_messages[name] += " (awaiting ack)"
     
-    def on_connect(self, client, userdata, flags, rc):
-        """Callback for when the client receives a CONNACK response from the server"""
-        if rc == 0:
-            self.connected = True
-            self.app.log_message("✅ Connected to MQTT broker")
+    def on_event(self, event, data):
+        """Render a core event; runs on paho's thread, so it only queues UI updates"""
+        if event == 'command_sent':
+            self.app.log_message(self.sent_messages[data[0]])
+        elif event == 'command_confirmed':
+            self.app.log_message(f"✅ {data[0].upper()} confirmed by broker in {data[1] * 1000:.1f} ms")
+        elif event == 'command_acked':
+            self.app.log_message(f"🚁 {data[0].upper()} acknowledged by drone in {data[1] * 1000:.1f} ms"
+                                 + (f" after {data[2]} attempts" if data[2] > 1 else ""))
+        elif event == 'command_retry':
+            self.app.log_message(f"🔁 No drone ack, resending {data[0].upper()} (attempt {data[1]})")
+        elif event == 'command_unacked':
+            self.app.log_message(f"❌ Drone never acknowledged {data[0].upper()} after {data[1]} attempts")
+        elif event == 'connecting':
+            self.app.log_message(f"MQTT: Connecting to {data[0]}:{data[1]}")
+        elif event == 'connect_failed':
+            self.app.log_message(f"Connection failed: {data}")
+        elif event == 'connected':
+            recovered = data[0]
+            if recovered is None:
+                self.app.log_message("✅ Connected to MQTT broker")
+            else:
+                self.app.log_message(f"✅ Reconnected in {recovered:.2f}s")
             self.app.update_connection_status(True)
-        else:
-            self.connected = False
-            self.app.log_message(f"❌ Connection failed with code {rc}")
+        elif event == 'connect_refused':
+            self.app.log_message(f"❌ Connection failed with code {data[0]}, retrying in {data[1]:.1f}s")
             self.app.update_connection_status(False)
-    
-    def on_disconnect(self, client, userdata, rc):
-        """Callback for when the client disconnects from the broker"""
-        self.connected = False
-        self.app.log_message("📡 Disconnected from MQTT broker")
-        self.app.update_connection_status(False)
-    
-    def on_message(self, client, userdata, msg):
-        """Callback for when a PUBLISH message is received from the server"""
-        self.app.log_message(f"📨 Received: {msg.topic} - {msg.payload.decode()}")
-    
-    def publish_brake(self):
-        """Publish brake command"""
-        if self.connected and self.client:
-            try:
-                payload = "1"
-                self.client.publish(self.brake_topic, payload)
-                self.app.log_message(f"🛑 BRAKE command sent: {self.brake_topic} = {payload}")
-                return True
-            except Exception as e:
-                self.app.log_message(f"❌ Failed to send brake: {str(e)}")
-                return False
-        else:
-            self.app.log_message("⚠️ Not connected, cannot send brake command")
-            return False
-    
-    def publish_land(self):
-        """Publish land command"""
-        if self.connected and self.client:
-            try:
-                payload = "1"
-                self.client.publish(self.land_topic, payload)
-                self.app.log_message(f"🛬 LAND command sent: {self.land_topic} = {payload}")
-                return True
-            except Exception as e:
-                self.app.log_message(f"❌ Failed to send land: {str(e)}")
-                return False
-        else:
-            self.app.log_message("⚠️ Not connected, cannot send land command")
-            return False
-    
-    def disconnect(self):
-        """Disconnect from MQTT broker"""
-        if self.client:
-            self.client.loop_stop()
-            self.client.disconnect()
-            self.connected = False
+        elif event == 'failover':
+            self.app.log_message(f"🔀 Failing over to {data[0]}:{data[1]}")
+        elif event == 'protocol_fallback':
+            self.app.log_message("⚠️ Broker refused MQTT 5, reconnecting with MQTT 3.1.1")
+        elif event == 'link_lost':
+            self.app.log_message(f"📡 Connection lost, reconnecting in {data[1]:.1f}s")
+            self.app.update_connection_status(False)
+        elif event == 'disconnected':
+            self.app.log_message("📡 Disconnected from MQTT broker")
+            self.app.update_connection_status(False)
+        elif event == 'message':
+            self.app.log_message(f"📨 Received: {data.topic} - {data.payload.decode()}")
+        elif event == 'command_failed':
+            self.app.log_message(f"❌ Failed to send {data[0]}: {data[1]}")
+        elif event == 'command_queued':
+            self.app.log_message(f"📥 {data.upper()} queued until the broker is reachable")
+        elif event == 'queue_failed':
+            self.app.log_message(f"❌ Failed to queue {data[0]}: {data[1]}")
+        elif event == 'not_connected':
+            self.app.log_message(f"⚠️ Not connected, cannot send {data} command")
+        elif event == 'unknown_command':
+            self.app.log_message(f"❌ Unknown command: {data}")
+        elif event == 'replayed':
+            self.app.log_message(f"📤 Replayed {data[0]} queued command(s), dropped {data[1]} stale")
 
 
 class COSMOSMQTTApp:
@@ -120,7 +101,28 @@ class COSMOSMQTTApp:
         self.style.theme_use('clam')
         
         self.mqtt_controller = MQTTController(self)
+        self.log_pipeline = LogPipeline(max_lines=500)
+        self.metrics_file = self.mqtt_controller.metrics.export_from_env()
+        # Widget updates from other threads are queued here and applied by the
+        # mainloop, polling fast only while commands are in flight
+        self.dispatcher = UIDispatcher(max_calls=64)
+        self.dispatcher.on('connected', self.apply_connection_status)
+        # Routes subscribed with context='ui' run on the mainloop too, newest message only
+        self.mqtt_controller.router.ui = self.dispatcher.call_latest
+        self.bridge = PollingBridge(
+            self.dispatcher, self.root.after, busy=self.mqtt_controller.commands_in_flight,
+            on_lag=lambda lag: self.mqtt_controller.metrics.observe('ui_dispatch_seconds', lag))
         self.setup_ui()
+        self.bridge.start()
+        self.start_recording()
+        # Resolve the broker and load paho now, and keep the link warm once
+        # connected, so the first press costs no more than later ones
+        self.mqtt_controller.enable_keep_warm()
+        self.root.after(0, lambda: self.mqtt_controller.warm_up(
+            self.host_entry.get().strip() or "broker.hivemq.com", self.port_entry.get().strip() or "1883"))
+        self.root.after(0, self.flush_log)
+        self.root.after(200, self.refresh_telemetry)
+        self.root.after(200, self.refresh_delivery)
         
     def setup_ui(self):
         """Setup the user interface"""
@@ -187,6 +189,35 @@ class COSMOSMQTTApp:
                                 width=12, height=3, command=self.send_land)
         self.land_btn.pack(side=tk.RIGHT, padx=10)
         
+        # Offline queue toggle
+        self.offline_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(main_frame, text="📥 Queue commands while offline",
+                       variable=self.offline_var, command=self.toggle_offline_queue,
+                       fg='white', bg='#2c3e50', selectcolor='#34495e',
+                       activebackground='#2c3e50').pack(anchor='w')
+        
+        # Drone-level acknowledgements
+        self.acks_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(main_frame, text="🤝 Require drone acknowledgement",
+                       variable=self.acks_var, command=self.toggle_command_acks,
+                       fg='white', bg='#2c3e50', selectcolor='#34495e',
+                       activebackground='#2c3e50').pack(anchor='w')
+        self.race_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(main_frame, text="🏁 Race BRAKE/LAND over all brokers",
+                       variable=self.race_var, command=self.toggle_race_publishing,
+                       fg='white', bg='#2c3e50', selectcolor='#34495e',
+                       activebackground='#2c3e50').pack(anchor='w')
+        self.mqtt5_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(main_frame, text="5️⃣ MQTT 5 (topic aliases, expiry)",
+                       variable=self.mqtt5_var, command=self.toggle_mqtt5,
+                       fg='white', bg='#2c3e50', selectcolor='#34495e',
+                       activebackground='#2c3e50').pack(anchor='w')
+        
+        # Delivery confirmation for QoS 1/2 commands
+        self.delivery_label = tk.Label(main_frame, text="📬 Delivery: QoS 0, not confirmed",
+                                       fg='#bdc3c7', bg='#2c3e50', font=('Arial', 9))
+        self.delivery_label.pack(anchor='w')
+        
         # Topics info
         topics_frame = tk.LabelFrame(main_frame, text="MQTT Topics", 
                                    font=('Arial', 10, 'bold'), fg='white', bg='#34495e')
@@ -197,6 +228,15 @@ class COSMOSMQTTApp:
         tk.Label(topics_frame, text="🛬 Land: landCosmos (payload: '1')", 
                 fg='white', bg='#34495e').pack(anchor='w', padx=5, pady=2)
         
+        # Telemetry (refreshed at display rate, not per message)
+        telemetry_frame = tk.LabelFrame(main_frame, text="Telemetry", 
+                                      font=('Arial', 10, 'bold'), fg='white', bg='#34495e')
+        telemetry_frame.pack(fill=tk.X, pady=5)
+        self.telemetry_label = tk.Label(telemetry_frame, text="No telemetry yet", justify=tk.LEFT,
+                                      fg='white', bg='#34495e', font=('Consolas', 9))
+        self.telemetry_label.pack(anchor='w', padx=5, pady=2)
+        self.telemetry_seen = 0
+        
         # Log area
         log_frame = tk.LabelFrame(main_frame, text="Activity Log", 
                                 font=('Arial', 10, 'bold'), fg='white', bg='#34495e')
@@ -212,14 +252,49 @@ class COSMOSMQTTApp:
         self.log_message("📝 Enter MQTT broker details and click Connect")
         
     def log_message(self, message):
-        """Add a timestamped message to the log"""
-        timestamp = time.strftime("[%H:%M:%S]")
-        log_entry = f"{timestamp} {message}\n"
-        self.log_text.insert(tk.END, log_entry)
-        self.log_text.see(tk.END)
+        """Queue a timestamped message for the log; safe to call from any thread"""
+        self.log_pipeline.post(message)
+    
+    def flush_log(self):
+        """Render queued log lines in one batch, then schedule the next flush"""
+        lines, overflowed = self.log_pipeline.take_batch()
+        if lines:
+            if overflowed:
+                self.log_text.delete('1.0', tk.END)
+            self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+            # Evict the oldest lines past the configured limit
+            line_count = int(self.log_text.index('end-1c').split('.')[0]) - 1
+            excess = line_count - self.log_pipeline.max_lines
+            if excess > 0:
+                self.log_text.delete('1.0', f'{excess + 1}.0')
+            self.log_text.see(tk.END)
+        self.root.after(int(self.log_pipeline.interval * 1000), self.flush_log)
+        
+    def refresh_telemetry(self):
+        """Show the latest downsampled telemetry if new samples arrived"""
+        telemetry = self.mqtt_controller.telemetry
+        if telemetry.messages != self.telemetry_seen:
+            self.telemetry_seen = telemetry.messages
+            self.telemetry_label.config(text=telemetry.summary())
+        self.root.after(200, self.refresh_telemetry)
+    
+    def refresh_delivery(self):
+        """Show confirmed vs pending QoS 1/2 commands and their ack latency"""
+        inflight = self.mqtt_controller.inflight
+        inflight.expire()
+        acks = self.mqtt_controller.acks
+        if acks is not None:
+            self.delivery_label.config(text=f"📬 Delivery: {acks.summary()}")
+        elif inflight.confirmed or len(inflight):
+            self.delivery_label.config(text=f"📬 Delivery: {inflight.summary()}")
+        self.root.after(200, self.refresh_delivery)
         
     def update_connection_status(self, connected):
-        """Update the connection status display"""
+        """Show the connection state; safe to call from any thread"""
+        self.dispatcher.post('connected', connected)
+    
+    def apply_connection_status(self, connected):
+        """Update the connection status display, on the Tk thread"""
         if connected:
             self.status_label.config(text="✅ Connected", fg='#27ae60')
             self.connect_btn.config(text="🔌 Disconnect", bg='#e74c3c')
@@ -251,21 +326,79 @@ class COSMOSMQTTApp:
             # Connect in background thread
             def connect_worker():
                 success = self.mqtt_controller.connect(host, port, username, password)
-                # Re-enable button
-                self.root.after(100, lambda: self.connect_btn.config(state='normal'))
-                if not success:
-                    self.root.after(100, lambda: self.update_connection_status(False))
+                # Tk widgets are only touched from the mainloop
+                self.dispatcher.call(self.connect_finished, success)
             
             threading.Thread(target=connect_worker, daemon=True).start()
     
+    def connect_finished(self, success):
+        """Re-enable the connect button once the connect attempt returned"""
+        self.connect_btn.config(state='normal')
+        if not success:
+            self.apply_connection_status(False)
+    
+    def start_recording(self):
+        """Keep a flight log of the session, replayable with replay.py"""
+        try:
+            path = new_session_path(os.path.join(os.path.expanduser("~"), ".cosmos_sessions"))
+            self.mqtt_controller.enable_recorder(path)
+            self.log_message(f"⏺️ Recording session to {path}")
+        except OSError as e:
+            self.log_message(f"⚠️ Could not record the session: {e}")
+    
+    def toggle_offline_queue(self):
+        """Enable or disable the durable offline command queue"""
+        if self.offline_var.get():
+            path = os.path.join(os.path.expanduser("~"), ".cosmos_offline_commands.q")
+            self.mqtt_controller.enable_offline_queue(path)
+            self.log_message(f"📥 Offline queue enabled ({path})")
+        else:
+            self.mqtt_controller.disable_offline_queue()
+            self.log_message("📥 Offline queue disabled")
+    
+    def toggle_command_acks(self):
+        """Turn drone-level command acknowledgements on or off"""
+        if self.acks_var.get():
+            self.mqtt_controller.enable_command_acks()
+            self.log_message("🤝 Commands now wait for a drone acknowledgement")
+        else:
+            self.mqtt_controller.disable_command_acks()
+            self.log_message("🤝 Drone acknowledgements disabled")
+    
+    def toggle_race_publishing(self):
+        """Send safety commands through every broker of a comma-separated host list"""
+        if not self.race_var.get():
+            self.mqtt_controller.disable_race_publishing()
+            self.log_message("🏁 Racing disabled, using the current broker only")
+            return
+        try:
+            self.mqtt_controller.enable_race_publishing()
+        except ValueError:
+            self.race_var.set(False)
+            messagebox.showwarning("Warning", "Enter several brokers, separated by commas, to race commands")
+            return
+        self.acks_var.set(True)
+        self.log_message(f"🏁 Racing BRAKE/LAND over {len(self.mqtt_controller.brokers)} brokers")
+    
+    def toggle_mqtt5(self):
+        """Speak MQTT 5 from the next connect, falling back to 3.1.1 if refused"""
+        if self.mqtt5_var.get():
+            self.mqtt_controller.enable_mqtt5()
+            self.log_message("5️⃣ MQTT 5 on, used from the next connect")
+        else:
+            self.mqtt_controller.disable_mqtt5()
+            self.log_message("5️⃣ MQTT 3.1.1 used from the next connect")
+    
     def send_brake(self):
         """Send brake command"""
-        if not self.mqtt_controller.connected:
+        if not self.mqtt_controller.connected and self.mqtt_controller.offline_queue is None:
             messagebox.showwarning("Warning", "Not connected to MQTT broker!")
             return
         
         success = self.mqtt_controller.publish_brake()
         if success:
+            # Pick up the ack and status updates without waiting for an idle poll
+            self.bridge.boost()
             # Visual feedback
             original_color = self.brake_btn.cget('bg')
             self.brake_btn.config(bg='#c0392b')
@@ -275,12 +408,14 @@ class COSMOSMQTTApp:
     
     def send_land(self):
         """Send land command"""
-        if not self.mqtt_controller.connected:
+        if not self.mqtt_controller.connected and self.mqtt_controller.offline_queue is None:
             messagebox.showwarning("Warning", "Not connected to MQTT broker!")
             return
         
         success = self.mqtt_controller.publish_land()
         if success:
+            # Pick up the ack and status updates without waiting for an idle poll
+            self.bridge.boost()
             # Visual feedback
             original_color = self.land_btn.cget('bg')
             self.land_btn.config(bg='#1e8449')
@@ -290,8 +425,15 @@ class COSMOSMQTTApp:
     
     def on_closing(self):
         """Handle application closing"""
+        self.bridge.stop()
         if self.mqtt_controller.connected:
             self.mqtt_controller.disconnect()
+        self.mqtt_controller.disable_recorder()
+        if self.metrics_file:
+            try:
+                self.mqtt_controller.metrics.write(self.metrics_file)
+            except OSError as e:
+                print(f"Could not write metrics to {self.metrics_file}: {e}")
         self.root.destroy()
     
     def run(self):
@@ -0,0 +1,167 @@
+"""
+COSMOS Fleet Controller
+Drives many COSMOS drones over a small pool of shared broker connections.
+
+Each drone gets its own topic namespace (cosmos/<drone_id>/brakeCosmos by default)
+and is pinned to one pooled AsyncMQTTController. Broadcast brake/land commands are
+pre-encoded per connection and written as one batched buffer, so "brake all" costs
+one socket write per pooled connection instead of one publish() per drone.
+"""
+
+import logging
+
+import mqtt_wire as wire
+from async_controller import AsyncMQTTController, get_shared_loop
+
+logger = logging.getLogger("cosmos.fleet")
+
+
+class FleetController:
+    """Maps drone IDs to per-drone topics and multiplexes them over pooled connections"""
+
+    def __init__(self, drone_ids=(), pool_size=2, topic_prefix="cosmos/{drone_id}/", loop=None):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        self.loop = loop or get_shared_loop()
+        self.topic_prefix = topic_prefix
+        self.brake_topic = "brakeCosmos"
+        self.land_topic = "landCosmos"
+        self.brake_payload = "1"
+        self.land_payload = "1"
+        self.qos = 0
+        self.pool = [AsyncMQTTController(loop=self.loop) for _ in range(pool_size)]
+        # drone_id -> index of its pooled connection, and the reverse grouping
+        self.assignments = {}
+        self.groups = [[] for _ in self.pool]
+        # (pool index, prefix, command topic, payload) -> concatenated PUBLISH packets for a broadcast
+        self._broadcast_cache = {}
+        for drone_id in drone_ids:
+            self.add_drone(drone_id)
+
+    @property
+    def connected(self):
+        """True when every pooled connection is up"""
+        return all(connection.connected for connection in self.pool)
+
+    @property
+    def drone_ids(self):
+        return list(self.assignments)
+
+    def add_listener(self, callback):
+        """Register callback(event, data) on every pooled connection"""
+        for connection in self.pool:
+            connection.add_listener(callback)
+
+    # Fleet membership
+
+    def add_drone(self, drone_id):
+        """Add a drone, pinning it to the least loaded pooled connection"""
+        if drone_id in self.assignments:
+            return
+        loads = [len(group) for group in self.groups]
+        index = loads.index(min(loads))
+        self.assignments[drone_id] = index
+        self.groups[index].append(drone_id)
+        self._invalidate(index)
+
+    def remove_drone(self, drone_id):
+        """Remove a drone from the fleet"""
+        index = self.assignments.pop(drone_id, None)
+        if index is not None:
+            self.groups[index].remove(drone_id)
+            self._invalidate(index)
+
+    def _invalidate(self, index):
+        for key in [key for key in self._broadcast_cache if key[0] == index]:
+            del self._broadcast_cache[key]
+
+    def topic_for(self, drone_id, command):
+        """Return the namespaced command topic for a drone"""
+        base = self.brake_topic if command == 'brake' else self.land_topic
+        return self.topic_prefix.format(drone_id=drone_id) + base
+
+    def _payload_for(self, command):
+        return self.brake_payload if command == 'brake' else self.land_payload
+
+    # Connection management
+
+    def connect(self, host, port, username, password):
+        """Open every pooled connection"""
+        return all([connection.connect(host, port, username, password)
+                    for connection in self.pool])
+
+    def disconnect(self):
+        """Close every pooled connection"""
+        for connection in self.pool:
+            connection.disconnect()
+
+    # Per-drone commands
+
+    def publish_brake(self, drone_id):
+        """Publish brake command to one drone"""
+        return self._publish_one(drone_id, 'brake')
+
+    def publish_land(self, drone_id):
+        """Publish land command to one drone"""
+        return self._publish_one(drone_id, 'land')
+
+    def _publish_one(self, drone_id, command):
+        connection = self.pool[self.assignments[drone_id]]
+        return connection.publish(self.topic_for(drone_id, command),
+                                  self._payload_for(command), self.qos, command)
+
+    # Broadcast commands
+
+    def brake_all(self):
+        """Brake every drone in one batched write per pooled connection"""
+        return self._broadcast('brake')
+
+    def land_all(self):
+        """Land every drone in one batched write per pooled connection"""
+        return self._broadcast('land')
+
+    def _broadcast(self, command):
+        """Fan a command out to every drone, returning the number of drones reached"""
+        reached = 0
+        for index, connection in enumerate(self.pool):
+            drones = self.groups[index]
+            if not drones:
+                continue
+            if not connection.connected:
+                logger.warning("Fleet: Connection %d down, %d drones missed %s",
+                               index, len(drones), command)
+                continue
+            if self.qos == 0:
+                batch = self._broadcast_packets(index, command, drones)
+                connection.call_in_loop(self._write_batch, connection, batch)
+            else:
+                topics = [self.topic_for(drone_id, command) for drone_id in drones]
+                connection.call_in_loop(self._publish_batch, connection, topics,
+                                         self._payload_for(command), self.qos)
+            reached += len(drones)
+        return reached
+
+    def _broadcast_packets(self, index, command, drones):
+        """Return the cached concatenated QoS 0 PUBLISH packets for a connection"""
+        payload = self._payload_for(command)
+        # The topics are public attributes that may be changed after the first broadcast
+        base = self.brake_topic if command == 'brake' else self.land_topic
+        key = (index, self.topic_prefix, base, payload)
+        batch = self._broadcast_cache.get(key)
+        if batch is None:
+            batch = b''.join(wire.encode_publish(self.topic_for(drone_id, command), payload)
+                             for drone_id in drones)
+            self._broadcast_cache[key] = batch
+        return batch
+
+    def _write_batch(self, connection, batch):
+        """Queue a pre-encoded batch and flush it in one write (event loop thread)"""
+        wire.queue_raw_publish(connection.client, batch)
+        connection.client.loop_write()
+
+    def _publish_batch(self, connection, topics, payload, qos):
+        """Queue QoS 1/2 publishes in one loop callback and flush once (event loop thread)"""
+        client = connection.client
+        for topic in topics:
+            client.publish(topic, payload, qos=qos)
+        client.loop_write()
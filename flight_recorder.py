@@ -0,0 +1,239 @@
+"""
+COSMOS Flight Recorder
+A compact binary log of a flight session: every command sent, every ack,
+connection state change and incoming message, with monotonic timestamps.
+
+The log is a memory-mapped file. A record is a 4-byte length followed by the
+time since the session started, a kind, QoS and the name, topic and payload
+bytes. Recording one is a copy into the mapping under a lock, so the publish
+path never waits for the disk. A background flusher writes dirty pages out every
+flush_interval seconds and grows the file a chunk at a time, ahead of the writer.
+If the writer catches up with the end of the mapping anyway, records are counted
+as dropped rather than grown inline.
+
+The length prefix is written last, and the unused rest of the file is zeros, so
+a log cut short by a crash ends cleanly at the last complete record. close()
+trims the file to what was written.
+
+Read a log back with FlightLog; replay.py plays one against a broker.
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+MAGIC = b"CFLIGHT1"
+# magic, wall-clock start time
+HEADER = struct.Struct("<8sd")
+HEADER_SIZE = 64
+LENGTH = struct.Struct("<I")
+# seconds since start, kind, qos, name length, topic length, payload length
+RECORD = struct.Struct("<dBBHHI")
+
+COMMAND = 1
+ACK = 2
+STATE = 3
+MESSAGE = 4
+KIND_NAMES = {COMMAND: 'command', ACK: 'ack', STATE: 'state', MESSAGE: 'message'}
+
+# Controller events and the kind they are recorded as; 'message' is recorded
+# by the controller itself so routed and telemetry messages are included
+EVENT_KINDS = {
+    'command_confirmed': ACK,
+    'command_acked': ACK,
+    'command_retry': ACK,
+    'command_unacked': ACK,
+    'command_failed': ACK,
+    'command_queued': STATE,
+    'connecting': STATE,
+    'connected': STATE,
+    'connect_failed': STATE,
+    'connect_refused': STATE,
+    'failover': STATE,
+    'link_lost': STATE,
+    'disconnected': STATE,
+    'reconnect_failed': STATE,
+    'protocol_fallback': STATE,
+    'not_connected': STATE,
+    'replayed': STATE,
+}
+
+
+def _encode(value):
+    if value is None:
+        return b""
+    if isinstance(value, str):
+        return value.encode('utf-8')
+    return bytes(value)
+
+
+def new_session_path(directory, keep=20, now=None):
+    """A fresh timestamped log path in directory, deleting all but the newest `keep` logs"""
+    os.makedirs(directory, exist_ok=True)
+    logs = sorted(name for name in os.listdir(directory) if name.endswith('.flight'))
+    for name in logs[:max(0, len(logs) - keep + 1)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+    return os.path.join(directory, f"cosmos-{stamp}-{os.getpid()}.flight")
+
+
+class SessionRecord:
+    """One record read back from a flight log"""
+
+    __slots__ = ('time', 'kind', 'qos', 'name', 'topic', 'payload')
+
+    def __init__(self, time, kind, qos, name, topic, payload):
+        self.time = time
+        self.kind = kind
+        self.qos = qos
+        self.name = name
+        self.topic = topic
+        self.payload = payload
+
+    def data(self):
+        """The event data of an ack or state record, decoded"""
+        return json.loads(self.payload) if self.payload else None
+
+    def __repr__(self):
+        return f"SessionRecord({self.time:.6f}, {KIND_NAMES.get(self.kind, self.kind)}, {self.name!r}, {self.topic!r})"
+
+
+class FlightRecorder:
+    """Appends session records to a memory-mapped log"""
+
+    def __init__(self, path, chunk=1 << 20, flush_interval=0.5):
+        self.path = path
+        self.chunk = chunk
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.file = open(path, 'w+b')
+        self.file.truncate(HEADER_SIZE + chunk)
+        self.mm = mmap.mmap(self.file.fileno(), HEADER_SIZE + chunk)
+        self.started = time.perf_counter()
+        HEADER.pack_into(self.mm, 0, MAGIC, time.time())
+        self.position = HEADER_SIZE
+        self.records = 0
+        self.dropped = 0
+        self.wake = threading.Event()
+        self.running = True
+        self.flusher = threading.Thread(target=self._flush_loop, name="cosmos-recorder", daemon=True)
+        self.flusher.start()
+
+    def __len__(self):
+        return self.records
+
+    def write(self, kind, name="", topic="", payload=b"", qos=0, now=None):
+        """Append one record; returns False if it was dropped"""
+        name = _encode(name)
+        topic = _encode(topic)
+        payload = _encode(payload)
+        elapsed = (time.perf_counter() if now is None else now) - self.started
+        size = RECORD.size + len(name) + len(topic) + len(payload)
+        with self.lock:
+            mm = self.mm
+            offset = self.position
+            end = offset + LENGTH.size + size
+            if mm is None or end > len(mm):
+                self.dropped += 1
+                self.wake.set()
+                return False
+            start = offset + LENGTH.size
+            RECORD.pack_into(mm, start, elapsed, kind, qos, len(name), len(topic), len(payload))
+            start += RECORD.size
+            body = name + topic + payload
+            mm[start:start + len(body)] = body
+            # The length goes in last: a reader never sees a half-written record
+            LENGTH.pack_into(mm, offset, size)
+            self.position = end
+            self.records += 1
+            if len(mm) - end < self.chunk // 2:
+                self.wake.set()
+        return True
+
+    def on_event(self, event, data):
+        """Controller event listener"""
+        if event == 'command_sent':
+            name, topic, payload = data
+            self.write(COMMAND, name, topic, payload)
+            return
+        kind = EVENT_KINDS.get(event)
+        if kind is not None:
+            self.write(kind, event, "", json.dumps(data, default=str))
+
+    def message(self, msg):
+        """Record an incoming paho message"""
+        self.write(MESSAGE, "", msg.topic, msg.payload, msg.qos)
+
+    def _flush_loop(self):
+        while self.running:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            with self.lock:
+                mm = self.mm
+                if mm is None:
+                    return
+                if len(mm) - self.position < self.chunk // 2:
+                    # Remaps and extends the file; only this thread changes the mapping
+                    mm.resize(len(mm) + self.chunk)
+            mm.flush()
+
+    def close(self):
+        """Flush, stop the flusher and trim the log to the records written"""
+        self.running = False
+        self.wake.set()
+        self.flusher.join(2.0)
+        with self.lock:
+            mm, self.mm = self.mm, None
+            if mm is None:
+                return
+            mm.flush()
+            mm.close()
+            self.file.truncate(self.position)
+            self.file.close()
+
+    def summary(self):
+        """One-line accounting"""
+        return f"{self.records} records, {self.position} bytes, {self.dropped} dropped"
+
+
+class FlightLog:
+    """Reads the records of a flight log, complete or cut short"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        if len(self.data) < HEADER.size:
+            raise ValueError(f"{path} is not a flight log")
+        magic, self.wall_start = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a flight log")
+
+    def __iter__(self):
+        data = self.data
+        offset = HEADER_SIZE
+        end = len(data)
+        while offset + LENGTH.size + RECORD.size <= end:
+            size, = LENGTH.unpack_from(data, offset)
+            if size < RECORD.size or offset + LENGTH.size + size > end:
+                # Zeros past the last record, or a record cut short
+                return
+            start = offset + LENGTH.size
+            elapsed, kind, qos, name_len, topic_len, payload_len = RECORD.unpack_from(data, start)
+            start += RECORD.size
+            name = data[start:start + name_len].decode('utf-8')
+            start += name_len
+            topic = data[start:start + topic_len].decode('utf-8')
+            start += topic_len
+            yield SessionRecord(elapsed, kind, qos, name, topic, data[start:start + payload_len])
+            offset += LENGTH.size + size
+
+    def records(self, kinds=None):
+        """The records as a list, optionally only those of the given kinds"""
+        return [record for record in self if kinds is None or record.kind in kinds]
@@ -0,0 +1,146 @@
+"""
+COSMOS Hardware Key Fast Path
+Sends BRAKE/LAND for hardware key presses (the volume rocker on Android) from a
+dedicated thread that calls the controller directly, so a press never waits for
+the UI toolkit's event loop, widget dispatch or a busy frame:
+
+    the platform's key callback only records the press and wakes the thread,
+    and returns straight away
+
+    debounce: auto-repeat of a held key is ignored, and so is a press of the
+    same command within `debounce` seconds of the last one accepted
+
+    coalescing: presses that arrive while the thread is still sending are merged
+    into one send per command, BRAKE before LAND
+
+The thread asks the OS for a higher priority where it is allowed to (Android lets
+apps raise their own threads). Key-down to socket write goes into the
+key_to_write_seconds histogram. Key-down times must come from the same monotonic
+clock as time.perf_counter(), which on Android and Linux is also Java's
+System.nanoTime().
+"""
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("cosmos.keys")
+
+# android.view.KeyEvent key codes
+KEYCODE_VOLUME_UP = 24
+KEYCODE_VOLUME_DOWN = 25
+
+DEFAULT_BINDINGS = {KEYCODE_VOLUME_UP: 'brake', KEYCODE_VOLUME_DOWN: 'land'}
+
+# Sent first when presses of several commands are waiting
+PRIORITY = ('brake', 'land')
+
+
+class KeyCommandDispatcher:
+    """Turns key-down events into controller commands on its own thread"""
+
+    def __init__(self, controller, bindings=None, debounce=0.15, nice=-10):
+        self.controller = controller
+        # key code -> command name
+        self.bindings = dict(bindings or DEFAULT_BINDINGS)
+        self.debounce = debounce
+        self.nice = nice
+        self.condition = threading.Condition()
+        # command name -> key-down time of the oldest press not sent yet
+        self.pending = {}
+        # command name -> key-down time of the last press accepted
+        self.last_press = {}
+        self.pressed = 0
+        self.sent = 0
+        self.debounced = 0
+        self.coalesced = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """Start the sending thread"""
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="cosmos-keys", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the sending thread; presses still waiting are dropped"""
+        with self.condition:
+            self.running = False
+            self.pending.clear()
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join(1.0)
+            self.thread = None
+
+    def key_down(self, code, pressed_at=None, repeat=0):
+        """Record a key-down; returns True if the key is bound, so the caller can consume it
+
+        Safe to call from any thread, and cheap enough for the platform's input thread.
+        """
+        name = self.bindings.get(code)
+        if name is None:
+            return False
+        if not self.running:
+            return False
+        if pressed_at is None:
+            pressed_at = time.perf_counter()
+        with self.condition:
+            self.pressed += 1
+            last = self.last_press.get(name)
+            if repeat or (last is not None and pressed_at - last < self.debounce):
+                self.debounced += 1
+                return True
+            self.last_press[name] = pressed_at
+            if name in self.pending:
+                self.coalesced += 1
+            else:
+                self.pending[name] = pressed_at
+            self.condition.notify()
+        return True
+
+    def _run(self):
+        self._raise_priority()
+        while True:
+            with self.condition:
+                while self.running and not self.pending:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                presses = sorted(self.pending.items(), key=lambda item: _priority(item[0]))
+                self.pending.clear()
+            # Read per batch: the app swaps in the background service's client
+            controller = self.controller
+            for name, pressed_at in presses:
+                stamp = None
+                if controller.connected:
+                    # Offline presses are not timed: a queued one is only written at replay
+                    stamp = controller.time_to_write('key_to_write_seconds', pressed_at)
+                if name == 'brake':
+                    sent = controller.publish_brake()
+                elif name == 'land':
+                    sent = controller.publish_land()
+                else:
+                    sent = controller.publish_command(name)
+                if sent:
+                    self.sent += 1
+                elif stamp is not None:
+                    controller.cancel_write(stamp)
+
+    def _raise_priority(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.nice)
+        except (AttributeError, OSError) as e:
+            logger.debug("Key thread keeps its priority: %s", e)
+
+    def summary(self):
+        """One-line press accounting for the UI"""
+        return (f"{self.sent} sent of {self.pressed} presses, "
+                f"{self.debounced} debounced, {self.coalesced} coalesced")
+
+
+def _priority(name):
+    return PRIORITY.index(name) if name in PRIORITY else len(PRIORITY)
@@ -0,0 +1,206 @@
+package org.cosmos.controller;
+
+import android.app.Activity;
+import android.view.ActionMode;
+import android.view.KeyEvent;
+import android.view.KeyboardShortcutGroup;
+import android.view.Menu;
+import android.view.MenuItem;
+import android.view.MotionEvent;
+import android.view.SearchEvent;
+import android.view.View;
+import android.view.Window;
+import android.view.WindowManager;
+import android.view.accessibility.AccessibilityEvent;
+
+import java.util.List;
+
+/**
+ * Hands volume key presses to Python before SDL or Android see them.
+ *
+ * SDL leaves the volume keys to Android, so they never reach Kivy. This wraps the
+ * activity's Window.Callback: volume key-downs go to the Listener (implemented in
+ * Python with pyjnius) together with System.nanoTime() of their arrival, and are
+ * consumed so the media volume does not change. Every other event is passed to
+ * the original callback untouched, without a round trip through Python.
+ */
+public class VolumeKeyInterceptor implements Window.Callback {
+
+    public interface Listener {
+        /** Return true to consume the key */
+        boolean onVolumeKey(int keyCode, long downNanos, int repeatCount);
+    }
+
+    private final Window window;
+    private final Window.Callback wrapped;
+    private final Listener listener;
+    // Key codes whose key-down was consumed, so their key-up is consumed too
+    private final boolean[] consumed = new boolean[KeyEvent.getMaxKeyCode() + 1];
+
+    private VolumeKeyInterceptor(Window window, Listener listener) {
+        this.window = window;
+        this.wrapped = window.getCallback();
+        this.listener = listener;
+    }
+
+    /** Install on the activity's window; call uninstall() on the result to remove it */
+    public static VolumeKeyInterceptor install(final Activity activity, Listener listener) {
+        final VolumeKeyInterceptor interceptor = new VolumeKeyInterceptor(activity.getWindow(), listener);
+        activity.runOnUiThread(new Runnable() {
+            @Override
+            public void run() {
+                interceptor.window.setCallback(interceptor);
+            }
+        });
+        return interceptor;
+    }
+
+    public void uninstall() {
+        window.getDecorView().post(new Runnable() {
+            @Override
+            public void run() {
+                if (window.getCallback() == VolumeKeyInterceptor.this) {
+                    window.setCallback(wrapped);
+                }
+            }
+        });
+    }
+
+    @Override
+    public boolean dispatchKeyEvent(KeyEvent event) {
+        int code = event.getKeyCode();
+        if (code == KeyEvent.KEYCODE_VOLUME_UP || code == KeyEvent.KEYCODE_VOLUME_DOWN) {
+            if (event.getAction() == KeyEvent.ACTION_DOWN) {
+                long now = System.nanoTime();
+                consumed[code] = listener.onVolumeKey(code, now, event.getRepeatCount());
+                if (consumed[code]) {
+                    return true;
+                }
+            } else if (event.getAction() == KeyEvent.ACTION_UP && consumed[code]) {
+                consumed[code] = false;
+                return true;
+            }
+        }
+        return wrapped.dispatchKeyEvent(event);
+    }
+
+    @Override
+    public boolean dispatchKeyShortcutEvent(KeyEvent event) {
+        return wrapped.dispatchKeyShortcutEvent(event);
+    }
+
+    @Override
+    public boolean dispatchTouchEvent(MotionEvent event) {
+        return wrapped.dispatchTouchEvent(event);
+    }
+
+    @Override
+    public boolean dispatchTrackballEvent(MotionEvent event) {
+        return wrapped.dispatchTrackballEvent(event);
+    }
+
+    @Override
+    public boolean dispatchGenericMotionEvent(MotionEvent event) {
+        return wrapped.dispatchGenericMotionEvent(event);
+    }
+
+    @Override
+    public boolean dispatchPopulateAccessibilityEvent(AccessibilityEvent event) {
+        return wrapped.dispatchPopulateAccessibilityEvent(event);
+    }
+
+    @Override
+    public View onCreatePanelView(int featureId) {
+        return wrapped.onCreatePanelView(featureId);
+    }
+
+    @Override
+    public boolean onCreatePanelMenu(int featureId, Menu menu) {
+        return wrapped.onCreatePanelMenu(featureId, menu);
+    }
+
+    @Override
+    public boolean onPreparePanel(int featureId, View view, Menu menu) {
+        return wrapped.onPreparePanel(featureId, view, menu);
+    }
+
+    @Override
+    public boolean onMenuOpened(int featureId, Menu menu) {
+        return wrapped.onMenuOpened(featureId, menu);
+    }
+
+    @Override
+    public boolean onMenuItemSelected(int featureId, MenuItem item) {
+        return wrapped.onMenuItemSelected(featureId, item);
+    }
+
+    @Override
+    public void onWindowAttributesChanged(WindowManager.LayoutParams attrs) {
+        wrapped.onWindowAttributesChanged(attrs);
+    }
+
+    @Override
+    public void onContentChanged() {
+        wrapped.onContentChanged();
+    }
+
+    @Override
+    public void onWindowFocusChanged(boolean hasFocus) {
+        wrapped.onWindowFocusChanged(hasFocus);
+    }
+
+    @Override
+    public void onAttachedToWindow() {
+        wrapped.onAttachedToWindow();
+    }
+
+    @Override
+    public void onDetachedFromWindow() {
+        wrapped.onDetachedFromWindow();
+    }
+
+    @Override
+    public void onPanelClosed(int featureId, Menu menu) {
+        wrapped.onPanelClosed(featureId, menu);
+    }
+
+    @Override
+    public boolean onSearchRequested() {
+        return wrapped.onSearchRequested();
+    }
+
+    @Override
+    public boolean onSearchRequested(SearchEvent searchEvent) {
+        return wrapped.onSearchRequested(searchEvent);
+    }
+
+    @Override
+    public ActionMode onWindowStartingActionMode(ActionMode.Callback callback) {
+        return wrapped.onWindowStartingActionMode(callback);
+    }
+
+    @Override
+    public ActionMode onWindowStartingActionMode(ActionMode.Callback callback, int type) {
+        return wrapped.onWindowStartingActionMode(callback, type);
+    }
+
+    @Override
+    public void onActionModeStarted(ActionMode mode) {
+        wrapped.onActionModeStarted(mode);
+    }
+
+    @Override
+    public void onActionModeFinished(ActionMode mode) {
+        wrapped.onActionModeFinished(mode);
+    }
+
+    @Override
+    public void onProvideKeyboardShortcuts(List<KeyboardShortcutGroup> data, Menu menu, int deviceId) {
+        wrapped.onProvideKeyboardShortcuts(data, menu, deviceId);
+    }
+
+    @Override
+    public void onPointerCaptureChanged(boolean hasCapture) {
+        wrapped.onPointerCaptureChanged(hasCapture);
+    }
+}
@@ -0,0 +1,361 @@
+"""
+COSMOS Load Generator
+Drives many headless MQTTControllers (no Kivy or Tk) against a broker to find
+how much command traffic it takes before delivery latency falls apart.
+
+The controllers are spread over worker processes, so the generator itself is not
+held back by one GIL. Every worker also runs a sink client subscribed to its
+controllers' command topics, so press and delivery are timed on the same clock.
+Latency is measured from when a press was due, not when it went out: a worker
+that falls behind its schedule shows up as latency instead of hiding it.
+
+Each step of a run sends presses at one total rate for --duration seconds, in
+bursts of --burst presses, and reports delivered throughput, the latency
+distribution, and CPU time and RSS per worker process. With --ramp the steps
+go up until the run ends, and the first step over --max-p99-ms (or losing
+presses or falling behind) is reported as the knee.
+
+The in-process loopback broker (--loopback) is fine for a smoke run but is the
+bottleneck long before the controllers are; point it at a real local broker
+(e.g. mosquitto) for capacity planning.
+
+Usage:
+    python -m loadgen --loopback --processes 2 --controllers 10 --rate 200
+    python -m loadgen --port 1883 --processes 4 --controllers 50 \\
+        --ramp 500,1000,2000,4000,8000 --duration 10 --max-p99-ms 50
+    python -m loadgen --port 1883 --rate 1000 --burst 20 --qos 1 --json load.json
+"""
+
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+from benchmarks.latency import wait_for
+from cosmos_core import MQTTController, create_client
+from cosmos_core.inflight import LatencyHistogram
+from loopback_broker import LoopbackBroker
+
+# Share of the target rate a step must reach not to count as falling behind
+KEEP_UP_RATIO = 0.9
+
+
+def process_usage():
+    """(CPU seconds of every thread, resident bytes or None) of this process"""
+    cpu = time.process_time()
+    try:
+        with open('/proc/self/statm') as handle:
+            return cpu, int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return cpu, None
+    # Peak rather than current RSS; kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return cpu, peak if sys.platform == 'darwin' else peak * 1024
+
+
+class CommandSink:
+    """Plays the drones of one worker and times every delivery against its press"""
+
+    def __init__(self, host, port, topics, qos):
+        self.lock = threading.Lock()
+        self.pending = {topic: collections.deque() for topic in topics}
+        self.histogram = LatencyHistogram()
+        self.last_delivery = 0.0
+        self.subscribed = threading.Event()
+        self.client = create_client()
+        self.client.on_connect = lambda client, userdata, flags, rc: client.subscribe(
+            [(topic, qos) for topic in topics])
+        self.client.on_subscribe = lambda *args: self.subscribed.set()
+        self.client.on_message = self.on_message
+        self.client.connect(host, port, 60)
+        self.client.loop_start()
+
+    def expect(self, topic, due):
+        """Register a press due at `due` before it is published"""
+        with self.lock:
+            self.pending[topic].append(due)
+
+    def cancel(self, topic):
+        """Forget the last press on topic, which was never sent"""
+        with self.lock:
+            self.pending[topic].pop()
+
+    def on_message(self, client, userdata, msg):
+        delivered = time.perf_counter()
+        with self.lock:
+            presses = self.pending.get(msg.topic)
+            if presses:
+                self.histogram.record(delivered - presses.popleft())
+                self.last_delivery = delivered
+
+    def outstanding(self):
+        with self.lock:
+            return sum(len(presses) for presses in self.pending.values())
+
+    def take(self):
+        """Return (histogram, presses never delivered, last delivery time) and start over"""
+        with self.lock:
+            histogram, self.histogram = self.histogram, LatencyHistogram()
+            lost = sum(len(presses) for presses in self.pending.values())
+            for presses in self.pending.values():
+                presses.clear()
+        return histogram, lost, self.last_delivery
+
+    def close(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+
+def start_controllers(worker, config):
+    """Connect this worker's controllers, each on its own command topics"""
+    controllers = []
+    for index in range(config['controllers']):
+        controller = MQTTController()
+        controller.brake_topic = f"loadgen/{worker}/{index}/brake"
+        controller.land_topic = f"loadgen/{worker}/{index}/land"
+        controller.qos = config['qos']
+        if config['mqtt5']:
+            controller.enable_mqtt5()
+        controller.connect(config['host'], config['port'], "", "")
+        controllers.append(controller)
+    if not wait_for(lambda: all(controller.connected for controller in controllers), 30):
+        connected = sum(controller.connected for controller in controllers)
+        raise RuntimeError(f"only {connected}/{len(controllers)} controllers connected")
+    return controllers
+
+
+def run_step(controllers, sink, rate, config, rng):
+    """Press at `rate` presses/s for the step's duration and report what happened"""
+    burst = config['burst']
+    interval = burst / rate
+    land_share = config['land_share']
+    cpu_before, _ = process_usage()
+    started = time.perf_counter()
+    end = started + config['duration']
+    due = started
+    sent = failed = 0
+    lag = 0.0
+    while due < end:
+        for _ in range(burst):
+            controller = controllers[sent % len(controllers)]
+            if land_share and rng.random() < land_share:
+                topic, publish = controller.land_topic, controller.publish_land
+            else:
+                topic, publish = controller.brake_topic, controller.publish_brake
+            sink.expect(topic, due)
+            if not publish():
+                sink.cancel(topic)
+                failed += 1
+            sent += 1
+        due += interval
+        behind = time.perf_counter() - due
+        if behind < 0:
+            time.sleep(-behind)
+        elif behind > lag:
+            lag = behind
+    seconds = time.perf_counter() - started
+    wait_for(lambda: sink.outstanding() == 0, config['drain'])
+    histogram, lost, last_delivery = sink.take()
+    cpu_after, rss = process_usage()
+    return {'rate': rate, 'sent': sent, 'failed': failed, 'delivered': histogram.count,
+            'lost': lost, 'seconds': seconds, 'max_lag': lag,
+            'delivery_seconds': max(seconds, last_delivery - started),
+            'cpu_seconds': cpu_after - cpu_before, 'rss_bytes': rss, 'histogram': histogram}
+
+
+def run_worker(worker, config, barrier, results):
+    """Entry point of one worker process: connect, then run every step in lockstep"""
+    controllers, sink = [], None
+    try:
+        controllers = start_controllers(worker, config)
+        topics = [topic for controller in controllers
+                  for topic in (controller.brake_topic, controller.land_topic)]
+        sink = CommandSink(config['host'], config['port'], topics, config['qos'])
+        if not sink.subscribed.wait(10):
+            raise RuntimeError("command sink did not subscribe")
+        rng = random.Random(worker)
+        barrier.wait()
+        for rate in config['steps']:
+            barrier.wait()
+            results.put((worker, run_step(controllers, sink, rate / config['processes'], config, rng)))
+    except threading.BrokenBarrierError:
+        pass
+    except Exception as e:
+        results.put((worker, f"{type(e).__name__}: {e}"))
+        barrier.abort()
+    finally:
+        for controller in controllers:
+            controller.disconnect()
+        if sink is not None:
+            sink.close()
+
+
+def summarize_step(rate, reports):
+    """Merge the workers' reports for one step"""
+    histogram = LatencyHistogram()
+    for report in reports:
+        histogram.merge(report['histogram'])
+    seconds = max(report['seconds'] for report in reports)
+    delivery_seconds = max(report['delivery_seconds'] for report in reports)
+    sent = sum(report['sent'] for report in reports)
+    return {'rate': rate, 'sent': sent, 'failed': sum(report['failed'] for report in reports),
+            'delivered': histogram.count, 'lost': sum(report['lost'] for report in reports),
+            'seconds': seconds, 'throughput': histogram.count / delivery_seconds, 'histogram': histogram,
+            'processes': reports}
+
+
+def run(host, port, steps, processes=2, controllers=10, duration=10.0, burst=1,
+        land_share=0.5, qos=0, mqtt5=False, drain=5.0, on_step=None):
+    """Run every step (a total press rate) in turn and return one summary per step
+
+    on_step(summary) is called as each step finishes.
+    """
+    config = {'host': host, 'port': port, 'steps': list(steps), 'processes': processes,
+              'controllers': controllers, 'duration': duration, 'burst': burst,
+              'land_share': land_share, 'qos': qos, 'mqtt5': mqtt5, 'drain': drain}
+    # spawn: paho threads must not be forked mid-flight, and it works on every OS
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(processes + 1)
+    results = context.Queue()
+    workers = [context.Process(target=run_worker, args=(worker, config, barrier, results), daemon=True)
+               for worker in range(processes)]
+    for worker in workers:
+        worker.start()
+    summaries = []
+    try:
+        barrier.wait(timeout=60)
+        for rate in config['steps']:
+            barrier.wait(timeout=30)
+            reports = [None] * processes
+            for _ in range(processes):
+                worker, report = results.get(timeout=duration * 10 + drain + 30)
+                if isinstance(report, str):
+                    raise RuntimeError(f"worker {worker}: {report}")
+                reports[worker] = report
+            summaries.append(summarize_step(rate, reports))
+            if on_step is not None:
+                on_step(summaries[-1])
+    except (threading.BrokenBarrierError, queue.Empty):
+        errors = []
+        while True:
+            try:
+                errors.append("worker %d: %s" % results.get(timeout=1))
+            except queue.Empty:
+                break
+        raise RuntimeError("; ".join(errors) or "workers did not respond")
+    finally:
+        barrier.abort()
+        for worker in workers:
+            worker.join(10)
+            if worker.is_alive():
+                worker.terminate()
+    return summaries
+
+
+def keeps_up(summary, max_p99=None):
+    """True if a step delivered everything on schedule (and within max_p99 seconds)"""
+    if summary['lost'] or summary['failed']:
+        return False
+    if summary['sent'] / summary['seconds'] < summary['rate'] * KEEP_UP_RATIO:
+        return False
+    return max_p99 is None or summary['histogram'].percentile(99) <= max_p99
+
+
+def to_json(summaries):
+    """Summaries with histograms replaced by their percentiles"""
+    def flatten(report):
+        report = dict(report)
+        histogram = report.pop('histogram')
+        for percent in (50, 90, 99, 99.9):
+            report[f'p{percent:g}_ms'] = (histogram.percentile(percent) or 0.0) * 1000
+        report['max_ms'] = histogram.max * 1000
+        if 'processes' in report:
+            report['processes'] = [flatten(process) for process in report['processes']]
+        return report
+    return [flatten(summary) for summary in summaries]
+
+
+def format_step(summary):
+    histogram = summary['histogram']
+    percentiles = [(histogram.percentile(percent) or 0.0) * 1000 for percent in (50, 90, 99)]
+    return (f"{summary['rate']:>9.0f}{summary['throughput']:>10.0f}"
+            f"{summary['delivered']:>9}/{summary['sent']:<9}{summary['lost']:>6}"
+            + "".join(f"{value:>9.3f}" for value in percentiles)
+            + f"{histogram.max * 1000:>10.3f}")
+
+
+def format_process(index, report):
+    cpu = report['cpu_seconds'] / report['seconds'] * 100
+    rss = f"{report['rss_bytes'] / 2 ** 20:.1f} MB" if report['rss_bytes'] is not None else "n/a"
+    return (f"    worker {index}: {report['delivered']}/{report['sent']} delivered, "
+            f"p99 {(report['histogram'].percentile(99) or 0.0) * 1000:.3f} ms, "
+            f"CPU {cpu:.0f}%, RSS {rss}, max lag {report['max_lag'] * 1000:.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COSMOS headless load generator")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--loopback', action='store_true',
+                        help="start an in-process loopback broker instead of using --host/--port")
+    parser.add_argument('--processes', type=int, default=2)
+    parser.add_argument('--controllers', type=int, default=10, help="controllers per process")
+    parser.add_argument('--rate', type=float, default=200.0, help="total presses per second")
+    parser.add_argument('--ramp', help="comma-separated total rates to step through instead of --rate")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds per step")
+    parser.add_argument('--burst', type=int, default=1, help="presses sent back to back per tick")
+    parser.add_argument('--land-share', type=float, default=0.5, help="share of presses that are LAND")
+    parser.add_argument('--qos', type=int, default=0, choices=[0, 1, 2])
+    parser.add_argument('--mqtt5', action='store_true', help="controllers speak MQTT 5")
+    parser.add_argument('--drain', type=float, default=5.0, help="seconds to wait for late deliveries")
+    parser.add_argument('--max-p99-ms', type=float, help="latency budget that marks the knee")
+    parser.add_argument('--json', help="write results to this file")
+    args = parser.parse_args(argv)
+
+    steps = [float(rate) for rate in args.ramp.split(",")] if args.ramp else [args.rate]
+    broker = LoopbackBroker().start() if args.loopback else None
+    host, port = (broker.host, broker.port) if broker else (args.host, args.port)
+    print(f"{args.processes} processes x {args.controllers} controllers -> {host}:{port}, "
+          f"QoS {args.qos}, bursts of {args.burst}")
+    print(f"{'target/s':>9}{'deliv/s':>10}{'delivered':>19}{'lost':>6}"
+          f"{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>10}")
+
+    def on_step(summary):
+        print(format_step(summary))
+        for index, report in enumerate(summary['processes']):
+            print(format_process(index, report))
+
+    try:
+        summaries = run(host, port, steps, args.processes, args.controllers, args.duration,
+                        args.burst, args.land_share, args.qos, args.mqtt5, args.drain, on_step)
+    finally:
+        if broker is not None:
+            broker.stop()
+
+    if args.json:
+        with open(args.json, 'w') as handle:
+            json.dump(to_json(summaries), handle, indent=2)
+
+    max_p99 = args.max_p99_ms / 1000.0 if args.max_p99_ms is not None else None
+    knee = next((summary for summary in summaries if not keeps_up(summary, max_p99)), None)
+    if knee is None:
+        print(f"✅ Kept up with every step, up to {steps[-1]:.0f} presses/s")
+    else:
+        print(f"⚠️ Falls apart at {knee['rate']:.0f} presses/s "
+              f"({knee['throughput']:.0f} delivered/s, p99 "
+              f"{(knee['histogram'].percentile(99) or 0.0) * 1000:.1f} ms, {knee['lost']} lost)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
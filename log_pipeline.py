@@ -0,0 +1,67 @@
+"""
+COSMOS Activity Log Pipeline
+A bounded, thread-safe activity log shared by the Kivy and Tk front ends.
+
+Any thread (UI, paho network thread, asyncio loop) posts messages into a fixed-size
+ring buffer. The UI drains the buffer on a timer capped at max_fps and renders each
+batch with a single widget update, so the cost per frame stays flat during message
+storms and long sessions never grow the widget past max_lines.
+"""
+
+import collections
+import threading
+import time
+
+
+class LogPipeline:
+    """Ring-buffered activity log drained by the UI in coalesced batches"""
+
+    def __init__(self, max_lines=200, max_fps=10, time_format="%H:%M:%S"):
+        self.max_lines = max_lines
+        self.max_fps = max_fps
+        self.time_format = time_format
+        self.lines = collections.deque(maxlen=max_lines)
+        self.lock = threading.Lock()
+        self.posted = 0
+        self.flushed = 0
+
+    @property
+    def interval(self):
+        """Seconds between UI flushes"""
+        return 1.0 / self.max_fps
+
+    def post(self, message):
+        """Queue a message from any thread; old lines are evicted past max_lines"""
+        entry = (time.time(), message)
+        with self.lock:
+            self.lines.append(entry)
+            self.posted += 1
+
+    def format(self, entry):
+        """Render one (timestamp, message) entry"""
+        timestamp, message = entry
+        return f"[{time.strftime(self.time_format, time.localtime(timestamp))}] {message}"
+
+    def take_batch(self):
+        """Return (new_lines, overflowed) posted since the previous call
+
+        overflowed is True when more lines arrived than the ring holds, in which
+        case new_lines is the whole retained buffer and the widget should be reset.
+        """
+        with self.lock:
+            pending = self.posted - self.flushed
+            if not pending:
+                return [], False
+            self.flushed = self.posted
+            overflowed = pending > len(self.lines)
+            if overflowed:
+                entries = list(self.lines)
+            else:
+                entries = [self.lines[i] for i in range(len(self.lines) - pending, len(self.lines))]
+        return [self.format(entry) for entry in entries], overflowed
+
+    def text(self):
+        """Render every retained line, oldest first"""
+        with self.lock:
+            entries = list(self.lines)
+        return "\n".join(self.format(entry) for entry in entries)
@@ -0,0 +1,414 @@
+"""
+Loopback MQTT Broker
+A small in-process MQTT 3.1.1/5 broker stand-in for offline tests and benchmarks.
+Supports CONNECT, SUBSCRIBE/UNSUBSCRIBE, PUBLISH at QoS 0/1/2 and PINGREQ, plus
+persistent sessions (clean_session=False) that keep subscriptions and queue QoS 1/2
+messages while the client is away.
+
+For failover and race benchmarks a broker can be made slow (`delay` seconds before
+each CONNACK and before handling each PUBLISH) and lossy (`loss`, the share of
+deliveries to subscribers that are silently dropped). For warm-up benchmarks a
+connection can go cold: the first packet after `idle_timeout` seconds of silence
+waits `wake_delay` seconds, like a radio leaving power save or a NAT rebinding.
+
+With `ssl_context` (a server SSLContext, see self_signed_context) the broker
+speaks MQTT over TLS, resuming sessions as the context allows.
+
+Clients may connect with MQTT 5 unless `protocols` leaves it out, in which case
+they are refused the way a 3.1.1-only broker would. MQTT 5 sessions get topic
+aliases (up to `topic_alias_maximum`), user properties forwarded to MQTT 5
+subscribers, and message expiry: a queued message whose expiry has passed is
+dropped instead of delivered late.
+"""
+
+import os
+import random
+import socket
+import ssl
+import struct
+import subprocess
+import threading
+import time
+
+import mqtt_wire as wire
+
+
+def self_signed_context(directory, hostname="localhost"):
+    """Create a self-signed EC certificate for hostname with the openssl tool
+
+    Returns (server SSLContext, certificate path). The certificate also covers
+    127.0.0.1 so clients can connect by address.
+    """
+    certfile = os.path.join(directory, "broker-cert.pem")
+    keyfile = os.path.join(directory, "broker-key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1",
+                    "-nodes", "-days", "3650", "-subj", f"/CN={hostname}",
+                    "-addext", f"subjectAltName=DNS:{hostname},IP:127.0.0.1",
+                    "-keyout", keyfile, "-out", certfile], check=True, capture_output=True)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile, keyfile)
+    return context, certfile
+
+
+class BrokerSession:
+    """A single client connection to the loopback broker"""
+
+    def __init__(self, broker, sock):
+        self.broker = broker
+        self.sock = sock
+        self.client_id = ""
+        self.clean_session = True
+        # QoS 1/2 messages held for a persistent session while it is offline, as
+        # (topic, payload, qos, properties, expires at or None)
+        self.pending = []
+        self.protocol = wire.MQTT311
+        # MQTT 5 topic aliases set by this client, alias -> topic
+        self.aliases = {}
+        self.send_lock = threading.Lock()
+        self.next_mid = 0
+        self.closed = False
+        self.last_packet = time.monotonic()
+
+    def send(self, data):
+        """Send raw bytes to the client"""
+        try:
+            with self.send_lock:
+                self.sock.sendall(data)
+        except OSError:
+            self.close()
+
+    def allocate_mid(self):
+        """Allocate a broker-side message id for outbound QoS 1/2 deliveries"""
+        with self.send_lock:
+            self.next_mid = self.next_mid % 65535 + 1
+            return self.next_mid
+
+    def close(self):
+        """Close the client socket"""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+    def run(self):
+        """Read and handle packets until the client goes away"""
+        try:
+            if isinstance(self.sock, ssl.SSLSocket):
+                self.sock.do_handshake()
+            while not self.closed:
+                packet = wire.read_packet(self.sock)
+                if packet is None:
+                    break
+                if not self.handle(*packet):
+                    break
+        except OSError:
+            pass
+        finally:
+            self.broker.remove_session(self)
+            self.close()
+
+    def handle(self, header, body):
+        """Handle one packet, returning False when the session should end"""
+        packet_type = header & 0xF0
+        if packet_type == wire.PUBLISH:
+            self.broker.publish_bytes += 1 + len(wire.encode_remaining_length(len(body))) + len(body)
+        now = time.monotonic()
+        if self.broker.wake_delay and now - self.last_packet > self.broker.idle_timeout:
+            self.broker.wakeups += 1
+            time.sleep(self.broker.wake_delay)
+        self.last_packet = now
+        if packet_type == wire.CONNECT:
+            return self.handle_connect(body)
+        elif packet_type == wire.PUBLISH:
+            self.handle_publish(header, body)
+        elif packet_type == wire.PUBREL:
+            (mid,) = struct.unpack_from('!H', body)
+            self.send(wire.encode_ack(wire.PUBCOMP, mid))
+        elif packet_type == wire.PUBREC:
+            (mid,) = struct.unpack_from('!H', body)
+            self.send(wire.encode_ack(wire.PUBREL, mid))
+        elif packet_type in (wire.PUBACK, wire.PUBCOMP):
+            pass
+        elif packet_type == wire.SUBSCRIBE:
+            self.handle_subscribe(body)
+        elif packet_type == wire.UNSUBSCRIBE:
+            self.handle_unsubscribe(body)
+        elif packet_type == wire.PINGREQ:
+            self.send(wire.encode_packet(wire.PINGRESP))
+        elif packet_type == wire.DISCONNECT:
+            return False
+        return True
+
+    def handle_connect(self, body):
+        """Accept a CONNECT, resuming a stored session if the client asks for one
+
+        Returns False if the protocol level is refused.
+        """
+        _, offset = wire.decode_string(body, 0)
+        self.protocol = body[offset]
+        flags = body[offset + 1]
+        if self.protocol not in self.broker.protocols:
+            # What a broker without MQTT 5 answers: unacceptable protocol version
+            self.send(wire.encode_packet(wire.CONNACK, b'\x00\x01'))
+            return False
+        # Skip protocol level (1), connect flags (1) and keepalive (2)
+        offset += 4
+        if self.protocol == wire.MQTT5:
+            _, offset = wire.decode_properties(body, offset)
+        self.client_id, offset = wire.decode_string(body, offset)
+        self.clean_session = bool(flags & 0x02)
+        if self.broker.delay:
+            time.sleep(self.broker.delay)
+        pending = self.broker.attach(self)
+        session_present = b'\x00' if pending is None else b'\x01'
+        connack = session_present + b'\x00'
+        if self.protocol == wire.MQTT5:
+            properties = []
+            if self.broker.topic_alias_maximum:
+                properties.append((wire.TOPIC_ALIAS_MAXIMUM, self.broker.topic_alias_maximum))
+            connack += wire.encode_properties(properties)
+        self.send(wire.encode_packet(wire.CONNACK, connack))
+        now = time.monotonic()
+        for topic, payload, qos, properties, expires_at in pending or ():
+            if expires_at is not None and expires_at <= now:
+                self.broker.expired += 1
+                continue
+            self.deliver(topic, payload, qos, properties, expires_at, now)
+        return True
+
+    def deliver(self, topic, payload, qos, properties=(), expires_at=None, now=None):
+        """Send a message to this client in its protocol version"""
+        mid = self.allocate_mid() if qos > 0 else 0
+        if self.protocol != wire.MQTT5:
+            self.send(wire.encode_publish(topic, payload, qos, mid))
+            return
+        properties = list(properties)
+        if expires_at is not None:
+            # The receiver sees the time the message has left, at least a second
+            remaining = expires_at - (time.monotonic() if now is None else now)
+            properties.append((wire.MESSAGE_EXPIRY, max(1, int(remaining + 0.5))))
+        self.send(wire.encode_publish(topic, payload, qos, mid, properties=properties))
+
+    def handle_publish(self, header, body):
+        """Acknowledge an inbound PUBLISH and route it to subscribers"""
+        if self.broker.delay:
+            time.sleep(self.broker.delay)
+        if self.protocol != wire.MQTT5:
+            topic, payload, qos, mid, retain = wire.decode_publish(header, body)
+            forwarded, expiry = (), None
+        else:
+            topic, payload, qos, mid, retain, properties = wire.decode_publish5(header, body)
+            forwarded, expiry = [], None
+            for identifier, value in properties:
+                if identifier == wire.TOPIC_ALIAS:
+                    # An alias with a topic sets it; an alias alone stands for the topic
+                    if topic:
+                        self.aliases[value] = topic
+                    else:
+                        topic = self.aliases[value]
+                elif identifier == wire.MESSAGE_EXPIRY:
+                    expiry = value
+                else:
+                    forwarded.append((identifier, value))
+        if qos == 1:
+            self.send(wire.encode_ack(wire.PUBACK, mid))
+        elif qos == 2:
+            self.send(wire.encode_ack(wire.PUBREC, mid))
+        self.broker.route(topic, payload, qos, forwarded, expiry)
+
+    def handle_subscribe(self, body):
+        """Register subscriptions and reply with a SUBACK"""
+        (mid,) = struct.unpack_from('!H', body)
+        offset = 2
+        if self.protocol == wire.MQTT5:
+            _, offset = wire.decode_properties(body, offset)
+        granted = bytearray()
+        while offset < len(body):
+            topic_filter, offset = wire.decode_string(body, offset)
+            # MQTT 5 keeps more subscription options in this byte; only QoS is honoured
+            qos = body[offset] & 0x03
+            offset += 1
+            self.broker.subscribe(self, topic_filter, qos)
+            granted.append(qos)
+        properties = b'\x00' if self.protocol == wire.MQTT5 else b''
+        self.send(wire.encode_packet(wire.SUBACK, struct.pack('!H', mid) + properties + bytes(granted)))
+
+    def handle_unsubscribe(self, body):
+        """Remove subscriptions and reply with an UNSUBACK"""
+        (mid,) = struct.unpack_from('!H', body)
+        offset = 2
+        if self.protocol == wire.MQTT5:
+            _, offset = wire.decode_properties(body, offset)
+        removed = 0
+        while offset < len(body):
+            topic_filter, offset = wire.decode_string(body, offset)
+            self.broker.unsubscribe(self, topic_filter)
+            removed += 1
+        if self.protocol == wire.MQTT5:
+            # An MQTT 5 UNSUBACK carries properties and a reason code per filter
+            self.send(wire.encode_packet(wire.UNSUBACK, struct.pack('!H', mid) + b'\x00' + bytes(removed)))
+        else:
+            self.send(wire.encode_ack(wire.UNSUBACK, mid))
+
+
+class LoopbackBroker:
+    """In-process MQTT broker listening on the loopback interface"""
+
+    def __init__(self, host="127.0.0.1", port=0, delay=0.0, loss=0.0, seed=None,
+                 idle_timeout=0.0, wake_delay=0.0, ssl_context=None, protocols=(wire.MQTT311, wire.MQTT5),
+                 topic_alias_maximum=10):
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.loss = loss
+        self.idle_timeout = idle_timeout
+        self.wake_delay = wake_delay
+        self.wakeups = 0
+        self.ssl_context = ssl_context
+        self.protocols = protocols
+        self.topic_alias_maximum = topic_alias_maximum
+        # Bytes of every PUBLISH received, fixed header included
+        self.publish_bytes = 0
+        # Queued messages dropped because their expiry passed
+        self.expired = 0
+        self.random = random.Random(seed)
+        self.dropped = 0
+        self.server_sock = None
+        self.sessions = []
+        self.subscriptions = []
+        # client_id -> the latest session of each client with clean_session=False
+        self.persistent = {}
+        self.lock = threading.Lock()
+        self.running = False
+        self.accept_thread = None
+
+    def start(self):
+        """Bind the listening socket and start accepting clients"""
+        self.server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_sock.bind((self.host, self.port))
+        self.server_sock.listen(128)
+        self.port = self.server_sock.getsockname()[1]
+        self.running = True
+        self.accept_thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self.accept_thread.start()
+        return self
+
+    def stop(self):
+        """Stop accepting clients and close every session"""
+        self.running = False
+        if self.server_sock:
+            # shutdown() wakes the thread blocked in accept(); close() alone does not
+            try:
+                self.server_sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.server_sock.close()
+        with self.lock:
+            sessions = list(self.sessions)
+            self.sessions = []
+            self.subscriptions = []
+            self.persistent = {}
+        for session in sessions:
+            session.close()
+        if self.accept_thread:
+            self.accept_thread.join(timeout=2)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _accept_loop(self):
+        """Accept incoming connections and spawn a session thread for each"""
+        while self.running:
+            try:
+                sock, _ = self.server_sock.accept()
+            except OSError:
+                break
+            if not self.running:
+                sock.close()
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self.ssl_context is not None:
+                # The handshake runs on the session thread, not in the accept loop
+                sock = self.ssl_context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False)
+            session = BrokerSession(self, sock)
+            with self.lock:
+                self.sessions.append(session)
+            threading.Thread(target=session.run, daemon=True).start()
+
+    def drop_all(self):
+        """Sever every client connection without a DISCONNECT, as a network fault would"""
+        with self.lock:
+            sessions = list(self.sessions)
+        for session in sessions:
+            session.close()
+        return len(sessions)
+
+    def attach(self, session):
+        """Register a connected session; returns its queued messages if a stored session resumed"""
+        with self.lock:
+            previous = self.persistent.pop(session.client_id, None) if session.client_id else None
+            if previous is None or session.clean_session:
+                if previous is not None:
+                    self.subscriptions = [sub for sub in self.subscriptions if sub[2] is not previous]
+                if not session.clean_session and session.client_id:
+                    self.persistent[session.client_id] = session
+                return None
+            # Move the stored subscriptions over to the new connection
+            self.subscriptions = [(topic_filter, qos, session if owner is previous else owner)
+                                  for topic_filter, qos, owner in self.subscriptions]
+            self.persistent[session.client_id] = session
+            pending, previous.pending = previous.pending, []
+        previous.close()
+        return pending
+
+    def remove_session(self, session):
+        """Forget a session, keeping the subscriptions of a persistent one"""
+        with self.lock:
+            if session in self.sessions:
+                self.sessions.remove(session)
+            if self.persistent.get(session.client_id) is not session:
+                self.subscriptions = [sub for sub in self.subscriptions if sub[2] is not session]
+
+    def subscribe(self, session, topic_filter, qos):
+        """Add or replace a subscription for a session"""
+        with self.lock:
+            self.subscriptions = [sub for sub in self.subscriptions
+                                  if not (sub[2] is session and sub[0] == topic_filter)]
+            self.subscriptions.append((topic_filter, qos, session))
+
+    def unsubscribe(self, session, topic_filter):
+        """Remove a subscription for a session"""
+        with self.lock:
+            self.subscriptions = [sub for sub in self.subscriptions
+                                  if not (sub[2] is session and sub[0] == topic_filter)]
+
+    def route(self, topic, payload, qos, properties=(), expiry=None):
+        """Deliver a message to every matching subscriber
+
+        properties are forwarded to MQTT 5 subscribers; expiry is the message
+        expiry interval in seconds, None if the message never expires.
+        """
+        expires_at = None if expiry is None else time.monotonic() + expiry
+        with self.lock:
+            targets = [(sub_qos, session) for topic_filter, sub_qos, session in self.subscriptions
+                       if wire.topic_matches(topic_filter, topic)]
+        for sub_qos, session in targets:
+            if self.loss and self.random.random() < self.loss:
+                self.dropped += 1
+                continue
+            delivery_qos = min(qos, sub_qos)
+            if session.closed:
+                # Only stored sessions keep subscriptions after closing
+                if delivery_qos > 0:
+                    with self.lock:
+                        session.pending.append((topic, payload, delivery_qos, properties, expires_at))
+                continue
+            session.deliver(topic, payload, delivery_qos, properties, expires_at)
@@ -4,179 +4,249 @@ An Android app built with Kivy that sends MQTT commands for brake and land opera
 Runs in background and responds to volume button presses.
 """
 
+from startup import StartupTimer
+
+# Started before anything else so the report covers every import below
+startup = StartupTimer()
+
+import collections
 import json
+import os
 import threading
 import time
-from kivy.app import App
-from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.button import Button
-from kivy.uix.label import Label
-from kivy.uix.textinput import TextInput
-from kivy.uix.switch import Switch
-from kivy.uix.popup import Popup
-from kivy.clock import Clock
-from kivy.logger import Logger
-from kivy.utils import platform
 
-import paho.mqtt.client as mqtt
+with startup.phase('import kivy'):
+    from kivy.app import App
+    from kivy.uix.boxlayout import BoxLayout
+    from kivy.uix.button import Button
+    from kivy.uix.label import Label
+    from kivy.uix.textinput import TextInput
+    from kivy.clock import Clock
+    from kivy.logger import Logger
+    from kivy.utils import platform
+
+with startup.phase('import core'):
+    # The core defers paho until the first connect (see preload_client)
+    from cosmos_core import MQTTController as ControllerCore, preload_client
+    from cosmos_core.service import ServiceClient, ServiceError, service_address
+    from flight_recorder import new_session_path
+    from hardware_keys import KeyCommandDispatcher
+    from log_pipeline import LogPipeline
+    from ui_dispatch import UIDispatcher
+startup.mark('imports_done')
+
+# Android-only modules and Java classes are looked up on first use, after the
+# control screen is up, instead of at import time
+_java_classes = {}
+
+
+def java_class(name):
+    """Return an Android Java class, looking it up through pyjnius once"""
+    cls = _java_classes.get(name)
+    if cls is None:
+        from jnius import autoclass
+        cls = _java_classes[name] = autoclass(name)
+    return cls
+
+
+def foreground_service():
+    """The activity and the service class python-for-android generates for service.py"""
+    activity = java_class('org.kivy.android.PythonActivity').mActivity
+    return activity, java_class(f"{activity.getPackageName()}.ServiceCosmos")
 
-if platform == 'android':
+
+def request_android_permissions():
+    """Ask for the runtime permissions the app needs"""
     from android.permissions import request_permissions, Permission
-    from android import mActivity
-    from jnius import autoclass
-    
-    # Android classes
-    PythonActivity = autoclass('org.kivy.android.PythonActivity')
-    Intent = autoclass('android.content.Intent')
-    PendingIntent = autoclass('android.app.PendingIntent')
-    AndroidString = autoclass('java.lang.String')
-    Context = autoclass('android.content.Context')
-    
-    # Request permissions
     request_permissions([
         Permission.WAKE_LOCK,
         Permission.INTERNET,
         Permission.ACCESS_NETWORK_STATE,
-        Permission.FOREGROUND_SERVICE
+        Permission.FOREGROUND_SERVICE,
+        Permission.POST_NOTIFICATIONS
     ])
 
 
-class MQTTController:
+class MQTTController(ControllerCore):
+    """Kivy adapter over the shared controller core: logs events and updates the status"""
+    
     def __init__(self, app_instance):
+        super().__init__()
         self.app = app_instance
-        self.client = None
-        self.connected = False
-        self.broker_host = ""
-        self.broker_port = 1883
-        self.username = ""
-        self.password = ""
-        self.brake_topic = "brakeCosmos"
-        self.land_topic = "landCosmos"
-        
-    def connect(self, host, port, username, password):
-        """Connect to MQTT broker"""
-        try:
-            self.broker_host = host
-            self.broker_port = int(port)
-            self.username = username
-            self.password = password
-            
-            # Create MQTT client with version compatibility
-            try:
-                # Try new method (paho-mqtt 2.0+)
-                self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
-                Logger.info("MQTT: Using CallbackAPIVersion.VERSION1")
-            except (AttributeError, TypeError):
-                # Fallback to old method (paho-mqtt 1.x)
-                self.client = mqtt.Client()
-                Logger.info("MQTT: Using legacy client creation")
-            
-            # Set credentials if provided
-            if username and password:
-                self.client.username_pw_set(username, password)
-                
-            self.client.on_connect = self.on_connect
-            self.client.on_disconnect = self.on_disconnect
-            self.client.on_message = self.on_message
-            
-            self.client.connect(host, int(port), 60)
-            self.client.loop_start()
-            
-            Logger.info(f"MQTT: Connecting to {host}:{port}")
-            return True
-            
-        except Exception as e:
-            Logger.error(f"MQTT: Connection failed - {str(e)}")
-            self.app.update_status(f"Connection failed: {str(e)}")
-            return False
-    
-    def on_connect(self, client, userdata, flags, rc):
-        """Callback for when the client receives a CONNACK response from the server"""
-        if rc == 0:
-            self.connected = True
-            Logger.info("MQTT: Connected successfully")
-            self.app.update_status("Connected to MQTT broker")
-        else:
-            self.connected = False
-            Logger.error(f"MQTT: Connection failed with code {rc}")
-            self.app.update_status(f"Connection failed with code {rc}")
-    
-    def on_disconnect(self, client, userdata, rc):
-        """Callback for when the client disconnects from the broker"""
-        self.connected = False
-        Logger.info("MQTT: Disconnected from broker")
-        self.app.update_status("Disconnected from MQTT broker")
-    
-    def on_message(self, client, userdata, msg):
-        """Callback for when a PUBLISH message is received from the server"""
-        Logger.info(f"MQTT: Received message: {msg.topic} - {msg.payload.decode()}")
-    
-    def publish_brake(self):
-        """Publish brake command"""
-        if self.connected and self.client:
-            try:
-                payload = "1"
-                self.client.publish(self.brake_topic, payload)
-                Logger.info(f"MQTT: Published brake command - {self.brake_topic}: {payload}")
-                self.app.update_status(f"Brake command sent: {payload}")
-                return True
-            except Exception as e:
-                Logger.error(f"MQTT: Failed to publish brake - {str(e)}")
-                return False
-        else:
-            Logger.warning("MQTT: Not connected, cannot publish brake")
-            return False
-    
-    def publish_land(self):
-        """Publish land command"""
-        if self.connected and self.client:
-            try:
-                payload = "1"
-                self.client.publish(self.land_topic, payload)
-                Logger.info(f"MQTT: Published land command - {self.land_topic}: {payload}")
-                self.app.update_status(f"Land command sent: {payload}")
-                return True
-            except Exception as e:
-                Logger.error(f"MQTT: Failed to publish land - {str(e)}")
-                return False
+        self.add_listener(self.on_event)
+        
+    def _log_sent(self, name, topic, payload):
+        """Log a sent command on the next frame, off the press path"""
+        if self.app.first_command_pending:
+            self.app.first_command_pending = False
+            startup.mark('first_command')
+            self.app.report_startup()
+        Logger.info(f"MQTT: Published {name} command - {topic}: {payload}")
+        if self.qos_for(name) > 0:
+            self.app.update_status(f"{name.capitalize()} command sent, awaiting ack")
         else:
-            Logger.warning("MQTT: Not connected, cannot publish land")
-            return False
+            self.app.update_status(f"{name.capitalize()} command sent: {payload}")
     
-    def disconnect(self):
-        """Disconnect from MQTT broker"""
-        if self.client:
-            self.client.loop_stop()
-            self.client.disconnect()
-            self.connected = False
+    def _log_confirmed(self, name, latency):
+        """Log a broker acknowledgement on the next frame"""
+        Logger.info(f"MQTT: {name} confirmed in {latency * 1000:.1f} ms")
+        self.app.update_status(f"{name.capitalize()} command confirmed ({latency * 1000:.0f} ms)")
+    
+    def on_event(self, event, data):
+        """Log a core event and mirror it in the status label"""
+        if event == 'command_sent':
+            self.app.dispatcher.call(self._log_sent, *data)
+        elif event == 'command_confirmed':
+            self.app.dispatcher.call(self._log_confirmed, *data)
+        elif event == 'command_acked':
+            Logger.info(f"MQTT: Drone acknowledged {data[0]} in {data[1] * 1000:.1f} ms ({data[2]} attempts)")
+            self.app.update_status(f"{data[0].capitalize()} acknowledged by drone ({data[1] * 1000:.0f} ms)")
+        elif event == 'command_retry':
+            Logger.warning(f"MQTT: No drone ack for {data[0]}, resending (attempt {data[1]})")
+        elif event == 'command_unacked':
+            Logger.error(f"MQTT: Drone never acknowledged {data[0]} after {data[1]} attempts")
+            self.app.update_status(f"{data[0].capitalize()} NOT acknowledged by drone")
+        elif event == 'connecting':
+            Logger.info(f"MQTT: Connecting to {data[0]}:{data[1]}")
+        elif event == 'connect_failed':
+            Logger.error(f"MQTT: Connection failed - {data}")
+            self.app.update_status(f"Connection failed: {data}")
+        elif event == 'connected':
+            recovered = data[0]
+            if recovered is None:
+                Logger.info("MQTT: Connected successfully")
+                self.app.update_status("Connected to MQTT broker")
+            else:
+                Logger.info(f"MQTT: Reconnected in {recovered:.3f}s")
+                self.app.update_status(f"Reconnected in {recovered:.2f}s")
+        elif event == 'connect_refused':
+            Logger.error(f"MQTT: Connection failed with code {data[0]}, retrying in {data[1]:.1f}s")
+            self.app.update_status(f"Connection failed with code {data[0]}")
+        elif event == 'failover':
+            Logger.warning(f"MQTT: Failing over to {data[0]}:{data[1]}")
+            self.app.update_status(f"Failing over to {data[0]}")
+        elif event == 'protocol_fallback':
+            Logger.warning("MQTT: Broker refused MQTT 5, reconnecting with MQTT 3.1.1")
+            self.app.update_status("Broker has no MQTT 5, using MQTT 3.1.1")
+        elif event == 'link_lost':
+            Logger.warning(f"MQTT: Connection lost (rc={data[0]}), reconnecting in {data[1]:.1f}s")
+            self.app.update_status("Connection lost, reconnecting...")
+        elif event == 'disconnected':
+            Logger.info("MQTT: Disconnected from broker")
+            self.app.update_status("Disconnected from MQTT broker")
+        elif event == 'reconnect_failed':
+            Logger.info(f"MQTT: Reconnect attempt failed, retrying in {data:.1f}s")
+        elif event == 'message':
+            Logger.info(f"MQTT: Received message: {data.topic} - {data.payload.decode()}")
+        elif event == 'command_failed':
+            Logger.error(f"MQTT: Failed to publish {data[0]} - {data[1]}")
+        elif event == 'command_queued':
+            Logger.info(f"MQTT: Queued {data} command until reconnect")
+            self.app.update_status(f"{data.capitalize()} command queued until reconnect")
+        elif event == 'queue_failed':
+            Logger.error(f"MQTT: Failed to queue {data[0]} - {data[1]}")
+        elif event == 'not_connected':
+            Logger.warning(f"MQTT: Not connected, cannot publish {data}")
+        elif event == 'unknown_command':
+            Logger.error(f"MQTT: Unknown command {data}")
+        elif event == 'replayed':
+            Logger.info(f"MQTT: Replayed {data[0]} queued commands, dropped {data[1]} stale")
+            self.app.update_status(f"Replayed {data[0]} queued command(s)")
+        elif event == 'service_lost':
+            Logger.warning("Service: Lost the background service")
+            self.app.dispatcher.call(self.app.service_lost)
+
+
+def volume_key_listener(dispatcher):
+    """A Java VolumeKeyInterceptor.Listener that hands key-downs to the dispatcher"""
+    from jnius import PythonJavaClass, java_method
+    
+    class VolumeKeyListener(PythonJavaClass):
+        __javainterfaces__ = ['org/cosmos/controller/VolumeKeyInterceptor$Listener']
+        __javacontext__ = 'app'
+        
+        @java_method('(IJI)Z')
+        def onVolumeKey(self, key_code, down_nanos, repeat_count):
+            # System.nanoTime() and perf_counter() share CLOCK_MONOTONIC on Android
+            return dispatcher.key_down(key_code, down_nanos / 1e9, repeat_count)
+    
+    return VolumeKeyListener()
 
 
 class VolumeButtonHandler:
-    """Handles volume button presses for brake/land commands"""
+    """Sends BRAKE (volume up) and LAND (volume down) straight from the keys
+    
+    The Java interceptor (java/org/cosmos/controller) catches the keys before SDL
+    and Android do, and the dispatcher publishes from its own thread, so a press
+    never waits for Kivy's event loop.
+    """
     
     def __init__(self, mqtt_controller):
         self.mqtt_controller = mqtt_controller
+        self.dispatcher = KeyCommandDispatcher(mqtt_controller)
         self.monitoring = False
+        self.interceptor = None
+        # Kept referenced: Java only holds a weak link to the Python object
+        self.listener = None
         
     def start_monitoring(self):
         """Start monitoring volume buttons"""
-        if platform == 'android':
-            self.monitoring = True
-            # Note: Volume button handling requires special Android implementation
-            # This is a placeholder - actual implementation would need Android-specific code
-            Logger.info("Volume button monitoring started")
+        if platform != 'android' or self.monitoring:
+            return
+        self.dispatcher.start()
+        try:
+            self.listener = volume_key_listener(self.dispatcher)
+            interceptor = java_class('org.cosmos.controller.VolumeKeyInterceptor')
+            activity = java_class('org.kivy.android.PythonActivity').mActivity
+            self.interceptor = interceptor.install(activity, self.listener)
+        except Exception as e:
+            self.dispatcher.stop()
+            self.listener = None
+            Logger.error(f"Volume: Could not hook the volume keys - {str(e)}")
+            return
+        self.monitoring = True
+        Logger.info("Volume button monitoring started")
         
     def stop_monitoring(self):
         """Stop monitoring volume buttons"""
+        if self.interceptor is not None:
+            self.interceptor.uninstall()
+            self.interceptor = None
+        self.dispatcher.stop()
+        self.listener = None
         self.monitoring = False
         Logger.info("Volume button monitoring stopped")
 
 
 class COSMOSMQTTApp(App):
     def build(self):
+        """Build only the control screen; everything else waits for the first frame"""
+        with startup.phase('build control screen'):
+            main_layout = self.build_control_screen()
+        startup.mark('control_screen_built')
+        Clock.schedule_once(self.on_first_frame, 0)
+        return main_layout
+    
+    def build_control_screen(self):
+        """Connection settings, status and the BRAKE/LAND buttons"""
         self.title = "COSMOS MQTT Controller"
+        self.log_pipeline = LogPipeline(max_lines=200)
+        self.log_pipeline.post("App started...")
+        # Coalesces status changes from the MQTT thread into one update per frame
+        self.dispatcher = UIDispatcher(wakeup=Clock.create_trigger(self.apply_ui_updates))
+        self.dispatcher.on('status', self.apply_status)
         self.mqtt_controller = MQTTController(self)
+        # Routes subscribed with context='ui' run in the next frame, newest message only
+        self.mqtt_controller.router.ui = self.dispatcher.call_latest
         self.volume_handler = VolumeButtonHandler(self.mqtt_controller)
+        # ServiceClient of the foreground service while it holds the link
+        self.service = None
+        # Where presses go: the in-app controller, or the service's client
+        self.commands = self.mqtt_controller
+        # Set from $COSMOS_METRICS_FILE once the first frame is up
+        self.metrics_file = None
+        # Cleared by the first command sent, which completes the startup report
+        self.first_command_pending = True
         
         # Main layout
         main_layout = BoxLayout(orientation='vertical', padding=10, spacing=10)
@@ -248,6 +318,91 @@ class COSMOSMQTTApp(App):
         
         main_layout.add_widget(controls_layout)
         
+        self.main_layout = main_layout
+        return main_layout
+    
+    def on_first_frame(self, dt):
+        """Runs once the control screen has been drawn: load the rest of the app"""
+        startup.mark('first_frame')
+        with startup.phase('build secondary widgets'):
+            self.build_secondary_widgets(self.main_layout)
+        if platform == 'android':
+            with startup.phase('request permissions'):
+                request_android_permissions()
+        # paho is only needed once the user connects; import it off the UI thread
+        preload_client()
+        self.metrics_file = self.mqtt_controller.metrics.export_from_env()
+        self.start_recording()
+        if platform == 'android':
+            # A service left running by an earlier session already holds the link
+            threading.Thread(target=self._attach_service_worker, daemon=True).start()
+        else:
+            self.warm_up_connection()
+        startup.mark('deferred_ready')
+        self.report_startup()
+    
+    def start_recording(self):
+        """Keep a flight log of the session next to the app's other files"""
+        try:
+            path = new_session_path(os.path.join(self.user_data_dir, 'sessions'))
+            self.mqtt_controller.enable_recorder(path)
+            Logger.info(f"Recorder: Recording session to {path}")
+        except OSError as e:
+            Logger.warning(f"Recorder: Could not record the session - {str(e)}")
+    
+    def warm_up_connection(self):
+        """Resolve the broker and, for a remembered broker without login, connect right away
+        
+        The first press then finds a live, warm connection instead of waiting for
+        DNS, TCP and the MQTT handshake.
+        """
+        remembered = self.load_last_broker()
+        if remembered:
+            self.host_input.text = remembered.get('host', self.host_input.text)
+            self.port_input.text = str(remembered.get('port', self.port_input.text))
+            self.username_input.text = remembered.get('username', '')
+        host = self.host_input.text.strip()
+        port = self.port_input.text.strip() or "1883"
+        if not host:
+            return
+        self.mqtt_controller.warm_up(host, port)
+        self.mqtt_controller.enable_keep_warm()
+        if remembered and not self.username_input.text.strip():
+            startup.mark('auto_connect')
+            self.connect_mqtt(None)
+    
+    def load_last_broker(self):
+        """The broker of the last successful connect, or None"""
+        try:
+            with open(os.path.join(self.user_data_dir, 'last_broker.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def save_last_broker(self):
+        """Remember the broker (never the password) for warm-up on the next launch"""
+        broker = {'host': self.host_input.text.strip(),
+                  'port': self.port_input.text.strip() or "1883",
+                  'username': self.username_input.text.strip()}
+        try:
+            with open(os.path.join(self.user_data_dir, 'last_broker.json'), 'w') as f:
+                json.dump(broker, f)
+        except OSError as e:
+            Logger.warning(f"MQTT: Could not remember broker - {str(e)}")
+    
+    def report_startup(self):
+        """Log the startup timings and keep them for comparison between releases"""
+        for line in startup.report():
+            Logger.info(f"Startup: {line}")
+        try:
+            startup.write(os.path.join(self.user_data_dir, 'startup_report.json'))
+        except OSError as e:
+            Logger.warning(f"Startup: Could not save timing report - {str(e)}")
+    
+    def build_secondary_widgets(self, main_layout):
+        """Toggles, telemetry and the activity log, added below the controls"""
+        from kivy.uix.switch import Switch
+        
         # Volume monitoring toggle
         volume_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=40)
         volume_layout.add_widget(Label(text='Volume Button Control:', size_hint_x=0.7))
@@ -264,17 +419,67 @@ class COSMOSMQTTApp(App):
         bg_layout.add_widget(self.bg_switch)
         main_layout.add_widget(bg_layout)
         
+        # Offline command queue toggle
+        offline_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=40)
+        offline_layout.add_widget(Label(text='Queue While Offline:', size_hint_x=0.7))
+        self.offline_switch = Switch(active=False)
+        self.offline_switch.bind(active=self.toggle_offline_queue)
+        offline_layout.add_widget(self.offline_switch)
+        main_layout.add_widget(offline_layout)
+        
+        # Drone-level acknowledgements
+        acks_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=40)
+        acks_layout.add_widget(Label(text='Require Drone Ack:', size_hint_x=0.7))
+        self.acks_switch = Switch(active=False)
+        self.acks_switch.bind(active=self.toggle_command_acks)
+        acks_layout.add_widget(self.acks_switch)
+        main_layout.add_widget(acks_layout)
+        
+        # Race safety commands over every broker of a comma-separated host list
+        race_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=40)
+        race_layout.add_widget(Label(text='Race Over All Brokers:', size_hint_x=0.7))
+        self.race_switch = Switch(active=False)
+        self.race_switch.bind(active=self.toggle_race_publishing)
+        race_layout.add_widget(self.race_switch)
+        main_layout.add_widget(race_layout)
+        
+        # MQTT 5: topic aliases, message expiry, takes effect on the next connect
+        mqtt5_layout = BoxLayout(orientation='horizontal', size_hint_y=None, height=40)
+        mqtt5_layout.add_widget(Label(text='MQTT 5:', size_hint_x=0.7))
+        self.mqtt5_switch = Switch(active=False)
+        self.mqtt5_switch.bind(active=self.toggle_mqtt5)
+        mqtt5_layout.add_widget(self.mqtt5_switch)
+        main_layout.add_widget(mqtt5_layout)
+        
+        # Telemetry (refreshed at display rate, not per message)
+        self.telemetry_label = Label(text='', size_hint_y=None, height=60,
+                                     font_size='12sp')
+        main_layout.add_widget(self.telemetry_label)
+        self.telemetry_seen = 0
+        Clock.schedule_interval(self.refresh_telemetry, 0.2)
+        
+        # Delivery confirmation for QoS 1/2 commands
+        self.delivery_label = Label(text='Delivery: QoS 0, not confirmed', size_hint_y=None,
+                                    height=30, font_size='12sp')
+        main_layout.add_widget(self.delivery_label)
+        Clock.schedule_interval(self.refresh_delivery, 0.2)
+        
+        # Press to socket write, volume keys next to the on-screen buttons
+        self.press_latency_label = Label(text='', size_hint_y=None, height=30, font_size='12sp')
+        main_layout.add_widget(self.press_latency_label)
+        Clock.schedule_interval(self.refresh_press_latency, 1.0)
+        
         # Log area
         log_label = Label(text='Activity Log:', size_hint_y=None, height=30)
         main_layout.add_widget(log_label)
         
-        self.log_label = Label(text='App started...', 
+        self.log_lines = collections.deque(maxlen=self.log_pipeline.max_lines)
+        self.log_label = Label(text='', 
                               text_size=(None, None),
                               valign='top',
                               halign='left')
         main_layout.add_widget(self.log_label)
-        
-        return main_layout
+        Clock.schedule_interval(self.flush_log, self.log_pipeline.interval)
     
     def connect_mqtt(self, instance):
         """Connect to MQTT broker"""
@@ -300,14 +505,19 @@ class COSMOSMQTTApp(App):
     
     def _connect_worker(self, host, port, username, password):
         """Worker thread for MQTT connection"""
-        success = self.mqtt_controller.connect(host, port, username, password)
+        try:
+            success = self.commands.connect(host, port, username, password)
+        except ServiceError as e:
+            Logger.error(f"Service: Connect failed - {str(e)}")
+            success = False
         
         # Update UI on main thread
-        Clock.schedule_once(lambda dt: self._update_connect_ui(success), 0)
+        self.dispatcher.call(self._update_connect_ui, success)
     
     def _update_connect_ui(self, success):
         """Update connection UI"""
         if success:
+            self.save_last_broker()
             self.connect_btn.text = "Disconnect"
             self.connect_btn.disabled = False
             self.connect_btn.bind(on_press=self.disconnect_mqtt)
@@ -317,23 +527,47 @@ class COSMOSMQTTApp(App):
     
     def disconnect_mqtt(self, instance):
         """Disconnect from MQTT broker"""
-        self.mqtt_controller.disconnect()
+        try:
+            self.commands.disconnect()
+        except ServiceError as e:
+            Logger.error(f"Service: Disconnect failed - {str(e)}")
         self.connect_btn.text = "Connect to MQTT Broker"
         self.connect_btn.bind(on_press=self.connect_mqtt)
         self.update_status("Disconnected")
     
     def send_brake(self, instance):
         """Send brake command"""
-        success = self.mqtt_controller.publish_brake()
+        stamp = self.time_button_press(instance)
+        success = self.commands.publish_brake()
         if not success:
+            self.cancel_button_timing(stamp)
             self.show_popup("Error", "Failed to send brake command. Check connection.")
     
     def send_land(self, instance):
         """Send land command"""
-        success = self.mqtt_controller.publish_land()
+        stamp = self.time_button_press(instance)
+        success = self.commands.publish_land()
         if not success:
+            self.cancel_button_timing(stamp)
             self.show_popup("Error", "Failed to send land command. Check connection.")
     
+    def time_button_press(self, button):
+        """Time the touch that pressed button until its command is written, for
+        comparison with the volume keys
+        
+        Kivy stamps touches with time.time() when it picks them up from SDL.
+        """
+        touch = getattr(button, 'last_touch', None)
+        if touch is None or not self.commands.connected:
+            return None
+        pressed_at = time.perf_counter() - (time.time() - touch.time_start)
+        return self.commands.time_to_write('button_to_write_seconds', pressed_at)
+    
+    def cancel_button_timing(self, stamp):
+        """Drop the timing of a press that was not sent"""
+        if stamp is not None:
+            self.commands.cancel_write(stamp)
+    
     def toggle_volume_monitoring(self, instance, value):
         """Toggle volume button monitoring"""
         if value:
@@ -343,6 +577,51 @@ class COSMOSMQTTApp(App):
             self.volume_handler.stop_monitoring()
             self.update_status("Volume button monitoring disabled")
     
+    def toggle_offline_queue(self, instance, value):
+        """Toggle the durable offline command queue"""
+        if value:
+            path = os.path.join(self.user_data_dir, 'offline_commands.q')
+            self.mqtt_controller.enable_offline_queue(path)
+            self.update_status("Offline command queue enabled")
+        else:
+            self.mqtt_controller.disable_offline_queue()
+            self.update_status("Offline command queue disabled")
+    
+    def toggle_command_acks(self, instance, value):
+        """Turn drone-level command acknowledgements on or off"""
+        if value:
+            if self.mqtt_controller.acks is None:
+                self.mqtt_controller.enable_command_acks()
+            self.update_status("Commands now wait for a drone acknowledgement")
+        else:
+            self.mqtt_controller.disable_command_acks()
+            self.update_status("Drone acknowledgements disabled")
+    
+    def toggle_race_publishing(self, instance, value):
+        """Send safety commands through every broker at once, first drone ack wins"""
+        if not value:
+            self.mqtt_controller.disable_race_publishing()
+            self.update_status("Racing disabled, using the current broker only")
+            return
+        try:
+            self.mqtt_controller.enable_race_publishing()
+        except ValueError:
+            instance.active = False
+            self.show_popup("Error", "Enter several brokers, separated by commas, to race commands")
+            return
+        # Racing relies on drone acks, which enable_race_publishing turned on
+        self.acks_switch.active = True
+        self.update_status(f"Racing brake/land over {len(self.mqtt_controller.brokers)} brokers")
+    
+    def toggle_mqtt5(self, instance, value):
+        """Speak MQTT 5 from the next connect, falling back to 3.1.1 if refused"""
+        if value:
+            self.mqtt_controller.enable_mqtt5()
+            self.update_status("MQTT 5 on, used from the next connect")
+        else:
+            self.mqtt_controller.disable_mqtt5()
+            self.update_status("MQTT 3.1.1 used from the next connect")
+    
     def toggle_background_service(self, instance, value):
         """Toggle background service"""
         if value:
@@ -353,36 +632,194 @@ class COSMOSMQTTApp(App):
             self.update_status("Background service disabled")
     
     def start_background_service(self):
-        """Start background service"""
-        if platform == 'android':
-            # Start foreground service to keep app running
-            Logger.info("Starting background service")
-            # This would require Android-specific implementation
+        """Move the broker connection into the foreground service (service.py)"""
+        if platform != 'android' or self.service is not None:
+            return
+        Logger.info("Service: Starting foreground service")
+        broker = (self.host_input.text.strip(), self.port_input.text.strip() or "1883",
+                  self.username_input.text.strip(), self.password_input.text.strip())
+        # Settings the service's controller takes over from the app's
+        settings = [call for call, active in (('enable_mqtt5', self.mqtt5_switch.active),
+                                              ('enable_command_acks', self.acks_switch.active)) if active]
+        threading.Thread(target=self._start_service_worker, args=(broker, settings), daemon=True).start()
+    
+    def _start_service_worker(self, broker, settings):
+        """Start the service and connect it; the app's link stays up until the service's is"""
+        client = ServiceClient(service_address(), metrics=self.mqtt_controller.metrics)
+        try:
+            activity, service = foreground_service()
+            service.start(activity, json.dumps({'data_dir': self.user_data_dir}))
+            status = client.open(wait=10)
+            for call in settings:
+                client.call(call)
+            if self.mqtt_controller.connected and not status['connected']:
+                client.connect(*broker)
+                deadline = time.perf_counter() + 5
+                while not client.connected and time.perf_counter() < deadline:
+                    time.sleep(0.05)
+                if not client.connected:
+                    raise ServiceError("the service could not reach the broker")
+        except Exception as e:
+            Logger.error(f"Service: Could not take over the connection - {str(e)}")
+            client.close()
+            self.stop_service_process()
+            self.dispatcher.call(self._service_failed, str(e))
+            return
+        self.dispatcher.call(self.use_service, client)
+    
+    def _service_failed(self, message):
+        """Turn the switch back off after a failed start"""
+        self.bg_switch.active = False
+        self.update_status(f"Background service failed: {message}")
+    
+    def _attach_service_worker(self):
+        """Use a running service, or fall back to warming up the app's own connection"""
+        client = ServiceClient(service_address(), metrics=self.mqtt_controller.metrics)
+        try:
+            client.open()
+        except (OSError, ServiceError):
+            self.dispatcher.call(self.warm_up_connection)
+            return
+        self.dispatcher.call(self.attach_service, client)
+    
+    def attach_service(self, client):
+        """Pick up the service an earlier session started"""
+        remembered = self.load_last_broker()
+        if remembered:
+            self.host_input.text = remembered.get('host', self.host_input.text)
+            self.port_input.text = str(remembered.get('port', self.port_input.text))
+            self.username_input.text = remembered.get('username', '')
+        self.use_service(client)
+        self.bg_switch.active = True
+        if client.connected:
+            self._update_connect_ui(True)
+    
+    def use_service(self, client):
+        """Send everything through the service's controller from now on"""
+        self.service = client
+        self.commands = client
+        self.volume_handler.dispatcher.controller = client
+        client.add_listener(self.mqtt_controller.on_event)
+        if self.mqtt_controller.client is not None:
+            # The service holds the link now
+            self.mqtt_controller.disconnect()
+        if client.connected:
+            self.update_status("Connected through the background service")
+        else:
+            self.update_status("Background service running, not connected")
+    
+    def use_app_controller(self):
+        """Send through the app's own controller again"""
+        self.commands = self.mqtt_controller
+        self.volume_handler.dispatcher.controller = self.mqtt_controller
     
     def stop_background_service(self):
-        """Stop background service"""
-        if platform == 'android':
-            Logger.info("Stopping background service")
+        """Bring the broker connection back into the app and stop the service"""
+        client = self.service
+        if platform != 'android' or client is None:
+            return
+        Logger.info("Service: Stopping foreground service")
+        self.service = None
+        client.remove_listener(self.mqtt_controller.on_event)
+        broker = (self.host_input.text.strip(), self.port_input.text.strip() or "1883",
+                  self.username_input.text.strip(), self.password_input.text.strip())
+        threading.Thread(target=self._stop_service_worker, args=(client, broker), daemon=True).start()
+    
+    def _stop_service_worker(self, client, broker):
+        """Connect the app first if the service was connected, then end the service cleanly"""
+        if client.connected:
+            success = self.mqtt_controller.connect(*broker)
+            self.dispatcher.call(self._update_connect_ui, success)
+        self.dispatcher.call(self.use_app_controller)
+        try:
+            client.disconnect()
+        except ServiceError as e:
+            Logger.warning(f"Service: Disconnect failed - {str(e)}")
+        client.close()
+        self.stop_service_process()
+    
+    def stop_service_process(self):
+        """Stop the foreground service, ending its process"""
+        try:
+            activity, service = foreground_service()
+            service.stop(activity)
+        except Exception as e:
+            Logger.error(f"Service: Could not stop - {str(e)}")
+    
+    def service_lost(self):
+        """The service process ended: fall back to the app's own controller"""
+        if self.service is None:
+            return
+        self.service = None
+        self.use_app_controller()
+        self.bg_switch.active = False
+        self.connect_btn.text = "Connect to MQTT Broker"
+        self.connect_btn.bind(on_press=self.connect_mqtt)
+        self.update_status("Background service stopped, connect again")
     
     def update_status(self, message):
-        """Update status label"""
-        def update_ui(dt):
-            self.status_label.text = message
-            if "Connected" in message:
-                self.status_label.color = (0, 1, 0, 1)  # Green
-            elif "failed" in message or "Error" in message:
-                self.status_label.color = (1, 0, 0, 1)  # Red
-            else:
-                self.status_label.color = (1, 1, 0, 1)  # Yellow
-            
-            # Update log
-            current_time = time.strftime("%H:%M:%S")
-            self.log_label.text += f"\n[{current_time}] {message}"
-        
-        Clock.schedule_once(update_ui, 0)
+        """Update status label; safe to call from any thread"""
+        # The log is rendered in batches by flush_log, the label once per frame
+        self.log_pipeline.post(message)
+        self.dispatcher.post('status', message)
+    
+    def apply_status(self, message):
+        """Show the latest status, on the UI thread"""
+        self.status_label.text = message
+        if "Connected" in message:
+            self.status_label.color = (0, 1, 0, 1)  # Green
+        elif "failed" in message or "Error" in message:
+            self.status_label.color = (1, 0, 0, 1)  # Red
+        else:
+            self.status_label.color = (1, 1, 0, 1)  # Yellow
+    
+    def apply_ui_updates(self, dt):
+        """Apply everything posted to the dispatcher since the last frame"""
+        lag = self.dispatcher.run_frame()
+        if lag is not None:
+            self.mqtt_controller.metrics.observe('ui_dispatch_seconds', lag)
+    
+    def flush_log(self, dt):
+        """Re-render the bounded activity log once per frame interval if it changed"""
+        lines, overflowed = self.log_pipeline.take_batch()
+        if lines:
+            if overflowed:
+                self.log_lines.clear()
+            self.log_lines.extend(lines)
+            self.log_label.text = "\n".join(self.log_lines)
+    
+    def refresh_telemetry(self, dt):
+        """Show the latest downsampled telemetry if new samples arrived"""
+        telemetry = self.mqtt_controller.telemetry
+        if telemetry.messages != self.telemetry_seen:
+            self.telemetry_seen = telemetry.messages
+            self.telemetry_label.text = telemetry.summary()
+    
+    def refresh_delivery(self, dt):
+        """Show confirmed vs pending QoS 1/2 commands and their ack latency"""
+        inflight = self.mqtt_controller.inflight
+        inflight.expire()
+        acks = self.mqtt_controller.acks
+        if acks is not None:
+            self.delivery_label.text = f"Delivery: {acks.summary()}"
+        elif inflight.confirmed or len(inflight):
+            self.delivery_label.text = f"Delivery: {inflight.summary()}"
+    
+    def refresh_press_latency(self, dt):
+        """Show median press-to-write time of the volume keys and the buttons"""
+        histograms = self.mqtt_controller.metrics.histograms
+        parts = []
+        for label, name in (('keys', 'key_to_write_seconds'), ('buttons', 'button_to_write_seconds')):
+            histogram = histograms[name]
+            if histogram.count:
+                parts.append(f"{label} {histogram.percentile(50) * 1000:.1f} ms "
+                             f"(p99 {histogram.percentile(99) * 1000:.1f})")
+        if parts:
+            self.press_latency_label.text = "Press to send: " + ", ".join(parts)
     
     def show_popup(self, title, message):
         """Show popup message"""
+        from kivy.uix.popup import Popup
         popup = Popup(title=title,
                      content=Label(text=message),
                      size_hint=(0.8, 0.4))
@@ -392,12 +829,35 @@ class COSMOSMQTTApp(App):
         """Called when the app starts"""
         self.update_status("App started - Enter MQTT credentials to connect")
     
+    def on_pause(self):
+        """Stop the idle echoes while in the background; the connection stays up"""
+        if self.mqtt_controller.keep_warm is not None:
+            self.mqtt_controller.keep_warm.stop()
+        return True
+    
+    def on_resume(self):
+        """Wake the path with an echo so the first press after resume is not a cold one"""
+        keep_warm = self.mqtt_controller.keep_warm
+        if keep_warm is not None and self.mqtt_controller.client is not None:
+            keep_warm.start(self.mqtt_controller._send_warm_echo)
+            keep_warm.kick()
+    
     def on_stop(self):
         """Called when the app stops"""
         if self.mqtt_controller:
             self.mqtt_controller.disconnect()
+            self.mqtt_controller.disable_recorder()
+            if self.metrics_file:
+                try:
+                    self.mqtt_controller.metrics.write(self.metrics_file)
+                except OSError as e:
+                    Logger.warning(f"Metrics: Could not write {self.metrics_file} - {str(e)}")
         if self.volume_handler:
             self.volume_handler.stop_monitoring()
+        if self.service is not None:
+            # The service keeps the link after the app is gone
+            self.service.remove_listener(self.mqtt_controller.on_event)
+            self.service.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,291 @@
+"""
+MQTT Wire Format Helpers
+Minimal MQTT 3.1.1 packet encoding and decoding shared by the loopback broker
+and the benchmark tools. Only the packet types the COSMOS controllers use are covered.
+
+MQTT 5 packets differ by a properties block after the variable header. Properties
+are handled as lists of (identifier, value) pairs; only the identifiers below are
+understood, which covers topic aliases, message expiry and user properties.
+"""
+
+import contextlib
+import struct
+import threading
+
+# Control packet types (high nibble of the fixed header)
+CONNECT = 0x10
+CONNACK = 0x20
+PUBLISH = 0x30
+PUBACK = 0x40
+PUBREC = 0x50
+PUBREL = 0x60
+PUBCOMP = 0x70
+SUBSCRIBE = 0x80
+SUBACK = 0x90
+UNSUBSCRIBE = 0xA0
+UNSUBACK = 0xB0
+PINGREQ = 0xC0
+PINGRESP = 0xD0
+DISCONNECT = 0xE0
+
+# Protocol levels in CONNECT
+MQTT311 = 4
+MQTT5 = 5
+
+# MQTT 5 property identifiers
+MESSAGE_EXPIRY = 0x02
+SESSION_EXPIRY = 0x11
+RECEIVE_MAXIMUM = 0x21
+TOPIC_ALIAS_MAXIMUM = 0x22
+TOPIC_ALIAS = 0x23
+USER_PROPERTY = 0x26
+
+# Serialises expedite() calls from different publishing threads
+_expedite_lock = threading.Lock()
+
+# identifier -> struct format, or 'pair' for a UTF-8 string pair
+PROPERTY_TYPES = {
+    MESSAGE_EXPIRY: '!I',
+    SESSION_EXPIRY: '!I',
+    RECEIVE_MAXIMUM: '!H',
+    TOPIC_ALIAS_MAXIMUM: '!H',
+    TOPIC_ALIAS: '!H',
+    USER_PROPERTY: 'pair',
+}
+
+
+def encode_remaining_length(length):
+    """Encode the variable length 'remaining length' field"""
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        if length > 0:
+            byte |= 0x80
+        encoded.append(byte)
+        if length == 0:
+            return bytes(encoded)
+
+
+def encode_string(value):
+    """Encode a UTF-8 string with its two byte length prefix"""
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    return struct.pack('!H', len(value)) + value
+
+
+def encode_packet(header, body=b''):
+    """Prefix a packet body with its fixed header"""
+    return bytes((header,)) + encode_remaining_length(len(body)) + body
+
+
+def encode_properties(properties):
+    """Encode an MQTT 5 properties block from (identifier, value) pairs"""
+    body = bytearray()
+    for identifier, value in properties:
+        kind = PROPERTY_TYPES[identifier]
+        body.append(identifier)
+        if kind == 'pair':
+            body += encode_string(value[0]) + encode_string(value[1])
+        else:
+            body += struct.pack(kind, value)
+    return encode_remaining_length(len(body)) + bytes(body)
+
+
+def decode_varint(data, offset):
+    """Decode a variable byte integer, returning (value, new_offset)"""
+    value = 0
+    multiplier = 1
+    while True:
+        byte = data[offset]
+        offset += 1
+        value += (byte & 0x7F) * multiplier
+        if not byte & 0x80:
+            return value, offset
+        multiplier *= 128
+
+
+def decode_properties(data, offset):
+    """Decode an MQTT 5 properties block into ([(identifier, value)], new_offset)
+
+    Raises ValueError on an identifier this module does not know, since its
+    length cannot be worked out.
+    """
+    length, offset = decode_varint(data, offset)
+    end = offset + length
+    properties = []
+    while offset < end:
+        identifier = data[offset]
+        offset += 1
+        kind = PROPERTY_TYPES.get(identifier)
+        if kind is None:
+            raise ValueError(f"unsupported property 0x{identifier:02x}")
+        if kind == 'pair':
+            key, offset = decode_string(data, offset)
+            value, offset = decode_string(data, offset)
+            properties.append((identifier, (key, value)))
+        else:
+            (value,) = struct.unpack_from(kind, data, offset)
+            offset += struct.calcsize(kind)
+            properties.append((identifier, value))
+    return properties, end
+
+
+def encode_publish(topic, payload, qos=0, mid=0, retain=False, dup=False, properties=None):
+    """Encode a complete PUBLISH packet; properties (even []) makes it an MQTT 5 packet"""
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    header = PUBLISH | (qos << 1)
+    if retain:
+        header |= 0x01
+    if dup:
+        header |= 0x08
+    body = encode_string(topic)
+    if qos > 0:
+        body += struct.pack('!H', mid)
+    if properties is not None:
+        body += encode_properties(properties)
+    return encode_packet(header, body + payload)
+
+
+def encode_ack(packet_type, mid):
+    """Encode a PUBACK/PUBREC/PUBREL/PUBCOMP/UNSUBACK packet"""
+    header = packet_type
+    if packet_type == PUBREL:
+        header |= 0x02
+    return encode_packet(header, struct.pack('!H', mid))
+
+
+def decode_string(data, offset):
+    """Decode a length-prefixed UTF-8 string, returning (value, new_offset)"""
+    (length,) = struct.unpack_from('!H', data, offset)
+    start = offset + 2
+    return bytes(data[start:start + length]).decode('utf-8'), start + length
+
+
+def decode_publish(header, body):
+    """Decode a PUBLISH body into (topic, payload, qos, mid, retain)"""
+    qos = (header >> 1) & 0x03
+    topic, offset = decode_string(body, 0)
+    mid = 0
+    if qos > 0:
+        (mid,) = struct.unpack_from('!H', body, offset)
+        offset += 2
+    return topic, bytes(body[offset:]), qos, mid, bool(header & 0x01)
+
+
+def decode_publish5(header, body):
+    """Decode an MQTT 5 PUBLISH body into (topic, payload, qos, mid, retain, properties)"""
+    qos = (header >> 1) & 0x03
+    topic, offset = decode_string(body, 0)
+    mid = 0
+    if qos > 0:
+        (mid,) = struct.unpack_from('!H', body, offset)
+        offset += 2
+    properties, offset = decode_properties(body, offset)
+    return topic, bytes(body[offset:]), qos, mid, bool(header & 0x01), properties
+
+
+def topic_matches(topic_filter, topic):
+    """Check whether a topic matches a subscription filter with + and # wildcards"""
+    if topic_filter == topic:
+        return True
+    filter_parts = topic_filter.split('/')
+    topic_parts = topic.split('/')
+    for index, part in enumerate(filter_parts):
+        if part == '#':
+            return True
+        if index >= len(topic_parts):
+            return False
+        if part != '+' and part != topic_parts[index]:
+            return False
+    return len(filter_parts) == len(topic_parts)
+
+
+def read_packet(sock):
+    """Read one packet from a blocking socket, returning (header, body) or None on EOF"""
+    first = _recv_exact(sock, 1)
+    if not first:
+        return None
+    multiplier = 1
+    length = 0
+    while True:
+        byte = _recv_exact(sock, 1)
+        if not byte:
+            return None
+        length += (byte[0] & 0x7F) * multiplier
+        if not byte[0] & 0x80:
+            break
+        multiplier *= 128
+    body = _recv_exact(sock, length) if length else b''
+    if body is None:
+        return None
+    return first[0], body
+
+
+def _recv_exact(sock, count):
+    """Receive exactly count bytes or return None if the peer closed"""
+    chunks = bytearray()
+    while len(chunks) < count:
+        chunk = sock.recv(count - len(chunks))
+        if not chunk:
+            return None
+        chunks.extend(chunk)
+    return bytes(chunks)
+
+
+def queue_raw_publish(client, data, info=None, urgent=False):
+    """Queue pre-encoded QoS 0 PUBLISH bytes on a paho client's outbound queue
+
+    Paho writes the bytes in order with its own packets and handles partial
+    writes, so several PUBLISH packets concatenated into one buffer go out in a
+    single send. Call it from the same threads you would call publish() from.
+    An urgent packet is moved ahead of everything already queued (see expedite).
+    """
+    if info is None:
+        from paho.mqtt.client import MQTTMessageInfo
+        info = MQTTMessageInfo(0)
+    result = client._packet_queue(PUBLISH, data, 0, 0, info)
+    if urgent:
+        expedite(client, lambda packet: packet['packet'] is data)
+    return result
+
+
+def expedite(client, match):
+    """Move a packet in a paho client's outbound queue ahead of everything but
+    the head and earlier expedited packets
+
+    match(entry) picks the packet among paho's queue entries, newest first. The
+    head entry stays first, since paho's thread may have half written it. Paho's
+    thread only ever takes or puts back the head, so nothing can come between
+    the two halves of a packet. Expedited packets keep their order among
+    themselves. Returns True if the packet was moved, and False if it was not
+    found, e.g. because it was already written.
+    """
+    queue = client._out_packet
+    # paho 1.x guards the queue with a mutex; 2.x relies on deque operations being atomic
+    mutex = getattr(client, '_out_packet_mutex', None) or contextlib.nullcontext()
+    with _expedite_lock, mutex:
+        # One atomic copy: paho's thread cannot change the queue while it is made
+        entries = list(queue)
+        for index in range(len(entries) - 1, 0, -1):
+            if match(entries[index]):
+                break
+        else:
+            return False
+        entry = entries[index]
+        position = 1
+        while position < index and entries[position].get('expedited'):
+            position += 1
+        entry['expedited'] = True
+        if position == index:
+            return False
+        try:
+            queue.remove(entry)
+        except ValueError:
+            # Taken by paho's thread in the meantime
+            return False
+        # If paho's thread took entries since the copy, this lands further back
+        # than planned, but never ahead of an earlier expedited packet
+        queue.insert(position, entry)
+    return True
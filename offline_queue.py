@@ -0,0 +1,191 @@
+"""
+COSMOS Offline Command Queue
+A durable outbound queue for commands pressed while the broker link is down.
+
+Records live in a fixed-size, memory-mapped ring file: a small header holds the
+head/tail counters and every record occupies one fixed-size slot, so enqueue and
+dequeue are constant time, appends are bounded and the file never grows. Each
+record carries its wall-clock creation time, an expiry and a CRC, so the queue
+survives app restarts and torn writes are detected. On reconnect the controller
+replays records in order and drops safety commands that have gone stale.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+MAGIC = b"CMQ1"
+# magic, slot size, capacity, head (total dequeued), tail (total enqueued)
+HEADER = struct.Struct("<4sIIQQ")
+HEADER_SIZE = 64
+# crc32, created, expires, qos, name length, topic length, payload length
+RECORD = struct.Struct("<IddBBHH")
+
+# Seconds a command stays worth replaying; anything older is dropped
+DEFAULT_TTLS = {
+    'brake': 5.0,
+    'land': 30.0,
+}
+DEFAULT_TTL = 10.0
+
+
+class QueuedCommand:
+    """A command read back from the queue"""
+
+    __slots__ = ('name', 'topic', 'payload', 'qos', 'created', 'expires')
+
+    def __init__(self, name, topic, payload, qos, created, expires):
+        self.name = name
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.created = created
+        self.expires = expires
+
+    def expired(self, now=None):
+        return (time.time() if now is None else now) >= self.expires
+
+
+class OfflineCommandQueue:
+    """Memory-mapped ring of fixed-size command records"""
+
+    def __init__(self, path, capacity=256, slot_size=256, ttls=None):
+        self.path = path
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.dropped_full = 0
+        self.lock = threading.Lock()
+        size = HEADER_SIZE + capacity * slot_size
+
+        exists = os.path.exists(path) and os.path.getsize(path) >= HEADER_SIZE
+        self.file = open(path, 'r+b' if exists else 'w+b')
+        if exists:
+            magic, slot_size, capacity, _, _ = HEADER.unpack_from(self.file.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not an offline command queue")
+            size = HEADER_SIZE + capacity * slot_size
+        if os.path.getsize(path) < size:
+            self.file.truncate(size)
+        self.mm = mmap.mmap(self.file.fileno(), size)
+        self.slot_size = slot_size
+        self.capacity = capacity
+        if not exists:
+            self._write_header(0, 0)
+
+    def _read_header(self):
+        _, _, _, head, tail = HEADER.unpack_from(self.mm, 0)
+        return head, tail
+
+    def _write_header(self, head, tail):
+        HEADER.pack_into(self.mm, 0, MAGIC, self.slot_size, self.capacity, head, tail)
+
+    def __len__(self):
+        head, tail = self._read_header()
+        return tail - head
+
+    def _offset(self, index):
+        return HEADER_SIZE + (index % self.capacity) * self.slot_size
+
+    def enqueue(self, name, topic, payload, qos=0, ttl=None, now=None):
+        """Append a command; the oldest record is evicted when the ring is full"""
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        name_bytes = name.encode('utf-8')
+        topic_bytes = topic.encode('utf-8')
+        body = name_bytes + topic_bytes + payload
+        if RECORD.size + len(body) > self.slot_size:
+            raise ValueError("command does not fit in a queue slot")
+
+        created = time.time() if now is None else now
+        if ttl is None:
+            ttl = self.ttls.get(name, DEFAULT_TTL)
+        fields = (created, created + ttl, qos, len(name_bytes), len(topic_bytes), len(payload))
+        crc = zlib.crc32(struct.pack("<ddBBHH", *fields) + body)
+
+        with self.lock:
+            head, tail = self._read_header()
+            if tail - head >= self.capacity:
+                head += 1
+                self.dropped_full += 1
+            offset = self._offset(tail)
+            RECORD.pack_into(self.mm, offset, crc, *fields)
+            start = offset + RECORD.size
+            self.mm[start:start + len(body)] = body
+            # Publish the record only after its bytes are in place
+            self._write_header(head, tail + 1)
+            self.mm.flush()
+
+    def _read(self, index):
+        """Decode the record at a ring index, or None if the slot is torn or corrupt"""
+        offset = self._offset(index)
+        crc, created, expires, qos, name_len, topic_len, payload_len = RECORD.unpack_from(self.mm, offset)
+        start = offset + RECORD.size
+        end = start + name_len + topic_len + payload_len
+        if end > offset + self.slot_size:
+            return None
+        body = self.mm[start:end]
+        fields = (created, expires, qos, name_len, topic_len, payload_len)
+        if zlib.crc32(struct.pack("<ddBBHH", *fields) + body) != crc:
+            return None
+        name = body[:name_len].decode('utf-8')
+        topic = body[name_len:name_len + topic_len].decode('utf-8')
+        return QueuedCommand(name, topic, body[name_len + topic_len:], qos, created, expires)
+
+    def peek(self):
+        """Return the oldest command without removing it, or None"""
+        with self.lock:
+            head, tail = self._read_header()
+            while head < tail:
+                record = self._read(head)
+                if record is not None:
+                    return record
+                head += 1
+            return None
+
+    def dequeue(self):
+        """Remove and return the oldest command, or None"""
+        with self.lock:
+            head, tail = self._read_header()
+            record = None
+            # Corrupt slots are skipped over
+            while head < tail and record is None:
+                record = self._read(head)
+                head += 1
+            self._write_header(head, tail)
+            self.mm.flush()
+            return record
+
+    def drain(self, now=None):
+        """Remove every queued command, returning (fresh commands in order, expired count)"""
+        now = time.time() if now is None else now
+        fresh = []
+        expired = 0
+        with self.lock:
+            head, tail = self._read_header()
+            for index in range(head, tail):
+                record = self._read(index)
+                if record is None:
+                    continue
+                if record.expired(now):
+                    expired += 1
+                else:
+                    fresh.append(record)
+            self._write_header(tail, tail)
+            self.mm.flush()
+        return fresh, expired
+
+    def clear(self):
+        """Drop every queued command"""
+        with self.lock:
+            head, tail = self._read_header()
+            self._write_header(tail, tail)
+            self.mm.flush()
+
+    def close(self):
+        """Flush and release the mapping"""
+        with self.lock:
+            self.mm.flush()
+            self.mm.close()
+            self.file.close()
@@ -0,0 +1,152 @@
+"""
+COSMOS Reconnect Engine
+Automatic recovery from a lost broker link for the app controllers.
+
+Link loss is detected quickly: the MQTT keepalive is short, and the TCP socket gets
+keepalive probes plus a user timeout, so a dead link fails in seconds instead of
+after minutes of retransmits. paho's network thread does the reconnecting. The
+engine decides how long each wait is, using capped exponential backoff with
+jitter so a fleet of phones does not reconnect in lockstep, and it records how
+long every recovery took.
+"""
+
+import collections
+import random
+import socket
+import time
+
+
+class Backoff:
+    """Capped exponential backoff with proportional jitter
+
+    The n-th delay is min(maximum, initial * multiplier ** n). A random share of
+    `jitter` (0..1) of that delay is taken off, so jitter=1.0 is "full jitter".
+    """
+
+    def __init__(self, initial=0.1, maximum=10.0, multiplier=2.0, jitter=0.5, rng=random.random):
+        self.initial = initial
+        self.maximum = maximum
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.rng = rng
+        self.attempts = 0
+
+    def next_delay(self):
+        """Return the wait before the next attempt and advance the schedule"""
+        base = min(self.maximum, self.initial * self.multiplier ** self.attempts)
+        self.attempts += 1
+        return base * (1.0 - self.jitter * self.rng())
+
+    def reset(self):
+        """Start again from the initial delay"""
+        self.attempts = 0
+
+
+class RecoveryStats:
+    """Time-to-recover measurements for lost links"""
+
+    def __init__(self, history=100):
+        self.recoveries = collections.deque(maxlen=history)
+        self.attempts = collections.deque(maxlen=history)
+        self.lost_at = None
+        self.links_lost = 0
+
+    def lost(self, now=None):
+        """Mark the link as lost (the first loss of an outage wins)"""
+        if self.lost_at is None:
+            self.lost_at = time.monotonic() if now is None else now
+            self.links_lost += 1
+
+    def recovered(self, attempts, now=None):
+        """Mark the link as back up; returns the recovery time or None"""
+        if self.lost_at is None:
+            return None
+        elapsed = (time.monotonic() if now is None else now) - self.lost_at
+        self.lost_at = None
+        self.recoveries.append(elapsed)
+        self.attempts.append(attempts)
+        return elapsed
+
+    @property
+    def last(self):
+        return self.recoveries[-1] if self.recoveries else None
+
+    def summary(self):
+        """Return a dict with the recovery count, p50, max and mean attempts"""
+        times = sorted(self.recoveries)
+        if not times:
+            return {'count': 0, 'links_lost': self.links_lost}
+        return {
+            'count': len(times),
+            'links_lost': self.links_lost,
+            'p50': times[len(times) // 2],
+            'max': times[-1],
+            'attempts': sum(self.attempts) / len(self.attempts),
+        }
+
+
+def tune_socket(sock, keepalive_idle=5, keepalive_interval=2, keepalive_count=3, user_timeout=10.0):
+    """Set TCP options that surface a dead link in seconds, where the platform has them"""
+    options = [(socket.IPPROTO_TCP, 'TCP_NODELAY', 1),
+               (socket.SOL_SOCKET, 'SO_KEEPALIVE', 1),
+               (socket.IPPROTO_TCP, 'TCP_KEEPIDLE', keepalive_idle),
+               (socket.IPPROTO_TCP, 'TCP_KEEPINTVL', keepalive_interval),
+               (socket.IPPROTO_TCP, 'TCP_KEEPCNT', keepalive_count),
+               # Abort when sent data stays unacknowledged this long (Linux/Android)
+               (socket.IPPROTO_TCP, 'TCP_USER_TIMEOUT', int(user_timeout * 1000))]
+    for level, name, value in options:
+        option = getattr(socket, name, None)
+        if option is None:
+            continue
+        try:
+            sock.setsockopt(level, option, value)
+        except (OSError, AttributeError):
+            # Not a TCP socket (websockets/unix) or not supported here
+            pass
+
+
+class ReconnectEngine:
+    """Drives paho's reconnect loop with jittered backoff and tracks recovery
+
+    Wire it up with attach(client) before connecting, then call link_lost(),
+    attempt_failed() and link_up() from the controller's paho callbacks.
+    """
+
+    def __init__(self, keepalive=15, initial_delay=0.1, max_delay=10.0, jitter=0.5,
+                 tcp_user_timeout=10.0):
+        self.keepalive = keepalive
+        self.tcp_user_timeout = tcp_user_timeout
+        self.backoff = Backoff(initial_delay, max_delay, jitter=jitter)
+        self.stats = RecoveryStats()
+        self.next_delay = None
+
+    def attach(self, client):
+        """Install the socket tuning hook on a client"""
+        client.on_socket_open = self.on_socket_open
+        self.backoff.reset()
+
+    def on_socket_open(self, client, userdata, sock):
+        tune_socket(sock, keepalive_idle=max(1, self.keepalive // 3),
+                    user_timeout=self.tcp_user_timeout)
+
+    def _schedule(self, client):
+        # paho doubles its delay between min and max; pinning both gives our value
+        self.next_delay = self.backoff.next_delay()
+        client.reconnect_delay_set(self.next_delay, self.next_delay)
+        return self.next_delay
+
+    def link_lost(self, client):
+        """Call from on_disconnect with a non-zero rc; returns the wait before retrying"""
+        self.stats.lost()
+        return self._schedule(client)
+
+    def attempt_failed(self, client):
+        """Call from on_connect_fail or a refused CONNACK; returns the next wait"""
+        self.stats.lost()
+        return self._schedule(client)
+
+    def link_up(self):
+        """Call from a successful on_connect; returns the recovery time or None"""
+        elapsed = self.stats.recovered(self.backoff.attempts)
+        self.backoff.reset()
+        return elapsed
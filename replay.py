@@ -0,0 +1,113 @@
+"""
+COSMOS Session Replay
+Plays a flight log (flight_recorder.py) back against a broker: the commands the
+controller sent and, optionally, the messages it received, on their original
+topics and with their original spacing.
+
+At --speed 1 records go out at the pace they were recorded, for reproducing an
+incident against a local broker and a drone simulator. --speed 0 sends them as
+fast as possible, for realistic benchmark traffic. Lateness is measured against
+the schedule, so a replay that could not keep up shows it.
+
+--dump prints the session instead of replaying it.
+
+Usage:
+    python -m replay session.flight --dump
+    python -m replay session.flight --loopback --speed 0
+    python -m replay session.flight --port 1883 --speed 1 --messages
+"""
+
+import argparse
+import sys
+import time
+
+from benchmarks.latency import percentile
+from cosmos_core import create_client
+from flight_recorder import COMMAND, KIND_NAMES, MESSAGE, FlightLog
+from loopback_broker import LoopbackBroker
+
+
+def format_record(record):
+    """One line per record, for reading a session"""
+    kind = KIND_NAMES.get(record.kind, str(record.kind))
+    if record.kind in (COMMAND, MESSAGE):
+        payload = record.payload.decode('utf-8', 'replace')
+        if len(payload) > 60:
+            payload = payload[:57] + "..."
+        detail = f"{record.name + ' ' if record.name else ''}{record.topic} = {payload}"
+    else:
+        detail = f"{record.name} {record.payload.decode('utf-8', 'replace')}"
+    return f"{record.time:10.4f}  {kind:8} {detail}"
+
+
+def replay(records, publish, speed=1.0, sleep=time.sleep):
+    """Call publish(record) for each record on the recorded schedule scaled by 1/speed
+
+    speed 0 sends back to back. Returns the seconds each publish was late.
+    """
+    lateness = []
+    if not records:
+        return lateness
+    first = records[0].time
+    started = time.perf_counter()
+    for record in records:
+        if speed > 0:
+            due = started + (record.time - first) / speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                sleep(delay)
+            lateness.append(max(0.0, time.perf_counter() - due))
+        publish(record)
+    return lateness
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COSMOS flight log replay")
+    parser.add_argument('log', help="flight log to replay")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--loopback', action='store_true',
+                        help="start an in-process loopback broker instead of using --host/--port")
+    parser.add_argument('--speed', type=float, default=1.0, help="1 for real time, 0 for as fast as possible")
+    parser.add_argument('--messages', action='store_true', help="also replay the messages the controller received")
+    parser.add_argument('--dump', action='store_true', help="print the session instead of replaying it")
+    args = parser.parse_args(argv)
+
+    log = FlightLog(args.log)
+    if args.dump:
+        print(f"Session started {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(log.wall_start))}")
+        for record in log:
+            print(format_record(record))
+        return 0
+
+    kinds = (COMMAND, MESSAGE) if args.messages else (COMMAND,)
+    records = log.records(kinds)
+    broker = LoopbackBroker().start() if args.loopback else None
+    host, port = (broker.host, broker.port) if broker else (args.host, args.port)
+    client = create_client()
+    try:
+        client.connect(host, port, 60)
+        client.loop_start()
+        pace = f"{args.speed:g}x" if args.speed > 0 else "as fast as possible"
+        print(f"Replaying {len(records)} records from {args.log} to {host}:{port}, {pace}")
+        started = time.perf_counter()
+        lateness = replay(records, lambda record: client.publish(record.topic, record.payload, record.qos),
+                          args.speed)
+        elapsed = time.perf_counter() - started
+    finally:
+        # DISCONNECT is queued behind the replayed packets, so they all go out first
+        client.disconnect()
+        client.loop_stop()
+        if broker is not None:
+            broker.stop()
+
+    print(f"Sent {len(records)} in {elapsed:.3f}s ({len(records) / max(elapsed, 1e-9):.0f}/s)")
+    if lateness:
+        lateness.sort()
+        print(f"Late vs schedule  p50 {percentile(lateness, 50) * 1000:.3f} ms"
+              f"  p99 {percentile(lateness, 99) * 1000:.3f} ms  max {lateness[-1] * 1000:.3f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""
+COSMOS Foreground Service
+The Android service process that owns the broker connection. main.py starts it
+from the "Run in Background" switch and drives it over the socket served by
+cosmos_core.service, so the connection, its keepalives and the offline queue keep
+running when the screen is off, the app is in the background or the Activity is
+destroyed.
+
+Declared in buildozer.spec as
+
+    services = Cosmos:service.py:foreground:sticky
+
+The service keeps a notification with BRAKE and LAND actions that reach the
+controller in this process directly, without the UI. While the screen is off it
+holds a partial wake lock and a Wi-Fi lock for as long as a link should be up (see
+WakePolicy). A foreground service keeps its network access in Doze, but without
+the wake lock the CPU can still sleep through keepalives and reconnects.
+
+When the system restarts the service on its own (sticky), it reconnects to the
+last broker if that broker needs no login.
+"""
+
+import json
+import logging
+import os
+import threading
+
+from jnius import PythonJavaClass, autoclass, cast, java_method
+
+from cosmos_core import MQTTController
+from cosmos_core.service import ControllerService, WakePolicy, service_address
+from flight_recorder import new_session_path
+
+logger = logging.getLogger("cosmos.android_service")
+
+NOTIFICATION_ID = 1
+CHANNEL_ID = "cosmos_controller"
+ACTION_BRAKE = "org.cosmos.controller.BRAKE"
+ACTION_LAND = "org.cosmos.controller.LAND"
+ACTION_SCREEN_ON = "android.intent.action.SCREEN_ON"
+ACTION_SCREEN_OFF = "android.intent.action.SCREEN_OFF"
+
+# android.app.PendingIntent / android.content.Context flags
+FLAG_UPDATE_CURRENT = 0x08000000
+FLAG_IMMUTABLE = 0x04000000
+RECEIVER_NOT_EXPORTED = 0x4
+
+Build = autoclass('android.os.Build')
+Context = autoclass('android.content.Context')
+Intent = autoclass('android.content.Intent')
+IntentFilter = autoclass('android.content.IntentFilter')
+PendingIntent = autoclass('android.app.PendingIntent')
+PowerManager = autoclass('android.os.PowerManager')
+WifiManager = autoclass('android.net.wifi.WifiManager')
+PythonService = autoclass('org.kivy.android.PythonService')
+
+
+class BroadcastListener(PythonJavaClass):
+    """Hands broadcasts received by a GenericBroadcastReceiver to a Python callable"""
+    __javainterfaces__ = ['org/kivy/android/GenericBroadcastReceiverCallback']
+    __javacontext__ = 'app'
+
+    def __init__(self, callback):
+        super().__init__()
+        self.callback = callback
+
+    @java_method('(Landroid/content/Context;Landroid/content/Intent;)V')
+    def onReceive(self, context, intent):
+        self.callback(intent.getAction())
+
+
+class AndroidWakeLocks:
+    """A partial wake lock and a Wi-Fi lock, taken and dropped together"""
+
+    def __init__(self, context):
+        power = cast('android.os.PowerManager', context.getSystemService(Context.POWER_SERVICE))
+        self.wake_lock = power.newWakeLock(PowerManager.PARTIAL_WAKE_LOCK, "cosmos:link")
+        self.wake_lock.setReferenceCounted(False)
+        wifi = cast('android.net.wifi.WifiManager',
+                    context.getApplicationContext().getSystemService(Context.WIFI_SERVICE))
+        self.wifi_lock = wifi.createWifiLock(WifiManager.WIFI_MODE_FULL_HIGH_PERF, "cosmos:link")
+        self.wifi_lock.setReferenceCounted(False)
+        self.interactive = power.isInteractive()
+
+    def acquire(self):
+        self.wake_lock.acquire()
+        self.wifi_lock.acquire()
+        logger.info("Holding wake and Wi-Fi locks while the screen is off")
+
+    def release(self):
+        if self.wifi_lock.isHeld():
+            self.wifi_lock.release()
+        if self.wake_lock.isHeld():
+            self.wake_lock.release()
+        logger.info("Released wake and Wi-Fi locks")
+
+
+class CosmosService:
+    """Wires the controller, its local socket, the notification and the wake policy"""
+
+    def __init__(self, service, argument):
+        self.service = service
+        self.package = service.getPackageName()
+        self.data_dir = argument.get('data_dir') or os.environ.get('ANDROID_PRIVATE', '.')
+        self.controller = MQTTController()
+        self.controller.enable_keep_warm()
+        # The process is killed rather than stopped, so the log is never closed;
+        # the flusher has written all but the last half second
+        self.controller.enable_recorder(new_session_path(os.path.join(self.data_dir, 'sessions')))
+        self.server = ControllerService(self.controller, argument.get('socket') or service_address())
+        self.locks = AndroidWakeLocks(service)
+        self.wake_policy = WakePolicy(self.locks.acquire, self.locks.release)
+        self.wake_policy.screen(self.locks.interactive)
+        self.controller.add_listener(self.wake_policy.on_event)
+        self.controller.add_listener(self.on_event)
+        # Kept referenced: Java only holds a weak link to the Python object
+        self.listener = BroadcastListener(self.on_broadcast)
+        self.receiver = None
+
+    def start(self, restarted):
+        self.server.start()
+        self.register_receiver()
+        self.show_notification("Not connected")
+        if restarted:
+            self.reconnect_last_broker()
+
+    def register_receiver(self):
+        receiver_class = autoclass('org.kivy.android.GenericBroadcastReceiver')
+        self.receiver = receiver_class(self.listener)
+        actions = IntentFilter()
+        for action in (ACTION_BRAKE, ACTION_LAND, ACTION_SCREEN_ON, ACTION_SCREEN_OFF):
+            actions.addAction(action)
+        if Build.VERSION.SDK_INT >= 33:
+            self.service.registerReceiver(self.receiver, actions, RECEIVER_NOT_EXPORTED)
+        else:
+            self.service.registerReceiver(self.receiver, actions)
+
+    def on_broadcast(self, action):
+        """Notification actions and screen changes"""
+        if action == ACTION_BRAKE:
+            self.controller.publish_brake()
+        elif action == ACTION_LAND:
+            self.controller.publish_land()
+        elif action == ACTION_SCREEN_ON:
+            self.wake_policy.screen(True)
+            keep_warm = self.controller.keep_warm
+            if keep_warm is not None and self.controller.client is not None:
+                # The first press after unlocking should not find a cold path
+                keep_warm.start(self.controller._send_warm_echo)
+                keep_warm.kick()
+        elif action == ACTION_SCREEN_OFF:
+            self.wake_policy.screen(False)
+            if self.controller.keep_warm is not None:
+                # Keepalives hold the link; echoes would only spend battery
+                self.controller.keep_warm.stop()
+
+    def on_event(self, event, data):
+        """Mirror the link state in the notification"""
+        if event == 'connected':
+            self.show_notification(f"Connected to {self.controller.broker_host}")
+        elif event == 'link_lost':
+            self.show_notification("Connection lost, reconnecting...")
+        elif event in ('disconnected', 'connect_failed'):
+            self.show_notification("Not connected")
+
+    def pending_broadcast(self, action, request_code):
+        intent = Intent(action)
+        intent.setPackage(self.package)
+        return PendingIntent.getBroadcast(self.service, request_code, intent,
+                                          FLAG_UPDATE_CURRENT | FLAG_IMMUTABLE)
+
+    def show_notification(self, text):
+        """Replace python-for-android's foreground notification with ours"""
+        NotificationBuilder = autoclass('android.app.Notification$Builder')
+        ActionBuilder = autoclass('android.app.Notification$Action$Builder')
+        icon = self.service.getApplicationInfo().icon
+        if Build.VERSION.SDK_INT >= 26:
+            NotificationChannel = autoclass('android.app.NotificationChannel')
+            NotificationManager = autoclass('android.app.NotificationManager')
+            channel = NotificationChannel(CHANNEL_ID, "Drone link", NotificationManager.IMPORTANCE_LOW)
+            manager = cast('android.app.NotificationManager',
+                           self.service.getSystemService(Context.NOTIFICATION_SERVICE))
+            manager.createNotificationChannel(channel)
+            builder = NotificationBuilder(self.service, CHANNEL_ID)
+        else:
+            builder = NotificationBuilder(self.service)
+        launch = self.service.getPackageManager().getLaunchIntentForPackage(self.package)
+        builder.setContentTitle("COSMOS MQTT Controller")
+        builder.setContentText(text)
+        builder.setSmallIcon(icon)
+        builder.setOngoing(True)
+        builder.setContentIntent(PendingIntent.getActivity(self.service, 0, launch, FLAG_IMMUTABLE))
+        builder.addAction(ActionBuilder(icon, "BRAKE", self.pending_broadcast(ACTION_BRAKE, 1)).build())
+        builder.addAction(ActionBuilder(icon, "LAND", self.pending_broadcast(ACTION_LAND, 2)).build())
+        self.service.startForeground(NOTIFICATION_ID, builder.build())
+
+    def reconnect_last_broker(self):
+        """Reconnect to the broker main.py remembered, unless it needs a login"""
+        try:
+            with open(os.path.join(self.data_dir, 'last_broker.json')) as f:
+                broker = json.load(f)
+        except (OSError, ValueError):
+            return
+        if broker.get('username'):
+            return
+        logger.info("Restarted by the system, reconnecting to %s", broker.get('host'))
+        self.controller.connect(broker['host'], broker.get('port', 1883), "", "")
+
+    def run(self):
+        """Serve until the app stops the service, which ends this process"""
+        threading.Event().wait()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    raw = os.environ.get('PYTHON_SERVICE_ARGUMENT', '')
+    # The system restarts a sticky service without the argument main.py gave it
+    argument = json.loads(raw) if raw else {}
+    cosmos = CosmosService(PythonService.mService, argument)
+    cosmos.start(restarted=not raw)
+    cosmos.run()
+
+
+if __name__ == '__main__':
+    main()
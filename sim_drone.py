@@ -0,0 +1,142 @@
+"""
+Simulated Drone
+A local stand-in for a drone that speaks the command acknowledgement protocol
+(cosmos_core.ackchannel), so the whole press -> actuate -> ack loop can be tested
+and benchmarked offline against the loopback broker or a real one.
+
+It acts on the first copy of every (epoch, sequence number) and acknowledges
+every copy, so retries stay idempotent. The keys it has seen are kept in a
+bounded window of the most recent `window` commands. Actuation delay and message loss can be simulated.
+With extra brokers it listens on all of them at once, the way a drone would for
+a controller that races safety commands, and acks each copy on the broker it
+arrived through. With MQTT 5 it reads sequence numbers from user properties as
+well as from the payload.
+
+Usage:
+    python -m sim_drone --host 127.0.0.1 --port 1883 --delay-ms 5 --drop 0.1
+    python -m sim_drone --host "127.0.0.1:1883, 127.0.0.1:1884"
+    python -m sim_drone --mqtt5
+"""
+
+import argparse
+import collections
+import random
+import sys
+import threading
+import time
+
+import mqtt_wire as wire
+from cosmos_core import create_client
+from cosmos_core.ackchannel import DEFAULT_ACK_TOPIC, decode_message, encode_ack
+from cosmos_core.brokers import parse_brokers
+from reconnect import tune_socket
+
+DEFAULT_COMMAND_TOPICS = {"brakeCosmos": 'brake', "landCosmos": 'land'}
+
+
+class SimulatedDrone:
+    """Subscribes to command topics, 'actuates' and replies on the ack topic"""
+
+    def __init__(self, host, port, commands=None, ack_topic=DEFAULT_ACK_TOPIC,
+                 actuation_delay=0.0, drop_rate=0.0, seed=None, qos=1, extra_brokers=(),
+                 protocol=wire.MQTT311, window=4096):
+        self.commands = dict(commands or DEFAULT_COMMAND_TOPICS)
+        self.ack_topic = ack_topic
+        self.actuation_delay = actuation_delay
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        # (name, seq) for every command acted on, in order
+        self.actions = []
+        # (epoch, seq) of the latest `window` commands acted on, oldest first
+        self.seen = collections.OrderedDict()
+        self.window = window
+        self.received = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.subscribed = threading.Event()
+        self.clients = []
+        brokers = [(host, port)] + list(extra_brokers)
+        remaining = [len(brokers)]
+
+        def on_subscribe(*args):
+            with self.lock:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    self.subscribed.set()
+
+        for broker_host, broker_port in brokers:
+            client = create_client(protocol=protocol)
+            client.on_connect = lambda client, userdata, flags, rc, properties=None: client.subscribe(
+                [(topic, qos) for topic in self.commands])
+            client.on_subscribe = on_subscribe
+            client.on_message = self.on_message
+            client.on_socket_open = lambda client, userdata, sock: tune_socket(sock)
+            client.connect(broker_host, broker_port, 60)
+            client.loop_start()
+            self.clients.append(client)
+        self.client = self.clients[0]
+
+    def on_message(self, client, userdata, msg):
+        name = self.commands.get(msg.topic)
+        if name is None:
+            return
+        _, epoch, seq, _ = decode_message(msg)
+        key = (epoch, seq)
+        with self.lock:
+            self.received += 1
+            if self.drop_rate and self.random.random() < self.drop_rate:
+                # Lost on the radio link: neither acted on nor acknowledged
+                self.dropped += 1
+                return
+            first = seq is None or key not in self.seen
+            if first:
+                if seq is not None:
+                    self.seen[key] = True
+                    if len(self.seen) > self.window:
+                        self.seen.popitem(last=False)
+                self.actions.append((name, seq))
+        if seq is None:
+            # A plain command from a controller without acks enabled
+            return
+        if self.actuation_delay and first:
+            threading.Timer(self.actuation_delay, self._ack, args=(client, epoch, seq)).start()
+        else:
+            self._ack(client, epoch, seq)
+
+    def _ack(self, client, epoch, seq):
+        client.publish(self.ack_topic, encode_ack(epoch, seq))
+
+    def close(self):
+        for client in self.clients:
+            client.disconnect()
+            client.loop_stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="COSMOS simulated drone")
+    parser.add_argument('--host', default="127.0.0.1", help="broker host, or a comma-separated list")
+    parser.add_argument('--port', type=int, default=1883)
+    parser.add_argument('--ack-topic', default=DEFAULT_ACK_TOPIC)
+    parser.add_argument('--delay-ms', type=float, default=0.0, help="simulated actuation time")
+    parser.add_argument('--drop', type=float, default=0.0, help="share of commands lost")
+    parser.add_argument('--mqtt5', action='store_true', help="connect with MQTT 5")
+    args = parser.parse_args(argv)
+
+    brokers = parse_brokers(args.host, args.port)
+    drone = SimulatedDrone(*brokers[0], ack_topic=args.ack_topic, extra_brokers=brokers[1:],
+                           actuation_delay=args.delay_ms / 1000.0, drop_rate=args.drop,
+                           protocol=wire.MQTT5 if args.mqtt5 else wire.MQTT311)
+    where = ", ".join(f"{host}:{port}" for host, port in brokers)
+    print(f"Simulated drone on {where}, acking on {args.ack_topic} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    drone.close()
+    print(f"{len(drone.actions)} commands acted on, {drone.dropped} dropped")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
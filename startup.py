@@ -0,0 +1,130 @@
+"""
+COSMOS Startup Timing
+Records how long each cold-start phase takes (imports, UI build, first frame,
+deferred work) so releases can be compared.
+
+The app writes the report as JSON next to its data. Compare two of them with:
+
+    python -m startup before.json after.json
+"""
+
+import json
+import os
+import sys
+import time
+
+
+def process_age():
+    """Seconds since the OS started this process, or None where /proc is unavailable
+
+    This covers the interpreter and loader time that passes before any Python code
+    of ours runs, which on Android includes unpacking the app.
+    """
+    try:
+        with open('/proc/self/stat') as stat:
+            # Field 22 is the start time in clock ticks after boot; the command name
+            # in field 2 may contain spaces, so split after its closing paren
+            fields = stat.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as uptime:
+            booted_for = float(uptime.read().split()[0])
+        return booted_for - int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class StartupTimer:
+    """Named phase durations and milestones relative to the first line of the app"""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.before_python = process_age()
+        self.phases = []
+        self.marks = []
+
+    def elapsed(self):
+        """Seconds since the timer was created"""
+        return time.perf_counter() - self.origin
+
+    def mark(self, name):
+        """Record a milestone, e.g. 'first_frame'"""
+        self.marks.append((name, self.elapsed()))
+
+    def phase(self, name):
+        """Context manager timing one phase, e.g. with timer.phase('import kivy'):"""
+        return _Phase(self, name)
+
+    def as_dict(self):
+        return {
+            'before_python': self.before_python,
+            'phases': {name: duration for name, duration in self.phases},
+            'marks': {name: at for name, at in self.marks},
+        }
+
+    def report(self):
+        """Render the timings as log-friendly lines in milliseconds"""
+        lines = []
+        if self.before_python is not None:
+            lines.append(f"process start -> app code: {self.before_python * 1000:.0f} ms")
+        for name, duration in self.phases:
+            lines.append(f"{name}: {duration * 1000:.1f} ms")
+        for name, at in self.marks:
+            lines.append(f"@{name}: {at * 1000:.1f} ms")
+        return lines
+
+    def write(self, path):
+        """Save the report as JSON"""
+        with open(path, 'w') as output:
+            json.dump(self.as_dict(), output, indent=2)
+
+
+class _Phase:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.timer.phases.append((self.name, time.perf_counter() - self.started))
+        return False
+
+
+def compare(before, after):
+    """Return (name, before ms, after ms) for every phase and mark in either report"""
+    rows = []
+    for section in ('phases', 'marks'):
+        names = list(before.get(section, {}))
+        names += [name for name in after.get(section, {}) if name not in names]
+        for name in names:
+            old = before.get(section, {}).get(name)
+            new = after.get(section, {}).get(name)
+            rows.append((name if section == 'phases' else f"@{name}",
+                         None if old is None else old * 1000,
+                         None if new is None else new * 1000))
+    return rows
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        print("usage: python -m startup BEFORE.json AFTER.json")
+        return 2
+    reports = []
+    for path in argv:
+        with open(path) as report:
+            reports.append(json.load(report))
+
+    def cell(value):
+        return f"{value:>10.1f}" if value is not None else f"{'-':>10}"
+
+    print(f"{'phase':<28}{'before ms':>10}{'after ms':>10}{'delta':>10}")
+    for name, old, new in compare(*reports):
+        delta = cell(new - old) if old is not None and new is not None else cell(None)
+        print(f"{name:<28}{cell(old)}{cell(new)}{delta}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,180 @@
+"""
+COSMOS Telemetry
+High-rate telemetry subscription for drone state (altitude, velocity, battery, ...).
+
+Payloads are decoded straight from memoryviews: binary float vectors are cast in
+place with no copy at all, and ASCII CSV payloads are parsed from bytes without a
+str decode. Samples land in preallocated array-backed ring buffers, one per channel,
+so memory stays flat however long the session runs. The UIs poll downsampled views
+at display rate instead of reacting to every message.
+"""
+
+import array
+import math
+import threading
+import time
+
+SPARK_BLOCKS = "▁▂▃▄▅▆▇█"
+
+# Default telemetry subscription: CSV "altitude,speed,battery" on telemetryCosmos
+DEFAULT_TELEMETRY_TOPICS = {
+    "telemetryCosmos": ('csv', ["altitude", "speed", "battery"]),
+}
+
+
+def decode_float32(view):
+    """Decode native-endian (little-endian on Android and x86) float32 values in place"""
+    return view.cast('B').cast('f')
+
+
+def decode_float64(view):
+    """Decode native-endian (little-endian on Android and x86) float64 values in place"""
+    return view.cast('B').cast('d')
+
+
+def decode_csv(view):
+    """Decode comma-separated ASCII numbers without decoding to str"""
+    return [float(field) for field in view.tobytes().split(b',') if field.strip()]
+
+
+CODECS = {
+    'float32': decode_float32,
+    'float64': decode_float64,
+    'csv': decode_csv,
+}
+
+
+class TelemetryChannel:
+    """Fixed-capacity ring buffer of (timestamp, value) samples"""
+
+    def __init__(self, name, capacity=4096):
+        self.name = name
+        self.capacity = capacity
+        self.times = array.array('d', bytes(8 * capacity))
+        self.values = array.array('d', bytes(8 * capacity))
+        # Total samples ever written; the write slot is count % capacity
+        self.count = 0
+
+    def append(self, timestamp, value):
+        """Store one sample, overwriting the oldest once full (single writer)"""
+        slot = self.count % self.capacity
+        self.times[slot] = timestamp
+        self.values[slot] = value
+        self.count += 1
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def latest(self):
+        """Return the newest (timestamp, value) or None"""
+        if not self.count:
+            return None
+        slot = (self.count - 1) % self.capacity
+        return self.times[slot], self.values[slot]
+
+    def window(self, samples=None):
+        """Return the newest samples (oldest first) as a list of values"""
+        count = self.count
+        size = min(count, self.capacity)
+        if samples is not None:
+            size = min(size, samples)
+        start = count - size
+        return [self.values[index % self.capacity] for index in range(start, count)]
+
+    def downsample(self, points, samples=None):
+        """Average the newest samples into at most `points` buckets for display"""
+        values = self.window(samples)
+        if len(values) <= points:
+            return values
+        bucket = len(values) / points
+        result = []
+        for index in range(points):
+            start = int(index * bucket)
+            end = int((index + 1) * bucket)
+            chunk = values[start:end]
+            result.append(sum(chunk) / len(chunk))
+        return result
+
+    def sparkline(self, points=20, samples=None):
+        """Render a downsampled view as a unicode sparkline"""
+        values = self.downsample(points, samples)
+        if not values:
+            return ""
+        low, high = min(values), max(values)
+        span = (high - low) or 1.0
+        top = len(SPARK_BLOCKS) - 1
+        return "".join(SPARK_BLOCKS[int((value - low) / span * top)] for value in values)
+
+
+class TelemetryHub:
+    """Subscribes to telemetry topics and fans decoded samples into channels
+
+    topics maps topic -> (codec, [channel names]); the n-th decoded value of a
+    message goes to the n-th channel. Channels are shared across topics by name.
+    """
+
+    def __init__(self, topics=None, capacity=4096, qos=0):
+        self.topics = {}
+        self.channels = {}
+        self.capacity = capacity
+        self.qos = qos
+        self.messages = 0
+        self.errors = 0
+        # NaN or infinite values left out of their channels
+        self.rejected = 0
+        self.lock = threading.Lock()
+        for topic, (codec, names) in (topics or {}).items():
+            self.add_topic(topic, codec, names)
+
+    def add_topic(self, topic, codec, names):
+        """Register a telemetry topic and the channels its values feed"""
+        if codec not in CODECS:
+            raise ValueError(f"Unknown telemetry codec: {codec}")
+        with self.lock:
+            channels = []
+            for name in names:
+                if name not in self.channels:
+                    self.channels[name] = TelemetryChannel(name, self.capacity)
+                channels.append(self.channels[name])
+            self.topics[topic] = (CODECS[codec], channels)
+
+    def handles(self, topic):
+        """True if the topic is a registered telemetry topic"""
+        return topic in self.topics
+
+    def subscribe(self, client):
+        """Subscribe a connected paho client to every telemetry topic"""
+        if self.topics:
+            client.subscribe([(topic, self.qos) for topic in self.topics])
+
+    def handle(self, topic, payload, timestamp=None):
+        """Decode one message into its channels; returns False if it could not be decoded"""
+        entry = self.topics.get(topic)
+        if entry is None:
+            return False
+        decode, channels = entry
+        if timestamp is None:
+            timestamp = time.monotonic()
+        try:
+            values = decode(memoryview(payload))
+        except (TypeError, ValueError):
+            self.errors += 1
+            return False
+        for channel, value in zip(channels, values):
+            # A NaN or inf would poison the averages and break the sparkline scale
+            if math.isfinite(value):
+                channel.append(timestamp, value)
+            else:
+                self.rejected += 1
+        self.messages += 1
+        return True
+
+    def summary(self, points=16):
+        """Render one line per channel with its latest value and a sparkline"""
+        lines = []
+        for name, channel in self.channels.items():
+            latest = channel.latest()
+            if latest is None:
+                continue
+            lines.append(f"{name}: {latest[1]:.2f} {channel.sparkline(points)}")
+        return "\n".join(lines)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for the drone acknowledgement channel and the simulated drone
+"""
+
+from benchmarks.latency import wait_for
+from cosmos_core import MQTTController
+from cosmos_core.ackchannel import AckChannel, decode_command, encode_ack
+from loopback_broker import LoopbackBroker
+from sim_drone import SimulatedDrone
+
+
+def test_stamped_commands_retry_until_acked_or_given_up():
+    """Deadlines drive resends with the same seq, then give up after max_retries"""
+    channel = AckChannel(deadline=0.1, max_retries=1)
+    brake = channel.stamp('brake', "brakeCosmos", "1", 0, now=0.0)
+    land = channel.stamp('land', "landCosmos", "1", 0, now=0.05)
+    payload, epoch, seq, sent_us = decode_command(brake)
+    assert payload == b"1" and epoch == channel.epoch and seq == 1 and sent_us > 0
+    assert decode_command(b"1") == (b"1", None, None, None)
+
+    resend, failed = channel.due(now=0.12)
+    assert [pending.name for pending in resend] == ['brake'] and not failed
+    assert resend[0].payload == brake
+
+    # An ack for seq 2 of an earlier channel matches nothing
+    assert channel.handle(encode_ack(channel.epoch ^ 1, 2), now=0.19) is None
+    name, latency, attempts = channel.handle(encode_ack(channel.epoch, 2), now=0.2)
+    assert (name, round(latency, 6), attempts) == ('land', 0.15, 1)
+    assert channel.handle(encode_ack(channel.epoch, 2), now=0.21) is None
+    resend, failed = channel.due(now=0.3)
+    assert not resend and [pending.name for pending in failed] == ['brake']
+    assert (channel.acked, channel.retried, channel.failed) == (1, 1, 1)
+    assert decode_command(land)[2] == 2
+
+
+def test_lossy_link_is_covered_by_retries_without_double_actuation():
+    """Every press is acted on exactly once even when the drone misses copies"""
+    with LoopbackBroker() as broker:
+        drone = SimulatedDrone(broker.host, broker.port, drop_rate=0.3, seed=7)
+        assert drone.subscribed.wait(5)
+        controller = MQTTController()
+        controller.command_qos['brake'] = 1
+        controller.enable_command_acks(deadline=0.05, max_retries=8)
+        acked = []
+        controller.add_listener(lambda event, data: event == 'command_acked' and acked.append(data))
+        controller.connect(broker.host, broker.port, "", "")
+        assert wait_for(lambda: controller.connected and controller.session_subscribed, 5)
+
+        for _ in range(20):
+            assert controller.publish_brake()
+        assert wait_for(lambda: len(acked) == 20, 10)
+        controller.disconnect()
+        drone.close()
+
+    assert drone.dropped > 0
+    assert controller.acks.retried >= drone.dropped
+    seqs = [seq for _, seq in drone.actions]
+    assert sorted(seqs) == list(range(1, 21))
+    assert max(attempts for _, _, attempts in acked) > 1
+
+
+def test_reenabled_acks_are_acted_on_despite_restarted_sequence_numbers():
+    """A new channel restarts at seq 1 under a new epoch, so the drone acts on it again"""
+    with LoopbackBroker() as broker:
+        drone = SimulatedDrone(broker.host, broker.port)
+        assert drone.subscribed.wait(5)
+        controller = MQTTController()
+        acked = []
+        controller.add_listener(lambda event, data: event == 'command_acked' and acked.append(data))
+        controller.enable_command_acks()
+        controller.connect(broker.host, broker.port, "", "")
+        try:
+            assert wait_for(lambda: controller.connected and controller.session_subscribed, 5)
+            assert controller.publish_brake()
+            assert wait_for(lambda: len(acked) == 1, 5)
+            controller.disable_command_acks()
+            controller.enable_command_acks()
+            assert controller.publish_brake()
+            assert wait_for(lambda: len(acked) == 2, 5)
+        finally:
+            controller.disconnect()
+            drone.close()
+    assert drone.actions == [('brake', 1), ('brake', 1)]
+    assert len(drone.seen) == 2
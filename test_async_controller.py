@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Tests for the asyncio MQTT controller engine
+"""
+
+import threading
+
+from async_controller import AsyncMQTTController, get_shared_loop
+from benchmarks.latency import DroneSubscriber, wait_for
+from loopback_broker import LoopbackBroker
+
+
+def test_publish_reaches_drone_in_order():
+    """Brake and land presses arrive at the drone and events arrive in order"""
+    with LoopbackBroker() as broker:
+        drone = DroneSubscriber(broker.host, broker.port, ["brakeCosmos", "landCosmos"], 1)
+        assert drone.subscribed.wait(5)
+
+        controller = AsyncMQTTController()
+        events = []
+        controller.add_listener(lambda event, data: events.append(event))
+        controller.qos = 1
+        assert controller.connect(broker.host, broker.port, "", "")
+        assert wait_for(lambda: controller.connected, 5)
+
+        for _ in range(5):
+            drone.expect("brakeCosmos", 0)
+            assert controller.publish_brake()
+            drone.expect("landCosmos", 0)
+            assert controller.publish_land()
+        assert wait_for(lambda: drone.outstanding() == 0, 5)
+        assert wait_for(lambda: events.count('published') == 10, 5)
+
+        controller.disconnect()
+        assert wait_for(lambda: 'disconnected' in events, 5)
+        drone.close()
+
+    assert events[:2] == ['connecting', 'connected']
+    sent = [i for i, event in enumerate(events) if event == 'command_sent']
+    assert len(sent) == 10
+    assert 'disconnected' in events
+
+
+def test_controllers_share_one_loop_thread():
+    """Many controllers run without spawning a network thread each"""
+    with LoopbackBroker() as broker:
+        controllers = [AsyncMQTTController() for _ in range(20)]
+        for controller in controllers:
+            assert controller.connect(broker.host, broker.port, "", "")
+        assert wait_for(lambda: all(c.connected for c in controllers), 5)
+        names = [thread.name for thread in threading.enumerate()]
+        assert names.count("cosmos-mqtt-loop") == 1
+        assert not [name for name in names if name.startswith("paho-mqtt-client")]
+        assert all(c.loop is get_shared_loop() for c in controllers)
+        for controller in controllers:
+            controller.disconnect()
+
+
+def test_publish_fails_when_disconnected():
+    """Commands are rejected before connecting, like the threaded controller"""
+    controller = AsyncMQTTController()
+    assert controller.publish_brake() is False
+    assert controller.publish_land() is False
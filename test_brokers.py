@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Tests for broker health probing, failover and race publishing
+"""
+
+from benchmarks.latency import wait_for
+from cosmos_core import MQTTController
+from cosmos_core.brokers import BrokerSet, parse_brokers
+from loopback_broker import LoopbackBroker
+from sim_drone import SimulatedDrone
+
+
+def address(brokers):
+    return ", ".join(f"{broker.host}:{broker.port}" for broker in brokers)
+
+
+def test_brokers_rank_by_health_then_latency():
+    """Probes order brokers by round trip and push a dead one to the back"""
+    assert parse_brokers("a:1884, b ;c:1", 1883) == [('a', 1884), ('b', 1883), ('c', 1)]
+    with LoopbackBroker(delay=0.03) as slow, LoopbackBroker() as fast, LoopbackBroker(delay=0.01) as medium:
+        brokers = BrokerSet([(slow.host, slow.port), (fast.host, fast.port), (medium.host, medium.port)],
+                            probe_timeout=1.0)
+        ranked = brokers.probe_all()
+        assert [endpoint.port for endpoint in ranked] == [fast.port, medium.port, slow.port]
+
+        fast.stop()
+        brokers.probe_all()
+        assert brokers.best().port == medium.port
+        assert brokers.ranked()[-1].port == fast.port
+        brokers.probe_all()
+        assert [endpoint.port for endpoint in brokers.healthy()] == [medium.port, slow.port]
+        assert brokers.summary()[-1].startswith(f"{fast.host}:{fast.port} down")
+
+
+def test_race_publishing_survives_a_lossy_broker_and_failover():
+    """Copies through every broker get each press acted on once; a dead broker is failed over"""
+    with LoopbackBroker(loss=1.0) as lossy, LoopbackBroker(delay=0.005) as backup, \
+            LoopbackBroker(delay=0.01) as spare:
+        drone = SimulatedDrone(lossy.host, lossy.port,
+                               extra_brokers=[(backup.host, backup.port), (spare.host, spare.port)])
+        assert drone.subscribed.wait(5)
+        controller = MQTTController()
+        events = []
+        controller.add_listener(lambda event, data: events.append((event, data)))
+        assert controller.connect(address([lossy, backup, spare]), 1883, "", "")
+        # The lossy broker answers probes fastest, so it becomes the primary
+        assert controller.broker_port == lossy.port
+        controller.enable_race_publishing()
+        assert wait_for(lambda: controller.connected and controller.session_subscribed
+                        and all(client.is_connected() for client in controller.race_clients.values()), 5)
+        assert len(controller.race_clients) == 2
+
+        for _ in range(10):
+            assert controller.publish_brake()
+        assert wait_for(lambda: controller.acks.acked == 10, 5)
+        assert controller.metrics['race_copies'] >= 10
+        assert sorted(seq for _, seq in drone.actions) == list(range(1, 11))
+
+        lossy.stop()
+        assert wait_for(lambda: ('failover', (backup.host, backup.port)) in events, 5)
+        assert wait_for(lambda: controller.connected and controller.broker_port == backup.port, 5)
+        assert controller.publish_brake()
+        assert wait_for(lambda: controller.acks.acked == 11, 5)
+        controller.disconnect()
+        drone.close()
+
+    assert controller.metrics['failovers'] == 1
+    assert len(drone.actions) == 11
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Tests for the pre-encoded command packet cache
+"""
+
+import mqtt_wire as wire
+from benchmarks.latency import DroneSubscriber, HeadlessApp, wait_for
+from command_cache import CommandPacketCache
+from cosmos_mqtt_controller import MQTTController
+from loopback_broker import LoopbackBroker
+
+
+def test_cache_encodes_complete_publish_packets():
+    """Cached packets decode back to the configured topic and payload"""
+    cache = CommandPacketCache()
+    cache.build({'brake': ("brakeCosmos", "1"), 'hover': ("hoverCosmos", "2")})
+    assert 'brake' in cache and 'hover' in cache and 'land' not in cache
+
+    packet = cache.packets['hover']
+    assert packet[0] & 0xF0 == wire.PUBLISH
+    topic, payload, qos, mid, retain = wire.decode_publish(packet[0], packet[2:])
+    assert (topic, payload, qos, retain) == ("hoverCosmos", b"2", 0, False)
+
+
+def test_cached_presses_reach_the_drone():
+    """Brake, land and extra commands sent from prebuilt packets are delivered"""
+    with LoopbackBroker() as broker:
+        drone = DroneSubscriber(broker.host, broker.port,
+                                ["brakeCosmos", "landCosmos", "hoverCosmos"], 0)
+        assert drone.subscribed.wait(5)
+
+        controller = MQTTController(HeadlessApp())
+        controller.extra_commands = {'hover': ("hoverCosmos", "1")}
+        controller.connect(broker.host, broker.port, "", "")
+        assert wait_for(lambda: controller.connected, 5)
+        assert 'hover' in controller.command_cache
+
+        for topic, press in (("brakeCosmos", controller.publish_brake),
+                             ("landCosmos", controller.publish_land),
+                             ("hoverCosmos", lambda: controller.publish_command('hover'))):
+            drone.expect(topic, 0)
+            assert press()
+        assert wait_for(lambda: drone.outstanding() == 0, 5)
+        assert controller.publish_command('unknown') is False
+
+        controller.disconnect()
+        drone.close()
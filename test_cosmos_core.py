@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared headless controller core
+"""
+
+import subprocess
+import sys
+
+from benchmarks.latency import DroneSubscriber, wait_for
+from cosmos_core import MQTTController
+from loopback_broker import LoopbackBroker
+
+
+def test_core_imports_without_a_ui_toolkit():
+    """Headless users never pay for Kivy or tkinter"""
+    code = ("import sys, cosmos_core; "
+            "print(any(name.split('.')[0] in ('kivy', 'tkinter') for name in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
+
+
+def test_core_publishes_and_reports_through_events():
+    """Commands reach the drone and every step is reported as an event and a counter"""
+    with LoopbackBroker() as broker:
+        drone = DroneSubscriber(broker.host, broker.port, ["brakeCosmos"], 0)
+        assert drone.subscribed.wait(5)
+
+        controller = MQTTController()
+        events = []
+        controller.add_listener(lambda event, data: events.append((event, data)))
+        assert not controller.publish_brake()
+        assert controller.connect(broker.host, broker.port, "", "")
+        assert wait_for(lambda: controller.connected, 5)
+
+        drone.expect("brakeCosmos", 0)
+        assert controller.publish_brake()
+        assert wait_for(lambda: drone.outstanding() == 0, 5)
+        controller.disconnect()
+        drone.close()
+
+    names = [event for event, _ in events]
+    assert names[:3] == ['not_connected', 'connecting', 'connected']
+    assert ('command_sent', ('brake', "brakeCosmos", "1")) in events
+    assert controller.metrics['commands_sent'] == 1
+    assert controller.metrics['connects'] == 1
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Tests for the multi-drone fleet controller
+"""
+
+from benchmarks.fleet import SwarmSubscriber
+from benchmarks.latency import wait_for
+from fleet_controller import FleetController
+from loopback_broker import LoopbackBroker
+
+
+def test_drones_are_namespaced_and_balanced():
+    """Each drone gets its own topics and drones spread evenly over the pool"""
+    fleet = FleetController([f"drone{i}" for i in range(7)], pool_size=3)
+    assert fleet.topic_for("drone3", 'brake') == "cosmos/drone3/brakeCosmos"
+    assert fleet.topic_for("drone3", 'land') == "cosmos/drone3/landCosmos"
+    assert sorted(len(group) for group in fleet.groups) == [2, 2, 3]
+
+    fleet.remove_drone("drone0")
+    assert "drone0" not in fleet.drone_ids
+    assert sum(len(group) for group in fleet.groups) == 6
+
+
+def test_broadcast_packets_follow_topic_changes():
+    """Changing a command topic or the prefix after a broadcast changes the cached packets"""
+    fleet = FleetController(["drone1"], pool_size=1)
+    drones = fleet.groups[0]
+    assert b"cosmos/drone1/brakeCosmos" in fleet._broadcast_packets(0, 'brake', drones)
+
+    fleet.brake_topic = "stop"
+    assert b"cosmos/drone1/stop" in fleet._broadcast_packets(0, 'brake', drones)
+    fleet.topic_prefix = "fleet/{drone_id}/"
+    batch = fleet._broadcast_packets(0, 'brake', drones)
+    assert b"fleet/drone1/stop" in batch and b"cosmos/" not in batch
+
+
+def test_broadcast_reaches_every_drone_over_pooled_sockets():
+    """brake_all/land_all reach every drone while only pool_size sockets are open"""
+    with LoopbackBroker() as broker:
+        swarm = SwarmSubscriber(broker.host, broker.port, "cosmos/#")
+        assert swarm.subscribed.wait(5)
+
+        fleet = FleetController([f"drone{i}" for i in range(200)], pool_size=2)
+        assert fleet.connect(broker.host, broker.port, "", "")
+        assert wait_for(lambda: fleet.connected, 5)
+        assert len(broker.sessions) == 3
+
+        assert fleet.brake_all() == 200
+        assert wait_for(lambda: swarm.count() == 200, 5)
+
+        fleet.qos = 1
+        assert fleet.land_all() == 200
+        assert wait_for(lambda: swarm.count() == 400, 5)
+
+        assert fleet.publish_brake("drone7")
+        assert wait_for(lambda: swarm.count() == 401, 5)
+
+        fleet.disconnect()
+        swarm.close()
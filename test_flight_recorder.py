@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Tests for the flight recorder and session replay
+"""
+
+import os
+
+from benchmarks.latency import DroneSubscriber, wait_for
+from cosmos_core import MQTTController, create_client
+from flight_recorder import ACK, COMMAND, MESSAGE, STATE, FlightLog, FlightRecorder
+from loopback_broker import LoopbackBroker
+from replay import replay
+
+
+def test_log_grows_reads_back_and_survives_a_cut(tmp_path):
+    """Records past the first chunk are kept; a log cut mid-record ends at the last whole one"""
+    path = str(tmp_path / "session.flight")
+    recorder = FlightRecorder(path, chunk=4096, flush_interval=0.01)
+    try:
+        for index in range(200):
+            assert recorder.write(MESSAGE, "", f"drones/{index}/status", b"x" * 40, 1, now=recorder.started + index)
+            if index % 20 == 0:
+                # Give the flusher time to grow the file ahead of the writer
+                assert wait_for(lambda: len(recorder.mm) - recorder.position >= 2048, 5)
+    finally:
+        recorder.close()
+    assert recorder.dropped == 0 and os.path.getsize(path) == recorder.position
+    records = FlightLog(path).records()
+    assert len(records) == 200
+    assert (records[-1].time, records[-1].topic, records[-1].qos) == (199.0, "drones/199/status", 1)
+
+    size = os.path.getsize(path)
+    # A log never closed ends in the zeros of the unused mapping
+    with open(path, 'ab') as f:
+        f.write(bytes(5000))
+    assert len(FlightLog(path).records()) == 200
+    with open(path, 'r+b') as f:
+        f.truncate(size - 10)
+    assert len(FlightLog(path).records()) == 199
+
+def test_controller_records_a_session(tmp_path):
+    """Commands, broker acks, state changes and incoming messages all land in the log"""
+    path = str(tmp_path / "session.flight")
+    with LoopbackBroker() as broker:
+        controller = MQTTController()
+        controller.command_qos = {'brake': 1}
+        controller.enable_recorder(path)
+        publisher = create_client()
+        publisher.connect(broker.host, broker.port, 60)
+        publisher.loop_start()
+        try:
+            assert controller.connect("localhost", broker.port, "", "")
+            assert wait_for(lambda: controller.session_subscribed, 5)
+            controller.publish_brake()
+            publisher.publish("telemetryCosmos", b"10,2,90")
+            assert wait_for(lambda: controller.metrics['telemetry_received'] == 1
+                            and controller.metrics['commands_confirmed'] == 1, 5)
+        finally:
+            publisher.loop_stop()
+            publisher.disconnect()
+            controller.disconnect()
+            controller.disable_recorder()
+    records = FlightLog(path).records()
+    assert [(r.name, r.topic, r.payload) for r in records if r.kind == COMMAND] == [("brake", "brakeCosmos", b"1")]
+    assert [r.name for r in records if r.kind == ACK] == ['command_confirmed']
+    assert {'connecting', 'connected'} <= {r.name for r in records if r.kind == STATE}
+    assert [(r.topic, r.payload) for r in records if r.kind == MESSAGE] == [("telemetryCosmos", b"10,2,90")]
+    times = [record.time for record in records]
+    assert times == sorted(times)
+
+
+def test_replay_keeps_the_recorded_spacing(tmp_path):
+    """At 1x the commands go out on schedule; at speed 0 they go out back to back"""
+    path = str(tmp_path / "session.flight")
+    recorder = FlightRecorder(path)
+    for index, name in enumerate(["brake", "land", "brake"]):
+        recorder.write(COMMAND, name, f"{name}Cosmos", b"1", now=recorder.started + index * 0.1)
+    recorder.close()
+    records = FlightLog(path).records((COMMAND,))
+
+    sleeps = []
+    sent = []
+    replay(records, sent.append, speed=2.0, sleep=sleeps.append)
+    assert [record.name for record in sent] == ["brake", "land", "brake"]
+    # The fake sleep does not advance the clock, so each is measured from the start
+    assert len(sleeps) == 2 and 0.09 < sleeps[-1] <= 0.1
+
+    with LoopbackBroker() as broker:
+        drone = DroneSubscriber(broker.host, broker.port, ["brakeCosmos", "landCosmos"], 0)
+        client = create_client()
+        try:
+            assert drone.subscribed.wait(5)
+            for record in records:
+                drone.expect(record.topic, 0.0)
+            client.connect(broker.host, broker.port, 60)
+            client.loop_start()
+            assert replay(records, lambda record: client.publish(record.topic, record.payload), 0) == []
+            assert wait_for(lambda: drone.outstanding() == 0, 5)
+        finally:
+            client.loop_stop()
+            client.disconnect()
+            drone.close()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Tests for the hardware key fast path: debounce, coalescing and key-to-write timing
+"""
+
+import threading
+
+from benchmarks.latency import wait_for
+from cosmos_core import MQTTController
+from hardware_keys import KEYCODE_VOLUME_DOWN, KEYCODE_VOLUME_UP, KeyCommandDispatcher
+from loopback_broker import LoopbackBroker
+from sim_drone import SimulatedDrone
+
+
+def connected_controller(broker):
+    controller = MQTTController()
+    assert controller.connect("localhost", broker.port, "", "")
+    assert wait_for(lambda: controller.connected, 5)
+    return controller
+
+
+def test_bounces_and_auto_repeat_send_one_brake():
+    """A bouncing or held key sends once, and the write is timed from key-down"""
+    with LoopbackBroker() as broker:
+        drone = SimulatedDrone(broker.host, broker.port)
+        assert drone.subscribed.wait(5)
+        controller = connected_controller(broker)
+        keys = KeyCommandDispatcher(controller, debounce=0.5)
+        keys.start()
+        try:
+            assert not keys.key_down(66)
+            assert keys.key_down(KEYCODE_VOLUME_UP)
+            assert keys.key_down(KEYCODE_VOLUME_UP, repeat=1)
+            assert keys.key_down(KEYCODE_VOLUME_UP)
+            assert wait_for(lambda: drone.actions, 5)
+            histogram = controller.metrics.histograms['key_to_write_seconds']
+            assert wait_for(lambda: histogram.count == 1, 5)
+            assert histogram.max < 1.0
+            assert drone.actions == [('brake', None)]
+            assert (keys.pressed, keys.sent, keys.debounced) == (3, 1, 2)
+        finally:
+            keys.stop()
+            controller.disconnect()
+            drone.close()
+
+
+def test_presses_while_busy_are_coalesced_brake_first():
+    """Presses that pile up while a send is in progress go out once each, BRAKE before LAND"""
+    with LoopbackBroker() as broker:
+        drone = SimulatedDrone(broker.host, broker.port)
+        assert drone.subscribed.wait(5)
+        controller = connected_controller(broker)
+        busy, release = threading.Event(), threading.Event()
+
+        def hold_first_send(event, data):
+            if event == 'command_sent' and not busy.is_set():
+                busy.set()
+                release.wait(5)
+
+        controller.add_listener(hold_first_send)
+        keys = KeyCommandDispatcher(controller, debounce=0.0)
+        keys.start()
+        try:
+            keys.key_down(KEYCODE_VOLUME_UP)
+            assert busy.wait(5)
+            keys.key_down(KEYCODE_VOLUME_DOWN)
+            keys.key_down(KEYCODE_VOLUME_DOWN)
+            keys.key_down(KEYCODE_VOLUME_UP)
+            release.set()
+            assert wait_for(lambda: len(drone.actions) == 3, 5)
+            assert [name for name, _ in drone.actions] == ['brake', 'brake', 'land']
+            assert keys.coalesced == 1
+        finally:
+            keys.stop()
+            controller.disconnect()
+            drone.close()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Tests for QoS delivery tracking and the latency histogram
+"""
+
+from benchmarks.latency import wait_for
+from cosmos_core import MQTTController
+from cosmos_core.inflight import InflightTracker, LatencyHistogram
+from loopback_broker import LoopbackBroker
+
+
+def test_histogram_percentiles_stay_within_bucket_precision():
+    """Log-linear buckets keep percentiles within ~6% in a fixed-size array"""
+    histogram = LatencyHistogram()
+    size = len(histogram.counts)
+    for millis in range(1, 1001):
+        histogram.record(millis / 1000.0)
+    assert len(histogram.counts) == size
+    assert histogram.count == 1000
+    assert abs(histogram.percentile(50) - 0.5) / 0.5 < 0.07
+    assert abs(histogram.percentile(99) - 0.99) / 0.99 < 0.07
+    assert histogram.percentile(100) == 1.0
+
+
+def test_tracker_matches_early_acks_and_bounds_outstanding():
+    """Acks may beat track(); stale and overflowing entries are dropped oldest first"""
+    tracker = InflightTracker(capacity=3, timeout=10.0)
+    assert tracker.ack(7, now=1.5) is None
+    assert tracker.track(7, 'brake', 1.0) == 0.5
+
+    for mid in range(1, 5):
+        tracker.track(mid, 'land', 2.0 + mid)
+    assert len(tracker) == 3 and tracker.dropped == 1
+    assert tracker.ack(3, now=5.25) == ('land', 0.25)
+    assert tracker.expire(now=20.0) == 0
+    assert tracker.timed_out == 2
+    assert tracker.confirmed == 2
+
+
+def test_qos1_presses_are_confirmed_with_latency():
+    """Every QoS 1 brake press is matched with its PUBACK"""
+    with LoopbackBroker() as broker:
+        controller = MQTTController()
+        controller.command_qos['brake'] = 1
+        confirmed = []
+        controller.add_listener(lambda event, data: event == 'command_confirmed' and confirmed.append(data))
+        controller.connect(broker.host, broker.port, "", "")
+        assert wait_for(lambda: controller.connected, 5)
+
+        for _ in range(50):
+            assert controller.publish_brake()
+        assert wait_for(lambda: len(confirmed) == 50, 5)
+        controller.disconnect()
+
+    assert {name for name, _ in confirmed} == {'brake'}
+    assert len(controller.inflight) == 0
+    assert controller.inflight.histogram.count == 50
+    assert controller.metrics['commands_confirmed'] == 50
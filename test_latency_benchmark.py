@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Tests for the loopback broker and the command latency benchmark
+"""
+
+import threading
+
+import mqtt_wire as wire
+from benchmarks import latency
+from loopback_broker import LoopbackBroker
+
+
+def test_topic_matches_wildcards():
+    """Subscription filters honour + and # wildcards"""
+    assert wire.topic_matches("brakeCosmos", "brakeCosmos")
+    assert wire.topic_matches("cosmos/+/brake", "cosmos/drone1/brake")
+    assert wire.topic_matches("cosmos/#", "cosmos/drone1/brake")
+    assert not wire.topic_matches("cosmos/+/brake", "cosmos/drone1/land")
+    assert not wire.topic_matches("cosmos/+", "cosmos/drone1/brake")
+
+
+def test_broker_delivers_at_every_qos():
+    """A message published at QoS 0/1/2 reaches a subscriber at the same QoS"""
+    with LoopbackBroker() as broker:
+        for qos in (0, 1, 2):
+            received = threading.Event()
+            drone = latency.DroneSubscriber(broker.host, broker.port, ["brakeCosmos"], qos)
+            drone.client.on_message = lambda client, userdata, msg: received.set()
+            assert drone.subscribed.wait(5)
+
+            publisher = latency.create_client()
+            publisher.connect(broker.host, broker.port, 60)
+            publisher.loop_start()
+            info = publisher.publish("brakeCosmos", "1", qos=qos)
+            info.wait_for_publish(5)
+            assert received.wait(5)
+
+            publisher.disconnect()
+            publisher.loop_stop()
+            drone.close()
+
+
+def test_benchmark_delivers_every_press():
+    """A short benchmark case delivers every press in both client modes"""
+    with LoopbackBroker() as broker:
+        for mode in ('threaded', 'async'):
+            result = latency.run_case(broker, mode, qos=1, payload_size=16, presses=20, rate=0)
+            assert result['delivered'] == 20
+            assert result['p50_ms'] <= result['p99_ms'] <= result['max_ms']
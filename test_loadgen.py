@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Tests for the headless load generator
+"""
+
+import loadgen
+from cosmos_core.inflight import LatencyHistogram
+from loopback_broker import LoopbackBroker
+
+
+def test_histograms_merge_across_workers():
+    """A merged histogram has every worker's durations"""
+    first, second = LatencyHistogram(), LatencyHistogram()
+    for _ in range(90):
+        first.record(0.001)
+    for _ in range(10):
+        second.record(0.050)
+    first.merge(second)
+    assert first.count == 100
+    assert first.max == 0.050
+    assert first.percentile(50) < 0.002 and first.percentile(99) > 0.045
+
+
+def test_every_press_from_every_worker_is_delivered():
+    """Two worker processes step through two rates and account for every press"""
+    with LoopbackBroker() as broker:
+        steps = []
+        summaries = loadgen.run(broker.host, broker.port, [100, 200], processes=2, controllers=3,
+                                duration=0.5, burst=5, qos=1, on_step=steps.append)
+    assert steps == summaries
+    for summary in summaries:
+        assert summary['sent'] == summary['delivered'] > 0
+        assert summary['lost'] == summary['failed'] == 0
+        assert len(summary['processes']) == 2
+        for report in summary['processes']:
+            assert report['cpu_seconds'] > 0
+            assert report['rss_bytes'] is None or report['rss_bytes'] > 0
+    assert loadgen.keeps_up(summaries[0])
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Tests for the bounded activity log pipeline
+"""
+
+import threading
+
+from log_pipeline import LogPipeline
+
+
+def test_batches_only_contain_new_lines():
+    """Each drain returns just the lines posted since the previous drain"""
+    pipeline = LogPipeline(max_lines=10)
+    pipeline.post("first")
+    pipeline.post("second")
+    lines, overflowed = pipeline.take_batch()
+    assert [line.split("] ", 1)[1] for line in lines] == ["first", "second"]
+    assert not overflowed
+    assert pipeline.take_batch() == ([], False)
+
+    pipeline.post("third")
+    lines, overflowed = pipeline.take_batch()
+    assert len(lines) == 1 and lines[0].endswith("third")
+
+
+def test_old_lines_are_evicted_past_the_limit():
+    """A storm larger than the ring keeps only the newest max_lines"""
+    pipeline = LogPipeline(max_lines=5)
+    for index in range(100):
+        pipeline.post(f"message {index}")
+    lines, overflowed = pipeline.take_batch()
+    assert overflowed
+    assert len(lines) == 5
+    assert lines[-1].endswith("message 99")
+    assert pipeline.text().count("\n") == 4
+
+
+def test_posting_from_many_threads_is_safe():
+    """Concurrent posts from network threads are all counted"""
+    pipeline = LogPipeline(max_lines=50)
+    threads = [threading.Thread(target=lambda: [pipeline.post("x") for _ in range(1000)])
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert pipeline.posted == 8000
+    lines, overflowed = pipeline.take_batch()
+    assert overflowed and len(lines) == 50
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Tests for the controller metrics registry and its exporters
+"""
+
+import json
+import threading
+import urllib.request
+
+from benchmarks.latency import DroneSubscriber, wait_for
+from cosmos_core import MQTTController
+from cosmos_core.metrics import ControllerMetrics
+from loopback_broker import LoopbackBroker
+
+
+def test_snapshot_exports_as_json_and_prometheus(tmp_path):
+    """Counters, gauges and histogram quantiles appear in both formats"""
+    metrics = ControllerMetrics()
+    metrics.increment('commands_sent', 3)
+    metrics.add_gauge('inflight_pending', lambda: 2)
+    metrics.add_gauge('not_applicable', lambda: None)
+    for micros in (100, 200, 300, 400, 10000):
+        metrics.observe('publish_seconds', micros / 1e6)
+
+    data = metrics.export()
+    assert data['counters']['commands_sent'] == 3
+    assert data['gauges'] == {'inflight_pending': 2}
+    publish = data['histograms']['publish_seconds']
+    assert publish['count'] == 5 and 0.0003 <= publish['p50'] <= 0.00032
+    assert publish['p99'] == 0.01
+
+    text = metrics.to_prometheus()
+    assert "cosmos_commands_sent_total 3" in text
+    assert "cosmos_inflight_pending 2" in text
+    assert 'cosmos_publish_seconds{quantile="0.99"} 0.01' in text
+    assert 'cosmos_connect_seconds{quantile="0.5"} NaN' in text
+
+    metrics.write(str(tmp_path / "metrics.json"))
+    assert json.loads((tmp_path / "metrics.json").read_text())['counters']['commands_sent'] == 3
+    metrics.write(str(tmp_path / "metrics.prom"))
+    assert (tmp_path / "metrics.prom").read_text().startswith("# TYPE")
+
+    metrics.enabled = False
+    metrics.observe('publish_seconds', 1.0)
+    assert metrics.histograms['publish_seconds'].count == 5
+
+
+def test_concurrent_updates_are_not_lost():
+    """Counters and histograms updated from many threads at once add up exactly"""
+    metrics = ControllerMetrics()
+    start = threading.Barrier(8)
+
+    def hammer():
+        start.wait()
+        for _ in range(20000):
+            metrics.increment('commands_confirmed')
+            metrics.observe('publish_seconds', 0.0001)
+
+    threads = [threading.Thread(target=hammer) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert metrics['commands_confirmed'] == 160000
+    assert metrics.snapshot()['commands_confirmed'] == 160000
+    assert metrics.histograms['publish_seconds'].count == 160000
+    assert metrics.export()['histograms']['publish_seconds']['count'] == 160000
+
+
+def test_cells_of_ended_threads_are_folded_away():
+    """Short-lived threads leave their counts behind but not their cells"""
+    metrics = ControllerMetrics()
+    for _ in range(50):
+        threads = [threading.Thread(target=lambda: (metrics.increment('connects'),
+                                                    metrics.observe('connect_seconds', 0.01)))
+                   for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    metrics.increment('connects')
+    assert metrics['connects'] == 501
+    assert metrics.snapshot()['connects'] == 501
+    assert metrics.histograms['connect_seconds'].count == 500
+    # The retired total and this thread's own cell
+    assert len(metrics.counters.all()) == 2
+    assert len(metrics.histograms['connect_seconds'].shards.all()) == 1
+
+
+def test_write_stamps_drained_from_two_threads_are_each_observed_once():
+    """paho's thread and a publishing thread flushing at once neither raise nor lose a stamp"""
+    controller = MQTTController()
+    done = threading.Event()
+    errors = []
+
+    def flush():
+        try:
+            while not done.is_set():
+                controller.on_writes_flushed(None, None, None)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=flush) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for _ in range(20000):
+        controller.time_to_write('button_to_write_seconds', 0.0)
+    done.set()
+    for thread in threads:
+        thread.join()
+    controller.on_writes_flushed(None, None, None)
+    assert errors == []
+    assert controller.metrics.histograms['button_to_write_seconds'].count == 20000
+
+
+def test_controller_instruments_connect_publish_and_messages():
+    """The hot paths feed the registry, which is served over a local port"""
+    with LoopbackBroker() as broker:
+        drone = DroneSubscriber(broker.host, broker.port, ["brakeCosmos"], 0)
+        assert drone.subscribed.wait(5)
+        controller = MQTTController()
+        controller.connect(broker.host, broker.port, "", "")
+        assert wait_for(lambda: controller.connected and controller.session_subscribed, 5)
+
+        drone.expect("brakeCosmos", 0)
+        assert controller.publish_brake()
+        assert wait_for(lambda: drone.outstanding() == 0, 5)
+        drone.client.publish("telemetryCosmos", b"12.5,3.0,87")
+        assert wait_for(lambda: controller.metrics['telemetry_received'] == 1, 5)
+
+        port = controller.metrics.serve(0)
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics.json", timeout=5) as response:
+                served = json.load(response)
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+                assert b"cosmos_connected 1" in response.read()
+        finally:
+            controller.metrics.stop_serving()
+        controller.disconnect()
+        drone.close()
+
+    histograms = served['histograms']
+    assert histograms['connect_seconds']['count'] == 1
+    assert histograms['publish_seconds']['count'] == 1
+    assert histograms['message_handling_seconds']['count'] == 1
+    assert served['counters']['commands_sent'] == 1
+    assert served['gauges']['inflight_pending'] == 0
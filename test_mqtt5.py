@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Tests for MQTT 5 mode: topic aliases, message expiry, user property stamps and 3.1.1 fallback
+"""
+
+import time
+
+import mqtt_wire as wire
+from benchmarks.latency import wait_for
+from cosmos_core import MQTTController, create_client
+from cosmos_core.controller import mqtt5_properties
+from loopback_broker import LoopbackBroker
+from sim_drone import SimulatedDrone
+
+
+def test_mqtt5_publish_round_trips_and_aliases_shrink_it():
+    """Properties survive encoding, and an alias-only packet is smaller than the full one"""
+    properties = [(wire.MESSAGE_EXPIRY, 5), (wire.USER_PROPERTY, ("seq", "7"))]
+    packet = wire.encode_publish("brakeCosmos", b"1", 1, 42, properties=properties)
+    body = packet[2:]
+    assert wire.decode_publish5(packet[0], body) == ("brakeCosmos", b"1", 1, 42, False, properties)
+
+    full = wire.encode_publish("brakeCosmos", b"1", properties=[(wire.TOPIC_ALIAS, 1)])
+    aliased = wire.encode_publish("", b"1", properties=[(wire.TOPIC_ALIAS, 1)])
+    assert len(aliased) == len(full) - len("brakeCosmos")
+
+
+def test_commands_use_aliases_and_acks_ride_in_user_properties():
+    """Presses after the first go out alias-only; the drone reads sequence numbers from properties"""
+    with LoopbackBroker() as broker:
+        drone = SimulatedDrone(broker.host, broker.port, protocol=wire.MQTT5)
+        assert drone.subscribed.wait(5)
+        controller = MQTTController()
+        controller.enable_mqtt5(message_expiry=5)
+        assert controller.connect("localhost", broker.port, "", "")
+        try:
+            assert wait_for(lambda: controller.connected and controller.session_subscribed, 5)
+            assert controller.topic_aliases == {"brakeCosmos": 1, "landCosmos": 2}
+
+            start = broker.publish_bytes
+            controller.publish_brake()
+            assert wait_for(lambda: broker.publish_bytes > start, 5)
+            first = broker.publish_bytes - start
+            controller.publish_brake()
+            assert wait_for(lambda: broker.publish_bytes > start + first, 5)
+            assert broker.publish_bytes - start - first == first - len("brakeCosmos")
+            assert wait_for(lambda: len(drone.actions) == 2, 5)
+
+            controller.enable_command_acks()
+            controller.publish_brake()
+            assert wait_for(lambda: controller.acks.acked == 1, 5)
+            # The stamp went in user properties, so the drone saw the plain payload's seq
+            assert drone.actions[-1] == ('brake', 1)
+        finally:
+            controller.disconnect()
+            drone.close()
+
+
+def test_expired_commands_are_not_delivered_late():
+    """A command queued for an offline session is dropped once its expiry passes"""
+    with LoopbackBroker() as broker:
+        received = []
+        listener = create_client("late-drone", protocol=wire.MQTT5)
+        listener.on_message = lambda client, userdata, msg: received.append(msg.payload)
+        session = mqtt5_properties('CONNECT', SessionExpiryInterval=60)
+        listener.connect(broker.host, broker.port, 60, clean_start=False, properties=session)
+        listener.subscribe("brakeCosmos", 1)
+        listener.loop_start()
+        assert wait_for(lambda: listener.is_connected(), 5)
+        time.sleep(0.1)
+        listener.disconnect()
+        listener.loop_stop()
+
+        controller = MQTTController()
+        controller.command_qos['brake'] = 1
+        controller.enable_mqtt5(message_expiry=1)
+        assert controller.connect("localhost", broker.port, "", "")
+        try:
+            assert wait_for(lambda: controller.connected, 5)
+            controller.publish_brake()
+            assert wait_for(lambda: controller.metrics['commands_confirmed'] == 1, 5)
+        finally:
+            controller.disconnect()
+
+        time.sleep(1.1)
+        listener.reconnect()
+        listener.loop_start()
+        assert wait_for(lambda: broker.expired == 1, 5)
+        listener.disconnect()
+        listener.loop_stop()
+        assert received == []
+
+
+def test_falls_back_to_mqtt311_when_the_broker_refuses_mqtt5():
+    """A 3.1.1-only broker's refusal reconnects with 3.1.1 and commands still flow"""
+    with LoopbackBroker(protocols=(wire.MQTT311,)) as broker:
+        events = []
+        controller = MQTTController()
+        controller.add_listener(lambda event, data: events.append(event))
+        controller.enable_mqtt5()
+        assert controller.connect("localhost", broker.port, "", "")
+        try:
+            assert wait_for(lambda: controller.connected, 5)
+            assert controller.protocol == wire.MQTT311
+            assert 'protocol_fallback' in events
+            assert controller.publish_brake()
+        finally:
+            controller.disconnect()
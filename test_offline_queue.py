@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Tests for the durable offline command queue
+"""
+
+import threading
+import time
+
+from benchmarks.latency import HeadlessApp, create_client, wait_for
+from cosmos_core import MQTTController as ControllerCore
+from cosmos_mqtt_controller import MQTTController
+from loopback_broker import LoopbackBroker
+from offline_queue import OfflineCommandQueue
+
+
+def test_commands_replay_in_order_and_survive_restart(tmp_path):
+    """Queued commands come back in order after reopening the file"""
+    path = str(tmp_path / "commands.q")
+    queue = OfflineCommandQueue(path, capacity=8)
+    queue.enqueue('brake', "brakeCosmos", "1")
+    queue.enqueue('land', "landCosmos", "1", qos=1)
+    queue.close()
+
+    queue = OfflineCommandQueue(path)
+    assert len(queue) == 2
+    first = queue.dequeue()
+    assert (first.name, first.topic, first.payload, first.qos) == ('brake', "brakeCosmos", b"1", 0)
+    assert queue.peek().name == 'land'
+    assert queue.dequeue().qos == 1
+    assert queue.dequeue() is None
+    queue.close()
+
+
+def test_stale_commands_are_dropped():
+    """Safety commands past their expiry are not replayed"""
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        queue = OfflineCommandQueue(f"{directory}/commands.q", ttls={'brake': 5.0, 'land': 30.0})
+        queue.enqueue('brake', "brakeCosmos", "1", now=1000.0)
+        queue.enqueue('land', "landCosmos", "1", now=1000.0)
+        fresh, expired = queue.drain(now=1010.0)
+        assert [command.name for command in fresh] == ['land']
+        assert expired == 1
+        assert len(queue) == 0
+        queue.close()
+
+
+def test_full_ring_evicts_oldest_and_skips_corrupt_slots(tmp_path):
+    """The file never grows: a full ring drops its oldest record"""
+    queue = OfflineCommandQueue(str(tmp_path / "commands.q"), capacity=4)
+    for index in range(6):
+        queue.enqueue('brake', "brakeCosmos", str(index))
+    assert len(queue) == 4 and queue.dropped_full == 2
+    # Corrupt the oldest remaining record's payload
+    offset = queue._offset(2) + 40
+    queue.mm[offset:offset + 1] = b"X"
+    payloads = [command.payload for command in queue.drain()[0]]
+    assert payloads == [b"3", b"4", b"5"]
+    queue.close()
+
+
+class OrderedDrone:
+    """Records brake payloads in arrival order and reconnects quickly"""
+
+    def __init__(self, host, port):
+        self.payloads = []
+        self.client = create_client()
+        self.client.reconnect_delay_set(min_delay=0.05, max_delay=0.1)
+        self.client.on_connect = lambda client, userdata, flags, rc: client.subscribe("brakeCosmos", 1)
+        self.client.on_message = lambda client, userdata, msg: self.payloads.append(int(msg.payload))
+        self.client.connect(host, port, 60)
+        self.client.loop_start()
+
+    def close(self):
+        self.client.disconnect()
+        self.client.loop_stop()
+
+
+def test_presses_during_broker_outage_are_replayed(tmp_path):
+    """Kill and restart the broker under load; offline presses arrive in order"""
+    broker = LoopbackBroker().start()
+    port = broker.port
+    drone = OrderedDrone(broker.host, port)
+    controller = MQTTController(HeadlessApp())
+    controller.qos = 1
+    controller.enable_offline_queue(str(tmp_path / "commands.q"))
+    controller.connect(broker.host, port, "", "")
+    assert wait_for(lambda: controller.connected, 5)
+
+    offline = []
+    stop = threading.Event()
+
+    def press_loop():
+        seq = 0
+        while not stop.is_set():
+            seq += 1
+            was_offline = not controller.connected
+            controller.brake_payload = str(seq)
+            assert controller.publish_brake()
+            if was_offline:
+                offline.append(seq)
+            time.sleep(0.01)
+
+    presser = threading.Thread(target=press_loop)
+    presser.start()
+    time.sleep(0.3)
+    broker.stop()
+    assert wait_for(lambda: not controller.connected, 5)
+    time.sleep(0.3)
+    broker = LoopbackBroker(port=port).start()
+    assert wait_for(lambda: controller.connected, 10)
+    time.sleep(0.3)
+    stop.set()
+    presser.join()
+
+    assert offline
+    assert wait_for(lambda: set(offline) <= set(drone.payloads), 5)
+    replayed = [seq for seq in drone.payloads if seq in set(offline)]
+    assert replayed == sorted(replayed)
+
+    controller.disconnect()
+    drone.close()
+    broker.stop()
+
+
+def test_send_failing_right_after_reconnect_is_reported(tmp_path):
+    """A press that finds the link back up while queueing fails like any other send"""
+    with LoopbackBroker() as broker:
+        controller = ControllerCore()
+        controller.enable_offline_queue(str(tmp_path / "commands.q"))
+        events = []
+        controller.events.add_listener(lambda event, data: events.append((event, data)))
+        try:
+            assert controller.connect(broker.host, broker.port, "", "")
+            assert wait_for(lambda: controller.connected, 5)
+
+            def fail(name, topic, payload):
+                raise OSError("socket closed")
+
+            controller._send_command = fail
+            assert not controller._queue_offline('brake', controller.brake_topic, controller.brake_payload)
+        finally:
+            controller.disconnect()
+    assert ('command_failed', ('brake', "socket closed")) in events
+    assert controller.metrics['commands_failed'] == 1
+    assert controller.metrics['commands_queued'] == 0
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Tests for the reconnect engine and persistent session resumption
+"""
+
+import time
+
+from benchmarks.latency import HeadlessApp, create_client, wait_for
+from cosmos_mqtt_controller import MQTTController
+from loopback_broker import LoopbackBroker
+from reconnect import Backoff
+
+
+def test_backoff_is_capped_jittered_and_resettable():
+    """Delays double up to the cap and jitter only ever shortens them"""
+    exact = Backoff(initial=0.1, maximum=1.0, jitter=0.0)
+    assert [round(exact.next_delay(), 3) for _ in range(6)] == [0.1, 0.2, 0.4, 0.8, 1.0, 1.0]
+    exact.reset()
+    assert exact.next_delay() == 0.1
+
+    jittered = Backoff(initial=1.0, maximum=8.0, jitter=0.5, rng=lambda: 1.0)
+    assert jittered.next_delay() == 0.5
+    assert jittered.next_delay() == 1.0
+
+
+def test_dropped_link_recovers_with_session_resumed():
+    """A dropped link comes back on its own and keeps its subscriptions"""
+    with LoopbackBroker() as broker:
+        controller = MQTTController(HeadlessApp())
+        controller.connect(broker.host, broker.port, "", "")
+        assert wait_for(lambda: controller.session_subscribed, 5)
+
+        assert broker.drop_all() == 1
+        assert wait_for(lambda: controller.reconnect.stats.last is not None, 5)
+        assert wait_for(lambda: controller.connected, 5)
+        assert controller.reconnect.stats.last < 2.0
+        assert controller.client_id in broker.persistent
+
+        publisher = create_client()
+        publisher.connect(broker.host, broker.port, 60)
+        publisher.loop_start()
+        assert wait_for(publisher.is_connected, 5)
+        publisher.publish("telemetryCosmos", b"12.5,3.0,80")
+        assert wait_for(lambda: controller.telemetry.messages == 1, 5)
+
+        publisher.disconnect()
+        publisher.loop_stop()
+        controller.disconnect()
+
+
+def test_connect_again_retires_the_previous_client():
+    """A second connect() stops the first client instead of leaving two with our client id"""
+    with LoopbackBroker() as broker:
+        controller = MQTTController(HeadlessApp())
+        events = []
+        controller.add_listener(lambda event, data: events.append(event))
+        controller.connect(broker.host, broker.port, "", "")
+        assert wait_for(lambda: controller.connected, 5)
+        first = controller.client
+
+        # As when Connect is clicked while the link is being re-established
+        controller.connect(broker.host, broker.port, "", "")
+        assert controller.client is not first
+        assert wait_for(lambda: controller.connected, 5)
+        del events[:]
+        time.sleep(1.0)
+        assert 'link_lost' not in events and controller.connected
+        assert first._thread is None
+        controller.disconnect()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Tests for the subscription router: topic trie matching and handler contexts
+"""
+
+import threading
+
+import pytest
+
+import mqtt_wire as wire
+from benchmarks.latency import wait_for
+from cosmos_core import MQTTController, create_client
+from cosmos_core.router import MessageRouter, TopicTrie
+from loopback_broker import LoopbackBroker
+
+
+class Message:
+    def __init__(self, topic, payload=b""):
+        self.topic = topic
+        self.payload = payload
+
+
+def test_trie_follows_mqtt_wildcard_rules():
+    """Matches agree with a filter-by-filter check, '$' topics excepted, and removal prunes"""
+    filters = ["drones/+/telemetry", "drones/7/#", "drones/#", "#", "+/+", "drones/7/status",
+               "drones/+/+/battery", "+", "drones/7/telemetry/#"]
+    topics = ["drones", "drones/7", "drones/7/status", "drones/8/telemetry", "drones/7/telemetry",
+              "drones/7/telemetry/battery", "other/x", "a//b", "/lead"]
+    trie = TopicTrie()
+    for topic_filter in filters:
+        trie.add(topic_filter, topic_filter)
+    for topic in topics:
+        expected = sorted(f for f in filters if wire.topic_matches(f, topic))
+        assert sorted(trie.match(topic)) == expected, topic
+        # The cached answer is the same
+        assert sorted(trie.match(topic)) == expected, topic
+    trie.add("$SYS/#", "$SYS/#")
+    assert trie.match("$SYS/broker/load") == ("$SYS/#",)
+
+    assert trie.remove("drones/7/#", "drones/7/#")
+    assert not trie.remove("drones/7/#", "drones/7/#")
+    assert "drones/7/#" not in trie.match("drones/7/status")
+    for topic_filter in filters:
+        if topic_filter != "drones/7/#":
+            assert trie.remove(topic_filter, topic_filter)
+    assert list(trie.root.children) == ["$SYS"] and len(trie) == 1
+    for bad in ("a/#/b", "a/b#", "a+/b", ""):
+        with pytest.raises(ValueError):
+            trie.add(bad, None)
+
+
+def test_handlers_run_in_their_context():
+    """network runs inline, worker on the pool, ui through the runner; a failure stops no one"""
+    ui_calls = []
+    router = MessageRouter(ui=lambda key, fn, *args: ui_calls.append((key, fn, args)))
+    seen = {}
+    done = threading.Event()
+
+    def record(context):
+        def handler(msg):
+            seen[context] = threading.current_thread()
+            if context == 'worker':
+                done.set()
+        return handler
+
+    def broken(msg):
+        raise RuntimeError("boom")
+
+    router.route("drones/+/status", broken)
+    for context in ('network', 'worker', 'ui'):
+        router.route("drones/#", record(context), context)
+    try:
+        assert router.dispatch(Message("drones/3/status")) == 4
+        assert router.dispatch(Message("fleet/status")) == 0
+        assert seen['network'] is threading.current_thread()
+        assert done.wait(5) and seen['worker'] is not threading.current_thread()
+        assert 'ui' not in seen and len(ui_calls) == 1
+        key, fn, args = ui_calls.pop()
+        assert key is args[0] and key.context == 'ui'
+        fn(*args)
+        assert 'ui' in seen and router.errors == 1
+    finally:
+        router.close()
+
+
+def test_controller_routes_wildcard_subscriptions():
+    """subscribe() reaches the broker on connect; routed messages skip the 'message' event"""
+    with LoopbackBroker() as broker:
+        controller = MQTTController()
+        received = []
+        events = []
+        controller.add_listener(lambda event, data: events.append(event))
+        route = controller.subscribe("drones/+/status", lambda msg: received.append(msg.topic))
+        publisher = create_client()
+        publisher.connect(broker.host, broker.port, 60)
+        publisher.loop_start()
+        try:
+            assert controller.connect("localhost", broker.port, "", "")
+            assert wait_for(lambda: controller.session_subscribed, 5)
+            # The route's SUBSCRIBE may still be on its way when the first SUBACK arrives
+            for _ in range(10):
+                publisher.publish("drones/1/status", b"ok")
+                if wait_for(lambda: received, 0.5):
+                    break
+            assert received[0] == "drones/1/status"
+            assert 'message' not in events
+            assert controller.unsubscribe(route) and not controller.unsubscribe(route)
+        finally:
+            publisher.loop_stop()
+            publisher.disconnect()
+            controller.disconnect()
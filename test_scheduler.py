@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for outbound priority: the safety lane's queue jump and the background lanes
+"""
+
+import collections
+import threading
+
+import mqtt_wire as wire
+from benchmarks.latency import DroneSubscriber, wait_for
+from cosmos_core import MQTTController
+from cosmos_core.scheduler import NORMAL, OutboundScheduler
+from loopback_broker import LoopbackBroker
+
+
+class QueueOnlyClient:
+    """Just paho's outbound queue, with entries shaped like paho's"""
+
+    def __init__(self, *names):
+        self._out_packet = collections.deque(self.entry(name) for name in names)
+
+    @staticmethod
+    def entry(name, pos=0):
+        return {'command': wire.PUBLISH, 'mid': 0, 'qos': 0, 'pos': pos, 'to_process': 1,
+                'packet': name, 'info': None}
+
+    def names(self):
+        return [entry['packet'] for entry in self._out_packet]
+
+
+def test_expedited_packets_skip_the_queue_in_order():
+    """Safety packets go behind the half-written head and earlier safety packets only"""
+    client = QueueOnlyClient('status1', 'status2', 'status3')
+    client._out_packet[0]['pos'] = 1
+    client._out_packet.append(client.entry('brake'))
+    assert wire.expedite(client, lambda entry: entry['packet'] == 'brake')
+    client._out_packet.append(client.entry('land'))
+    assert wire.expedite(client, lambda entry: entry['packet'] == 'land')
+    assert client.names() == ['status1', 'brake', 'land', 'status2', 'status3']
+    assert not wire.expedite(client, lambda entry: entry['packet'] == 'written already')
+
+
+def test_background_lanes_wait_for_room_and_coalesce():
+    """Nothing is fed while the link is backed up; then normal goes first and bulk keeps the latest value"""
+    sent = []
+    depth = [(5, 0)]
+    fed = threading.Event()
+
+    def publish(topic, payload, qos):
+        sent.append((topic, payload))
+        fed.set()
+
+    scheduler = OutboundScheduler(publish, lambda: depth[0], max_packets=2, bulk_rate=1000, bulk_burst=10)
+    try:
+        scheduler.submit("status/battery", "90")
+        scheduler.submit("status/gps", "a")
+        scheduler.submit("status/battery", "89")
+        scheduler.submit("log", "1", lane=NORMAL)
+        scheduler.submit("log", "2", lane=NORMAL)
+        assert not fed.wait(0.05)
+        depth[0] = (0, 0)
+        scheduler.kick()
+        assert wait_for(lambda: len(sent) == 4, 5)
+        assert sent == [("log", "1"), ("log", "2"), ("status/battery", "89"), ("status/gps", "a")]
+        assert scheduler.coalesced == 1
+    finally:
+        scheduler.stop()
+
+
+def test_background_publish_reaches_the_broker_after_reconnect():
+    """Background publishes made while offline wait and go out once connected"""
+    with LoopbackBroker() as broker:
+        drone = DroneSubscriber(broker.host, broker.port, ["cosmos/status"], 0)
+        assert drone.subscribed.wait(5)
+        controller = MQTTController()
+        try:
+            drone.expect("cosmos/status", 0.0)
+            controller.publish_background("cosmos/status", "old")
+            controller.publish_background("cosmos/status", "new")
+            assert controller.connect("localhost", broker.port, "", "")
+            assert wait_for(lambda: drone.outstanding() == 0, 5)
+            assert controller.outbound.sent['bulk'] == 1
+        finally:
+            controller.disconnect()
+            drone.close()
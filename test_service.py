@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for the controller service: commands and events over the local socket, and the wake lock policy
+"""
+
+import os
+import tempfile
+
+import pytest
+
+from benchmarks.latency import wait_for
+from cosmos_core import MQTTController
+from cosmos_core.service import ControllerService, ServiceClient, ServiceError, WakePolicy
+from loopback_broker import LoopbackBroker
+from sim_drone import SimulatedDrone
+
+
+def test_press_through_the_service_reaches_the_drone():
+    """The UI connects the service's controller, sends BRAKE through it and hears its events"""
+    with LoopbackBroker() as broker, tempfile.TemporaryDirectory() as directory:
+        drone = SimulatedDrone(broker.host, broker.port)
+        assert drone.subscribed.wait(5)
+        address = os.path.join(directory, "controller.sock")
+        service = ControllerService(MQTTController(), address).start()
+        client = ServiceClient(address)
+        events = []
+        client.add_listener(lambda event, data: events.append(event))
+        try:
+            assert client.open(wait=2)['connected'] is False
+            assert client.call('connect', "localhost", broker.port, "", "")
+            assert wait_for(lambda: client.connected, 5)
+            assert 'connected' in events
+            stamp_histogram = client.metrics.histograms['key_to_write_seconds']
+            client.time_to_write('key_to_write_seconds', 0.0)
+            assert client.publish_brake()
+            assert wait_for(lambda: drone.actions, 5)
+            assert drone.actions == [('brake', None)]
+            assert wait_for(lambda: client.metrics.histograms['service_call_seconds'].count == 1, 5)
+            assert stamp_histogram.count == 1
+            assert client.call('status')['commands_sent'] == 1
+            client.call('disconnect')
+            assert wait_for(lambda: not client.connected, 5)
+        finally:
+            client.close()
+            service.stop()
+            drone.close()
+
+
+def test_only_allowed_calls_are_served():
+    """Calls outside SERVICE_CALLS are refused, and a closed service fails pending callers"""
+    with tempfile.TemporaryDirectory() as directory:
+        address = os.path.join(directory, "controller.sock")
+        service = ControllerService(MQTTController(), address).start()
+        client = ServiceClient(address)
+        lost = []
+        client.add_listener(lambda event, data: event == 'service_lost' and lost.append(event))
+        try:
+            client.open(wait=2)
+            with pytest.raises(ServiceError):
+                client.call('handle_message', None)
+            with pytest.raises(ServiceError):
+                client.call('__init__')
+            service.stop()
+            assert wait_for(lambda: lost, 5)
+            assert not client.publish_brake()
+        finally:
+            client.close()
+            service.stop()
+
+
+def test_wake_locks_held_only_with_screen_off_and_a_link():
+    """Locks are taken when the screen goes off on a live or reconnecting link, and dropped otherwise"""
+    calls = []
+    policy = WakePolicy(lambda: calls.append('acquire'), lambda: calls.append('release'))
+    policy.screen(False)
+    assert calls == []
+    policy.on_event('connected', (None, False))
+    assert calls == ['acquire']
+    policy.on_event('link_lost', (7, 1.0))
+    policy.on_event('connected', (0.4, True))
+    assert calls == ['acquire']
+    policy.screen(True)
+    assert calls == ['acquire', 'release']
+    policy.screen(False)
+    policy.on_event('disconnected', 0)
+    assert calls == ['acquire', 'release', 'acquire', 'release']
+    policy.close()
+    assert calls == ['acquire', 'release', 'acquire', 'release']
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Tests for startup timing and deferred imports
+"""
+
+import json
+import subprocess
+import sys
+
+import startup
+
+
+def test_report_round_trips_and_compares(tmp_path):
+    """Phases and marks are saved as JSON and line up between two reports"""
+    timer = startup.StartupTimer()
+    with timer.phase('import kivy'):
+        pass
+    timer.mark('first_frame')
+    path = tmp_path / "startup.json"
+    timer.write(str(path))
+
+    report = json.loads(path.read_text())
+    assert set(report['phases']) == {'import kivy'}
+    assert report['marks']['first_frame'] >= 0
+    faster = {'phases': {'import kivy': 0.0}, 'marks': {'first_frame': 0.0, 'deferred_ready': 0.5}}
+    rows = startup.compare(report, faster)
+    assert [name for name, _, _ in rows] == ['import kivy', '@first_frame', '@deferred_ready']
+    assert rows[2][1] is None and rows[2][2] == 500.0
+
+
+def test_core_defers_paho_until_first_client():
+    """Importing the core stays cheap; paho loads on the first create_client()"""
+    code = ("import sys, cosmos_core; before = 'paho.mqtt.client' in sys.modules; "
+            "cosmos_core.MQTTController(); cosmos_core.create_client(); "
+            "print(before, 'paho.mqtt.client' in sys.modules)")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.split() == ["False", "True"]
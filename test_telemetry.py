@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Tests for the telemetry ring buffers and decoders
+"""
+
+import array
+
+from telemetry import TelemetryChannel, TelemetryHub
+
+
+def test_codecs_decode_into_channels():
+    """Binary and CSV payloads fill channels in declaration order"""
+    hub = TelemetryHub({
+        "binary": ('float32', ["altitude", "speed"]),
+        "text": ('csv', ["battery"]),
+    })
+    assert hub.handle("binary", array.array('f', [10.5, 2.0]).tobytes(), timestamp=1.0)
+    assert hub.handle("text", b"87.5", timestamp=2.0)
+    assert hub.channels["altitude"].latest() == (1.0, 10.5)
+    assert hub.channels["speed"].latest() == (1.0, 2.0)
+    assert hub.channels["battery"].latest() == (2.0, 87.5)
+
+    assert not hub.handle("binary", b"\x00\x01\x02")
+    assert not hub.handle("unknown", b"1")
+    assert hub.errors == 1 and hub.messages == 2
+
+
+def test_non_finite_values_are_left_out():
+    """NaN and inf samples never reach a channel, so the summary still renders"""
+    hub = TelemetryHub({
+        "binary": ('float64', ["altitude", "speed"]),
+        "text": ('csv', ["altitude", "speed", "battery"]),
+    })
+    assert hub.handle("text", b"10,2,90", timestamp=1.0)
+    assert hub.handle("text", b"nan,inf,89", timestamp=2.0)
+    assert hub.handle("binary", array.array('d', [float('nan'), 3.0]).tobytes(), timestamp=3.0)
+    assert hub.channels["altitude"].window() == [10.0]
+    assert hub.channels["speed"].window() == [2.0, 3.0]
+    assert hub.channels["battery"].latest() == (2.0, 89.0)
+    assert hub.rejected == 3
+    assert "altitude: 10.00" in hub.summary()
+
+
+def test_ring_buffer_wraps_without_growing():
+    """A channel keeps only its newest samples in fixed storage"""
+    channel = TelemetryChannel("altitude", capacity=8)
+    storage = channel.values.buffer_info()
+    for index in range(20):
+        channel.append(float(index), float(index))
+    assert len(channel) == 8
+    assert channel.window() == [float(i) for i in range(12, 20)]
+    assert channel.window(3) == [17.0, 18.0, 19.0]
+    assert channel.values.buffer_info() == storage
+
+
+def test_downsample_averages_buckets():
+    """Downsampled views average the window into display points"""
+    channel = TelemetryChannel("speed", capacity=100)
+    for index in range(100):
+        channel.append(index, float(index))
+    points = channel.downsample(10)
+    assert len(points) == 10
+    assert points[0] == sum(range(10)) / 10
+    assert len(channel.sparkline(10)) == 10
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Tests for the polling bridge between paho's thread and the Tk mainloop
+"""
+
+from benchmarks.latency import percentile
+from benchmarks.tk_bridge import FakeTkRoot, HeadlessTkApp, stress
+from cosmos_mqtt_controller import MQTTController
+from ui_dispatch import PollingBridge, UIDispatcher
+
+
+def test_poll_interval_drops_while_work_is_in_flight():
+    """The bridge idles slowly and polls fast while updates or commands are pending"""
+    scheduled = []
+    in_flight = [0]
+    dispatcher = UIDispatcher()
+    shown = []
+    dispatcher.on('connected', shown.append)
+    bridge = PollingBridge(dispatcher, lambda ms, fn: scheduled.append(ms),
+                           busy=lambda: in_flight[0], idle_interval=0.05, busy_interval=0.002)
+    bridge.start()
+    assert scheduled == [0]
+
+    bridge.poll()
+    assert scheduled[-1] == 50
+    dispatcher.post('connected', True)
+    bridge.poll()
+    assert shown == [True] and scheduled[-1] == 2
+    bridge.poll()
+    assert scheduled[-1] == 50
+    in_flight[0] = 1
+    bridge.poll()
+    assert scheduled[-1] == 2
+    in_flight[0] = 0
+    bridge.boost(10)
+    bridge.poll()
+    assert scheduled[-1] == 2
+    bridge.stop()
+    bridge.poll()
+    assert len(scheduled) == 6
+
+
+def test_message_flood_keeps_the_mainloop_responsive():
+    """Widgets are only touched on the mainloop and its timers keep firing during a flood"""
+    root = FakeTkRoot()
+    app = HeadlessTkApp(root, MQTTController)
+    lateness = stress(app, root, threads=4, messages=20000)
+
+    metrics = app.mqtt_controller.metrics
+    assert metrics['messages_received'] + metrics['telemetry_received'] == 20000
+    assert app.off_thread == 0
+    # Link flaps from four threads collapse into far fewer status updates
+    assert 0 < app.status_updates < 4 * 40
+    assert app.rendered_lines > 0
+    assert len(lateness) > 5 and percentile(lateness, 50) < 50
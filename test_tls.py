@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Tests for the TLS transport: session resumption on reconnect and certificate pinning
+"""
+
+import shutil
+import ssl
+
+import pytest
+
+from benchmarks.latency import wait_for
+from cosmos_core import MQTTController
+from cosmos_core.tls import fingerprint, tls_context
+from loopback_broker import LoopbackBroker, self_signed_context
+
+pytestmark = pytest.mark.skipif(shutil.which("openssl") is None,
+                                reason="needs the openssl tool for a self-signed certificate")
+
+
+def test_reconnect_resumes_the_tls_session(tmp_path):
+    """The first handshake is full; after a dropped link the broker resumes the session"""
+    server, certfile = self_signed_context(str(tmp_path))
+    with LoopbackBroker(ssl_context=server) as broker:
+        controller = MQTTController()
+        controller.reconnect.backoff.initial = 0.05
+        controller.enable_tls(ca_file=certfile)
+        assert controller.connect("localhost", broker.port, "", "")
+        try:
+            assert wait_for(lambda: controller.connected and controller.session_subscribed, 5)
+            assert controller.tls.full.count == 1
+            assert controller.publish_brake()
+
+            broker.drop_all()
+            assert wait_for(lambda: not controller.connected, 5)
+            assert wait_for(lambda: controller.connected, 5)
+            assert controller.tls.resumed.count >= 1
+            assert controller.tls.server_names["127.0.0.1"] == "localhost"
+            assert 'tls_resumed_handshake_seconds' in controller.metrics.export()['histograms']
+        finally:
+            controller.disconnect()
+
+
+def test_pinned_certificate_is_the_trust_anchor(tmp_path):
+    """A matching pin connects without a CA; any other certificate is refused"""
+    server, certfile = self_signed_context(str(tmp_path))
+    with open(certfile) as handle:
+        pin = fingerprint(ssl.PEM_cert_to_DER_cert(handle.read()))
+    assert tls_context(pins=[pin.upper()]) is tls_context(pins=[pin])
+
+    with LoopbackBroker(ssl_context=server) as broker:
+        pinned = MQTTController()
+        pinned.enable_tls(pins=[pin])
+        assert pinned.connect("localhost", broker.port, "", "")
+        try:
+            assert wait_for(lambda: pinned.connected, 5)
+        finally:
+            pinned.disconnect()
+
+        failures = []
+        wrong = MQTTController()
+        wrong.add_listener(lambda event, data: failures.append(data) if event == 'connect_failed' else None)
+        wrong.enable_tls(pins=["00" * 32])
+        assert not wrong.connect("localhost", broker.port, "", "")
+        assert "pinned" in failures[0]
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Tests for the coalescing UI dispatcher
+"""
+
+import threading
+import time
+
+from ui_dispatch import UIDispatcher
+
+
+def test_bursts_collapse_to_the_latest_value():
+    """Many posts between frames are applied once, with the last value"""
+    wakeups = []
+    dispatcher = UIDispatcher(max_calls=2, wakeup=lambda: wakeups.append(1))
+    shown = []
+    dispatcher.on('status', shown.append)
+
+    assert dispatcher.run_frame() is None
+    for index in range(100):
+        dispatcher.post('status', f"event {index}")
+    calls = []
+    for index in range(3):
+        dispatcher.call(calls.append, index)
+    assert dispatcher.run_frame() >= 0
+    assert shown == ["event 99"] and calls == [0, 1]
+    # The leftover call asked for another frame
+    assert len(wakeups) == 104
+    dispatcher.run_frame()
+    assert shown == ["event 99"] and calls == [0, 1, 2]
+    assert not dispatcher.pending and dispatcher.run_frame() is None
+
+
+def test_calls_are_never_dropped():
+    """A backlog of calls far bigger than one frame all run, oldest first"""
+    dispatcher = UIDispatcher(max_calls=64)
+    calls = []
+    for index in range(5000):
+        dispatcher.call(calls.append, index)
+    dispatcher.call(calls.append, "connect_finished")
+    while dispatcher.pending:
+        dispatcher.run_frame()
+    assert calls == list(range(5000)) + ["connect_finished"]
+
+
+def test_latest_calls_run_once_per_frame_with_the_newest_arguments():
+    """A busy key runs only its newest call, while plain calls still all run"""
+    dispatcher = UIDispatcher(max_calls=4)
+    shown = []
+    control = []
+    for index in range(1000):
+        dispatcher.call_latest('telemetry', shown.append, index)
+    dispatcher.call(control.append, "connect_finished")
+    dispatcher.run_frame()
+    assert shown == [999] and control == ["connect_finished"]
+    dispatcher.call_latest('telemetry', shown.append, 1000)
+    dispatcher.run_frame()
+    assert shown == [999, 1000] and not dispatcher.pending
+
+
+def test_event_flood_keeps_frame_work_constant():
+    """Writers on several threads never make one frame do more than a bounded amount of work"""
+    dispatcher = UIDispatcher(max_calls=8)
+    work_per_frame = []
+    statuses = []
+    reported = []
+
+    def apply(shown, value):
+        shown.append(value)
+        work_per_frame[-1] += 1
+
+    def report(index):
+        reported.append(index)
+        work_per_frame[-1] += 1
+
+    dispatcher.on('status', lambda value: apply(statuses, value))
+    dispatcher.on('connected', lambda value: apply([], value))
+    def flood(thread):
+        for index in range(20000):
+            dispatcher.post('status', (thread, index))
+            if index % 10 == 0:
+                dispatcher.post('connected', index % 20 == 0)
+            if index % 100 == 0:
+                dispatcher.call(report, index)
+
+    writers = [threading.Thread(target=flood, args=(thread,)) for thread in range(4)]
+    for writer in writers:
+        writer.start()
+    while any(writer.is_alive() for writer in writers) or dispatcher.pending:
+        work_per_frame.append(0)
+        dispatcher.run_frame()
+        time.sleep(0.001)
+
+    # Two state keys plus at most max_calls calls, however many events arrived
+    assert max(work_per_frame) <= 2 + 8
+    assert sum(work_per_frame) < 4 * (20000 + 2000)
+    # Every call ran and the label ends on the newest status
+    assert len(reported) == 4 * 200
+    assert statuses[-1] == dispatcher.latest['status'][1]
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for DNS caching, keep-warm echoes and the first-command metric
+"""
+
+import socket
+
+from benchmarks.latency import wait_for
+from cosmos_core import MQTTController
+from cosmos_core.warmup import DNSCache, KeepWarm
+from loopback_broker import LoopbackBroker
+
+
+class FakeResolver:
+    def __init__(self, address):
+        self.address = address
+        self.calls = 0
+        self.failing = False
+
+    def __call__(self, host, port, family, kind):
+        self.calls += 1
+        if self.failing:
+            raise socket.gaierror("resolver down")
+        return [(socket.AF_INET, kind, 6, "", (self.address, port))]
+
+
+def test_dns_cache_reuses_answers_until_ttl_and_falls_back_to_stale():
+    """Lookups are served from memory within the TTL and from the old answer when DNS fails"""
+    resolver = FakeResolver("10.0.0.1")
+    cache = DNSCache(ttl=60, resolver=resolver)
+    assert cache.resolve("broker", 1883, now=0) == "10.0.0.1"
+    assert cache.resolve("broker", 1883, now=59) == "10.0.0.1"
+    assert resolver.calls == 1 and cache.hits == 1
+    assert cache.resolve("127.0.0.1", 1883) == "127.0.0.1"
+    assert resolver.calls == 1
+
+    assert cache.expired("broker", 1883, now=61)
+    resolver.address = "10.0.0.2"
+    assert cache.resolve("broker", 1883, now=61) == "10.0.0.2"
+    resolver.failing = True
+    assert cache.resolve("broker", 1883, now=200) == "10.0.0.2"
+
+
+def test_keep_warm_shortens_after_a_cold_echo_and_relaxes_otherwise():
+    """A slow echo after an idle gap halves the interval; warm echoes let it grow"""
+    keep_warm = KeepWarm(interval=8.0, minimum=1.0, maximum=10.0)
+    keep_warm.touch(now=100.0)
+    assert keep_warm.due(now=104.0) == 4.0
+    assert keep_warm.due(now=110.0) == 0.0
+
+    keep_warm.sent(now=110.0)
+    assert round(keep_warm.echoed(now=110.005), 6) == 0.005
+    assert keep_warm.interval == 10.0
+    keep_warm.sent(now=120.0)
+    keep_warm.echoed(now=120.2)
+    assert keep_warm.cold == 1 and keep_warm.interval == 5.0
+    assert keep_warm.echoed(now=121.0) is None
+
+
+def test_keep_warm_echo_round_trip_and_first_command_metric():
+    """The controller echoes through the broker when idle and reports time to first command"""
+    with LoopbackBroker() as broker:
+        controller = MQTTController()
+        controller.enable_keep_warm(interval=0.05, minimum=0.05)
+        assert controller.connect("localhost", broker.port, "", "")
+        assert controller.broker_address == "127.0.0.1"
+        try:
+            assert wait_for(lambda: controller.keep_warm.echoes >= 2, 5)
+            assert controller.metrics.histograms['warm_echo_seconds'].count >= 2
+            assert controller.metrics.export()['gauges'].get('time_to_first_command_seconds') is None
+
+            assert controller.publish_brake()
+            gauges = controller.metrics.export()['gauges']
+            assert gauges['time_to_first_command_seconds'] > 0
+            assert gauges['keep_warm_interval_seconds'] >= 0.05
+        finally:
+            controller.disconnect()
+        assert controller.keep_warm.thread is None
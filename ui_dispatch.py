@@ -0,0 +1,166 @@
+"""
+COSMOS UI Dispatcher
+Carries state changes from the MQTT network thread (or any other thread) to the
+UI thread, coalesced so the UI does a bounded amount of work per frame.
+
+Two kinds of update are supported:
+
+    post(key, value)    latest-wins state, e.g. the status line; a burst of posts
+                        to one key between frames is applied once, with the last
+                        value
+    call(fn, *args)     one-off work that must not be dropped; at most max_calls
+                        of these run per frame and the rest wait for the next one
+    call_latest(key, fn, *args)
+                        latest-wins work, e.g. a router 'ui' handler; only the
+                        newest call for key still waiting runs
+
+Neither side takes a lock. Writers store into a dict and append to a deque, both
+single atomic operations in CPython, and the UI thread reads them in run_frame().
+The toolkit supplies `wakeup`, a callable that asks for one frame callback however
+often it is called, such as a Kivy Clock trigger. Tk has no such call that is
+safe from other threads, so PollingBridge drains the dispatcher from an after()
+timer instead.
+"""
+
+import collections
+import itertools
+import logging
+import time
+
+logger = logging.getLogger("cosmos.ui")
+
+
+class UIDispatcher:
+    """Latest-value state and bounded call batches, applied once per frame"""
+
+    def __init__(self, max_calls=32, wakeup=None):
+        self.max_calls = max_calls
+        self.wakeup = wakeup
+        self.handlers = {}
+        # key -> (sequence, value, posted at); written by any thread
+        self.latest = {}
+        # key -> sequence last applied; UI thread only
+        self.applied = {}
+        # Unbounded: a lost call can leave the UI stuck, e.g. the connect button
+        # never re-enabled. Anything high-rate belongs in post() or call_latest()
+        self.calls = collections.deque()
+        self.sequence = itertools.count(1)
+        self.dirty = False
+        self.frames = 0
+
+    def on(self, key, handler):
+        """Apply posted values for key with handler(value) on the UI thread"""
+        self.handlers[key] = handler
+
+    def post(self, key, value):
+        """Set the latest value for key from any thread"""
+        self.latest[key] = (next(self.sequence), value, time.perf_counter())
+        self.dirty = True
+        if self.wakeup is not None:
+            self.wakeup()
+
+    def call_latest(self, key, fn, *args):
+        """Run fn(*args) on the UI thread in a later frame, replacing a call for key still waiting"""
+        self.handlers.setdefault(key, self._run_call)
+        self.post(key, (fn, args))
+
+    def _run_call(self, call):
+        fn, args = call
+        fn(*args)
+
+    def call(self, fn, *args):
+        """Run fn(*args) on the UI thread in a later frame; every call runs, in order"""
+        self.calls.append((fn, args, time.perf_counter()))
+        self.dirty = True
+        if self.wakeup is not None:
+            self.wakeup()
+
+    @property
+    def pending(self):
+        """True if work is waiting for the next frame"""
+        return self.dirty or bool(self.calls)
+
+    def run_frame(self):
+        """Apply changed keys and up to max_calls calls; returns the oldest lag in seconds or None
+
+        Call on the UI thread. If calls remain afterwards, wakeup() is called again.
+        """
+        if not self.pending:
+            return None
+        # Cleared before reading, so a post racing with this frame is seen by the next one
+        self.dirty = False
+        self.frames += 1
+        oldest = None
+        for key, (sequence, value, posted_at) in self.latest.copy().items():
+            if self.applied.get(key) == sequence:
+                continue
+            self.applied[key] = sequence
+            if oldest is None or posted_at < oldest:
+                oldest = posted_at
+            self._apply(self.handlers.get(key), value)
+        calls = self.calls
+        for _ in range(min(self.max_calls, len(calls))):
+            fn, args, posted_at = calls.popleft()
+            if oldest is None or posted_at < oldest:
+                oldest = posted_at
+            self._apply(fn, *args)
+        if calls and self.wakeup is not None:
+            self.wakeup()
+        return None if oldest is None else time.perf_counter() - oldest
+
+    def _apply(self, fn, *args):
+        if fn is None:
+            return
+        try:
+            fn(*args)
+        except Exception:
+            logger.exception("UI update failed")
+
+
+class PollingBridge:
+    """Drains a UIDispatcher from a toolkit timer, polling fast only while busy
+
+    For toolkits without a thread-safe wakeup, such as Tk: schedule(ms, fn) is
+    root.after. The timer runs every busy_interval while updates keep arriving,
+    while busy() is true (e.g. commands awaiting an ack) or shortly after
+    boost(), and every idle_interval otherwise.
+    """
+
+    def __init__(self, dispatcher, schedule, busy=None, idle_interval=0.05,
+                 busy_interval=0.002, on_lag=None):
+        self.dispatcher = dispatcher
+        self.schedule = schedule
+        self.busy = busy
+        self.idle_interval = idle_interval
+        self.busy_interval = busy_interval
+        self.on_lag = on_lag
+        self.busy_until = 0.0
+        self.interval = idle_interval
+        self.running = False
+        self.ticks = 0
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.schedule(0, self.poll)
+
+    def stop(self):
+        self.running = False
+
+    def boost(self, seconds=0.5):
+        """Poll at the busy rate for a while, e.g. right after a button press"""
+        self.busy_until = max(self.busy_until, time.perf_counter() + seconds)
+
+    def poll(self):
+        """Apply pending updates on the UI thread and schedule the next poll"""
+        if not self.running:
+            return
+        self.ticks += 1
+        lag = self.dispatcher.run_frame()
+        if lag is not None and self.on_lag is not None:
+            self.on_lag(lag)
+        busy = (lag is not None or self.dispatcher.pending
+                or time.perf_counter() < self.busy_until
+                or (self.busy is not None and self.busy()))
+        self.interval = self.busy_interval if busy else self.idle_interval
+        self.schedule(int(self.interval * 1000), self.poll)